@@ -2,16 +2,34 @@
 Exam generation API endpoints
 """
 
+from typing import Optional
+
 from fastapi import APIRouter, Depends, HTTPException
 from app.models.schemas import ExamGenerateRequest, ExamResponse
 from app.services.exam.generator import ExamGenerator, get_exam_generator
+from app.services.exam.grading import (
+    BulkGradeResult,
+    BulkSubmission,
+    ExamGrader,
+    ExamGradeResult,
+    ExamSubmission,
+    get_exam_grader,
+)
+from app.services.exam.mastery import AdaptiveExamRequest, MasteryStore, get_mastery_store
+from app.services.exam.pool import ExamPool, get_exam_pool
+from app.services.exam.session import (
+    AnswerUpdate,
+    ExamSessionState,
+    ExamSessionStore,
+    get_exam_session_store,
+)
 
 router = APIRouter()
 
 @router.post("/generate", response_model=ExamResponse)
 async def generate_exam(
     request: ExamGenerateRequest,
-    generator: ExamGenerator = Depends(get_exam_generator)
+    pool: ExamPool = Depends(get_exam_pool)
 ) -> ExamResponse:
     """
     模試を生成する
@@ -20,14 +38,175 @@ async def generate_exam(
     - **difficulty_ratio**: 難易度比率 (合計1.0)
     - **tags**: 対象タグ (省略時は全分野)
     - **time_limit_min**: 制限時間 (10-300分)
+    
+    頻出条件の模試は事前生成済みのプールから返す (なければその場で生成)
     """
     try:
-        return await generator.generate_exam(request)
+        return await pool.generate_exam(request)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Exam generation failed: {str(e)}")
 
-@router.get("/results/{exam_id}")
-async def get_exam_results(exam_id: str):
-    """模試結果を取得"""
-    # TODO: Implement exam results retrieval
-    return {"exam_id": exam_id, "message": "Not implemented yet"}
\ No newline at end of file
+@router.post("/generate/adaptive", response_model=ExamResponse)
+async def generate_adaptive_exam(
+    request: AdaptiveExamRequest,
+    generator: ExamGenerator = Depends(get_exam_generator),
+    mastery: MasteryStore = Depends(get_mastery_store)
+) -> ExamResponse:
+    """
+    回答履歴に基づく弱点克服模試を生成する
+    
+    - **user_id**: ユーザーID (採点時に送った user_id の習熟度を参照)
+    - その他は /generate と同じ
+    
+    正答率の低い分野を多めに、未出題・誤答した問題を優先して出題する
+    """
+    tag_ratio, problem_weights = await mastery.plan(request.user_id, request.tags)
+    return await generator.generate_exam(request, tag_ratio=tag_ratio or None, problem_weights=problem_weights)
+
+@router.get("/adaptive/metrics")
+async def get_adaptive_metrics(
+    mastery: MasteryStore = Depends(get_mastery_store)
+):
+    """
+    弱点克服模試のメトリクスを取得
+    
+    - **rows_upserted**: 採点時に更新した習熟度の行数
+    - **plan_ms**: 習熟度の読み込みと重み計算の所要時間
+    """
+    return mastery.get_metrics()
+
+@router.post("/{exam_id}/session", response_model=ExamSessionState)
+async def start_exam_session(
+    exam_id: str,
+    store: ExamSessionStore = Depends(get_exam_session_store)
+) -> ExamSessionState:
+    """
+    模試を開始する (既に開始済みなら途中から再開)
+    
+    制限時間のタイマーはこの時点から計測する
+    """
+    return await store.start(exam_id)
+
+@router.get("/{exam_id}/session", response_model=ExamSessionState)
+async def get_exam_session(
+    exam_id: str,
+    store: ExamSessionStore = Depends(get_exam_session_store)
+) -> ExamSessionState:
+    """一時保存した回答と残り時間を取得"""
+    return await store.resume(exam_id)
+
+@router.put("/{exam_id}/answers", response_model=ExamSessionState)
+async def save_exam_answers(
+    exam_id: str,
+    update: AnswerUpdate,
+    store: ExamSessionStore = Depends(get_exam_session_store)
+) -> ExamSessionState:
+    """
+    回答を一時保存する
+    
+    - **answers**: 変更した問題の 問題ID:選択肢ラベル (null で回答取り消し)
+    
+    回答はメモリ上でまとめられ、数秒ごとに一括でDBへ書き込まれる
+    """
+    return await store.record_answers(exam_id, update.answers)
+
+@router.post("/{exam_id}/submit", response_model=ExamGradeResult)
+async def submit_exam(
+    exam_id: str,
+    submission: Optional[ExamSubmission] = None,
+    store: ExamSessionStore = Depends(get_exam_session_store),
+    grader: ExamGrader = Depends(get_exam_grader)
+) -> ExamGradeResult:
+    """
+    模試を提出して採点する
+    
+    - **answers**: 最終回答 (省略時、または制限時間を過ぎた提出では自動保存済みの回答で採点)
+    - **time_ms**: 問題ごとの回答時間 (任意、回答ログに記録)
+    - **user_id**: ユーザーID (任意、弱点克服模試用の習熟度を更新)
+    
+    スコアと分野別・難易度別の正答率、問題ごとの正誤を返す
+    """
+    submission = submission or ExamSubmission()
+    answers = await store.finish(exam_id, submission.answers)
+    try:
+        return await grader.grade(exam_id, answers, submission.time_ms, submission.user_id)
+    except Exception:
+        # 採点に失敗した答案は未提出に戻し、再提出できるようにする
+        await store.reopen(exam_id)
+        raise
+
+@router.post("/submit/bulk", response_model=BulkGradeResult)
+async def submit_exams_bulk(
+    submission: BulkSubmission,
+    grader: ExamGrader = Depends(get_exam_grader)
+) -> BulkGradeResult:
+    """
+    答案を一括採点する (クラス単位の取り込み用)
+    
+    - **sheets**: 模試ID・回答・ユーザーID (任意) の組のリスト
+    
+    模試ごとにまとめて一度に採点し、回答ログは1トランザクションで書き込む
+    """
+    return await grader.grade_bulk(submission)
+
+@router.get("/grading/metrics")
+async def get_grading_metrics(
+    grader: ExamGrader = Depends(get_exam_grader)
+):
+    """
+    採点のメトリクスを取得
+    
+    - **grade_ms**: 採点処理の所要時間のヒストグラム
+    - **answer_key_cache**: 正解表キャッシュのヒット率
+    """
+    return grader.get_metrics()
+
+@router.get("/sessions/metrics")
+async def get_exam_session_metrics(
+    store: ExamSessionStore = Depends(get_exam_session_store)
+):
+    """
+    模試セッションのメトリクスを取得
+    
+    - **coalesced_updates**: 自動保存でまとめられた回答更新数
+    - **flush_ms**: 一括書き込みの所要時間のヒストグラム
+    """
+    return store.get_metrics()
+
+@router.get("/metrics")
+async def get_exam_metrics(
+    generator: ExamGenerator = Depends(get_exam_generator)
+):
+    """
+    模試生成のメトリクスを取得
+    
+    - **question_cache**: 問題キャッシュのヒット率と使用バイト数
+    """
+    return generator.get_metrics()
+
+@router.get("/pool/metrics")
+async def get_exam_pool_metrics(
+    pool: ExamPool = Depends(get_exam_pool)
+):
+    """
+    模試プールのメトリクスを取得
+    
+    - **hit_rate**: プールから返せたリクエストの割合
+    - **pools**: 条件ごとの準備済み模試数と補充待ち時間
+    - **refill_lag_ms**: 不足してから満杯に戻るまでの時間のヒストグラム
+    """
+    return pool.get_metrics()
+
+@router.get("/results/{exam_id}", response_model=ExamResponse)
+async def get_exam_results(
+    exam_id: str,
+    generator: ExamGenerator = Depends(get_exam_generator)
+) -> ExamResponse:
+    """
+    生成済みの模試を取得
+    
+    シードと問題セットのスナップショットから出題順を再生成する
+    """
+    return await generator.load_exam(exam_id)
\ No newline at end of file
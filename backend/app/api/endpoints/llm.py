@@ -2,15 +2,20 @@
 LLM API endpoints for paraphrasing and explanation
 """
 
-from fastapi import APIRouter, Depends, HTTPException
+from typing import Any, Dict, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
 from app.models.schemas import ParaphraseRequest, ParaphraseResponse, ExplainRequest, ExplainResponse
-from app.services.llm.service import LLMService, get_llm_service
+from app.services.llm.service import LLMService, get_llm_cache_service, get_llm_service
+from app.services.llm.streaming import SSE_HEADERS
 
 router = APIRouter()
 
 @router.post("/paraphrase", response_model=ParaphraseResponse)
 async def paraphrase_text(
     request: ParaphraseRequest,
+    seed: Optional[int] = Query(None, ge=0, description="乱数シード (同じシードで同じ結果を再現)"),
     llm_service: LLMService = Depends(get_llm_service)
 ) -> ParaphraseResponse:
     """
@@ -18,15 +23,21 @@ async def paraphrase_text(
     
     - **text**: パラフレーズするテキスト
     - **creativity**: 創造性レベル (0.0-1.0)
+    - **seed**: 乱数シード (省略時は入力から決まるシード)
+    
+    同じ入力・パラメータ・モデルの結果はキャッシュから返す
     """
     try:
-        return await llm_service.paraphrase(request.text, request.creativity)
+        return await llm_service.paraphrase(request.text, request.creativity, seed=seed)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Paraphrase failed: {str(e)}")
 
 @router.post("/explain", response_model=ExplainResponse)
 async def explain_problem(
     request: ExplainRequest,
+    seed: Optional[int] = Query(None, ge=0, description="乱数シード (同じシードで同じ結果を再現)"),
     llm_service: LLMService = Depends(get_llm_service)
 ) -> ExplainResponse:
     """
@@ -35,8 +46,106 @@ async def explain_problem(
     - **question**: 問題文
     - **answer**: 正解
     - **context**: 追加コンテキスト (省略可)
+    - **seed**: 乱数シード (省略時は入力から決まるシード)
+    
+    同じ入力・パラメータ・モデルの結果はキャッシュから返す
     """
     try:
-        return await llm_service.generate_explanation(request.question, request.answer, request.context)
+        return await llm_service.generate_explanation(
+            request.question, request.answer, request.context, seed=seed
+        )
+    except HTTPException:
+        raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Explanation generation failed: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Explanation generation failed: {str(e)}")
+
+@router.post("/paraphrase/stream")
+async def stream_paraphrase(
+    request: ParaphraseRequest,
+    http_request: Request,
+    seed: Optional[int] = Query(None, ge=0, description="乱数シード (同じシードで同じ結果を再現)"),
+    llm_service: LLMService = Depends(get_llm_service)
+) -> StreamingResponse:
+    """
+    パラフレーズをトークン単位でストリーミングする (Server-Sent Events)
+    
+    - **token**: 生成されたトークン (`{"text": ...}`)
+    - **done**: 最終テキスト・最初のトークンまでの時間 (first_token_ms)・tokens/sec
+    - **error**: 生成失敗 (`{"status": ..., "detail": ...}`)
+    
+    クライアントが切断すると生成を中止し、モデルを次のリクエストに解放する。
+    キャッシュ済みの結果は token 1件と `"cached": true` の done で返す
+    """
+    events = await llm_service.paraphrase_events(
+        request.text, request.creativity, seed=seed, is_disconnected=http_request.is_disconnected
+    )
+    return StreamingResponse(
+        events,
+        media_type="text/event-stream",
+        headers=SSE_HEADERS
+    )
+
+@router.post("/explain/stream")
+async def stream_explanation(
+    request: ExplainRequest,
+    http_request: Request,
+    seed: Optional[int] = Query(None, ge=0, description="乱数シード (同じシードで同じ結果を再現)"),
+    llm_service: LLMService = Depends(get_llm_service)
+) -> StreamingResponse:
+    """
+    問題の解説をトークン単位でストリーミングする (Server-Sent Events)
+    
+    イベント形式は /paraphrase/stream と同じ
+    """
+    events = await llm_service.explanation_events(
+        request.question, request.answer, request.context,
+        seed=seed, is_disconnected=http_request.is_disconnected
+    )
+    return StreamingResponse(
+        events,
+        media_type="text/event-stream",
+        headers=SSE_HEADERS
+    )
+
+@router.get("/metrics")
+async def get_llm_metrics(
+    llm_service: LLMService = Depends(get_llm_service)
+) -> Dict[str, Any]:
+    """
+    LLMワーカーのメトリクスを取得
+    
+    - **queue_depth**: 待機中の生成リクエスト数
+    - **rejected** / **timed_out**: 満杯で拒否した数 / タイムアウトした数
+    - **first_token_ms**: 最初のトークンまでの時間 (待ち時間込み) のヒストグラム
+    - **streams_aborted**: 切断・タイムアウトで中止したストリーミング数
+    - **workers**: モデルインスタンスごとの処理数・待ち時間・tokens/sec
+    """
+    return llm_service.get_metrics()
+
+@router.get("/admin/cache")
+async def get_llm_cache_stats(
+    llm_service: LLMService = Depends(get_llm_cache_service)
+) -> Dict[str, Any]:
+    """
+    生成結果キャッシュの統計を取得 (管理用)
+    
+    - **hit_rate**: 起動後のヒット率
+    - **bytes** / **max_bytes**: 使用量 / 上限 (超過分は古い順に削除)
+    - **models**: モデル (SHA-256・ファイル名) ごとの件数・サイズ・ヒット数
+    
+    モデルは読み込まず、キャッシュだけを開く
+    """
+    return await llm_service.get_cache_stats()
+
+@router.delete("/admin/cache")
+async def purge_llm_cache(
+    model: str = Query(..., min_length=1, description="モデルのSHA-256またはファイル名 ('all' で全削除)"),
+    llm_service: LLMService = Depends(get_llm_cache_service)
+) -> Dict[str, Any]:
+    """
+    生成結果キャッシュを削除する (管理用)
+    
+    - **model**: 削除対象のモデル (SHA-256 またはファイル名、`all` で全モデル)
+    """
+    deleted = await llm_service.purge_cache(None if model == "all" else model)
+    return {"model": model, "deleted": deleted}
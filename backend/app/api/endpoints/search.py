@@ -2,6 +2,7 @@
 Search API endpoints
 """
 
+from typing import Optional
 from fastapi import APIRouter, Query, Depends, HTTPException
 from app.models.schemas import SearchResponse
 from app.services.embedding.service import EmbeddingService, get_embedding_service
@@ -12,6 +13,7 @@ router = APIRouter()
 async def search_problems(
     q: str = Query(..., description="検索クエリ", min_length=1),
     k: int = Query(5, description="取得件数", ge=1, le=50),
+    difficulty: Optional[int] = Query(None, description="難易度フィルタ", ge=1, le=5),
     service: EmbeddingService = Depends(get_embedding_service)
 ) -> SearchResponse:
     """
@@ -19,8 +21,21 @@ async def search_problems(
     
     - **q**: 検索したいキーワードまたは文章
     - **k**: 取得する類似問題の件数 (1-50)
+    - **difficulty**: 難易度で絞り込み (省略可)
     """
     if not q.strip():
         raise HTTPException(status_code=400, detail="Query cannot be empty")
     
-    return await service.search_similar(q.strip(), k)
\ No newline at end of file
+    return await service.search_similar(q.strip(), k, difficulty)
+
+@router.get("/metrics")
+async def get_search_metrics(
+    service: EmbeddingService = Depends(get_embedding_service)
+):
+    """
+    検索パイプラインのメトリクスを取得
+    
+    - **batcher**: バッチサイズとキュー待ち時間のヒストグラム
+    - **embedding_cache** / **result_cache**: キャッシュのヒット・ミス数
+    """
+    return service.get_metrics()
\ No newline at end of file
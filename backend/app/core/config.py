@@ -25,11 +25,104 @@ class Settings(BaseSettings):
     EMBEDDING_MODEL: str = "sentence-transformers/all-MiniLM-L6-v2"
     LLM_MODEL_PATH: str = "./models/llama-3-elyza-jp-8b-q4.gguf"
     TRANSFORMERS_CACHE: str = "./cache"
+    # Embedding encoder backend: "torch" (SentenceTransformer) or "onnx" (onnxruntime)
+    EMBEDDING_BACKEND: str = "torch"
+    EMBEDDING_ONNX_PATH: str = "./cache/onnx"
+    # Serve the dynamically int8-quantized ONNX graph
+    EMBEDDING_ONNX_QUANTIZE: bool = False
     
     # Performance
     EMBEDDING_BATCH_SIZE: int = 100
     MAX_SEARCH_RESULTS: int = 50
     
+    # Vector search backend: "chroma" or "numpy" (memory-mapped brute force)
+    VECTOR_BACKEND: str = "chroma"
+    VECTOR_INDEX_PATH: str = "./data/vector_index"
+    # Scan precision for the numpy backend: "float32", "float16" or "int8"
+    VECTOR_INDEX_DTYPE: str = "float32"
+    # Quantized scans re-score top k * factor candidates at full precision
+    VECTOR_RERANK_FACTOR: int = 4
+    SEARCH_BATCH_WINDOW_MS: float = 5.0
+    SEARCH_BATCH_MAX_SIZE: int = 32
+    
+    # Persistent embedding cache under CHROMA_PATH (keyed by model + text hash)
+    EMBEDDING_DISK_CACHE_ENABLED: bool = True
+    EMBEDDING_DISK_CACHE_MAX_ENTRIES: int = 200000
+    
+    # Search caches (entries / TTL seconds)
+    SEARCH_EMBEDDING_CACHE_SIZE: int = 2048
+    SEARCH_EMBEDDING_CACHE_TTL_SEC: float = 86400
+    SEARCH_RESULT_CACHE_SIZE: int = 1024
+    SEARCH_RESULT_CACHE_TTL_SEC: float = 600
+    
+    # Load models and run a warm-up inference at startup; /ready returns 503 until done
+    WARMUP_ON_STARTUP: bool = True
+    # Components /ready does not wait for (still warmed up and retried in the background)
+    WARMUP_OPTIONAL_STEPS: List[str] = ["llm"]
+    # Failed warm-up steps are retried with exponential backoff capped at this many seconds
+    WARMUP_RETRY_MAX_BACKOFF_SEC: float = 300
+    
+    # Inference executors (threads / max queued calls before 503)
+    EMBEDDING_POOL_WORKERS: int = 2
+    EMBEDDING_POOL_QUEUE_DEPTH: int = 64
+    # LLM workers (model instances, one thread each / max queued generations before 503)
+    LLM_POOL_WORKERS: int = 1
+    LLM_POOL_QUEUE_DEPTH: int = 8
+    
+    # llama-cpp context per instance (tokens / CPU threads / prompt batch) and per-request timeout
+    LLM_N_CTX: int = 2048
+    LLM_N_THREADS: int = 4
+    LLM_N_BATCH: int = 512
+    LLM_TIMEOUT_SEC: float = 60
+    # Saved KV states of fixed prompt prefixes per instance (0 = evaluate every prompt in full)
+    LLM_PREFIX_CACHE_SIZE: int = 4
+    # Finished paraphrases/explanations keyed by model file hash, template, input and sampling
+    # parameters (SQLite file / size cap in MB, least recently used evicted first)
+    LLM_RESULT_CACHE_ENABLED: bool = True
+    LLM_RESULT_CACHE_PATH: str = "./data/llm_cache.sqlite3"
+    LLM_RESULT_CACHE_MAX_MB: int = 64
+    # Output limits (paraphrase characters / explanation tokens)
+    LLM_PARAPHRASE_MAX_CHARS: int = 120
+    LLM_EXPLANATION_MAX_TOKENS: int = 400
+    
+    # Exam storage: "compact" (seed + catalog fingerprint, questions re-derived on read)
+    # or "materialized" (one row per question)
+    EXAM_STORAGE: str = "compact"
+    
+    # Hydrated exam questions shared across exams (entries / TTL seconds / byte budget)
+    EXAM_QUESTION_CACHE_SIZE: int = 50000
+    EXAM_QUESTION_CACHE_TTL_SEC: float = 3600
+    EXAM_QUESTION_CACHE_MAX_BYTES: int = 64 * 1024 * 1024
+    
+    # Exam sessions: autosave flush interval (0 = write every update), retention after the
+    # deadline or last update, late-answer grace and sweeper interval (seconds)
+    EXAM_SESSION_FLUSH_INTERVAL_SEC: float = 2.0
+    EXAM_SESSION_TTL_SEC: float = 86400
+    EXAM_SESSION_GRACE_SEC: float = 30
+    EXAM_SESSION_SWEEP_INTERVAL_SEC: float = 600
+    
+    # Per-exam answer keys used for grading (entries / TTL seconds)
+    EXAM_ANSWER_KEY_CACHE_SIZE: int = 1000
+    EXAM_ANSWER_KEY_CACHE_TTL_SEC: float = 3600
+
+    # Adaptive exams: tag weight = catalog share * (1 + boost * error rate); seen problems
+    # weigh between SEEN (always right) and MISSED (always wrong), unseen ones 1.0
+    ADAPTIVE_WEAK_TAG_BOOST: float = 2.0
+    ADAPTIVE_SEEN_WEIGHT: float = 0.2
+    ADAPTIVE_MISSED_WEIGHT: float = 0.8
+    # Per-user mastery aggregates kept in memory (entries / TTL seconds)
+    ADAPTIVE_MASTERY_CACHE_SIZE: int = 1000
+    ADAPTIVE_MASTERY_CACHE_TTL_SEC: float = 300
+
+    # Pre-generated exams for the most frequent (num_questions, difficulty_ratio, tags) requests
+    EXAM_POOL_ENABLED: bool = True
+    EXAM_POOL_SIZE: int = 20
+    EXAM_POOL_MAX_SIGNATURES: int = 8
+    # A signature needs this many requests within the history window to get a pool
+    EXAM_POOL_MIN_REQUESTS: int = 3
+    EXAM_POOL_HISTORY_SIZE: int = 1000
+    EXAM_POOL_REFILL_INTERVAL_SEC: float = 5.0
+    
     # Scraping
     SCRAPER_DELAY_MS: int = 1000
     USER_AGENT: str = "G-Kentei-Study-Tool/1.0"
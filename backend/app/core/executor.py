@@ -0,0 +1,121 @@
+"""
+Bounded thread pools for blocking, CPU-bound inference work
+"""
+
+import asyncio
+import functools
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Tuple
+
+from fastapi import HTTPException
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class InferencePool:
+    """
+    Thread pool with a hard cap on queued work
+
+    At most ``max_workers`` calls run concurrently and at most ``max_queue``
+    more may wait for a thread. Further submissions are rejected with a 503
+    so callers get back-pressure instead of an unbounded backlog.
+    """
+
+    def __init__(self, name: str, max_workers: int, max_queue: int):
+        self.name = name
+        self.max_workers = max(1, max_workers)
+        self.max_queue = max(0, max_queue)
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.max_workers,
+            thread_name_prefix=f"{name}-inference"
+        )
+        self._in_flight = 0
+        self._completed = 0
+        self._rejected = 0
+
+    @property
+    def in_flight(self) -> int:
+        """Running plus queued calls"""
+        return self._in_flight
+
+    @property
+    def queue_depth(self) -> int:
+        """Calls waiting for a free thread"""
+        return max(0, self._in_flight - self.max_workers)
+
+    @property
+    def saturated(self) -> bool:
+        """Whether a new submission would be rejected"""
+        return self._in_flight >= self.max_workers + self.max_queue
+
+    async def run(self, func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """Run a blocking callable on the pool without blocking the event loop"""
+        if self.saturated:
+            self._rejected += 1
+            logger.warning(f"Inference pool '{self.name}' saturated ({self._in_flight} in flight)")
+            raise HTTPException(
+                status_code=503,
+                detail=f"Inference pool '{self.name}' is busy. Please retry shortly.",
+                headers={"Retry-After": "1"}
+            )
+
+        self._in_flight += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(
+                self._executor, functools.partial(func, *args, **kwargs)
+            )
+        finally:
+            self._in_flight -= 1
+            self._completed += 1
+
+    def shutdown(self, wait: bool = False) -> None:
+        """Stop accepting work and release the threads"""
+        self._executor.shutdown(wait=wait, cancel_futures=True)
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """Pool occupancy counters"""
+        return {
+            "max_workers": self.max_workers,
+            "max_queue": self.max_queue,
+            "in_flight": self._in_flight,
+            "queue_depth": self.queue_depth,
+            "completed": self._completed,
+            "rejected": self._rejected,
+        }
+
+
+def _pool_limits(name: str) -> Tuple[int, int]:
+    """Configured (workers, queue depth) for a named pool"""
+    if name == "embedding":
+        return settings.EMBEDDING_POOL_WORKERS, settings.EMBEDDING_POOL_QUEUE_DEPTH
+    raise ValueError(f"Unknown inference pool: {name}")
+
+
+_pools: Dict[str, InferencePool] = {}
+
+
+def get_inference_pool(name: str) -> InferencePool:
+    """Return the shared pool for a service, creating it on first use"""
+    pool = _pools.get(name)
+    if pool is None:
+        workers, queue_depth = _pool_limits(name)
+        pool = InferencePool(name, workers, queue_depth)
+        _pools[name] = pool
+        logger.info(f"Created inference pool '{name}' (workers={workers}, queue={queue_depth})")
+    return pool
+
+
+def get_pool_metrics() -> Dict[str, Dict[str, Any]]:
+    """Metrics for every pool created so far"""
+    return {name: pool.get_metrics() for name, pool in _pools.items()}
+
+
+def shutdown_inference_pools() -> None:
+    """Shut down all pools (application shutdown)"""
+    for pool in _pools.values():
+        pool.shutdown()
+    _pools.clear()
@@ -0,0 +1,156 @@
+"""
+Startup warm-up and readiness state
+
+Each component (embedding search, LLM) is initialized and exercised once in
+parallel when the application starts. ``/health`` only reports that the
+process is alive, while ``/ready`` reports the state tracked here, so load
+balancers and the compose healthcheck route traffic only after warm-up.
+
+A failed step is retried with exponential backoff until it succeeds.
+Readiness only waits for the required steps; optional ones (the LLM by
+default, whose model file may be absent) warm up and retry in the
+background and show up in ``errors`` while they fail.
+"""
+
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Collection, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+WarmupStep = Callable[[], Awaitable[Optional[Dict[str, float]]]]
+
+
+class ReadinessState:
+    """Progress of the startup warm-up"""
+
+    def __init__(self):
+        self.ready = False
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.timings: Dict[str, float] = {}
+        self.errors: Dict[str, str] = {}
+        self.attempts: Dict[str, int] = {}
+        self.optional: Collection[str] = ()
+
+    def snapshot(self) -> Dict[str, Any]:
+        status = "ready" if self.ready else ("failed" if self.errors else "starting")
+        elapsed = None
+        if self.started_at is not None:
+            end = self.finished_at if self.finished_at is not None else time.monotonic()
+            elapsed = round(end - self.started_at, 3)
+        return {
+            "status": status,
+            "elapsed_s": elapsed,
+            "timings_s": dict(self.timings),
+            "errors": dict(self.errors),
+            "attempts": dict(self.attempts),
+            "optional": sorted(self.optional),
+        }
+
+
+readiness = ReadinessState()
+
+
+async def _run_step(
+    name: str,
+    step: WarmupStep,
+    state: ReadinessState,
+    backoff_sec: float,
+    max_backoff_sec: float,
+    max_attempts: Optional[int]
+) -> bool:
+    """Run one component until it succeeds (or ``max_attempts`` fail); record timing or error"""
+    attempt = 0
+    while True:
+        attempt += 1
+        state.attempts[name] = attempt
+        start_time = time.perf_counter()
+        try:
+            details = await step()
+            break
+        except Exception as e:
+            state.errors[name] = str(e)
+            if max_attempts is not None and attempt >= max_attempts:
+                logger.error(f"Warm-up of {name} failed after {attempt} attempts: {e}")
+                return False
+            delay = min(backoff_sec * 2 ** (attempt - 1), max_backoff_sec)
+            logger.error(f"Warm-up of {name} failed (attempt {attempt}, retrying in {delay:.0f}s): {e}")
+            await asyncio.sleep(delay)
+
+    state.errors.pop(name, None)
+    elapsed = round(time.perf_counter() - start_time, 3)
+    state.timings[name] = elapsed
+    for step_name, seconds in (details or {}).items():
+        state.timings[f"{name}.{step_name}"] = seconds
+    logger.info(f"Warm-up of {name} finished in {elapsed:.2f}s {details or ''}")
+    return True
+
+
+async def warm_up(
+    steps: Dict[str, WarmupStep],
+    state: ReadinessState = readiness,
+    optional: Collection[str] = (),
+    backoff_sec: float = 1.0,
+    max_backoff_sec: float = 300.0,
+    max_attempts: Optional[int] = None
+) -> ReadinessState:
+    """
+    Run every warm-up step concurrently, retrying failures with backoff
+
+    The state becomes ready as soon as every required step has succeeded;
+    optional steps keep retrying afterwards. Returns once all steps have
+    finished (or exhausted ``max_attempts``).
+    """
+    state.ready = False
+    state.started_at = time.monotonic()
+    state.finished_at = None
+    state.timings.clear()
+    state.errors.clear()
+    state.attempts.clear()
+    state.optional = [name for name in steps if name in optional]
+
+    tasks = {
+        name: asyncio.create_task(
+            _run_step(name, step, state, backoff_sec, max_backoff_sec, max_attempts)
+        )
+        for name, step in steps.items()
+    }
+    try:
+        required = [task for name, task in tasks.items() if name not in state.optional]
+        results = await asyncio.gather(*required)
+        state.finished_at = time.monotonic()
+        state.ready = all(results)
+        if state.ready:
+            logger.info(f"Application ready after {state.finished_at - state.started_at:.2f}s")
+        await asyncio.gather(*tasks.values())
+    finally:
+        # Cancelled on shutdown: stop the steps still retrying
+        for task in tasks.values():
+            task.cancel()
+    return state
+
+
+async def _warm_up_embedding() -> Dict[str, float]:
+    from app.services.embedding.service import get_embedding_service
+
+    service = await get_embedding_service()
+    await service.warm_up()
+    return service.load_timings
+
+
+async def _warm_up_llm() -> Dict[str, float]:
+    from app.services.llm.service import get_llm_service
+
+    service = await get_llm_service()
+    await service.warm_up()
+    return service.load_timings
+
+
+def default_steps() -> Dict[str, WarmupStep]:
+    """Components warmed up by the application lifespan"""
+    return {
+        "embedding": _warm_up_embedding,
+        "llm": _warm_up_llm,
+    }
@@ -2,20 +2,57 @@
 FastAPI main application entry point
 """
 
+import asyncio
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 import uvicorn
 
 from app.core.config import settings
+from app.core.executor import shutdown_inference_pools
+from app.core.warmup import default_steps, readiness, warm_up
+from app.services.exam.pool import get_exam_pool
+from app.services.exam.session import get_exam_session_store
+from app.services.llm.service import shutdown_llm_service
 from app.api.v1.router import api_router
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Warm up models and start exam background tasks; release resources on shutdown"""
+    warmup_task = None
+    if settings.WARMUP_ON_STARTUP:
+        # Run in the background so /health answers while models load
+        warmup_task = asyncio.create_task(warm_up(
+            default_steps(),
+            optional=settings.WARMUP_OPTIONAL_STEPS,
+            max_backoff_sec=settings.WARMUP_RETRY_MAX_BACKOFF_SEC
+        ))
+    else:
+        readiness.ready = True
+    exam_pool = await get_exam_pool()
+    exam_pool.start()
+    session_store = await get_exam_session_store()
+    session_store.start_background_tasks()
+    
+    yield
+    
+    await exam_pool.stop()
+    await session_store.stop()
+    await shutdown_llm_service()
+    if warmup_task is not None and not warmup_task.done():
+        warmup_task.cancel()
+    shutdown_inference_pools()
+
 def create_app() -> FastAPI:
     """Create and configure FastAPI application"""
     app = FastAPI(
         title=settings.PROJECT_NAME,
         description="G検定対策ツール - オフライン学習支援システム",
         version=settings.VERSION,
-        openapi_url=f"{settings.API_V1_STR}/openapi.json"
+        openapi_url=f"{settings.API_V1_STR}/openapi.json",
+        lifespan=lifespan
     )
 
     # CORS middleware
@@ -36,9 +73,17 @@ app = create_app()
 
 @app.get("/health")
 async def health_check():
-    """Health check endpoint"""
+    """Liveness check endpoint"""
     return {"status": "healthy", "service": settings.PROJECT_NAME}
 
+@app.get("/ready")
+async def readiness_check():
+    """Readiness check endpoint (503 until startup warm-up has finished)"""
+    snapshot = readiness.snapshot()
+    if not readiness.ready:
+        return JSONResponse(status_code=503, content=snapshot)
+    return snapshot
+
 if __name__ == "__main__":
     uvicorn.run(
         "app.main:app",
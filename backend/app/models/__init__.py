@@ -0,0 +1 @@
+# Data models package
\ No newline at end of file
@@ -0,0 +1,116 @@
+"""
+Pydantic schemas for API requests and responses
+"""
+
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from pydantic import BaseModel, ConfigDict, Field, field_validator
+
+DIFFICULTY_LEVELS = ("1", "2", "3", "4", "5")
+
+# === Problems ===
+
+class ChoiceBase(BaseModel):
+    label: str = Field(..., description="選択肢ラベル (A-D)")
+    body: str = Field(..., description="選択肢の本文")
+    is_correct: bool = Field(False, description="正解かどうか")
+
+class ChoiceCreate(ChoiceBase):
+    pass
+
+class Choice(ChoiceBase):
+    model_config = ConfigDict(from_attributes=True)
+    
+    id: int
+
+class ProblemBase(BaseModel):
+    question: str = Field(..., min_length=1, description="問題文")
+    answer: str = Field(..., description="解答")
+    explanation: Optional[str] = Field(None, description="解説")
+    difficulty: int = Field(..., ge=1, le=5, description="難易度 (1-5)")
+    tags: Optional[str] = Field(None, description="カンマ区切りのタグ")
+    source_url: Optional[str] = Field(None, description="出典URL")
+
+class ProblemCreate(ProblemBase):
+    choices: List[ChoiceCreate] = Field(default_factory=list, description="選択肢")
+
+class Problem(ProblemBase):
+    model_config = ConfigDict(from_attributes=True)
+    
+    id: int
+    choices: List[Choice] = []
+    created_at: Optional[datetime] = None
+
+# === Search ===
+
+class SearchResult(BaseModel):
+    id: str = Field(..., description="問題ID")
+    score: float = Field(..., description="類似度スコア (0-1)")
+    snippet: str = Field(..., description="問題文のスニペット")
+    difficulty: Optional[int] = Field(None, description="難易度")
+    tags: Optional[str] = Field(None, description="タグ")
+
+class SearchResponse(BaseModel):
+    query: str = Field(..., description="検索クエリ")
+    results: List[SearchResult] = Field(..., description="検索結果")
+    total_time_ms: float = Field(..., description="検索時間 (ミリ秒)")
+    k: int = Field(..., description="取得件数")
+
+# === Exams ===
+
+class ExamGenerateRequest(BaseModel):
+    """Exam composition (difficulty ratios must sum to 1.0)"""
+    num_questions: int = Field(..., ge=1, le=200, description="問題数")
+    difficulty_ratio: Dict[str, float] = Field(..., description="難易度レベル:比率")
+    tags: Optional[List[str]] = Field(None, description="対象タグ (省略時は全分野)")
+    time_limit_min: int = Field(120, ge=10, le=300, description="制限時間 (分)")
+    
+    @field_validator("difficulty_ratio")
+    @classmethod
+    def validate_difficulty_ratio(cls, v: Dict[str, float]) -> Dict[str, float]:
+        for level, ratio in v.items():
+            if level not in DIFFICULTY_LEVELS:
+                raise ValueError(f"難易度レベルは1-5である必要があります: {level}")
+            if ratio < 0:
+                raise ValueError(f"難易度比率は0以上である必要があります: {level}={ratio}")
+        total = sum(v.values())
+        # Allow for floating point error
+        if not 0.99 <= total <= 1.01:
+            raise ValueError(f"難易度比率の合計は1.0である必要があります (現在: {total})")
+        return v
+
+class ExamQuestion(BaseModel):
+    id: int
+    question: str
+    choices: List[Choice]
+    difficulty: int
+    tags: Optional[str] = None
+
+class ExamResponse(BaseModel):
+    exam_id: str
+    questions: List[ExamQuestion]
+    time_limit_min: int
+    total_questions: int
+    difficulty_distribution: Dict[str, float] = Field(..., description="実際の難易度比率")
+
+# === LLM ===
+
+class ParaphraseRequest(BaseModel):
+    text: str = Field(..., min_length=1, max_length=500, description="パラフレーズするテキスト")
+    creativity: float = Field(0.7, ge=0.0, le=1.0, description="創造性レベル")
+
+class ParaphraseResponse(BaseModel):
+    original: str
+    paraphrased: str
+    processing_time_ms: float = Field(..., description="処理時間 (ミリ秒)")
+
+class ExplainRequest(BaseModel):
+    question: str = Field(..., min_length=1, description="問題文")
+    answer: str = Field(..., description="正解")
+    context: Optional[str] = Field(None, description="補足情報 (選択肢など)")
+
+class ExplainResponse(BaseModel):
+    question: str
+    explanation: str
+    processing_time_ms: float = Field(..., description="処理時間 (ミリ秒)")
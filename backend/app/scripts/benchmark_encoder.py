@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+エンコーダバックエンドのベンチマーク
+
+PyTorch / ONNX (fp32) / ONNX (int8) ごとに、モデル読み込み時間・単一クエリの
+レイテンシ (p50/p95)・バッチ処理のスループット・最大RSS を計測する。
+RSS を正しく比較するため、各バックエンドは別プロセスで実行する。
+
+使用方法:
+    python -m app.scripts.benchmark_encoder [--model sentence-transformers/all-MiniLM-L6-v2] [--docs 2000]
+"""
+
+import argparse
+import json
+import logging
+import resource
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List
+
+import numpy as np
+
+from app.services.embedding.encoder import load_encoder
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+VARIANTS = {
+    "torch": {"backend": "torch", "quantize": False},
+    "onnx": {"backend": "onnx", "quantize": False},
+    "onnx-int8": {"backend": "onnx", "quantize": True},
+}
+
+SAMPLE_TEXTS = [
+    "ニューラルネットワークの学習で勾配消失が起きる原因として最も適切なものを選べ。",
+    "畳み込みニューラルネットワークにおけるプーリング層の役割はどれか。",
+    "強化学習における探索と活用のトレードオフについて説明せよ。",
+    "過学習を防ぐための正則化手法として誤っているものを選べ。",
+    "Transformer の Self-Attention の計算量は系列長に対してどのように増えるか。",
+    "AIの倫理的・法的・社会的課題 (ELSI) に関する記述として正しいものはどれか。",
+]
+
+
+def make_corpus(num_docs: int) -> List[str]:
+    """問題文らしい長さのテキストを生成"""
+    return [f"{SAMPLE_TEXTS[i % len(SAMPLE_TEXTS)]} (問{i})" for i in range(num_docs)]
+
+
+def max_rss_mb() -> float:
+    """このプロセスの最大RSS (MB)"""
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux は KB、macOS はバイト単位
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+
+def run_variant(variant: str, model: str, onnx_path: str, num_docs: int, num_queries: int, batch_size: int) -> Dict[str, Any]:
+    """1つのバックエンドを計測 (子プロセス内で実行)"""
+    options = VARIANTS[variant]
+
+    start_time = time.perf_counter()
+    encoder = load_encoder(model, options["backend"], onnx_path, options["quantize"])
+    load_s = time.perf_counter() - start_time
+
+    # ウォームアップ
+    encoder.encode(SAMPLE_TEXTS, batch_size=batch_size)
+
+    latencies = []
+    for i in range(num_queries):
+        start_time = time.perf_counter()
+        encoder.encode([SAMPLE_TEXTS[i % len(SAMPLE_TEXTS)]])
+        latencies.append((time.perf_counter() - start_time) * 1000)
+
+    corpus = make_corpus(num_docs)
+    start_time = time.perf_counter()
+    encoder.encode(corpus, batch_size=batch_size)
+    elapsed = time.perf_counter() - start_time
+
+    return {
+        "variant": variant,
+        "load_s": round(load_s, 2),
+        "query_p50_ms": round(float(np.percentile(latencies, 50)), 2),
+        "query_p95_ms": round(float(np.percentile(latencies, 95)), 2),
+        "docs_per_sec": round(num_docs / elapsed, 1),
+        "max_rss_mb": round(max_rss_mb(), 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark embedding encoder backends')
+    parser.add_argument('--model', default='sentence-transformers/all-MiniLM-L6-v2', help='Embedding model name')
+    parser.add_argument('--onnx-path', default='./cache/onnx', help='ONNX export directory')
+    parser.add_argument('--variants', nargs='+', choices=list(VARIANTS), default=list(VARIANTS))
+    parser.add_argument('--docs', type=int, default=2000, help='Documents for the throughput run')
+    parser.add_argument('--queries', type=int, default=200, help='Single-query latency samples')
+    parser.add_argument('--batch-size', type=int, default=64, help='Encode batch size')
+    parser.add_argument('--worker', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        result = run_variant(args.worker, args.model, args.onnx_path, args.docs, args.queries, args.batch_size)
+        print(json.dumps(result))
+        return
+
+    results = []
+    for variant in args.variants:
+        logger.info(f"Benchmarking {variant}...")
+        completed = subprocess.run(
+            [
+                sys.executable, "-m", "app.scripts.benchmark_encoder",
+                "--worker", variant,
+                "--model", args.model,
+                "--onnx-path", args.onnx_path,
+                "--docs", str(args.docs),
+                "--queries", str(args.queries),
+                "--batch-size", str(args.batch_size),
+            ],
+            capture_output=True,
+            text=True
+        )
+        if completed.returncode != 0:
+            logger.error(f"{variant} failed:\n{completed.stderr}")
+            continue
+        results.append(json.loads(completed.stdout.strip().splitlines()[-1]))
+
+    header = f"{'variant':<10} {'load_s':>7} {'p50_ms':>8} {'p95_ms':>8} {'docs/s':>9} {'rss_mb':>8}"
+    print(header)
+    print("-" * len(header))
+    for row in results:
+        print(
+            f"{row['variant']:<10} {row['load_s']:>7.2f} {row['query_p50_ms']:>8.2f} "
+            f"{row['query_p95_ms']:>8.2f} {row['docs_per_sec']:>9.1f} {row['max_rss_mb']:>8.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+"""
+/exam/generate エンドポイントのレイテンシ計測
+
+合成した問題データベースに対して v1 の模試生成エンドポイントを
+ASGI 経由で繰り返し呼び出し、問題数ごとの p50 / p95 / p99 を表示する。
+
+使用方法:
+    python -m app.scripts.benchmark_exam [--problems 20000] [--sizes 100,200] [--requests 200] [--pool]
+
+--pool を付けると模試プールを有効にし、各問題数の条件を学習・補充させてから計測する
+(--requests をプールサイズ以下にすると全件ヒット時のレイテンシになる)。
+
+--adaptive を付けると、--seen 問の回答履歴 (習熟度集計) と --log-rows 行の回答ログを
+持つユーザーで /exam/generate/adaptive を計測する。
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import random
+import sqlite3
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+import numpy as np
+
+logging.basicConfig(
+    level=logging.WARNING,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+TAGS = ["機械学習", "深層学習", "強化学習", "AI倫理", "数理統計", "自然言語処理", "画像認識"]
+DIFFICULTY_RATIO = {"1": 0.1, "2": 0.2, "3": 0.4, "4": 0.2, "5": 0.1}
+
+
+def build_database(db_path: Path, num_problems: int, seed: int = 0) -> None:
+    """problems / choices テーブルに合成データを投入"""
+    rng = random.Random(seed)
+    conn = sqlite3.connect(db_path)
+    conn.executescript("""
+        CREATE TABLE problems (
+            id INTEGER PRIMARY KEY,
+            question TEXT NOT NULL,
+            answer TEXT,
+            explanation TEXT,
+            difficulty INTEGER,
+            tags TEXT,
+            source_url TEXT,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        );
+        CREATE TABLE choices (
+            id INTEGER PRIMARY KEY,
+            problem_id INTEGER NOT NULL REFERENCES problems(id),
+            label TEXT NOT NULL,
+            body TEXT NOT NULL,
+            is_correct BOOLEAN NOT NULL
+        );
+        CREATE INDEX idx_choices_problem_id ON choices(problem_id);
+    """)
+    conn.executemany(
+        "INSERT INTO problems (id, question, answer, difficulty, tags) VALUES (?, ?, ?, ?, ?)",
+        (
+            (i, f"問題{i}: " + "ニューラルネットワークの学習について正しいものを選べ。" * 3, "A",
+             rng.randint(1, 5), ",".join(rng.sample(TAGS, 2)))
+            for i in range(1, num_problems + 1)
+        )
+    )
+    conn.executemany(
+        "INSERT INTO choices (problem_id, label, body, is_correct) VALUES (?, ?, ?, ?)",
+        (
+            (i, label, f"選択肢{label}の説明文 (問題{i})", label == "A")
+            for i in range(1, num_problems + 1)
+            for label in "ABCD"
+        )
+    )
+    conn.commit()
+    conn.close()
+
+
+async def measure(
+    app: Any,
+    num_questions: int,
+    num_requests: int,
+    concurrency: int,
+    pool: Any = None,
+    user_id: str = ""
+) -> Dict[str, Any]:
+    """指定問題数で num_requests 回生成し、レイテンシ分布を返す"""
+    import httpx
+
+    payload = {
+        "num_questions": num_questions,
+        "difficulty_ratio": DIFFICULTY_RATIO,
+        "time_limit_min": 120,
+    }
+    path = "/exam/generate"
+    if user_id:
+        payload["user_id"] = user_id
+        path = "/exam/generate/adaptive"
+    latencies: List[float] = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        # ウォームアップ (カタログ読み込み・パーティション構築)
+        response = await client.post(path, json=payload)
+        response.raise_for_status()
+        if pool is not None:
+            for _ in range(pool.min_requests):
+                (await client.post(path, json=payload)).raise_for_status()
+            await pool.refill()
+            hits_before = pool.hits
+
+        async def one() -> None:
+            async with semaphore:
+                start_time = time.perf_counter()
+                response = await client.post(path, json=payload)
+                latencies.append((time.perf_counter() - start_time) * 1000)
+                response.raise_for_status()
+
+        await asyncio.gather(*(one() for _ in range(num_requests)))
+
+    row = {
+        "questions": num_questions,
+        "requests": num_requests,
+        "p50_ms": round(float(np.percentile(latencies, 50)), 2),
+        "p95_ms": round(float(np.percentile(latencies, 95)), 2),
+        "p99_ms": round(float(np.percentile(latencies, 99)), 2),
+    }
+    if pool is not None:
+        row["hit_rate"] = round((pool.hits - hits_before) / num_requests, 3)
+    return row
+
+
+def build_history(db_path: Path, num_problems: int, num_seen: int, num_log_rows: int, user_id: str) -> None:
+    """ユーザーの習熟度集計 (num_seen 問) と、参照されない大量の回答ログを作成"""
+    from app.services.exam.mastery import PROBLEM_MASTERY_TABLE, TAG_MASTERY_TABLE, MasteryStore
+
+    rng = np.random.default_rng(1)
+    conn = sqlite3.connect(db_path)
+    MasteryStore().ensure_tables(conn)
+    seen = rng.choice(num_problems, size=min(num_seen, num_problems), replace=False) + 1
+    attempts = rng.integers(1, 4, size=len(seen))
+    correct = rng.binomial(attempts, 0.6)
+    conn.executemany(
+        f"INSERT INTO {PROBLEM_MASTERY_TABLE} VALUES (?, ?, ?, ?, 0)",
+        [(user_id, int(p), int(a), int(c)) for p, a, c in zip(seen, attempts, correct)]
+    )
+    conn.executemany(
+        f"INSERT INTO {TAG_MASTERY_TABLE} VALUES (?, ?, ?, ?, 0)",
+        [(user_id, tag, 100, int(rng.integers(20, 95))) for tag in TAGS]
+    )
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS answer_logs (id INTEGER PRIMARY KEY, problem_id INTEGER NOT NULL, "
+        "is_correct BOOLEAN NOT NULL, time_ms INTEGER, answered_at DATETIME DEFAULT CURRENT_TIMESTAMP, user_id TEXT)"
+    )
+    conn.executemany(
+        "INSERT INTO answer_logs (problem_id, is_correct, user_id) VALUES (?, ?, ?)",
+        ((int(p), bool(c), f"user-{i % 5000}") for i, (p, c) in enumerate(zip(
+            rng.integers(1, num_problems + 1, size=num_log_rows), rng.random(num_log_rows) < 0.6
+        )))
+    )
+    conn.commit()
+    conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark /exam/generate latency')
+    parser.add_argument('--problems', type=int, default=20000, help='Synthetic problems in the database')
+    parser.add_argument('--sizes', default='100,200', help='Comma separated question counts')
+    parser.add_argument('--requests', type=int, default=200, help='Requests per size')
+    parser.add_argument('--concurrency', type=int, default=1, help='Concurrent requests')
+    parser.add_argument('--storage', choices=['compact', 'materialized'], default='compact', help='Exam storage mode')
+    parser.add_argument('--pool', action='store_true', help='Serve from pre-generated exam pools')
+    parser.add_argument('--pool-size', type=int, default=20, help='Exams kept ready per signature')
+    parser.add_argument('--adaptive', action='store_true', help='Benchmark /exam/generate/adaptive')
+    parser.add_argument('--seen', type=int, default=5000, help='Problems in the adaptive user history')
+    parser.add_argument('--log-rows', type=int, default=1000000, help='Answer log rows (adaptive only)')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = Path(tmp_dir) / "problems.db"
+        build_database(db_path, args.problems)
+
+        # 設定はインポート時に読まれるため、アプリのインポート前に差し替える
+        os.environ["DB_PATH"] = str(db_path)
+        os.environ["CHROMA_PATH"] = str(Path(tmp_dir) / "chroma")
+        os.environ["EXAM_STORAGE"] = args.storage
+        os.environ["EXAM_POOL_ENABLED"] = "true" if args.pool else "false"
+        os.environ["EXAM_POOL_SIZE"] = str(args.pool_size)
+        user_id = "bench-user" if args.adaptive else ""
+        if args.adaptive:
+            build_history(db_path, args.problems, args.seen, args.log_rows, user_id)
+        from fastapi import FastAPI
+        from app.api.endpoints import exam
+        from app.services.exam.generator import get_exam_generator
+        from app.services.exam.pool import get_exam_pool
+
+        app = FastAPI()
+        app.include_router(exam.router, prefix="/exam")
+
+        async def run_all() -> List[Dict[str, Any]]:
+            pool = await get_exam_pool() if args.pool else None
+            return [
+                await measure(app, int(size), args.requests, args.concurrency, pool, user_id)
+                for size in args.sizes.split(',') if size
+            ]
+
+        db_bytes_before = db_path.stat().st_size
+        rows = asyncio.run(run_all())
+        conn = sqlite3.connect(db_path)
+        stored_exams = conn.execute("SELECT COUNT(*) FROM exams").fetchone()[0]
+        stored_questions = conn.execute("SELECT COUNT(*) FROM exam_questions").fetchone()[0]
+        conn.close()
+        db_growth = db_path.stat().st_size - db_bytes_before
+        cache_stats = asyncio.run(get_exam_generator()).get_metrics()["question_cache"]
+
+    print(
+        f"problems={args.problems} concurrency={args.concurrency} pool={args.pool} storage={args.storage}"
+        + (f" adaptive seen={args.seen} log_rows={args.log_rows}" if args.adaptive else "")
+    )
+    headers = list(rows[0].keys())
+    print(" | ".join(f"{h:>10}" for h in headers))
+    for row in rows:
+        print(" | ".join(f"{str(row[h]):>10}" for h in headers))
+    print(
+        f"storage: {stored_exams} exams, {stored_questions} question rows, "
+        f"db +{db_growth / 1024:.0f} KiB ({db_growth / max(stored_exams, 1):.0f} B/exam)"
+    )
+    print(
+        f"question cache: hit_rate={cache_stats['hit_rate']} size={cache_stats['size']} "
+        f"bytes={cache_stats['bytes']} ({cache_stats['bytes'] / cache_stats['size'] if cache_stats['size'] else 0:.0f} B/question)"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+模試一括採点のスループット計測
+
+多数の答案 (既定 10,000 枚 × 200 問) を、1問ずつ比較して答案ごとに回答ログを
+書き込む素朴な方式と、正解表のベクトル比較 + 1回の executemany で書き込む
+ExamGrader.grade_bulk とで比較する。
+
+使用方法:
+    python -m app.scripts.benchmark_grading [--sheets 10000] [--questions 200] [--exams 30]
+"""
+
+import argparse
+import asyncio
+import logging
+import sqlite3
+import tempfile
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+
+logging.basicConfig(
+    level=logging.WARNING,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+AREAS = ["機械学習", "深層学習", "AI倫理", "数理統計", "強化学習"]
+
+
+class FixedExams:
+    """模試IDごとの出題順を返すだけの生成器 (模試テーブルを経由しない)"""
+
+    def __init__(self, exams: Dict[str, List[int]]):
+        self.exams = exams
+
+    async def exam_problem_ids(self, exam_id: str) -> Tuple[List[int], int]:
+        return self.exams[exam_id], 120
+
+
+def build_database(db_path: Path, num_problems: int, seed: int = 0) -> None:
+    rng = np.random.default_rng(seed)
+    conn = sqlite3.connect(db_path)
+    conn.executescript("""
+        CREATE TABLE problems (id INTEGER PRIMARY KEY, question TEXT, difficulty INTEGER, tags TEXT);
+        CREATE TABLE choices (
+            id INTEGER PRIMARY KEY, problem_id INTEGER, label TEXT, body TEXT, is_correct BOOLEAN
+        );
+        CREATE INDEX idx_choices_problem_id ON choices(problem_id);
+    """)
+    conn.executemany(
+        "INSERT INTO problems VALUES (?, ?, ?, ?)",
+        [
+            (i, f"問題{i}", int(rng.integers(1, 6)), AREAS[int(rng.integers(0, len(AREAS)))])
+            for i in range(1, num_problems + 1)
+        ]
+    )
+    correct = rng.integers(0, 4, size=num_problems + 1)
+    conn.executemany(
+        "INSERT INTO choices (problem_id, label, body, is_correct) VALUES (?, ?, ?, ?)",
+        [
+            (i, label, f"選択肢{label}", bool(k == correct[i]))
+            for i in range(1, num_problems + 1)
+            for k, label in enumerate("ABCD")
+        ]
+    )
+    conn.commit()
+    conn.close()
+
+
+def make_sheets(exams: Dict[str, List[int]], num_sheets: int, seed: int = 1) -> List[Dict[str, Any]]:
+    """9割の問題に回答した答案"""
+    rng = np.random.default_rng(seed)
+    exam_ids = list(exams)
+    sheets = []
+    for i in range(num_sheets):
+        exam_id = exam_ids[i % len(exam_ids)]
+        problem_ids = exams[exam_id]
+        labels = rng.integers(0, 4, size=len(problem_ids))
+        answered = rng.random(len(problem_ids)) < 0.9
+        sheets.append({
+            "exam_id": exam_id,
+            "answers": {pid: "ABCD"[k] for pid, k, a in zip(problem_ids, labels.tolist(), answered.tolist()) if a},
+        })
+    return sheets
+
+
+def grade_naive(db_path: Path, exams: Dict[str, List[int]], sheets: List[Dict[str, Any]]) -> Dict[str, float]:
+    """答案ごとに問題を1問ずつ照合し、答案ごとにコミットする"""
+    conn = sqlite3.connect(db_path)
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS answer_logs (id INTEGER PRIMARY KEY, problem_id INTEGER NOT NULL, "
+        "is_correct BOOLEAN NOT NULL, time_ms INTEGER, answered_at DATETIME DEFAULT CURRENT_TIMESTAMP)"
+    )
+    start_time = time.perf_counter()
+    keys: Dict[str, Dict[int, Tuple[str, int, str]]] = {}
+    for sheet in sheets:
+        exam_id = sheet["exam_id"]
+        if exam_id not in keys:
+            problem_ids = exams[exam_id]
+            placeholders = ",".join("?" for _ in problem_ids)
+            keys[exam_id] = {
+                pid: (label, difficulty, tags)
+                for pid, difficulty, tags, label in conn.execute(
+                    f"SELECT p.id, p.difficulty, p.tags, c.label FROM problems p "
+                    f"JOIN choices c ON c.problem_id = p.id AND c.is_correct WHERE p.id IN ({placeholders})",
+                    problem_ids
+                )
+            }
+        key = keys[exam_id]
+        by_tag: Dict[str, List[int]] = defaultdict(lambda: [0, 0])
+        by_level: Dict[int, List[int]] = defaultdict(lambda: [0, 0])
+        correct = 0
+        with conn:
+            for pid in exams[exam_id]:
+                label, difficulty, tags = key[pid]
+                answer = sheet["answers"].get(pid)
+                hit = answer == label
+                correct += hit
+                by_tag[tags][0] += hit
+                by_tag[tags][1] += 1
+                by_level[difficulty][0] += hit
+                by_level[difficulty][1] += 1
+                if answer is not None:
+                    conn.execute(
+                        "INSERT INTO answer_logs (problem_id, is_correct, time_ms) VALUES (?, ?, NULL)",
+                        (pid, hit)
+                    )
+    elapsed = time.perf_counter() - start_time
+    conn.close()
+    return {"strategy": "per-answer loop", "seconds": round(elapsed, 2)}
+
+
+async def grade_vectorized(db_path: Path, exams: Dict[str, List[int]], sheets: List[Dict[str, Any]]) -> Dict[str, Any]:
+    from app.services.exam.grading import BulkSubmission, ExamGrader
+    from app.services.exam.mastery import MasteryStore
+
+    grader = ExamGrader(FixedExams(exams), MasteryStore(db_path=str(db_path)), db_path=str(db_path))
+    start_time = time.perf_counter()
+    submission = BulkSubmission(sheets=sheets)
+    validated = time.perf_counter() - start_time
+    start_time = time.perf_counter()
+    result = await grader.grade_bulk(submission)
+    graded = time.perf_counter() - start_time
+    payload = result.model_dump_json()
+    total = time.perf_counter() - start_time
+    metrics = grader.get_metrics()
+    return {
+        "strategy": "grade_bulk",
+        "validate_s": round(validated, 2),
+        "seconds": round(graded, 2),
+        "with_json": round(total, 2),
+        "log_write_s": round(metrics["log_write_ms"]["sum"] / 1000, 2),
+        "response_mb": round(len(payload) / 1e6, 1),
+        "logged": result.logged_answers,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark bulk exam grading')
+    parser.add_argument('--sheets', type=int, default=10000, help='Answer sheets to grade')
+    parser.add_argument('--questions', type=int, default=200, help='Questions per exam')
+    parser.add_argument('--exams', type=int, default=30, help='Distinct exams among the sheets')
+    parser.add_argument('--problems', type=int, default=20000, help='Problems in the database')
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(2)
+    exams = {
+        f"exam-{i}": (rng.choice(args.problems, size=args.questions, replace=False) + 1).tolist()
+        for i in range(args.exams)
+    }
+    sheets = make_sheets(exams, args.sheets)
+
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        naive_db = Path(tmp_dir) / "naive.db"
+        build_database(naive_db, args.problems)
+        rows.append(grade_naive(naive_db, exams, sheets))
+
+        vector_db = Path(tmp_dir) / "vector.db"
+        build_database(vector_db, args.problems)
+        rows.append(asyncio.run(grade_vectorized(vector_db, exams, sheets)))
+
+    print(f"sheets={args.sheets} questions={args.questions} exams={args.exams}")
+    for row in rows:
+        print(" | ".join(f"{k}={v}" for k, v in row.items()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+"""
+模試問題ハイドレーション方式の比較
+
+選ばれた問題 (既定200問) の本文と選択肢を読み込む各方式について、
+レイテンシ・tracemalloc によるメモリ割り当て・選択肢の破損件数を比較する。
+
+- group_concat: 旧 legacy 実装 (GROUP_CONCAT をカンマで分割)
+- left_join_rows: 選択肢ごとに1行返す JOIN をPython側で組み立て
+- json_group_array: 現行実装 (ExamGenerator._hydrate)
+
+legacy_* は候補取得を含めた legacy の1リクエスト分
+(旧: 全問題を選択肢ごと GROUP_CONCAT、新: 候補列のみ取得し選ばれた問題だけ JSON で取得)。
+
+使用方法:
+    python -m app.scripts.benchmark_hydration [--problems 20000] [--questions 200] [--runs 100]
+"""
+
+import argparse
+import json
+import logging
+import random
+import sqlite3
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Sequence
+
+import numpy as np
+
+from app.scripts.benchmark_exam import build_database
+from app.services.exam.generator import ExamGenerator
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+Hydrator = Callable[[sqlite3.Connection, Sequence[int]], Dict[int, Dict[str, Any]]]
+
+
+def hydrate_group_concat(conn: sqlite3.Connection, problem_ids: Sequence[int]) -> Dict[int, Dict[str, Any]]:
+    """旧方式: GROUP_CONCAT した文字列をカンマで分割"""
+    placeholders = ','.join('?' for _ in problem_ids)
+    rows = conn.execute(f"""
+        SELECT p.id, p.question, p.difficulty, p.tags,
+               GROUP_CONCAT(c.label), GROUP_CONCAT(c.body), GROUP_CONCAT(c.is_correct)
+        FROM problems p
+        LEFT JOIN choices c ON p.id = c.problem_id
+        WHERE p.id IN ({placeholders})
+        GROUP BY p.id
+    """, list(problem_ids)).fetchall()
+
+    problems = {}
+    for problem_id, question, difficulty, tags, labels, bodies, corrects in rows:
+        choices = []
+        if labels:
+            for label, body, correct in zip(labels.split(','), bodies.split(','), str(corrects).split(',')):
+                choices.append({'label': label.strip(), 'body': body.strip(), 'is_correct': correct.strip() == '1'})
+        problems[problem_id] = {
+            'id': problem_id, 'question': question, 'choices': choices,
+            'difficulty': difficulty, 'tags': tags,
+        }
+    return problems
+
+
+def hydrate_left_join_rows(conn: sqlite3.Connection, problem_ids: Sequence[int]) -> Dict[int, Dict[str, Any]]:
+    """選択肢ごとに1行受け取り、Python側でまとめる"""
+    placeholders = ','.join('?' for _ in problem_ids)
+    rows = conn.execute(f"""
+        SELECT p.id, p.question, p.difficulty, p.tags, c.id, c.label, c.body, c.is_correct
+        FROM problems p
+        LEFT JOIN choices c ON c.problem_id = p.id
+        WHERE p.id IN ({placeholders})
+        ORDER BY p.id, c.label
+    """, list(problem_ids)).fetchall()
+
+    problems: Dict[int, Dict[str, Any]] = {}
+    for problem_id, question, difficulty, tags, choice_id, label, body, is_correct in rows:
+        problem = problems.get(problem_id)
+        if problem is None:
+            problem = problems[problem_id] = {
+                'id': problem_id, 'question': question, 'choices': [],
+                'difficulty': difficulty, 'tags': tags,
+            }
+        if choice_id is not None:
+            problem['choices'].append({'id': choice_id, 'label': label, 'body': body, 'is_correct': bool(is_correct)})
+    return problems
+
+
+def legacy_join_all(conn: sqlite3.Connection, problem_ids: Sequence[int]) -> Dict[int, Dict[str, Any]]:
+    """旧 legacy の流れ: 全候補を選択肢付きで取得してから選ばれた問題を分割"""
+    rows = conn.execute("""
+        SELECT p.*, GROUP_CONCAT(c.label) as choice_labels,
+               GROUP_CONCAT(c.body) as choice_bodies,
+               GROUP_CONCAT(c.is_correct) as choice_corrects
+        FROM problems p
+        LEFT JOIN choices c ON p.id = c.problem_id
+        GROUP BY p.id
+        ORDER BY p.id
+    """).fetchall()
+    columns = [d[0] for d in conn.execute("SELECT * FROM problems LIMIT 0").description]
+    candidates = {row[0]: dict(zip(columns + ['choice_labels', 'choice_bodies', 'choice_corrects'], row)) for row in rows}
+
+    problems = {}
+    for problem_id in problem_ids:
+        row = candidates[problem_id]
+        choices = [
+            {'label': label.strip(), 'body': body.strip(), 'is_correct': correct.strip() == '1'}
+            for label, body, correct in zip(
+                row['choice_labels'].split(','), row['choice_bodies'].split(','), str(row['choice_corrects']).split(',')
+            )
+        ]
+        problems[problem_id] = {
+            'id': problem_id, 'question': row['question'], 'choices': choices,
+            'difficulty': row['difficulty'], 'tags': row['tags'],
+        }
+    return problems
+
+
+def legacy_ids_then_json(conn: sqlite3.Connection, problem_ids: Sequence[int]) -> Dict[int, Dict[str, Any]]:
+    """新 legacy の流れ: 候補は問題列のみ、選択肢は選ばれた問題だけ JSON で取得"""
+    candidates = {
+        row[0]: row
+        for row in conn.execute("SELECT id, question, difficulty, tags FROM problems ORDER BY id").fetchall()
+    }
+    placeholders = ','.join('?' for _ in problem_ids)
+    choices = dict(conn.execute(f"""
+        SELECT problem_id,
+               json_group_array(json_object('label', label, 'body', body, 'is_correct', is_correct))
+        FROM (
+            SELECT problem_id, label, body, is_correct FROM choices
+            WHERE problem_id IN ({placeholders}) ORDER BY problem_id, label
+        )
+        GROUP BY problem_id
+    """, list(problem_ids)).fetchall())
+
+    problems = {}
+    for problem_id in problem_ids:
+        _, question, difficulty, tags = candidates[problem_id]
+        problems[problem_id] = {
+            'id': problem_id, 'question': question, 'choices': json.loads(choices.get(problem_id, '[]')),
+            'difficulty': difficulty, 'tags': tags,
+        }
+    return problems
+
+
+HYDRATORS: Dict[str, Hydrator] = {
+    'group_concat': hydrate_group_concat,
+    'left_join_rows': hydrate_left_join_rows,
+    'json_group_array': ExamGenerator._hydrate,
+    'legacy_join_all': legacy_join_all,
+    'legacy_ids_then_json': legacy_ids_then_json,
+}
+
+
+def measure(
+    conn: sqlite3.Connection,
+    hydrate: Hydrator,
+    id_sets: List[List[int]],
+    expected: Dict[int, List[str]]
+) -> Dict[str, Any]:
+    """レイテンシ・割り当て量・破損件数を計測"""
+    hydrate(conn, id_sets[0])  # ウォームアップ
+
+    latencies = []
+    for problem_ids in id_sets:
+        start_time = time.perf_counter()
+        hydrate(conn, problem_ids)
+        latencies.append((time.perf_counter() - start_time) * 1000)
+
+    # 割り当ては計測オーバーヘッドが大きいので1回分だけ別に測る
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    result = hydrate(conn, id_sets[0])
+    after = tracemalloc.take_snapshot()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    retained_blocks = sum(stat.count_diff for stat in after.compare_to(before, 'filename'))
+
+    corrupted = sum(
+        1 for problem_id, problem in result.items()
+        if sorted(choice['body'] for choice in problem['choices']) != expected[problem_id]
+    )
+    return {
+        'mean_ms': round(float(np.mean(latencies)), 3),
+        'p95_ms': round(float(np.percentile(latencies, 95)), 3),
+        'peak_kib': round(peak / 1024, 1),
+        'retained_blocks': retained_blocks,
+        'corrupted': corrupted,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare exam question hydration strategies')
+    parser.add_argument('--problems', type=int, default=20000, help='Synthetic problems in the database')
+    parser.add_argument('--questions', type=int, default=200, help='Problems hydrated per exam')
+    parser.add_argument('--runs', type=int, default=100, help='Exams hydrated per strategy')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = Path(tmp_dir) / "problems.db"
+        build_database(db_path, args.problems)
+
+        conn = sqlite3.connect(db_path)
+        # 3件に1件はカンマを含む本文にする (GROUP_CONCAT 方式では分割が壊れる)
+        conn.execute("UPDATE choices SET body = body || '、ただし, 例外あり' WHERE id % 3 = 0")
+        conn.commit()
+        expected: Dict[int, List[str]] = {}
+        for problem_id, body in conn.execute("SELECT problem_id, body FROM choices ORDER BY problem_id, body"):
+            expected.setdefault(problem_id, []).append(body)
+
+        rng = random.Random(0)
+        id_sets = [rng.sample(range(1, args.problems + 1), args.questions) for _ in range(args.runs)]
+
+        rows = []
+        for name, hydrate in HYDRATORS.items():
+            logger.info(f"Measuring {name}...")
+            rows.append({'strategy': name, **measure(conn, hydrate, id_sets, expected)})
+        conn.close()
+
+    headers = list(rows[0].keys())
+    print(" | ".join(f"{h:>16}" for h in headers))
+    for row in rows:
+        print(" | ".join(f"{str(row[h]):>16}" for h in headers))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+固定プロンプト前半 (指示文) のKV状態再利用によるプロンプト評価時間の計測
+
+パラフレーズと解説のリクエストを交互 (alternate) または同じテンプレートだけ
+(same) で送り、最初のトークンまでの時間 (max_tokens=1 なのでほぼプロンプト評価時間)
+を、前半の再利用なし (off) とあり (on) で比較する。交互の場合、llama-cpp 自身の
+直前プロンプトとの共通部分の再利用はほとんど効かない。
+
+使用方法:
+    python -m app.scripts.benchmark_prompt_prefix [--model path.gguf] [--requests 40] [--pattern alternate]
+"""
+
+import argparse
+import asyncio
+import logging
+from typing import Any, Dict, List
+
+import numpy as np
+
+from app.core.config import settings
+from app.services.llm.prompts import Prompt, explanation_prompt, paraphrase_prompt
+from app.services.llm.worker import GenerationParams, LLMWorkerPool, load_llama
+
+logging.basicConfig(
+    level=logging.WARNING,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+SAMPLE_TEXTS = [
+    "人工知能は機械学習と深層学習の技術を用いて、複雑な問題を解決する能力を持っています。",
+    "畳み込みニューラルネットワークは画像の局所的な特徴を捉えるのに適している。",
+    "過学習を防ぐために正則化やドロップアウトが用いられる。",
+    "強化学習ではエージェントが報酬を最大化するように行動を学習する。",
+]
+
+
+def build_prompts(count: int, pattern: str) -> List[Prompt]:
+    prompts = []
+    for i in range(count):
+        text = SAMPLE_TEXTS[i % len(SAMPLE_TEXTS)] + f" (例{i})"
+        if pattern == "alternate" and i % 2:
+            prompts.append(explanation_prompt(text, "正しい"))
+        else:
+            prompts.append(paraphrase_prompt(text))
+    return prompts
+
+
+async def measure(model: Any, prompts: List[Prompt], reuse: bool) -> Dict[str, Any]:
+    pool = LLMWorkerPool(lambda: model, prefix_cache_size=4 if reuse else 0)
+    params = GenerationParams(max_tokens=1, temperature=0.0)
+    # Start from an empty context so neither mode inherits the other's state
+    model.reset()
+    first_token_ms = []
+    try:
+        for prompt in prompts:
+            result = await pool.generate(prompt if reuse else prompt.text, params)
+            first_token_ms.append(result.first_token_ms)
+        prefix_cache = pool.get_metrics()["workers"][0]["prefix_cache"]
+    finally:
+        await pool.stop()
+
+    # The first request of each template pays for evaluating its prefix
+    steady = first_token_ms[2:]
+    return {
+        "reuse": "on" if reuse else "off",
+        "first_ms": round(first_token_ms[0], 1),
+        "p50_ms": round(float(np.percentile(steady, 50)), 1),
+        "p95_ms": round(float(np.percentile(steady, 95)), 1),
+        "mean_ms": round(float(np.mean(steady)), 1),
+        "reused_tokens": prefix_cache["reused_tokens"] if prefix_cache else 0,
+        "restores": prefix_cache["restored"] if prefix_cache else 0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark prompt prefix KV reuse')
+    parser.add_argument('--model', default=settings.LLM_MODEL_PATH, help='GGUF model path')
+    parser.add_argument('--requests', type=int, default=40, help='Requests per mode')
+    parser.add_argument('--pattern', choices=['alternate', 'same'], default='alternate',
+                        help='Alternate paraphrase/explanation templates or use only paraphrase')
+    args = parser.parse_args()
+
+    model = load_llama(args.model, settings.LLM_N_CTX, settings.LLM_N_THREADS, settings.LLM_N_BATCH)
+    prompts = build_prompts(max(args.requests, 3), args.pattern)
+    prefix_tokens = {
+        prompt.prefix: len(model.tokenize(prompt.prefix.encode("utf-8"))) for prompt in prompts[:2]
+    }
+    prompt_tokens = [len(model.tokenize(prompt.text.encode("utf-8"))) for prompt in prompts]
+
+    rows = [asyncio.run(measure(model, prompts, reuse)) for reuse in (False, True)]
+
+    print(
+        f"model={args.model} requests={len(prompts)} pattern={args.pattern} "
+        f"prompt_tokens(mean)={np.mean(prompt_tokens):.0f} prefix_tokens={sorted(prefix_tokens.values())}"
+    )
+    headers = list(rows[0].keys())
+    print(" | ".join(f"{h:>13}" for h in headers))
+    for row in rows:
+        print(" | ".join(f"{str(row[h]):>13}" for h in headers))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+模試セッション自動保存のスループット計測
+
+多数の受験者を同時にシミュレートし、回答保存 (PUT /exam/{exam_id}/answers) を
+ASGI 経由で繰り返す。毎回書き込むモード (flush間隔 0) と、メモリ上でまとめて
+一定間隔で書き込むモードの回答保存レイテンシ・スループット・DB書き込み行数を比較する。
+
+使用方法:
+    python -m app.scripts.benchmark_sessions [--examinees 300] [--questions 100] [--intervals 0,2]
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import random
+import sqlite3
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List
+
+import numpy as np
+
+logging.basicConfig(
+    level=logging.WARNING,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+
+def build_database(db_path: Path, num_examinees: int) -> List[str]:
+    """受験者ごとの模試行だけを持つデータベースを作成"""
+    exam_ids = [f"bench-{i}" for i in range(num_examinees)]
+    conn = sqlite3.connect(db_path)
+    conn.execute(
+        "CREATE TABLE exams (exam_id TEXT PRIMARY KEY, num_questions INTEGER, time_limit_min INTEGER, params TEXT)"
+    )
+    conn.executemany("INSERT INTO exams VALUES (?, 100, 120, '{}')", [(exam_id,) for exam_id in exam_ids])
+    conn.commit()
+    conn.close()
+    return exam_ids
+
+
+async def measure(
+    app: Any,
+    store: Any,
+    exam_ids: List[str],
+    num_questions: int,
+    think_ms: float
+) -> Dict[str, Any]:
+    """全受験者が num_questions 問に回答し終えるまでのレイテンシ分布"""
+    import httpx
+
+    latencies: List[float] = []
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        async def examinee(exam_id: str, rng: random.Random) -> None:
+            (await client.post(f"/exam/{exam_id}/session")).raise_for_status()
+            for problem_id in range(1, num_questions + 1):
+                await asyncio.sleep(rng.uniform(0, think_ms) / 1000)
+                start_time = time.perf_counter()
+                response = await client.put(
+                    f"/exam/{exam_id}/answers",
+                    json={"answers": {str(problem_id): rng.choice("ABCD")}}
+                )
+                latencies.append((time.perf_counter() - start_time) * 1000)
+                response.raise_for_status()
+            await store.finish(exam_id)
+
+        start_time = time.perf_counter()
+        await asyncio.gather(*(examinee(exam_id, random.Random(i)) for i, exam_id in enumerate(exam_ids)))
+        elapsed = time.perf_counter() - start_time
+
+    metrics = store.get_metrics()
+    return {
+        "flush_sec": store.flush_interval_sec,
+        "answers": len(latencies),
+        "answers_per_s": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(float(np.percentile(latencies, 50)), 2),
+        "p95_ms": round(float(np.percentile(latencies, 95)), 2),
+        "p99_ms": round(float(np.percentile(latencies, 99)), 2),
+        "rows_written": metrics["rows_written"],
+        "transactions": metrics["flushes"],
+    }
+
+
+def provide(value: Any) -> Callable[[], Awaitable[Any]]:
+    """依存関係の差し替え用 (ループ変数ではなく引数を閉じ込める)"""
+    async def dependency() -> Any:
+        return value
+    return dependency
+
+
+async def run(app: Any, store: Any, exam_ids: List[str], num_questions: int, think_ms: float) -> Dict[str, Any]:
+    """自動保存タスクを動かした状態で1モード分を計測"""
+    store.start_background_tasks()
+    try:
+        return await measure(app, store, exam_ids, num_questions, think_ms)
+    finally:
+        await store.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark exam session autosave')
+    parser.add_argument('--examinees', type=int, default=300, help='Concurrent simulated examinees')
+    parser.add_argument('--questions', type=int, default=100, help='Answers per examinee')
+    parser.add_argument('--think-ms', type=float, default=20.0, help='Max random delay between answers')
+    parser.add_argument('--intervals', default='0,2', help='Comma separated flush intervals (0 = write-through)')
+    args = parser.parse_args()
+
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        os.environ["CHROMA_PATH"] = str(Path(tmp_dir) / "chroma")
+        from fastapi import FastAPI
+        from app.api.endpoints import exam
+        from app.services.exam.session import ExamSessionStore, get_exam_session_store
+
+        for index, interval in enumerate(float(value) for value in args.intervals.split(',') if value):
+            db_path = Path(tmp_dir) / f"sessions-{index}.db"
+            exam_ids = build_database(db_path, args.examinees)
+            store = ExamSessionStore(db_path=str(db_path), flush_interval_sec=interval)
+
+            app = FastAPI()
+            app.include_router(exam.router, prefix="/exam")
+            app.dependency_overrides[get_exam_session_store] = provide(store)
+
+            rows.append(asyncio.run(run(app, store, exam_ids, args.questions, args.think_ms)))
+
+    print(f"examinees={args.examinees} questions={args.questions} think_ms<={args.think_ms}")
+    headers = list(rows[0].keys())
+    print(" | ".join(f"{h:>13}" for h in headers))
+    for row in rows:
+        print(" | ".join(f"{str(row[h]):>13}" for h in headers))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,544 @@
+#!/usr/bin/env python3
+"""
+問題バンク全体のパラフレーズ・解説をローカルLLMで一括生成するスクリプト
+
+problems テーブルを id 順にページングで読み込み、問題ごとのジョブを
+LLMワーカープールへ投入する。複数のモデルインスタンス (スロット) を
+並行して埋め、結果は problem_llm_outputs テーブルへまとめて書き込む。
+書き込みと同じトランザクションで進捗 (チェックポイント) を保存するため、
+中断しても次回は未処理の問題から再開される。生成済みの結果は
+LLM結果キャッシュにも保存され、APIからの同じリクエストはキャッシュから返る。
+
+スロットは llama-cpp-python の Llama API が1コンテキストで複数系列の
+バッチデコードを提供しないため、独立したコンテキストを持つインスタンスで実現する。
+
+使用方法:
+    python -m app.scripts.generate_llm_content [--kinds paraphrase,explanation] [--slots 2]
+        [--max-tokens 200000] [--max-minutes 60] [--retry-failed]
+"""
+
+import argparse
+import asyncio
+import functools
+import json
+import logging
+import sqlite3
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from fastapi import HTTPException
+from tqdm import tqdm
+
+from app.core.config import settings
+from app.services.llm.prompts import EXPLANATION_TEMPLATE, PARAPHRASE_TEMPLATE
+from app.services.llm.service import Completion, LLMService
+from app.services.llm.worker import PRIORITY_BATCH, LLMWorkerPool, load_llama
+
+# ログ設定
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+OUTPUT_TABLE = "problem_llm_outputs"
+CHECKPOINT_TABLE = "llm_batch_checkpoint"
+
+KIND_PARAPHRASE = "paraphrase"
+KIND_EXPLANATION = "explanation"
+TEMPLATES = {KIND_PARAPHRASE: PARAPHRASE_TEMPLATE, KIND_EXPLANATION: EXPLANATION_TEMPLATE}
+
+# 解答欄が空の問題は正解選択肢の本文を解答として使う
+PROBLEM_QUERY = """
+    SELECT
+        p.id,
+        p.question,
+        COALESCE(
+            NULLIF(p.answer, ''),
+            (SELECT c.body FROM choices c WHERE c.problem_id = p.id AND c.is_correct = 1 LIMIT 1)
+        ) AS answer
+    FROM problems p
+    WHERE p.question IS NOT NULL AND p.question != '' AND p.id > ?
+    ORDER BY p.id
+    LIMIT ?
+"""
+
+# (problem_id, kind, text, tokens, error)
+OutputRow = Tuple[int, str, Optional[str], int, Optional[str]]
+
+
+class BatchProgress:
+    """生成トークン数・処理件数・経過時間から tokens/sec と残り時間を算出"""
+
+    def __init__(self, total_jobs: int):
+        self.total_jobs = total_jobs
+        self.started_at = time.perf_counter()
+        self.jobs = 0
+        self.cached = 0
+        self.failed = 0
+        self.deferred = 0
+        self.tokens = 0
+
+    def record(self, completion: Optional[Completion]) -> None:
+        self.jobs += 1
+        if completion is None:
+            self.failed += 1
+        elif completion.cached:
+            self.cached += 1
+        else:
+            self.tokens += completion.tokens
+
+    def record_deferred(self) -> None:
+        """一時的なエラー (503/504) で次回に持ち越したジョブ"""
+        self.deferred += 1
+
+    @property
+    def elapsed_sec(self) -> float:
+        return time.perf_counter() - self.started_at
+
+    def as_dict(self) -> Dict[str, Any]:
+        elapsed = self.elapsed_sec
+        remaining = max(self.total_jobs - self.jobs, 0)
+        jobs_per_sec = self.jobs / elapsed if elapsed else 0.0
+        return {
+            'jobs': self.jobs,
+            'total_jobs': self.total_jobs,
+            'cached': self.cached,
+            'failed': self.failed,
+            'deferred': self.deferred,
+            'tokens': self.tokens,
+            'tokens_per_sec': round(self.tokens / elapsed, 2) if elapsed else 0.0,
+            'elapsed_sec': round(elapsed, 1),
+            'eta_sec': round(remaining / jobs_per_sec) if jobs_per_sec else None,
+        }
+
+
+class BatchGenerator:
+    def __init__(
+        self,
+        service: LLMService,
+        db_path: str = "./data/problems.db",
+        model_path: Optional[str] = None,
+        kinds: Sequence[str] = (KIND_PARAPHRASE,),
+        creativity: float = 0.7,
+        slots: int = 1,
+        page_size: int = 200,
+        commit_every: int = 50
+    ):
+        """
+        Args:
+            service: 生成に使うLLMサービス (ワーカープール・結果キャッシュ)
+            db_path: SQLiteデータベースのパス
+            model_path: 生成に使うモデル (結果に記録するモデル名。省略時は設定値)
+            kinds: 生成する種類 ("paraphrase" / "explanation")
+            creativity: パラフレーズの temperature
+            slots: 並行して埋めるモデルインスタンス数
+            page_size: 1回に読み込む問題数
+            commit_every: まとめて書き込む結果数
+        """
+        self.service = service
+        self.db_path = Path(db_path)
+        self.model_name = Path(model_path or settings.LLM_MODEL_PATH).name
+        self.kinds = list(kinds)
+        self.creativity = creativity
+        self.slots = max(1, slots)
+        self.page_size = page_size
+        self.commit_every = commit_every
+        # 種類とテンプレートの組ごとに進捗を管理 (テンプレート更新時は最初から)
+        self.job_name = ",".join(f"{kind}:{TEMPLATES[kind]}" for kind in sorted(self.kinds))
+        self._tables_ready = False
+
+    def _connect(self) -> sqlite3.Connection:
+        if not self.db_path.exists():
+            raise FileNotFoundError(f"Database not found: {self.db_path}")
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _ensure_tables(self, conn: sqlite3.Connection) -> None:
+        if self._tables_ready:
+            return
+        conn.execute(f"""
+            CREATE TABLE IF NOT EXISTS {OUTPUT_TABLE} (
+                problem_id INTEGER NOT NULL,
+                kind TEXT NOT NULL,
+                template TEXT NOT NULL,
+                model_name TEXT NOT NULL,
+                text TEXT,
+                tokens INTEGER NOT NULL DEFAULT 0,
+                error TEXT,
+                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (problem_id, kind, template)
+            )
+        """)
+        conn.execute(f"""
+            CREATE TABLE IF NOT EXISTS {CHECKPOINT_TABLE} (
+                job TEXT PRIMARY KEY,
+                last_problem_id INTEGER NOT NULL,
+                updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        conn.commit()
+        self._tables_ready = True
+
+    # === Checkpoint ===
+
+    def load_checkpoint(self) -> int:
+        """この id 以下の問題は全種類の生成が書き込み済み"""
+        conn = self._connect()
+        try:
+            self._ensure_tables(conn)
+            row = conn.execute(
+                f"SELECT last_problem_id FROM {CHECKPOINT_TABLE} WHERE job = ?", (self.job_name,)
+            ).fetchone()
+        finally:
+            conn.close()
+        return row[0] if row else -1
+
+    def reset(self, failed_only: bool) -> int:
+        """失敗した結果 (または全結果) と進捗を削除して再生成対象に戻す"""
+        conn = self._connect()
+        try:
+            self._ensure_tables(conn)
+            templates = [TEMPLATES[kind] for kind in self.kinds]
+            placeholders = ",".join("?" for _ in self.kinds)
+            with conn:
+                cursor = conn.execute(
+                    f"""
+                    DELETE FROM {OUTPUT_TABLE}
+                    WHERE kind IN ({placeholders}) AND template IN ({placeholders})
+                    {"AND error IS NOT NULL" if failed_only else ""}
+                    """,
+                    (*self.kinds, *templates)
+                )
+                conn.execute(f"DELETE FROM {CHECKPOINT_TABLE} WHERE job = ?", (self.job_name,))
+        finally:
+            conn.close()
+        return cursor.rowcount
+
+    # === Reading ===
+
+    def count_remaining(self, after_id: int) -> int:
+        """チェックポイント以降の問題数 (残りジョブ数の見積もり)"""
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                "SELECT COUNT(*) FROM problems WHERE question IS NOT NULL AND question != '' AND id > ?",
+                (after_id,)
+            ).fetchone()
+        finally:
+            conn.close()
+        return row[0] * len(self.kinds)
+
+    def read_page(self, after_id: int) -> Optional[Tuple[int, List[Tuple[Dict[str, Any], str]]]]:
+        """
+        after_id より後の1ページ分の問題を読み込む (キーセットページング)
+
+        Returns:
+            ページ末尾の問題 id と、そのページの未生成の (問題, 種類)。問題が残っていなければ None
+        """
+        conn = self._connect()
+        try:
+            self._ensure_tables(conn)
+            problems = [dict(row) for row in conn.execute(PROBLEM_QUERY, (after_id, self.page_size))]
+            if not problems:
+                return None
+            ids = [problem['id'] for problem in problems]
+            placeholders = ",".join("?" for _ in ids)
+            # チェックポイントより先に書き込み済みの結果 (中断前の並行処理分) は飛ばす
+            done = {
+                (row[0], row[1])
+                for row in conn.execute(
+                    f"""
+                    SELECT problem_id, kind FROM {OUTPUT_TABLE}
+                    WHERE problem_id IN ({placeholders})
+                      AND (kind, template) IN ({",".join("(?, ?)" for _ in self.kinds)})
+                    """,
+                    (*ids, *[value for kind in self.kinds for value in (kind, TEMPLATES[kind])])
+                )
+            }
+        finally:
+            conn.close()
+        jobs = [
+            (problem, kind)
+            for problem in problems
+            for kind in self.kinds
+            if (problem['id'], kind) not in done
+            and not (kind == KIND_EXPLANATION and not problem['answer'])
+        ]
+        return ids[-1], jobs
+
+    # === Writing ===
+
+    def write_outputs(self, rows: List[OutputRow], checkpoint: int) -> None:
+        """結果の一括書き込みと進捗保存を1トランザクションで行う"""
+        conn = self._connect()
+        try:
+            self._ensure_tables(conn)
+            with conn:
+                conn.executemany(
+                    f"""
+                    INSERT OR REPLACE INTO {OUTPUT_TABLE}
+                        (problem_id, kind, template, model_name, text, tokens, error, created_at)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+                    """,
+                    [
+                        (problem_id, kind, TEMPLATES[kind], self.model_name, text, tokens, error)
+                        for problem_id, kind, text, tokens, error in rows
+                    ]
+                )
+                conn.execute(
+                    f"""
+                    INSERT INTO {CHECKPOINT_TABLE} (job, last_problem_id, updated_at)
+                    VALUES (?, ?, CURRENT_TIMESTAMP)
+                    ON CONFLICT (job) DO UPDATE SET
+                        last_problem_id = MAX(last_problem_id, excluded.last_problem_id),
+                        updated_at = excluded.updated_at
+                    """,
+                    (self.job_name, checkpoint)
+                )
+        finally:
+            conn.close()
+
+    # === Generation ===
+
+    async def generate_one(self, problem: Dict[str, Any], kind: str) -> Completion:
+        if kind == KIND_PARAPHRASE:
+            return await self.service.paraphrase_completion(
+                problem['question'], self.creativity, priority=PRIORITY_BATCH
+            )
+        return await self.service.explanation_completion(
+            problem['question'], problem['answer'], priority=PRIORITY_BATCH
+        )
+
+    async def run(
+        self,
+        max_tokens: Optional[int] = None,
+        max_seconds: Optional[float] = None
+    ) -> Dict[str, Any]:
+        """
+        未生成の (問題, 種類) をすべて処理する
+
+        スロット数の2倍までのジョブを同時に投入してワーカーを常に埋める。
+        トークン数または時間の予算に達したら新規投入をやめ、実行中のジョブの
+        完了を待って書き込む。生成結果が不適切 (422) な場合だけ失敗として
+        記録し、キュー満杯 (503) やタイムアウト (504) のジョブは書き込まずに
+        チェックポイントをその手前に留め、次回の実行で再度生成する。
+        """
+        checkpoint = await asyncio.to_thread(self.load_checkpoint)
+        progress = BatchProgress(await asyncio.to_thread(self.count_remaining, checkpoint))
+        logger.info(f"Resuming '{self.job_name}' after problem {checkpoint} (~{progress.total_jobs} jobs)")
+
+        in_flight: Dict[int, int] = {}
+        pending: List[OutputRow] = []
+        # この id 以下の問題は全ジョブ投入済み
+        frontier = checkpoint
+        semaphore = asyncio.Semaphore(self.slots * 2)
+        tasks = set()
+        stop_reason = None
+        bar = tqdm(total=progress.total_jobs, desc="Generating", unit="jobs")
+
+        def low_water_mark() -> int:
+            # 実行中の最小 id より前はすべて完了している
+            return min(frontier, min(in_flight) - 1) if in_flight else frontier
+
+        async def flush() -> None:
+            nonlocal pending
+            rows, pending = pending, []
+            await asyncio.to_thread(self.write_outputs, rows, low_water_mark())
+
+        async def run_job(problem: Dict[str, Any], kind: str) -> None:
+            try:
+                try:
+                    completion = await self.generate_one(problem, kind)
+                    pending.append((problem['id'], kind, completion.text, completion.tokens, None))
+                except HTTPException as e:
+                    if e.status_code != 422:
+                        # 実行中のまま残し、チェックポイントがこの問題を越えないようにする
+                        logger.warning(f"Deferred {kind} of problem {problem['id']}: {e.detail}")
+                        progress.record_deferred()
+                        bar.update(1)
+                        return
+                    completion = None
+                    pending.append((problem['id'], kind, None, 0, str(e.detail)))
+                progress.record(completion)
+                in_flight[problem['id']] -= 1
+                if not in_flight[problem['id']]:
+                    del in_flight[problem['id']]
+                bar.update(1)
+                stats = progress.as_dict()
+                bar.set_postfix(tok_s=stats['tokens_per_sec'], tokens=stats['tokens'], failed=stats['failed'])
+                if len(pending) >= self.commit_every:
+                    await flush()
+            finally:
+                semaphore.release()
+
+        try:
+            while stop_reason is None:
+                page = await asyncio.to_thread(self.read_page, frontier)
+                if page is None:
+                    break
+                page_last_id, jobs = page
+                for problem, kind in jobs:
+                    if max_tokens is not None and progress.tokens >= max_tokens:
+                        stop_reason = f"token budget ({max_tokens}) reached"
+                    elif max_seconds is not None and progress.elapsed_sec >= max_seconds:
+                        stop_reason = f"time budget ({max_seconds:g}s) reached"
+                    if stop_reason is not None:
+                        frontier = max(frontier, problem['id'] - 1)
+                        break
+                    await semaphore.acquire()
+                    in_flight[problem['id']] = in_flight.get(problem['id'], 0) + 1
+                    task = asyncio.create_task(run_job(problem, kind))
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+                else:
+                    frontier = page_last_id
+            if tasks:
+                await asyncio.gather(*tasks)
+        finally:
+            # 中断 (Ctrl+C 等) でも完了済みの結果は書き込む
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            if pending or frontier > checkpoint:
+                await flush()
+            bar.close()
+
+        if stop_reason is not None:
+            logger.warning(f"Stopped early: {stop_reason}; rerun to continue")
+        if progress.deferred:
+            logger.warning(f"{progress.deferred} jobs hit transient errors; rerun to generate them")
+        return {**progress.as_dict(), 'checkpoint': low_water_mark(), 'stopped': stop_reason}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate paraphrases/explanations for the problem bank')
+    parser.add_argument(
+        '--kinds',
+        default=KIND_PARAPHRASE,
+        help='Comma separated outputs to generate: paraphrase, explanation (default: paraphrase)'
+    )
+    parser.add_argument(
+        '--db-path',
+        default=settings.DB_PATH,
+        help='SQLite database path'
+    )
+    parser.add_argument(
+        '--model',
+        default=settings.LLM_MODEL_PATH,
+        help='GGUF model path'
+    )
+    parser.add_argument(
+        '--slots',
+        type=int,
+        default=settings.LLM_POOL_WORKERS,
+        help='Model instances generating in parallel (default: LLM_POOL_WORKERS)'
+    )
+    parser.add_argument(
+        '--threads',
+        type=int,
+        default=settings.LLM_N_THREADS,
+        help='CPU threads shared by all slots (default: LLM_N_THREADS)'
+    )
+    parser.add_argument(
+        '--timeout',
+        type=float,
+        default=900,
+        help='Seconds a job may queue and generate before it is deferred to the next run (default: 900)'
+    )
+    parser.add_argument(
+        '--creativity',
+        type=float,
+        default=0.7,
+        help='Paraphrase temperature (default: 0.7)'
+    )
+    parser.add_argument(
+        '--commit-every',
+        type=int,
+        default=50,
+        help='Results written per transaction (default: 50)'
+    )
+    parser.add_argument(
+        '--max-tokens',
+        type=int,
+        help='Stop after generating this many tokens'
+    )
+    parser.add_argument(
+        '--max-minutes',
+        type=float,
+        help='Stop after this many minutes'
+    )
+    parser.add_argument(
+        '--retry-failed',
+        action='store_true',
+        help='Regenerate problems whose previous attempt failed'
+    )
+    parser.add_argument(
+        '--restart',
+        action='store_true',
+        help='Delete previous results of these kinds and start over'
+    )
+    parser.add_argument(
+        '--no-result-cache',
+        action='store_true',
+        help='Do not read or write the LLM result cache'
+    )
+
+    args = parser.parse_args()
+    kinds = [kind.strip() for kind in args.kinds.split(',') if kind.strip()]
+    unknown = sorted(set(kinds) - set(TEMPLATES))
+    if unknown:
+        parser.error(f"Unknown kinds: {', '.join(unknown)}")
+
+    slots = max(1, args.slots)
+    workers = LLMWorkerPool(
+        functools.partial(
+            load_llama,
+            args.model,
+            n_ctx=settings.LLM_N_CTX,
+            n_threads=max(1, args.threads // slots),
+            n_batch=settings.LLM_N_BATCH
+        ),
+        instances=slots,
+        max_queue=slots * 2,
+        timeout_sec=args.timeout,
+        prefix_cache_size=settings.LLM_PREFIX_CACHE_SIZE
+    )
+    service = LLMService(workers=workers, use_result_cache=not args.no_result_cache, model_path=args.model)
+    generator = BatchGenerator(
+        service,
+        db_path=args.db_path,
+        model_path=args.model,
+        kinds=kinds,
+        creativity=args.creativity,
+        slots=slots,
+        commit_every=args.commit_every
+    )
+
+    if args.restart or args.retry_failed:
+        removed = generator.reset(failed_only=not args.restart)
+        logger.info(f"Removed {removed} previous results")
+
+    async def run() -> Dict[str, Any]:
+        await service.initialize()
+        try:
+            return await generator.run(
+                max_tokens=args.max_tokens,
+                max_seconds=args.max_minutes * 60 if args.max_minutes else None
+            )
+        finally:
+            await service.shutdown()
+
+    try:
+        summary = asyncio.run(run())
+    except KeyboardInterrupt:
+        logger.warning("Interrupted; completed results were saved and the next run resumes from them")
+        return
+    logger.info(f"Batch result: {json.dumps(summary, ensure_ascii=False)}")
+    logger.info(f"Worker metrics: {json.dumps(workers.get_metrics()['workers'], ensure_ascii=False)}")
+
+
+if __name__ == "__main__":
+    main()
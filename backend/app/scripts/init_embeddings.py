@@ -2,22 +2,39 @@
 """
 G検定問題文をChromaDBにEmbeddingとして登録するスクリプト
 
+既定では差分登録を行う。問題ごとの内容ハッシュとモデル名を
+embedding_state テーブルに保持し、新規・変更された問題だけを
+エンコードし、削除された問題のベクトルを削除する。
+EMBEDDING_MODEL が変わった場合のみ全件を再構築する。
+
+処理は 読み込み → エンコード → 書き込み の3段パイプラインで、
+各段は有界キューで接続されたスレッドとして並行に動作する。
+
 使用方法:
-    python ingest_embeddings.py [--reset] [--batch-size 100]
+    python ingest_embeddings.py [--reset] [--full] [--batch-size 100]
 """
 
 import sqlite3
+import hashlib
 import logging
 import argparse
+import queue
+import threading
+import time
 from pathlib import Path
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterator, Optional, Tuple
 import json
 
 import chromadb
 from chromadb.config import Settings
-from sentence_transformers import SentenceTransformer
 from tqdm import tqdm
 
+from app.core.config import settings
+from app.services.embedding.collection_version import bump_collection_version
+from app.services.embedding.embedding_cache import EmbeddingDiskCache
+from app.services.embedding.encoder import ENCODER_BACKENDS, load_encoder
+from app.services.embedding.vector_index import NumpyVectorIndex, current_index_dir
+
 # ログ設定
 logging.basicConfig(
     level=logging.INFO,
@@ -25,18 +42,74 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+STATE_TABLE = "embedding_state"
+
+PROBLEM_COLUMNS = "id, question, answer, difficulty, tags, source_url, created_at"
+
+# パイプラインの段間で受け渡すジョブ種別
+JOB_ENCODE = "encode"
+JOB_UPDATE = "update"
+JOB_DELETE = "delete"
+_END = None
+
+class StageStats:
+    """パイプライン各段の処理件数と稼働時間"""
+    
+    def __init__(self, name: str):
+        self.name = name
+        self.docs = 0
+        self.busy_seconds = 0.0
+        self.started_at = time.perf_counter()
+        self.finished_at: Optional[float] = None
+    
+    def record(self, docs: int, seconds: float) -> None:
+        self.docs += docs
+        self.busy_seconds += seconds
+    
+    def finish(self) -> None:
+        self.finished_at = time.perf_counter()
+    
+    def as_dict(self) -> Dict[str, Any]:
+        wall = (self.finished_at or time.perf_counter()) - self.started_at
+        return {
+            'docs': self.docs,
+            'busy_sec': round(self.busy_seconds, 2),
+            'wall_sec': round(wall, 2),
+            # キュー待ちを除いた実処理スループット
+            'docs_per_sec': round(self.docs / self.busy_seconds, 1) if self.busy_seconds else 0.0,
+        }
+
+def content_hash(problem: Dict[str, Any]) -> str:
+    """Embedding対象テキストのハッシュ"""
+    return hashlib.sha256((problem.get('question') or '').encode('utf-8')).hexdigest()
+
+def metadata_hash(problem: Dict[str, Any]) -> str:
+    """Chromaメタデータに載せる項目のハッシュ"""
+    fields = [problem.get(key) for key in ('difficulty', 'tags', 'source_url', 'created_at')]
+    return hashlib.sha256(json.dumps(fields, ensure_ascii=False, default=str).encode('utf-8')).hexdigest()
+
 class EmbeddingIngestor:
     def __init__(
         self, 
         db_path: str = "./data/problems.db",
         chroma_path: str = "./data/chroma",
-        model_name: str = "sentence-transformers/all-MiniLM-L6-v2"
+        model_name: str = "sentence-transformers/all-MiniLM-L6-v2",
+        use_embedding_cache: bool = True,
+        embedding_cache_max_entries: int = 200_000,
+        encoder_backend: str = "torch",
+        onnx_cache_dir: str = "./cache/onnx",
+        onnx_quantize: bool = False
     ):
         """
         Args:
             db_path: SQLiteデータベースのパス
             chroma_path: ChromaDBデータディレクトリのパス  
             model_name: Embeddingモデル名
+            use_embedding_cache: 永続Embeddingキャッシュを使うか
+            embedding_cache_max_entries: キャッシュの最大件数
+            encoder_backend: エンコーダ ("torch" / "onnx")
+            onnx_cache_dir: ONNX書き出し先ディレクトリ
+            onnx_quantize: int8量子化したONNXモデルを使うか
         """
         self.db_path = Path(db_path)
         self.chroma_path = Path(chroma_path)
@@ -52,8 +125,19 @@ class EmbeddingIngestor:
         )
         
         # Embeddingモデル初期化
-        logger.info(f"Loading embedding model: {model_name}")
-        self.embedding_model = SentenceTransformer(model_name)
+        logger.info(f"Loading embedding model: {model_name} ({encoder_backend})")
+        self.embedding_model = load_encoder(
+            model_name, encoder_backend, onnx_cache_dir, onnx_quantize
+        )
+        # 量子化モデルは別のベクトル空間として扱う (差分状態・キャッシュのキーになる)
+        self.model_name = self.embedding_model.name
+        
+        # 永続Embeddingキャッシュ (リセット後の再構築をCPUではなくI/Oで済ませる)
+        self.embedding_cache = None
+        if use_embedding_cache:
+            self.embedding_cache = EmbeddingDiskCache(
+                str(self.chroma_path), self.model_name, embedding_cache_max_entries
+            )
         
         # Collection取得/作成
         self.collection = self._get_or_create_collection()
@@ -104,15 +188,50 @@ class EmbeddingIngestor:
         logger.info(f"Fetched {len(problems)} problems")
         return problems
     
-    def generate_embeddings(self, texts: List[str]) -> List[List[float]]:
+    def iter_problem_batches(self, batch_size: int = 500) -> Iterator[List[Dict[str, Any]]]:
+        """問題データを id 順に少しずつ取得 (全件をメモリに載せない)"""
+        if not self.db_path.exists():
+            raise FileNotFoundError(f"Database not found: {self.db_path}")
+        
+        last_id = -1
+        with sqlite3.connect(self.db_path) as conn:
+            conn.row_factory = sqlite3.Row
+            while True:
+                # キーセットページングで1ページずつ取得し、読み取りロックを長く保持しない
+                rows = conn.execute(
+                    f"""
+                    SELECT {PROBLEM_COLUMNS}
+                    FROM problems
+                    WHERE question IS NOT NULL AND question != '' AND id > ?
+                    ORDER BY id
+                    LIMIT ?
+                    """,
+                    (last_id, batch_size)
+                ).fetchall()
+                if not rows:
+                    return
+                last_id = rows[-1]['id']
+                yield [dict(row) for row in rows]
+    
+    def generate_embeddings(
+        self,
+        texts: List[str],
+        batch_size: int = 32,
+        show_progress_bar: bool = False
+    ) -> List[List[float]]:
         """テキストリストからEmbeddingを生成"""
-        logger.info(f"Generating embeddings for {len(texts)} texts")
-        embeddings = self.embedding_model.encode(
-            texts, 
-            convert_to_tensor=False,
-            show_progress_bar=True
-        )
-        return embeddings.tolist()
+        logger.debug(f"Generating embeddings for {len(texts)} texts")
+        
+        def encode(batch_texts: List[str]) -> List[List[float]]:
+            return self.embedding_model.encode(
+                batch_texts, 
+                batch_size=batch_size,
+                show_progress_bar=show_progress_bar
+            ).tolist()
+        
+        if self.embedding_cache is not None:
+            return self.embedding_cache.encode(texts, encode)
+        return encode(texts)
     
     def prepare_snippets(self, questions: List[str], max_length: int = 150) -> List[str]:
         """検索結果表示用のスニペットを生成"""
@@ -129,6 +248,16 @@ class EmbeddingIngestor:
         
         return snippets
     
+    def build_metadata(self, problem: Dict[str, Any], snippet: str) -> Dict[str, Any]:
+        """ChromaDBに保存するメタデータ (Noneは保存できないため空値に置換)"""
+        return {
+            'difficulty': problem.get('difficulty') or 1,
+            'tags': problem.get('tags') or '',
+            'source_url': problem.get('source_url') or '',
+            'created_at': str(problem.get('created_at') or ''),
+            'snippet': snippet
+        }
+    
     def upsert_to_chroma(
         self, 
         problems: List[Dict[str, Any]], 
@@ -147,16 +276,10 @@ class EmbeddingIngestor:
             snippets = self.prepare_snippets(questions)
             
             # メタデータ準備
-            metadatas = []
-            for problem in batch:
-                metadata = {
-                    'difficulty': problem.get('difficulty', 1),
-                    'tags': problem.get('tags', ''),
-                    'source_url': problem.get('source_url', ''),
-                    'created_at': problem.get('created_at', ''),
-                    'snippet': snippets[batch.index(problem)]
-                }
-                metadatas.append(metadata)
+            metadatas = [
+                self.build_metadata(problem, snippet)
+                for problem, snippet in zip(batch, snippets)
+            ]
             
             # Embedding生成
             embeddings = self.generate_embeddings(questions)
@@ -169,8 +292,278 @@ class EmbeddingIngestor:
                 metadatas=metadatas
             )
         
+        # 検索結果キャッシュを無効化
+        bump_collection_version(str(self.chroma_path))
         logger.info("Upsert completed successfully")
     
+    def _ensure_state_table(self, conn: sqlite3.Connection) -> None:
+        """差分管理用のサイドカーテーブル作成"""
+        conn.execute(f"""
+            CREATE TABLE IF NOT EXISTS {STATE_TABLE} (
+                problem_id INTEGER PRIMARY KEY,
+                content_hash TEXT NOT NULL,
+                metadata_hash TEXT NOT NULL,
+                model_name TEXT NOT NULL,
+                updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+    
+    def load_state(self) -> Dict[int, Tuple[str, str, str]]:
+        """登録済み問題の (content_hash, metadata_hash, model_name) を取得"""
+        if not self.db_path.exists():
+            return {}
+        with sqlite3.connect(self.db_path) as conn:
+            self._ensure_state_table(conn)
+            rows = conn.execute(
+                f"SELECT problem_id, content_hash, metadata_hash, model_name FROM {STATE_TABLE}"
+            ).fetchall()
+        return {row[0]: (row[1], row[2], row[3]) for row in rows}
+    
+    def save_state(self, problems: List[Dict[str, Any]], removed_ids: List[int]) -> None:
+        """登録・削除結果をサイドカーテーブルへ反映"""
+        with sqlite3.connect(self.db_path) as conn:
+            self._ensure_state_table(conn)
+            conn.executemany(
+                f"""
+                INSERT OR REPLACE INTO {STATE_TABLE}
+                    (problem_id, content_hash, metadata_hash, model_name, updated_at)
+                VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)
+                """,
+                [
+                    (problem['id'], content_hash(problem), metadata_hash(problem), self.model_name)
+                    for problem in problems
+                ]
+            )
+            conn.executemany(
+                f"DELETE FROM {STATE_TABLE} WHERE problem_id = ?",
+                [(problem_id,) for problem_id in removed_ids]
+            )
+            conn.commit()
+    
+    def clear_state(self) -> None:
+        """サイドカーテーブルを空にする (全件再構築時)"""
+        if not self.db_path.exists():
+            return
+        with sqlite3.connect(self.db_path) as conn:
+            self._ensure_state_table(conn)
+            conn.execute(f"DELETE FROM {STATE_TABLE}")
+            conn.commit()
+    
+    def sync_incremental(
+        self,
+        batch_size: int = 100,
+        encode_chunk_size: int = 1024,
+        encode_batch_size: int = 64,
+        queue_size: int = 4
+    ) -> Dict[str, Any]:
+        """
+        新規・変更分のみエンコードし、削除分をChromaDBから取り除く
+        
+        読み込み・エンコード・書き込みの各段を別スレッドで実行し、
+        有界キューで接続する。書き込み段はバッチごとに差分状態を保存するため、
+        中断しても次回は未処理分から再開される。
+        """
+        state = self.load_state()
+        
+        # モデル変更またはCollection消失時は全件再構築
+        stale_models = {model for _, _, model in state.values() if model != self.model_name}
+        if stale_models:
+            logger.warning(f"Embedding model changed ({', '.join(sorted(stale_models))} -> {self.model_name}); rebuilding")
+            self.reset_collection()
+            state = {}
+        elif state and self.collection.count() == 0:
+            logger.warning("Collection is empty but state exists; rebuilding")
+            self.clear_state()
+            state = {}
+        
+        encode_queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        write_queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        stop_event = threading.Event()
+        errors: List[BaseException] = []
+        stats = {name: StageStats(name) for name in ('reader', 'encoder', 'writer')}
+        counts = {'encoded': 0, 'metadata_updated': 0, 'deleted': 0, 'unchanged': 0}
+        
+        def put(target: queue.Queue, item: Any) -> None:
+            # 下流が失敗した場合に永久にブロックしないよう停止フラグを確認
+            while not stop_event.is_set():
+                try:
+                    target.put(item, timeout=0.5)
+                    return
+                except queue.Full:
+                    continue
+        
+        def run_stage(name: str, func, *args) -> threading.Thread:
+            def target():
+                try:
+                    func(*args)
+                except BaseException as e:  # noqa: BLE001 - 呼び出し元で再送出
+                    logger.error(f"Pipeline stage '{name}' failed: {e}")
+                    errors.append(e)
+                    stop_event.set()
+                finally:
+                    stats[name].finish()
+            thread = threading.Thread(target=target, name=f"ingest-{name}", daemon=True)
+            thread.start()
+            return thread
+        
+        def read_stage() -> None:
+            seen_ids = set()
+            start = time.perf_counter()
+            for problems in self.iter_problem_batches(batch_size=max(batch_size, 500)):
+                if stop_event.is_set():
+                    return
+                to_encode, metadata_only = [], []
+                for problem in problems:
+                    seen_ids.add(problem['id'])
+                    previous = state.get(problem['id'])
+                    if previous is None or previous[0] != content_hash(problem):
+                        to_encode.append(problem)
+                    elif previous[1] != metadata_hash(problem):
+                        metadata_only.append(problem)
+                    else:
+                        counts['unchanged'] += 1
+                stats['reader'].record(len(problems), time.perf_counter() - start)
+                if to_encode:
+                    put(encode_queue, (JOB_ENCODE, to_encode))
+                if metadata_only:
+                    put(encode_queue, (JOB_UPDATE, metadata_only))
+                start = time.perf_counter()
+            
+            removed_ids = sorted(set(state) - seen_ids)
+            if removed_ids:
+                put(encode_queue, (JOB_DELETE, removed_ids))
+            put(encode_queue, _END)
+        
+        def flush_encoded(pending: List[Dict[str, Any]]) -> None:
+            # 長さ順に並べて同程度の長さの文をまとめ、パディングを減らす
+            pending.sort(key=lambda problem: len(problem['question']))
+            start = time.perf_counter()
+            embeddings = self.generate_embeddings(
+                [problem['question'] for problem in pending],
+                batch_size=encode_batch_size
+            )
+            stats['encoder'].record(len(pending), time.perf_counter() - start)
+            for i in range(0, len(pending), batch_size):
+                put(write_queue, (JOB_ENCODE, (pending[i:i + batch_size], embeddings[i:i + batch_size])))
+        
+        def encode_stage() -> None:
+            pending: List[Dict[str, Any]] = []
+            while not stop_event.is_set():
+                try:
+                    job = encode_queue.get(timeout=0.5)
+                except queue.Empty:
+                    continue
+                if job is _END:
+                    break
+                kind, payload = job
+                if kind == JOB_ENCODE:
+                    pending.extend(payload)
+                    if len(pending) >= encode_chunk_size:
+                        flush_encoded(pending)
+                        pending = []
+                else:
+                    put(write_queue, job)
+            if pending and not stop_event.is_set():
+                flush_encoded(pending)
+            put(write_queue, _END)
+        
+        def write_stage() -> None:
+            progress = tqdm(desc="Ingesting", unit="docs")
+            try:
+                while not stop_event.is_set():
+                    try:
+                        job = write_queue.get(timeout=0.5)
+                    except queue.Empty:
+                        continue
+                    if job is _END:
+                        return
+                    kind, payload = job
+                    start = time.perf_counter()
+                    if kind == JOB_ENCODE:
+                        problems, embeddings = payload
+                        self._write_encoded(problems, embeddings)
+                        self.save_state(problems, [])
+                        counts['encoded'] += len(problems)
+                        done = len(problems)
+                    elif kind == JOB_UPDATE:
+                        self._write_metadata(payload)
+                        self.save_state(payload, [])
+                        counts['metadata_updated'] += len(payload)
+                        done = len(payload)
+                    else:
+                        for i in range(0, len(payload), batch_size):
+                            self.collection.delete(ids=[str(pid) for pid in payload[i:i + batch_size]])
+                        self.save_state([], payload)
+                        counts['deleted'] += len(payload)
+                        done = len(payload)
+                    stats['writer'].record(done, time.perf_counter() - start)
+                    progress.update(done)
+            finally:
+                progress.close()
+        
+        threads = [
+            run_stage('reader', read_stage),
+            run_stage('encoder', encode_stage),
+            run_stage('writer', write_stage),
+        ]
+        for thread in threads:
+            thread.join()
+        
+        changed = counts['encoded'] + counts['metadata_updated'] + counts['deleted']
+        if changed:
+            bump_collection_version(str(self.chroma_path))
+        
+        for name, stage in stats.items():
+            logger.info(f"Stage {name}: {json.dumps(stage.as_dict())}")
+        if self.embedding_cache is not None:
+            logger.info(f"Embedding cache: {json.dumps(self.embedding_cache.get_stats())}")
+        
+        if errors:
+            raise errors[0]
+        
+        return {**counts, 'stages': {name: stage.as_dict() for name, stage in stats.items()}}
+    
+    def _write_encoded(self, problems: List[Dict[str, Any]], embeddings: List[List[float]]) -> None:
+        """エンコード済みの問題をChromaDBへupsert"""
+        questions = [problem['question'] for problem in problems]
+        snippets = self.prepare_snippets(questions)
+        self.collection.upsert(
+            ids=[str(problem['id']) for problem in problems],
+            embeddings=embeddings,
+            documents=questions,
+            metadatas=[
+                self.build_metadata(problem, snippet)
+                for problem, snippet in zip(problems, snippets)
+            ]
+        )
+    
+    def _write_metadata(self, problems: List[Dict[str, Any]]) -> None:
+        """問題文が同じならEmbeddingは再利用し、メタデータだけ更新"""
+        snippets = self.prepare_snippets([problem['question'] for problem in problems])
+        self.collection.update(
+            ids=[str(problem['id']) for problem in problems],
+            metadatas=[
+                self.build_metadata(problem, snippet)
+                for problem, snippet in zip(problems, snippets)
+            ]
+        )
+    
+    def build_vector_index(self, index_path: str) -> int:
+        """ChromaDBの内容からNumPyベクトルインデックスを構築"""
+        logger.info(f"Building NumPy vector index at {index_path}")
+        
+        # 再エンコードせず、保存済みのEmbeddingをそのまま書き出す
+        data = self.collection.get(include=['embeddings', 'metadatas'])
+        count = NumpyVectorIndex.build(
+            index_path,
+            ids=data['ids'],
+            embeddings=data['embeddings'],
+            metadatas=data['metadatas'],
+            model_name=self.model_name
+        )
+        bump_collection_version(str(self.chroma_path))
+        return count
+    
     def reset_collection(self) -> None:
         """Collectionを削除して再作成"""
         logger.warning("Resetting 'problems' collection")
@@ -180,6 +573,9 @@ class EmbeddingIngestor:
             logger.warning(f"Could not delete collection: {e}")
         
         self.collection = self._get_or_create_collection()
+        # 差分情報も破棄して次回は全件登録
+        self.clear_state()
+        bump_collection_version(str(self.chroma_path))
     
     def get_collection_stats(self) -> Dict[str, Any]:
         """Collection統計情報を取得"""
@@ -198,26 +594,82 @@ def main():
         action='store_true',
         help='Reset collection before ingesting'
     )
+    parser.add_argument(
+        '--full',
+        action='store_true',
+        help='Re-encode every problem instead of only new/changed ones'
+    )
     parser.add_argument(
         '--batch-size',
         type=int,
         default=100,
         help='Batch size for upsert (default: 100)'
     )
+    parser.add_argument(
+        '--encode-chunk-size',
+        type=int,
+        default=1024,
+        help='Problems gathered and length-sorted per encode call (default: 1024)'
+    )
+    parser.add_argument(
+        '--encode-batch-size',
+        type=int,
+        default=64,
+        help='Model forward batch size (default: 64)'
+    )
+    parser.add_argument(
+        '--queue-size',
+        type=int,
+        default=4,
+        help='Max batches buffered between pipeline stages (default: 4)'
+    )
+    parser.add_argument(
+        '--no-embedding-cache',
+        action='store_true',
+        help='Do not read or write the persistent embedding cache'
+    )
     parser.add_argument(
         '--db-path',
-        default='./data/problems.db',
-        help='SQLite database path'
+        default=settings.DB_PATH,
+        help='SQLite database path (default: DB_PATH)'
     )
     parser.add_argument(
         '--chroma-path',
-        default='./data/chroma',
-        help='ChromaDB storage path'
+        default=settings.CHROMA_PATH,
+        help='ChromaDB storage path (default: CHROMA_PATH)'
     )
     parser.add_argument(
         '--model',
-        default='sentence-transformers/all-MiniLM-L6-v2',
-        help='Embedding model name'
+        default=settings.EMBEDDING_MODEL,
+        help='Embedding model name (default: EMBEDDING_MODEL)'
+    )
+    parser.add_argument(
+        '--encoder-backend',
+        choices=ENCODER_BACKENDS,
+        default=settings.EMBEDDING_BACKEND,
+        help='Encoder backend (default: EMBEDDING_BACKEND)'
+    )
+    parser.add_argument(
+        '--onnx-path',
+        default=settings.EMBEDDING_ONNX_PATH,
+        help='ONNX export directory (default: EMBEDDING_ONNX_PATH)'
+    )
+    parser.add_argument(
+        '--onnx-quantize',
+        action=argparse.BooleanOptionalAction,
+        default=settings.EMBEDDING_ONNX_QUANTIZE,
+        help='Use the dynamically int8-quantized ONNX model (default: EMBEDDING_ONNX_QUANTIZE)'
+    )
+    parser.add_argument(
+        '--vector-index-path',
+        default=settings.VECTOR_INDEX_PATH,
+        help='NumPy vector index output directory (default: VECTOR_INDEX_PATH)'
+    )
+    parser.add_argument(
+        '--vector-index',
+        action=argparse.BooleanOptionalAction,
+        default=settings.VECTOR_BACKEND == 'numpy',
+        help='Build the NumPy vector index (default: only when VECTOR_BACKEND=numpy)'
     )
     
     args = parser.parse_args()
@@ -227,22 +679,37 @@ def main():
         ingestor = EmbeddingIngestor(
             db_path=args.db_path,
             chroma_path=args.chroma_path,
-            model_name=args.model
+            model_name=args.model,
+            use_embedding_cache=not args.no_embedding_cache,
+            encoder_backend=args.encoder_backend,
+            onnx_cache_dir=args.onnx_path,
+            onnx_quantize=args.onnx_quantize
         )
         
         # Collection リセット (必要に応じて)
-        if args.reset:
+        if args.reset or args.full:
             ingestor.reset_collection()
         
-        # 問題データ取得
-        problems = ingestor.fetch_problems_from_db()
+        # 差分のみChromaDBへ反映 (読み込み・エンコード・書き込みを並行実行)
+        diff = ingestor.sync_incremental(
+            batch_size=args.batch_size,
+            encode_chunk_size=args.encode_chunk_size,
+            encode_batch_size=args.encode_batch_size,
+            queue_size=args.queue_size
+        )
+        logger.info(
+            f"Sync result: encoded={diff['encoded']}, metadata_updated={diff['metadata_updated']}, "
+            f"deleted={diff['deleted']}, unchanged={diff['unchanged']}"
+        )
         
-        if not problems:
+        if not (diff['encoded'] or diff['unchanged']):
             logger.warning("No problems found in database")
-            return
         
-        # ChromaDBにupsert
-        ingestor.upsert_to_chroma(problems, batch_size=args.batch_size)
+        # NumPyベクトルインデックスを構築 (numpyバックエンド利用時、変更があった場合・未作成の場合のみ)
+        if args.vector_index:
+            index_missing = current_index_dir(args.vector_index_path) is None
+            if index_missing or diff['encoded'] or diff['metadata_updated'] or diff['deleted']:
+                ingestor.build_vector_index(args.vector_index_path)
         
         # 統計情報表示
         stats = ingestor.get_collection_stats()
@@ -0,0 +1,115 @@
+"""
+Asyncio micro-batcher for search queries
+"""
+
+import asyncio
+import time
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from app.utils.metrics import Histogram, BATCH_SIZE_BUCKETS, LATENCY_BUCKETS_MS
+
+logger = logging.getLogger(__name__)
+
+BatchHandler = Callable[[List[Any]], Awaitable[List[Any]]]
+
+
+class _PendingItem:
+    """Queued item waiting for the next batch flush"""
+
+    __slots__ = ("item", "future", "enqueued_at")
+
+    def __init__(self, item: Any, future: asyncio.Future):
+        self.item = item
+        self.future = future
+        self.enqueued_at = time.perf_counter()
+
+
+class MicroBatcher:
+    """
+    Gather items submitted within a short window and process them together
+
+    A batch is flushed when ``window_ms`` has elapsed since the first queued
+    item or as soon as ``max_batch_size`` items are waiting, whichever comes
+    first. The handler receives the items in submission order and must return
+    one result per item.
+    """
+
+    def __init__(
+        self,
+        handler: BatchHandler,
+        window_ms: float = 5.0,
+        max_batch_size: int = 32
+    ):
+        self._handler = handler
+        self.window_ms = window_ms
+        self.max_batch_size = max(1, max_batch_size)
+
+        self._pending: List[_PendingItem] = []
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._tasks: set = set()
+
+        self.batch_size_histogram = Histogram(BATCH_SIZE_BUCKETS)
+        self.queue_wait_histogram = Histogram(LATENCY_BUCKETS_MS)
+
+    async def submit(self, item: Any) -> Any:
+        """Queue an item and wait for its individual result"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append(_PendingItem(item, future))
+
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.window_ms / 1000, self._flush)
+
+        return await future
+
+    def _flush(self) -> None:
+        """Hand the queued items to the handler as one batch"""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+
+        if not self._pending:
+            return
+
+        batch, self._pending = self._pending, []
+        task = asyncio.ensure_future(self._run_batch(batch))
+        # Keep a reference so the task is not garbage collected mid-flight
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run_batch(self, batch: List[_PendingItem]) -> None:
+        """Execute the handler and resolve every waiter"""
+        started_at = time.perf_counter()
+        self.batch_size_histogram.observe(len(batch))
+        for pending in batch:
+            self.queue_wait_histogram.observe((started_at - pending.enqueued_at) * 1000)
+
+        try:
+            results = await self._handler([pending.item for pending in batch])
+            if len(results) != len(batch):
+                raise RuntimeError(
+                    f"Batch handler returned {len(results)} results for {len(batch)} items"
+                )
+        except Exception as e:
+            logger.error(f"Batch of {len(batch)} items failed: {e}")
+            for pending in batch:
+                if not pending.future.done():
+                    pending.future.set_exception(e)
+            return
+
+        for pending, result in zip(batch, results):
+            if not pending.future.done():
+                pending.future.set_result(result)
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """Batch-size and queue-wait histograms"""
+        return {
+            "window_ms": self.window_ms,
+            "max_batch_size": self.max_batch_size,
+            "pending": len(self._pending),
+            "batch_size": self.batch_size_histogram.snapshot(),
+            "queue_wait_ms": self.queue_wait_histogram.snapshot(),
+        }
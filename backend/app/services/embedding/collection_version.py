@@ -0,0 +1,49 @@
+"""
+Version stamp for the 'problems' vector collection
+
+Writers (embedding ingestion, problem CRUD) bump the stamp whenever the
+collection or its source data changes. Readers compare it against the value
+they saw last to decide whether derived caches are stale. The stamp lives in
+a small file next to the ChromaDB data so that every process sharing
+``CHROMA_PATH`` (ingestion container, uvicorn workers) observes it.
+"""
+
+import logging
+import os
+import time
+import uuid
+from pathlib import Path
+from typing import Optional
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+VERSION_FILENAME = "collection.version"
+
+
+def _version_file(chroma_path: Optional[str] = None) -> Path:
+    return Path(chroma_path or settings.CHROMA_PATH) / VERSION_FILENAME
+
+
+def read_collection_version(chroma_path: Optional[str] = None) -> str:
+    """Current stamp ('' if the collection has never been stamped)"""
+    try:
+        return _version_file(chroma_path).read_text(encoding="utf-8").strip()
+    except OSError:
+        return ""
+
+
+def bump_collection_version(chroma_path: Optional[str] = None) -> str:
+    """Write a new stamp, invalidating caches derived from the collection"""
+    path = _version_file(chroma_path)
+    token = uuid.uuid4().hex[:8]
+    version = f"{time.time_ns()}-{token}"
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f"{VERSION_FILENAME}.{token}.tmp")
+        tmp_path.write_text(version, encoding="utf-8")
+        os.replace(tmp_path, path)
+    except OSError as e:
+        logger.warning(f"Could not write collection version stamp: {e}")
+    return version
@@ -0,0 +1,185 @@
+"""
+Persistent, content-addressed embedding cache
+
+Entries are keyed by (model name, SHA-256 of the normalized text) and stored
+as float32 blobs in a SQLite file under ``CHROMA_PATH``. Both the ingestion
+job and the online query encoder consult it before running the model, so
+rebuilding a wiped collection or re-encoding re-scraped text costs I/O
+instead of CPU. The number of entries is capped; the least recently used
+ones are evicted first.
+"""
+
+import hashlib
+import logging
+import sqlite3
+import threading
+import time
+import unicodedata
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+CACHE_FILENAME = "embedding_cache.sqlite3"
+
+# Extra rows removed per eviction so that inserts do not evict one row at a time
+EVICTION_SLACK = 0.05
+
+
+def normalize_text(text: str) -> str:
+    """Canonical form used for cache keys"""
+    return " ".join(unicodedata.normalize("NFKC", text).split())
+
+
+def text_hash(text: str) -> str:
+    """SHA-256 of the normalized text"""
+    return hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+
+
+class EmbeddingDiskCache:
+    """SQLite-backed embedding cache with an LRU size cap"""
+
+    def __init__(self, cache_dir: str, model_name: str, max_entries: int = 200_000):
+        self.path = Path(cache_dir) / CACHE_FILENAME
+        self.model_name = model_name
+        self.max_entries = max(1, max_entries)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS embedding_cache (
+                model TEXT NOT NULL,
+                text_hash TEXT NOT NULL,
+                dim INTEGER NOT NULL,
+                vector BLOB NOT NULL,
+                last_access REAL NOT NULL,
+                PRIMARY KEY (model, text_hash)
+            )
+        """)
+        self._conn.execute("""
+            CREATE INDEX IF NOT EXISTS idx_embedding_cache_last_access
+            ON embedding_cache(last_access)
+        """)
+        self._conn.commit()
+
+    def get_many(self, texts: Sequence[str]) -> List[Optional[List[float]]]:
+        """Cached vectors in input order (None for misses)"""
+        if not texts:
+            return []
+
+        hashes = [text_hash(text) for text in texts]
+        unique_hashes = list(dict.fromkeys(hashes))
+        found: Dict[str, List[float]] = {}
+
+        with self._lock:
+            # Stay well below SQLite's host-parameter limit
+            for start in range(0, len(unique_hashes), 500):
+                chunk = unique_hashes[start:start + 500]
+                placeholders = ",".join("?" for _ in chunk)
+                rows = self._conn.execute(
+                    f"""
+                    SELECT text_hash, vector FROM embedding_cache
+                    WHERE model = ? AND text_hash IN ({placeholders})
+                    """,
+                    (self.model_name, *chunk)
+                ).fetchall()
+                for digest, blob in rows:
+                    found[digest] = np.frombuffer(blob, dtype=np.float32).tolist()
+
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE embedding_cache SET last_access = ? WHERE model = ? AND text_hash = ?",
+                    [(now, self.model_name, digest) for digest in found]
+                )
+                self._conn.commit()
+
+        results = [found.get(digest) for digest in hashes]
+        hit_count = sum(1 for vector in results if vector is not None)
+        self.hits += hit_count
+        self.misses += len(results) - hit_count
+        return results
+
+    def put_many(self, texts: Sequence[str], vectors: Sequence[Sequence[float]]) -> None:
+        """Store vectors for the given texts, evicting old entries over the cap"""
+        if not texts:
+            return
+
+        now = time.time()
+        rows = []
+        for text, vector in zip(texts, vectors):
+            array = np.asarray(vector, dtype=np.float32)
+            rows.append((self.model_name, text_hash(text), int(array.shape[0]), array.tobytes(), now))
+
+        with self._lock:
+            self._conn.executemany(
+                """
+                INSERT OR REPLACE INTO embedding_cache (model, text_hash, dim, vector, last_access)
+                VALUES (?, ?, ?, ?, ?)
+                """,
+                rows
+            )
+            self._evict_locked()
+            self._conn.commit()
+
+    def _evict_locked(self) -> None:
+        """Drop least recently used rows once the cap is exceeded"""
+        count = self._conn.execute("SELECT COUNT(*) FROM embedding_cache").fetchone()[0]
+        if count <= self.max_entries:
+            return
+
+        excess = count - self.max_entries + int(self.max_entries * EVICTION_SLACK)
+        self._conn.execute(
+            """
+            DELETE FROM embedding_cache WHERE rowid IN (
+                SELECT rowid FROM embedding_cache ORDER BY last_access LIMIT ?
+            )
+            """,
+            (excess,)
+        )
+        logger.info(f"Evicted {excess} entries from embedding cache")
+
+    def encode(
+        self,
+        texts: Sequence[str],
+        encode_fn: Callable[[List[str]], Any]
+    ) -> List[List[float]]:
+        """Return embeddings for texts, running ``encode_fn`` only on cache misses"""
+        cached = self.get_many(texts)
+        missing = [i for i, vector in enumerate(cached) if vector is None]
+
+        if missing:
+            missing_texts = [texts[i] for i in missing]
+            encoded = encode_fn(missing_texts)
+            encoded = encoded.tolist() if hasattr(encoded, "tolist") else list(encoded)
+            self.put_many(missing_texts, encoded)
+            for i, vector in zip(missing, encoded):
+                cached[i] = vector
+
+        return cached
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Hit/miss counters and size"""
+        with self._lock:
+            size = self._conn.execute(
+                "SELECT COUNT(*) FROM embedding_cache WHERE model = ?", (self.model_name,)
+            ).fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            "size": size,
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
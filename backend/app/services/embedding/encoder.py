@@ -0,0 +1,229 @@
+"""
+Sentence encoders used for embeddings
+
+``TorchEncoder`` wraps ``SentenceTransformer``. ``OnnxEncoder`` serves the same
+model through onnxruntime: the transformer is exported once (optionally with
+dynamic int8 weight quantization) and pooling/normalization are replayed in
+NumPy, so inference and cold start do not need PyTorch. Both expose
+``encode(texts, batch_size) -> np.ndarray`` and a ``name`` that identifies
+the vector space they produce, used to key caches and ingestion state.
+"""
+
+import json
+import logging
+import os
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+ENCODER_BACKENDS = ("torch", "onnx")
+ONNX_MODEL_FILENAME = "model.onnx"
+ONNX_INT8_MODEL_FILENAME = "model.int8.onnx"
+ENCODER_CONFIG_FILENAME = "encoder_config.json"
+TOKENIZER_FILENAME = "tokenizer.json"
+
+
+class TextEncoder:
+    """Interface shared by encoder backends"""
+
+    name: str = ""
+
+    def encode(self, texts: Sequence[str], batch_size: int = 32, **kwargs: Any) -> np.ndarray:
+        raise NotImplementedError
+
+
+class TorchEncoder(TextEncoder):
+    """PyTorch SentenceTransformer encoder"""
+
+    def __init__(self, model_name: str):
+        from sentence_transformers import SentenceTransformer
+
+        self.name = model_name
+        self._model = SentenceTransformer(model_name, device="cpu")
+
+    def encode(self, texts: Sequence[str], batch_size: int = 32, **kwargs: Any) -> np.ndarray:
+        return self._model.encode(
+            list(texts),
+            batch_size=batch_size,
+            convert_to_numpy=True,
+            show_progress_bar=kwargs.get("show_progress_bar", False)
+        )
+
+
+def onnx_export_dir(cache_dir: str, model_name: str) -> Path:
+    """Directory holding the exported ONNX files for a model"""
+    return Path(cache_dir) / model_name.replace("/", "__")
+
+
+def export_onnx(model_name: str, output_dir: str, quantize: bool = False, opset: int = 14) -> Path:
+    """
+    Export the transformer of a SentenceTransformer model to ONNX
+
+    Writes the fp32 graph, an int8 dynamically quantized graph when requested,
+    the fast tokenizer and the pooling settings needed to reproduce
+    ``SentenceTransformer.encode``.
+    """
+    import torch
+    from sentence_transformers import SentenceTransformer
+    from sentence_transformers.models import Normalize, Pooling
+
+    out = Path(output_dir)
+    out.mkdir(parents=True, exist_ok=True)
+    model_path = out / ONNX_MODEL_FILENAME
+
+    st_model = SentenceTransformer(model_name, device="cpu")
+    tokenizer = st_model.tokenizer
+    transformer = st_model[0].auto_model.eval()
+
+    if not model_path.exists():
+        logger.info(f"Exporting {model_name} to ONNX at {model_path}")
+        sample = tokenizer(["ONNX export sample"], return_tensors="pt")
+        input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in sample]
+
+        class _Wrapper(torch.nn.Module):
+            def __init__(self, inner: Any):
+                super().__init__()
+                self.inner = inner
+
+            def forward(self, *inputs: Any) -> Any:
+                return self.inner(**dict(zip(input_names, inputs)))[0]
+
+        dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+        dynamic_axes["last_hidden_state"] = {0: "batch", 1: "sequence"}
+        with torch.no_grad():
+            torch.onnx.export(
+                _Wrapper(transformer),
+                tuple(sample[name] for name in input_names),
+                str(model_path),
+                input_names=input_names,
+                output_names=["last_hidden_state"],
+                dynamic_axes=dynamic_axes,
+                opset_version=opset,
+                do_constant_folding=True
+            )
+
+    if quantize and not (out / ONNX_INT8_MODEL_FILENAME).exists():
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        logger.info("Quantizing ONNX model weights to int8")
+        quantize_dynamic(str(model_path), str(out / ONNX_INT8_MODEL_FILENAME), weight_type=QuantType.QInt8)
+
+    tokenizer.save_pretrained(str(out))
+
+    pooling = next((module for module in st_model if isinstance(module, Pooling)), None)
+    pooling_config = pooling.get_config_dict() if pooling is not None else {}
+    if pooling_config.get("pooling_mode_cls_token"):
+        pooling_mode = "cls"
+    elif pooling_config.get("pooling_mode_max_tokens"):
+        pooling_mode = "max"
+    else:
+        pooling_mode = "mean"
+
+    config = {
+        "model_name": model_name,
+        "pooling_mode": pooling_mode,
+        "normalize": any(isinstance(module, Normalize) for module in st_model),
+        "max_seq_length": st_model.max_seq_length,
+        "pad_token": tokenizer.pad_token,
+        "pad_token_id": tokenizer.pad_token_id,
+    }
+    (out / ENCODER_CONFIG_FILENAME).write_text(json.dumps(config, indent=2), encoding="utf-8")
+    return out
+
+
+class OnnxEncoder(TextEncoder):
+    """onnxruntime encoder reproducing SentenceTransformer pooling"""
+
+    def __init__(
+        self,
+        model_name: str,
+        cache_dir: str,
+        quantize: bool = False,
+        num_threads: Optional[int] = None
+    ):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        export_dir = onnx_export_dir(cache_dir, model_name)
+        model_file = ONNX_INT8_MODEL_FILENAME if quantize else ONNX_MODEL_FILENAME
+        if not (export_dir / model_file).exists() or not (export_dir / ENCODER_CONFIG_FILENAME).exists():
+            export_onnx(model_name, str(export_dir), quantize=quantize)
+
+        self.config: Dict[str, Any] = json.loads(
+            (export_dir / ENCODER_CONFIG_FILENAME).read_text(encoding="utf-8")
+        )
+        # int8 weights change the vectors slightly, so they form their own vector space
+        self.name = f"{model_name}+onnx-int8" if quantize else model_name
+
+        self._tokenizer = Tokenizer.from_file(str(export_dir / TOKENIZER_FILENAME))
+        self._tokenizer.enable_truncation(max_length=self.config["max_seq_length"])
+        self._tokenizer.enable_padding(
+            pad_id=self.config["pad_token_id"], pad_token=self.config["pad_token"]
+        )
+
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = num_threads or os.cpu_count() or 1
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self._session = ort.InferenceSession(
+            str(export_dir / model_file), sess_options=options, providers=["CPUExecutionProvider"]
+        )
+        self._input_names = {i.name for i in self._session.get_inputs()}
+        logger.info(f"Loaded ONNX encoder {export_dir / model_file}")
+
+    def _pool(self, hidden: np.ndarray, mask: np.ndarray) -> np.ndarray:
+        mode = self.config["pooling_mode"]
+        if mode == "cls":
+            pooled = hidden[:, 0]
+        elif mode == "max":
+            pooled = np.where(mask[:, :, None] > 0, hidden, -1e9).max(axis=1)
+        else:
+            weights = mask[:, :, None].astype(np.float32)
+            pooled = (hidden * weights).sum(axis=1) / np.clip(weights.sum(axis=1), 1e-9, None)
+
+        if self.config["normalize"]:
+            norms = np.linalg.norm(pooled, axis=1, keepdims=True)
+            pooled = pooled / np.clip(norms, 1e-12, None)
+        return pooled.astype(np.float32)
+
+    def encode(self, texts: Sequence[str], batch_size: int = 32, **kwargs: Any) -> np.ndarray:
+        texts = list(texts)
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+
+        # Length-sorted batches minimise padding, as SentenceTransformer does
+        order = np.argsort([-len(text) for text in texts], kind="stable")
+        outputs: List[np.ndarray] = [None] * len(texts)  # type: ignore[list-item]
+
+        for start in range(0, len(texts), batch_size):
+            indices = order[start:start + batch_size]
+            encodings = self._tokenizer.encode_batch([texts[i] for i in indices])
+            feed = {
+                "input_ids": np.array([e.ids for e in encodings], dtype=np.int64),
+                "attention_mask": np.array([e.attention_mask for e in encodings], dtype=np.int64),
+            }
+            if "token_type_ids" in self._input_names:
+                feed["token_type_ids"] = np.array([e.type_ids for e in encodings], dtype=np.int64)
+
+            hidden = self._session.run(["last_hidden_state"], feed)[0]
+            pooled = self._pool(hidden, feed["attention_mask"])
+            for row, index in enumerate(indices):
+                outputs[index] = pooled[row]
+
+        return np.stack(outputs)
+
+
+def load_encoder(
+    model_name: str,
+    backend: str = "torch",
+    onnx_cache_dir: str = "./cache/onnx",
+    quantize: bool = False
+) -> TextEncoder:
+    """Create the configured encoder backend"""
+    if backend == "torch":
+        return TorchEncoder(model_name)
+    if backend == "onnx":
+        return OnnxEncoder(model_name, onnx_cache_dir, quantize=quantize)
+    raise ValueError(f"Unknown encoder backend: {backend} (expected one of {ENCODER_BACKENDS})")
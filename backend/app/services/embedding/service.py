@@ -3,26 +3,69 @@ Embedding service for similarity search
 """
 
 import time
+import asyncio
 import logging
-from typing import Dict, Any
+import unicodedata
+from typing import Dict, Any, List, NamedTuple, Optional
 
 import chromadb
 from chromadb.config import Settings
-from sentence_transformers import SentenceTransformer
 from fastapi import HTTPException
 
 from app.core.config import settings
+from app.core.executor import InferencePool, get_inference_pool
 from app.models.schemas import SearchResponse, SearchResult
+from app.services.embedding.batcher import MicroBatcher
+from app.services.embedding.collection_version import read_collection_version
+from app.services.embedding.embedding_cache import EmbeddingDiskCache
+from app.services.embedding.encoder import load_encoder
+from app.services.embedding.vector_index import (
+    ChromaVectorIndex,
+    NumpyVectorIndex,
+    VectorHit,
+    VectorIndex,
+)
+from app.utils.cache import TTLCache
 
 logger = logging.getLogger(__name__)
 
+class SearchQuery(NamedTuple):
+    """Single similarity query queued for batched execution"""
+    query: str
+    k: int
+    difficulty: Optional[int] = None
+
+def normalize_query(query: str) -> str:
+    """Canonical form of a query used for encoding and cache keys"""
+    normalized = unicodedata.normalize("NFKC", query)
+    return " ".join(normalized.split()).casefold()
+
 class EmbeddingService:
-    """Singleton embedding service for ChromaDB and sentence transformers"""
+    """Singleton embedding service for the vector index and sentence transformers"""
     
     _instance = None
     _chroma_client = None
     _embedding_model = None
     _collection = None
+    _index: Optional[VectorIndex] = None
+    _disk_cache: Optional[EmbeddingDiskCache] = None
+    _batcher = None
+    _collection_version = None
+    _init_lock = asyncio.Lock()
+    _version_lock = asyncio.Lock()
+    # Seconds spent per startup step, reported by the readiness endpoint
+    load_timings: Dict[str, float] = {}
+    
+    # Level 1: normalized query text -> embedding vector
+    _embedding_cache = TTLCache(
+        max_size=settings.SEARCH_EMBEDDING_CACHE_SIZE,
+        ttl_seconds=settings.SEARCH_EMBEDDING_CACHE_TTL_SEC
+    )
+    # Level 2: (normalized query, k, filters) -> SearchResponse
+    _result_cache = TTLCache(
+        max_size=settings.SEARCH_RESULT_CACHE_SIZE,
+        ttl_seconds=settings.SEARCH_RESULT_CACHE_TTL_SEC
+    )
     
     def __new__(cls):
         if cls._instance is None:
@@ -34,86 +77,283 @@ class EmbeddingService:
         chroma_path: str = None,
         model_name: str = None
     ):
-        """Initialize ChromaDB and embedding model"""
+        """Initialize the vector index and embedding model"""
         chroma_path = chroma_path or settings.CHROMA_PATH
         model_name = model_name or settings.EMBEDDING_MODEL
         
-        if self._chroma_client is None:
-            logger.info("Initializing ChromaDB client...")
-            self._chroma_client = chromadb.PersistentClient(
-                path=chroma_path,
-                settings=Settings(anonymized_telemetry=False)
+        # Concurrent first requests wait for a single initialization
+        async with self._init_lock:
+            # Index opening and model loading are independent; load them in parallel
+            await asyncio.gather(
+                self._ensure_index(chroma_path),
+                self._ensure_model(model_name)
             )
+            self._check_index_model()
             
-            try:
-                self._collection = self._chroma_client.get_collection("problems")
-                logger.info(f"Connected to 'problems' collection: {self._collection.count()} documents")
-            except Exception as e:
-                logger.error(f"Failed to get 'problems' collection: {e}")
-                raise HTTPException(
-                    status_code=500,
-                    detail="ChromaDB collection 'problems' not found. Run embedding ingestion first."
+            if self._disk_cache is None and settings.EMBEDDING_DISK_CACHE_ENABLED:
+                self._disk_cache = await self._get_pool().run(
+                    EmbeddingDiskCache,
+                    chroma_path,
+                    self._embedding_model.name,
+                    settings.EMBEDDING_DISK_CACHE_MAX_ENTRIES
                 )
+    
+    @property
+    def initialized(self) -> bool:
+        return self._index is not None and self._embedding_model is not None
+    
+    async def _ensure_index(self, chroma_path: str) -> None:
+        """Open the configured vector index (blocking work runs on the pool)"""
+        if self._index is not None:
+            return
+        start_time = time.perf_counter()
+        pool = self._get_pool()
+        if settings.VECTOR_BACKEND == "numpy":
+            await self._open_numpy_index(pool)
+        elif settings.VECTOR_BACKEND == "chroma":
+            await self._open_chroma_index(pool, chroma_path)
+        else:
+            raise ValueError(f"Unknown VECTOR_BACKEND: {settings.VECTOR_BACKEND}")
+        self.load_timings["vector_index"] = round(time.perf_counter() - start_time, 3)
+    
+    async def _ensure_model(self, model_name: str) -> None:
+        """Load the embedding encoder on the pool"""
+        if self._embedding_model is not None:
+            return
+        start_time = time.perf_counter()
+        logger.info(f"Loading embedding model: {model_name} ({settings.EMBEDDING_BACKEND})")
+        self._embedding_model = await self._get_pool().run(
+            load_encoder,
+            model_name,
+            settings.EMBEDDING_BACKEND,
+            settings.EMBEDDING_ONNX_PATH,
+            settings.EMBEDDING_ONNX_QUANTIZE
+        )
+        self.load_timings["embedding_model"] = round(time.perf_counter() - start_time, 3)
+        logger.info("Embedding model loaded successfully")
+    
+    async def warm_up(self) -> None:
+        """Run one encode and index lookup so the first request does not pay for lazy setup"""
+        start_time = time.perf_counter()
+        await self._get_pool().run(self._search_batch_sync, [SearchQuery("warm-up", 1)])
+        self.load_timings["embedding_warmup"] = round(time.perf_counter() - start_time, 3)
+    
+    async def _open_chroma_index(self, pool: InferencePool, chroma_path: str) -> None:
+        """Connect to the ChromaDB 'problems' collection"""
+        logger.info("Initializing ChromaDB client...")
+        self._chroma_client = await pool.run(
+            chromadb.PersistentClient,
+            path=chroma_path,
+            settings=Settings(anonymized_telemetry=False)
+        )
+        
+        try:
+            self._collection = await pool.run(self._chroma_client.get_collection, "problems")
+            document_count = await pool.run(self._collection.count)
+            logger.info(f"Connected to 'problems' collection: {document_count} documents")
+        except Exception as e:
+            logger.error(f"Failed to get 'problems' collection: {e}")
+            raise HTTPException(
+                status_code=500,
+                detail="ChromaDB collection 'problems' not found. Run embedding ingestion first."
+            )
         
-        if self._embedding_model is None:
-            logger.info(f"Loading embedding model: {model_name}")
-            self._embedding_model = SentenceTransformer(model_name)
-            logger.info("Embedding model loaded successfully")
+        self._index = ChromaVectorIndex(self._collection)
     
-    async def search_similar(self, query: str, k: int = 5) -> SearchResponse:
+    def _check_index_model(self) -> None:
+        """Refuse a NumPy index whose vectors were built by a different encoder"""
+        if not isinstance(self._index, NumpyVectorIndex):
+            return
+        try:
+            self._index.bind_model(self._embedding_model.name)
+        except ValueError as e:
+            # Stay not ready (warm-up retries) rather than rank with incomparable vectors
+            logger.error(f"Refusing vector index: {e}")
+            self._index = None
+            raise HTTPException(status_code=500, detail=str(e))
+    
+    async def _open_numpy_index(self, pool: InferencePool) -> None:
+        """Memory-map the NumPy vector index built by the ingestion job"""
+        logger.info(
+            f"Opening NumPy vector index at {settings.VECTOR_INDEX_PATH} "
+            f"(dtype={settings.VECTOR_INDEX_DTYPE})"
+        )
+        try:
+            self._index = await pool.run(
+                NumpyVectorIndex.load,
+                settings.VECTOR_INDEX_PATH,
+                dtype=settings.VECTOR_INDEX_DTYPE,
+                rerank_factor=settings.VECTOR_RERANK_FACTOR
+            )
+        except (OSError, ValueError) as e:
+            logger.error(f"Failed to open vector index: {e}")
+            raise HTTPException(status_code=500, detail=str(e))
+    
+    @staticmethod
+    def _get_pool() -> InferencePool:
+        """Shared inference pool for model and vector store calls"""
+        return get_inference_pool("embedding")
+    
+    def _get_batcher(self) -> MicroBatcher:
+        """Lazily create the query micro-batcher"""
+        if self._batcher is None:
+            EmbeddingService._batcher = MicroBatcher(
+                self._search_batch,
+                window_ms=settings.SEARCH_BATCH_WINDOW_MS,
+                max_batch_size=settings.SEARCH_BATCH_MAX_SIZE
+            )
+        return self._batcher
+    
+    async def _sync_collection_version(self) -> None:
+        """Reload the index and drop cached search results if the collection changed since last seen"""
+        version = await asyncio.to_thread(read_collection_version)
+        if version == self._collection_version:
+            return
+        # One request reloads; the others wait and then see the new version
+        async with self._version_lock:
+            if version == self._collection_version:
+                return
+            if self._index is not None:
+                try:
+                    await asyncio.to_thread(self._index.refresh)
+                except (OSError, ValueError) as e:
+                    # Keep serving the loaded index; the next request retries the reload
+                    logger.warning(f"Vector index reload failed; keeping the loaded index: {e}")
+                    return
+            if self._collection_version is not None:
+                logger.info("Collection version changed; clearing search result cache")
+            self._result_cache.clear()
+            EmbeddingService._collection_version = version
+    
+    def invalidate_search_cache(self) -> None:
+        """Clear cached search results (in-process writers)"""
+        self._result_cache.clear()
+    
+    async def search_similar(
+        self,
+        query: str,
+        k: int = 5,
+        difficulty: Optional[int] = None
+    ) -> SearchResponse:
         """Execute similarity search"""
-        if self._collection is None or self._embedding_model is None:
+        if not self.initialized:
             raise HTTPException(status_code=500, detail="Service not initialized")
         
         start_time = time.time()
+        normalized = normalize_query(query)
+        cache_key = (normalized, k, difficulty)
         
-        try:
-            # Generate query embedding
-            query_embedding = self._embedding_model.encode([query]).tolist()[0]
-            
-            # Search in ChromaDB
-            results = self._collection.query(
-                query_embeddings=[query_embedding],
-                n_results=k,
-                include=['metadatas', 'documents', 'distances']
-            )
-            
-            # Format results
-            search_results = []
-            if results['ids'] and results['ids'][0]:
-                for i, doc_id in enumerate(results['ids'][0]):
-                    distance = results['distances'][0][i]
-                    score = max(0.0, 1.0 - distance)  # Convert distance to similarity score
-                    
-                    metadata = results['metadatas'][0][i]
-                    snippet = metadata.get('snippet', results['documents'][0][i][:150] + "...")
-                    
-                    search_results.append(SearchResult(
-                        id=doc_id,
-                        score=round(score, 4),
-                        snippet=snippet,
-                        difficulty=metadata.get('difficulty'),
-                        tags=metadata.get('tags')
-                    ))
-            
+        await self._sync_collection_version()
+        cached = self._result_cache.get(cache_key)
+        if cached is not None:
             total_time_ms = round((time.time() - start_time) * 1000, 2)
-            
-            return SearchResponse(
-                query=query,
-                results=search_results,
-                total_time_ms=total_time_ms,
-                k=k
+            return cached.model_copy(update={"query": query, "total_time_ms": total_time_ms})
+        
+        try:
+            # Queries arriving within the batch window share one encode/query pass
+            search_results = await self._get_batcher().submit(
+                SearchQuery(normalized, k, difficulty)
             )
-            
+        except HTTPException:
+            raise
         except Exception as e:
             logger.error(f"Search failed: {e}")
             raise HTTPException(status_code=500, detail=f"Search failed: {str(e)}")
+        
+        total_time_ms = round((time.time() - start_time) * 1000, 2)
+        
+        response = SearchResponse(
+            query=query,
+            results=search_results,
+            total_time_ms=total_time_ms,
+            k=k
+        )
+        self._result_cache.set(cache_key, response)
+        return response
+    
+    async def _search_batch(self, queries: List[SearchQuery]) -> List[List[SearchResult]]:
+        """Run a query batch on the inference pool"""
+        return await self._get_pool().run(self._search_batch_sync, queries)
+    
+    def _search_batch_sync(self, queries: List[SearchQuery]) -> List[List[SearchResult]]:
+        """Encode a batch of queries in one pass and run one multi-query lookup per filter"""
+        # Identical queries within a batch are encoded only once
+        unique_texts = list(dict.fromkeys(q.query for q in queries))
+        embeddings = dict(zip(unique_texts, self._encode_queries(unique_texts)))
+        
+        groups: Dict[Optional[int], List[SearchQuery]] = {}
+        for q in queries:
+            groups.setdefault(q.difficulty, []).append(q)
+        
+        formatted = {}
+        for difficulty, group in groups.items():
+            texts = list(dict.fromkeys(q.query for q in group))
+            hits = self._index.query(
+                [embeddings[text] for text in texts],
+                k=max(q.k for q in group),
+                difficulty=difficulty
+            )
+            for text, row_hits in zip(texts, hits):
+                formatted[(text, difficulty)] = self._format_results(row_hits)
+        
+        return [formatted[(q.query, q.difficulty)][:q.k] for q in queries]
+    
+    def _encode_queries(self, texts: List[str]) -> List[List[float]]:
+        """Encode query texts, consulting the level-one embedding cache first"""
+        vectors = {}
+        missing = []
+        for text in texts:
+            vector = self._embedding_cache.get(text)
+            if vector is None:
+                missing.append(text)
+            else:
+                vectors[text] = vector
+        
+        if missing:
+            # Level-one misses fall back to the persistent cache before the model
+            if self._disk_cache is not None:
+                encoded = self._disk_cache.encode(missing, self._embedding_model.encode)
+            else:
+                encoded = self._embedding_model.encode(missing).tolist()
+            for text, vector in zip(missing, encoded):
+                self._embedding_cache.set(text, vector)
+                vectors[text] = vector
+        
+        return [vectors[text] for text in texts]
+    
+    @staticmethod
+    def _format_results(hits: List[VectorHit]) -> List[SearchResult]:
+        """Convert index hits into SearchResult objects"""
+        search_results = []
+        for hit in hits:
+            snippet = hit.metadata.get('snippet', hit.document[:150] + "...")
+            search_results.append(SearchResult(
+                id=hit.id,
+                score=round(hit.score, 4),
+                snippet=snippet,
+                difficulty=hit.metadata.get('difficulty'),
+                tags=hit.metadata.get('tags')
+            ))
+        return search_results
+    
+    def get_metrics(self) -> Dict[str, Any]:
+        """Search pipeline metrics"""
+        return {
+            "batcher": self._get_batcher().get_metrics(),
+            "executor": self._get_pool().get_metrics(),
+            "backend": settings.VECTOR_BACKEND,
+            "encoder": self._embedding_model.name if self._embedding_model is not None else None,
+            "indexed_vectors": self._index.count() if self._index is not None else 0,
+            "embedding_cache": self._embedding_cache.get_stats(),
+            "result_cache": self._result_cache.get_stats(),
+            "disk_cache": self._disk_cache.get_stats() if self._disk_cache is not None else None,
+        }
 
 # Global instance
 _embedding_service = EmbeddingService()
 
 async def get_embedding_service() -> EmbeddingService:
     """Dependency injection for FastAPI"""
-    if _embedding_service._chroma_client is None:
+    if not _embedding_service.initialized:
         await _embedding_service.initialize()
     return _embedding_service
\ No newline at end of file
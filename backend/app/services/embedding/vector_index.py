@@ -0,0 +1,392 @@
+"""
+Vector index backends for similarity search
+
+``ChromaVectorIndex`` delegates to the ChromaDB collection. ``NumpyVectorIndex``
+keeps every embedding in one contiguous float32 matrix stored as a
+memory-mapped ``.npy`` file; uvicorn workers opening the same file share a
+single page-cached copy. Every build is written to its own directory and
+published by rewriting the ``CURRENT`` pointer file. Both answer batched
+queries and return hits in the same shape so ``EmbeddingService`` does not
+care which one is active.
+
+The NumPy index can also scan a float16 or int8 (per-vector scale) copy of
+the matrix and re-score only the top ``k * rerank_factor`` candidates
+against the full-precision rows, which are then read lazily from disk.
+"""
+
+import json
+import logging
+import os
+import shutil
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+VECTORS_FILENAME = "vectors.npy"
+SIDECAR_FILENAME = "index_meta.json"
+# Names the generation directory readers should open
+CURRENT_FILENAME = "CURRENT"
+VERSION_PREFIX = "v"
+QUANTIZED_FILENAMES = {"float16": "vectors.f16.npy", "int8": "vectors.i8.npy"}
+INT8_SCALES_FILENAME = "scales.i8.npy"
+INDEX_DTYPES = ("float32", "float16", "int8")
+
+# Rows converted to float32 at a time while scanning a quantized matrix
+SCAN_BLOCK_ROWS = 16384
+
+
+class VectorHit(NamedTuple):
+    """Single search hit"""
+    id: str
+    score: float
+    document: str
+    metadata: Dict[str, Any]
+
+
+class VectorIndex:
+    """Interface shared by search backends"""
+
+    def query(
+        self,
+        embeddings: Sequence[Sequence[float]],
+        k: int,
+        difficulty: Optional[int] = None
+    ) -> List[List[VectorHit]]:
+        """Top-k hits for each query embedding"""
+        raise NotImplementedError
+
+    def count(self) -> int:
+        """Number of indexed vectors"""
+        raise NotImplementedError
+
+    def refresh(self) -> None:
+        """Pick up changes written by the ingestion job"""
+
+
+class ChromaVectorIndex(VectorIndex):
+    """Search backed by the ChromaDB 'problems' collection"""
+
+    def __init__(self, collection: Any):
+        self._collection = collection
+
+    def query(
+        self,
+        embeddings: Sequence[Sequence[float]],
+        k: int,
+        difficulty: Optional[int] = None
+    ) -> List[List[VectorHit]]:
+        results = self._collection.query(
+            query_embeddings=[list(e) for e in embeddings],
+            n_results=k,
+            where={"difficulty": difficulty} if difficulty is not None else None,
+            include=['metadatas', 'documents', 'distances']
+        )
+
+        hits = []
+        for row in range(len(embeddings)):
+            row_hits = []
+            if results['ids'] and results['ids'][row]:
+                for i, doc_id in enumerate(results['ids'][row]):
+                    distance = results['distances'][row][i]
+                    row_hits.append(VectorHit(
+                        id=doc_id,
+                        score=max(0.0, 1.0 - distance),  # Convert distance to similarity score
+                        document=results['documents'][row][i] or "",
+                        metadata=results['metadatas'][row][i] or {}
+                    ))
+            hits.append(row_hits)
+        return hits
+
+    def count(self) -> int:
+        return self._collection.count()
+
+
+def _normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    """L2-normalize rows so that dot products equal cosine similarity"""
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def quantize_int8(matrix: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Symmetric per-vector int8 quantization; returns (codes, scales)"""
+    scales = np.abs(matrix).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    codes = np.clip(np.rint(matrix / scales[:, None]), -127, 127).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+class _LoadedIndex(NamedTuple):
+    """Arrays of one index generation, swapped in as a unit by ``refresh``"""
+    version: str
+    vectors: np.ndarray
+    scan_vectors: np.ndarray
+    scales: Optional[np.ndarray]
+    ids: List[str]
+    metadatas: List[Dict[str, Any]]
+    difficulty: np.ndarray
+
+
+def current_index_dir(index_path: str) -> Optional[Path]:
+    """Directory of the published index generation (None if nothing was built yet)"""
+    path = Path(index_path)
+    try:
+        name = (path / CURRENT_FILENAME).read_text(encoding="utf-8").strip()
+    except OSError:
+        name = ""
+    if name:
+        return path / name
+    # Indexes built before versioned directories keep their files at the top level
+    if (path / SIDECAR_FILENAME).exists():
+        return path
+    return None
+
+
+def _remove_old_versions(path: Path, keep: Sequence[str]) -> None:
+    """Delete superseded generations; the previous one stays for readers still mapping it"""
+    for entry in path.glob(f"{VERSION_PREFIX}*"):
+        if entry.is_dir() and entry.name not in keep:
+            shutil.rmtree(entry, ignore_errors=True)
+
+
+class NumpyVectorIndex(VectorIndex):
+    """Brute-force cosine search over a memory-mapped matrix"""
+
+    def __init__(self, index_path: str, dtype: str = "float32", rerank_factor: int = 4):
+        if dtype not in INDEX_DTYPES:
+            raise ValueError(f"Unsupported index dtype: {dtype}")
+        self.index_path = Path(index_path)
+        self.dtype = dtype
+        self.rerank_factor = max(1, rerank_factor)
+        self._state: Optional[_LoadedIndex] = None
+        self.model_name: Optional[str] = None
+        # Encoder that queries come from; generations built by another model are refused
+        self.expected_model: Optional[str] = None
+        self.refresh()
+
+    @classmethod
+    def load(
+        cls,
+        index_path: str,
+        dtype: str = "float32",
+        rerank_factor: int = 4
+    ) -> "NumpyVectorIndex":
+        return cls(index_path, dtype=dtype, rerank_factor=rerank_factor)
+
+    @staticmethod
+    def build(
+        index_path: str,
+        ids: Sequence[str],
+        embeddings: Any,
+        metadatas: Sequence[Dict[str, Any]],
+        model_name: str = ""
+    ) -> int:
+        """Write a new index generation and publish it atomically; returns the number of vectors"""
+        path = Path(index_path)
+        path.mkdir(parents=True, exist_ok=True)
+
+        matrix = np.asarray(embeddings, dtype=np.float32)
+        if len(ids) == 0:
+            matrix = matrix.reshape(0, matrix.shape[-1] if matrix.ndim == 2 else 0)
+        if matrix.ndim != 2 or len(matrix) != len(ids) or len(ids) != len(metadatas):
+            raise ValueError("ids, embeddings and metadatas must have matching lengths")
+        matrix = np.ascontiguousarray(_normalize_rows(matrix), dtype=np.float32)
+
+        sidecar = {
+            "model_name": model_name,
+            "rows": int(matrix.shape[0]),
+            "dim": int(matrix.shape[1]),
+            "ids": [str(i) for i in ids],
+            "metadatas": list(metadatas),
+        }
+
+        # Quantized copies are cheap to derive, so every dtype is always available
+        codes, scales = quantize_int8(matrix)
+        arrays = {
+            VECTORS_FILENAME: matrix,
+            QUANTIZED_FILENAMES["float16"]: matrix.astype(np.float16),
+            QUANTIZED_FILENAMES["int8"]: codes,
+            INT8_SCALES_FILENAME: scales,
+        }
+
+        # Each build goes to a fresh directory; readers only follow CURRENT, which is
+        # swapped in one rename, so they never see files from two generations
+        version = f"{VERSION_PREFIX}{time.time_ns()}-{uuid.uuid4().hex[:8]}"
+        version_dir = path / version
+        version_dir.mkdir()
+        for name, array in arrays.items():
+            with open(version_dir / name, "wb") as f:
+                np.save(f, array)
+        (version_dir / SIDECAR_FILENAME).write_text(json.dumps(sidecar, ensure_ascii=False), encoding="utf-8")
+
+        previous = current_index_dir(index_path)
+        tmp_current = path / f"{CURRENT_FILENAME}.{version}.tmp"
+        tmp_current.write_text(version, encoding="utf-8")
+        os.replace(tmp_current, path / CURRENT_FILENAME)
+        _remove_old_versions(path, keep=[version, previous.name if previous is not None else ""])
+
+        logger.info(f"Built vector index with {len(ids)} vectors at {version_dir}")
+        return len(ids)
+
+    def refresh(self) -> None:
+        """(Re)open the index files if a new generation was published"""
+        directory = current_index_dir(str(self.index_path))
+        if directory is None or not (directory / VECTORS_FILENAME).exists():
+            raise FileNotFoundError(
+                f"Vector index not found at {self.index_path}. Run embedding ingestion first."
+            )
+
+        sidecar_path = directory / SIDECAR_FILENAME
+        if directory == self.index_path:
+            version = f"legacy:{sidecar_path.stat().st_mtime_ns}"
+        else:
+            version = directory.name
+        if self._state is not None and version == self._state.version:
+            return
+
+        sidecar = json.loads(sidecar_path.read_text(encoding="utf-8"))
+        self._check_model(sidecar.get("model_name"))
+        vectors = np.load(directory / VECTORS_FILENAME, mmap_mode="r")
+        if vectors.shape[0] != sidecar["rows"] or (vectors.shape[0] and vectors.shape[1] != sidecar["dim"]):
+            raise ValueError(
+                f"Vector index is inconsistent: {vectors.shape} vectors, "
+                f"{sidecar['rows']} ids of dim {sidecar['dim']}"
+            )
+
+        scan_vectors, scales = vectors, None
+        if self.dtype != "float32":
+            scan_vectors = np.load(directory / QUANTIZED_FILENAMES[self.dtype], mmap_mode="r")
+            if self.dtype == "int8":
+                scales = np.load(directory / INT8_SCALES_FILENAME)
+
+        metadatas = sidecar["metadatas"]
+        # One assignment, so a query running on another thread sees either generation whole
+        self._state = _LoadedIndex(
+            version=version,
+            vectors=vectors,
+            scan_vectors=scan_vectors,
+            scales=scales,
+            ids=sidecar["ids"],
+            metadatas=metadatas,
+            difficulty=np.array([m.get("difficulty") or 0 for m in metadatas], dtype=np.int16),
+        )
+        self.model_name = sidecar.get("model_name")
+        logger.info(f"Loaded vector index: {len(metadatas)} vectors from {directory}")
+
+    def bind_model(self, model_name: str) -> None:
+        """Require the loaded and every later generation to come from ``model_name``"""
+        self._check_model(self.model_name, expected=model_name)
+        self.expected_model = model_name
+
+    def _check_model(self, model_name: Optional[str], expected: Optional[str] = None) -> None:
+        expected = expected or self.expected_model
+        # Older builds did not record the model; they are accepted as before
+        if expected and model_name and model_name != expected:
+            raise ValueError(
+                f"Vector index at {self.index_path} was built with {model_name}, "
+                f"but queries are encoded with {expected}. Run embedding ingestion first."
+            )
+
+    @property
+    def vectors(self) -> np.ndarray:
+        """Full-precision (memory-mapped) matrix of the loaded generation"""
+        return self._state.vectors
+
+    def count(self) -> int:
+        return len(self._state.ids)
+
+    def resident_bytes(self) -> int:
+        """Bytes touched by a full scan (the float32 rows are read only on re-rank)"""
+        state = self._state
+        scales_bytes = state.scales.nbytes if state.scales is not None else 0
+        return int(state.scan_vectors.nbytes + scales_bytes)
+
+    def _scores(self, state: _LoadedIndex, queries: np.ndarray) -> np.ndarray:
+        """Cosine similarity (approximate for quantized dtypes) against every vector"""
+        if self.dtype == "float32":
+            return queries @ state.vectors.T
+
+        total = len(state.scan_vectors)
+        scores = np.empty((len(queries), total), dtype=np.float32)
+        for start in range(0, total, SCAN_BLOCK_ROWS):
+            block = np.asarray(state.scan_vectors[start:start + SCAN_BLOCK_ROWS], dtype=np.float32)
+            scores[:, start:start + len(block)] = queries @ block.T
+        if state.scales is not None:
+            scores *= state.scales
+        return scores
+
+    def query(
+        self,
+        embeddings: Sequence[Sequence[float]],
+        k: int,
+        difficulty: Optional[int] = None
+    ) -> List[List[VectorHit]]:
+        queries = _normalize_rows(np.atleast_2d(np.asarray(embeddings, dtype=np.float32)))
+        state = self._state
+        if len(state.ids) == 0:
+            return [[] for _ in range(len(queries))]
+
+        scores = self._scores(state, queries)
+        if difficulty is not None:
+            scores[:, state.difficulty != difficulty] = -np.inf
+
+        if self.dtype == "float32":
+            return [self._top_k(state, np.arange(len(row)), row, k) for row in scores]
+        return [self._rerank(state, query, row, k) for query, row in zip(queries, scores)]
+
+    def _rerank(self, state: _LoadedIndex, query: np.ndarray, approx_scores: np.ndarray, k: int) -> List[VectorHit]:
+        """Re-score the best quantized candidates against full-precision vectors"""
+        n_candidates = min(len(approx_scores), k * self.rerank_factor)
+        candidates = np.argpartition(-approx_scores, n_candidates - 1)[:n_candidates]
+        candidates = candidates[np.isfinite(approx_scores[candidates])]
+        if len(candidates) == 0:
+            return []
+
+        # Sorted row order keeps the lazy reads from the memory map sequential
+        candidates.sort()
+        exact_scores = state.vectors[candidates] @ query
+        return self._top_k(state, candidates, exact_scores, k)
+
+    def _top_k(self, state: _LoadedIndex, indices: np.ndarray, scores: np.ndarray, k: int) -> List[VectorHit]:
+        """Hits for the k highest finite scores, best first"""
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+
+        hits = []
+        for position in top:
+            score = float(scores[position])
+            if not np.isfinite(score):
+                break
+            index = int(indices[position])
+            metadata = state.metadatas[index]
+            hits.append(VectorHit(
+                id=state.ids[index],
+                score=max(0.0, score),
+                document=metadata.get("snippet", ""),
+                metadata=metadata
+            ))
+        return hits
+
+
+def recall_at_k(
+    exact: VectorIndex,
+    approximate: VectorIndex,
+    queries: Any,
+    k: int = 10
+) -> float:
+    """Mean fraction of the exact top-k ids that the approximate index also returns"""
+    exact_hits = exact.query(queries, k)
+    approx_hits = approximate.query(queries, k)
+
+    recalls = []
+    for expected, actual in zip(exact_hits, approx_hits):
+        expected_ids = {hit.id for hit in expected}
+        if expected_ids:
+            recalls.append(len(expected_ids & {hit.id for hit in actual}) / len(expected_ids))
+    return float(np.mean(recalls)) if recalls else 0.0
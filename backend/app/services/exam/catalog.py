@@ -0,0 +1,418 @@
+"""
+Resident problem catalog for exam generation
+
+Holds only what candidate selection needs - problem ids, difficulties and
+tag membership - in NumPy arrays, with one boolean bitmap per difficulty
+level and per tag. Filtering candidates is then bitmap algebra instead of a
+``problems JOIN choices`` scan, and question/choice bodies are fetched only
+for the problems finally selected. ``ProblemCRUD`` keeps the catalog up to
+date through ``notify_problem_created`` / ``notify_problem_deleted``; writes
+from other processes are picked up through the collection version stamp.
+
+``fingerprint()`` identifies the live content (ids, difficulties, tags), so
+a seeded exam composed against one fingerprint can be re-derived later from
+the same catalog or from a ``to_bytes()`` snapshot of it.
+"""
+
+import asyncio
+import hashlib
+import io
+import itertools
+import logging
+import sqlite3
+import threading
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.core.config import settings
+from app.services.embedding.collection_version import read_collection_version
+
+logger = logging.getLogger(__name__)
+
+MIN_CAPACITY = 1024
+
+# Distinguishes catalog instances in derived caches (id() can be reused after GC)
+_catalog_uids = itertools.count(1)
+
+
+def parse_tags(tags: Optional[str]) -> List[str]:
+    """Split the comma-separated ``problems.tags`` column"""
+    if not tags:
+        return []
+    return [tag.strip() for tag in tags.split(",") if tag.strip()]
+
+
+class CatalogSnapshot(NamedTuple):
+    """Immutable copy of the catalog arrays taken at one revision"""
+    revision: int
+    ids: np.ndarray
+    alive: np.ndarray
+    difficulty_masks: Dict[int, np.ndarray]
+    tag_masks: Dict[str, np.ndarray]
+
+    def mask(self, tags: Optional[Sequence[str]] = None, difficulty: Optional[int] = None) -> np.ndarray:
+        """Bitmap of live problems having any of ``tags`` and the given difficulty"""
+        if tags:
+            result = np.zeros(len(self.ids), dtype=bool)
+            for tag in tags:
+                result |= self.tag_mask(tag)
+        else:
+            result = self.alive.copy()
+        if difficulty is not None:
+            result &= self.difficulty_mask(difficulty)
+        return result
+
+    def candidate_ids(self, tags: Optional[Sequence[str]] = None, difficulty: Optional[int] = None) -> np.ndarray:
+        return self.ids_for(self.mask(tags, difficulty))
+
+    def ids_for(self, mask: np.ndarray) -> np.ndarray:
+        return self.ids[mask]
+
+    def tag_mask(self, tag: str) -> np.ndarray:
+        mask = self.tag_masks.get(tag)
+        return mask if mask is not None else np.zeros(len(self.ids), dtype=bool)
+
+    def difficulty_mask(self, level: int) -> np.ndarray:
+        mask = self.difficulty_masks.get(int(level))
+        return mask if mask is not None else np.zeros(len(self.ids), dtype=bool)
+
+
+class ProblemCatalog:
+    """Array-backed index of problem ids by difficulty and tag"""
+
+    def __init__(self, db_path: Optional[str] = None):
+        self.db_path = db_path or settings.DB_PATH
+        self.loaded = False
+        # Bumped on every change so derived data can tell it is stale
+        self.revision = 0
+        self.collection_version: Optional[str] = None
+        self.uid = next(_catalog_uids)
+        self._lock = threading.Lock()
+        self._fingerprint: Optional[Tuple[int, str]] = None
+        self._reset(0)
+
+    def _reset(self, capacity: int) -> None:
+        capacity = max(capacity, MIN_CAPACITY)
+        self._size = 0
+        self._ids = np.zeros(capacity, dtype=np.int64)
+        self._difficulty = np.zeros(capacity, dtype=np.int8)
+        self._alive = np.zeros(capacity, dtype=bool)
+        self._difficulty_masks: Dict[int, np.ndarray] = {}
+        self._tag_masks: Dict[str, np.ndarray] = {}
+
+    def _reserve(self, size: int) -> None:
+        """Grow every array geometrically so appends stay amortized O(1)"""
+        capacity = len(self._ids)
+        if size <= capacity:
+            return
+        new_capacity = max(size, capacity * 2)
+
+        def grow(array: np.ndarray) -> np.ndarray:
+            grown = np.zeros(new_capacity, dtype=array.dtype)
+            grown[:capacity] = array
+            return grown
+
+        self._ids = grow(self._ids)
+        self._difficulty = grow(self._difficulty)
+        self._alive = grow(self._alive)
+        self._difficulty_masks = {k: grow(v) for k, v in self._difficulty_masks.items()}
+        self._tag_masks = {k: grow(v) for k, v in self._tag_masks.items()}
+
+    def _mask_for(self, masks: Dict[Any, np.ndarray], key: Any) -> np.ndarray:
+        mask = masks.get(key)
+        if mask is None:
+            mask = masks[key] = np.zeros(len(self._ids), dtype=bool)
+        return mask
+
+    def load(self, rows: Optional[Iterable[Tuple[int, Optional[int], Optional[str]]]] = None) -> int:
+        """Rebuild the catalog from ``(id, difficulty, tags)`` rows (default: the database)"""
+        version = read_collection_version()
+        if rows is None:
+            rows = self._fetch_rows()
+        rows = sorted(rows, key=lambda row: row[0])
+
+        with self._lock:
+            self._reset(len(rows))
+            for row in rows:
+                self._append_locked(*row)
+            self.loaded = True
+            self.revision += 1
+            self.collection_version = version
+
+        logger.info(
+            f"Loaded problem catalog: {len(rows)} problems, "
+            f"{len(self._tag_masks)} tags, {len(self._difficulty_masks)} difficulty levels"
+        )
+        return len(rows)
+
+    def _fetch_rows(self) -> List[Tuple[int, Optional[int], Optional[str]]]:
+        conn = sqlite3.connect(self.db_path)
+        try:
+            return conn.execute("SELECT id, difficulty, tags FROM problems ORDER BY id").fetchall()
+        finally:
+            conn.close()
+
+    def _append_locked(self, problem_id: int, difficulty: Optional[int], tags: Optional[str]) -> None:
+        if self._size and problem_id <= self._ids[self._size - 1]:
+            # Out-of-order ids are rare (manual imports); insert in place to keep ids sorted
+            self._insert_locked(problem_id, difficulty, tags)
+            return
+
+        self._reserve(self._size + 1)
+        pos = self._size
+        self._size += 1
+        self._set_row_locked(pos, problem_id, difficulty, tags)
+
+    def _insert_locked(self, problem_id: int, difficulty: Optional[int], tags: Optional[str]) -> None:
+        pos = int(np.searchsorted(self._ids[:self._size], problem_id))
+        if pos < self._size and self._ids[pos] == problem_id:
+            self._clear_row_locked(pos)
+        else:
+            self._reserve(self._size + 1)
+            arrays = (
+                self._ids, self._difficulty, self._alive,
+                *self._difficulty_masks.values(), *self._tag_masks.values()
+            )
+            for array in arrays:
+                array[pos + 1:self._size + 1] = array[pos:self._size]
+            self._size += 1
+        self._set_row_locked(pos, problem_id, difficulty, tags)
+
+    def _set_row_locked(self, pos: int, problem_id: int, difficulty: Optional[int], tags: Optional[str]) -> None:
+        level = int(difficulty or 0)
+        self._ids[pos] = problem_id
+        self._difficulty[pos] = level
+        self._alive[pos] = True
+        for mask in (*self._difficulty_masks.values(), *self._tag_masks.values()):
+            mask[pos] = False
+        self._mask_for(self._difficulty_masks, level)[pos] = True
+        for tag in parse_tags(tags):
+            self._mask_for(self._tag_masks, tag)[pos] = True
+
+    def _clear_row_locked(self, pos: int) -> None:
+        self._alive[pos] = False
+        for mask in (*self._difficulty_masks.values(), *self._tag_masks.values()):
+            mask[pos] = False
+
+    def add(self, problem_id: int, difficulty: Optional[int], tags: Optional[str]) -> None:
+        """Insert or replace a problem (no-op until the catalog is loaded)"""
+        with self._lock:
+            if not self.loaded:
+                return
+            self._append_locked(problem_id, difficulty, tags)
+            self.revision += 1
+
+    def remove(self, problem_id: int) -> bool:
+        """Drop a problem; its slot is kept as a tombstone until the next load"""
+        with self._lock:
+            if not self.loaded:
+                return False
+            pos = int(np.searchsorted(self._ids[:self._size], problem_id))
+            if pos >= self._size or self._ids[pos] != problem_id or not self._alive[pos]:
+                return False
+            self._clear_row_locked(pos)
+            self.revision += 1
+            return True
+
+    def mask(
+        self,
+        tags: Optional[Sequence[str]] = None,
+        difficulty: Optional[int] = None
+    ) -> np.ndarray:
+        """Bitmap of live problems having any of ``tags`` and the given difficulty"""
+        with self._lock:
+            size = self._size
+            if tags:
+                result = np.zeros(size, dtype=bool)
+                for tag in tags:
+                    tag_mask = self._tag_masks.get(tag)
+                    if tag_mask is not None:
+                        result |= tag_mask[:size]
+            else:
+                result = self._alive[:size].copy()
+
+            if difficulty is not None:
+                level_mask = self._difficulty_masks.get(int(difficulty))
+                if level_mask is None:
+                    return np.zeros(size, dtype=bool)
+                result &= level_mask[:size]
+            return result
+
+    def candidate_ids(
+        self,
+        tags: Optional[Sequence[str]] = None,
+        difficulty: Optional[int] = None
+    ) -> np.ndarray:
+        """Sorted ids of the problems matching the filters"""
+        return self.snapshot(tags).candidate_ids(tags, difficulty)
+
+    def snapshot(self, tags: Optional[Iterable[str]] = None) -> "CatalogSnapshot":
+        """
+        Copy of the arrays at the current revision (tag bitmaps limited to ``tags``)
+
+        Inserts shift the live arrays in place, so readers that combine
+        several bitmaps with the ids index one snapshot instead.
+        """
+        with self._lock:
+            size = self._size
+            names = self._tag_masks.keys() if tags is None else tags
+            return CatalogSnapshot(
+                revision=self.revision,
+                ids=self._ids[:size].copy(),
+                alive=self._alive[:size].copy(),
+                difficulty_masks={level: mask[:size].copy() for level, mask in self._difficulty_masks.items()},
+                tag_masks={
+                    tag: self._tag_masks[tag][:size].copy() for tag in names if tag in self._tag_masks
+                },
+            )
+
+    def difficulty_levels(self) -> List[int]:
+        """Difficulty levels that have at least one live problem"""
+        with self._lock:
+            size = self._size
+            return sorted(level for level, mask in self._difficulty_masks.items() if mask[:size].any())
+
+    def tag_counts(self) -> Dict[str, int]:
+        """Live problems per tag (tags without live problems are omitted)"""
+        with self._lock:
+            size = self._size
+            alive = self._alive[:size]
+            counts = {
+                tag: int(np.count_nonzero(mask[:size] & alive))
+                for tag, mask in self._tag_masks.items()
+            }
+        return {tag: count for tag, count in sorted(counts.items()) if count}
+
+    def difficulties(self, mask: np.ndarray) -> np.ndarray:
+        return self._difficulty[:len(mask)][mask]
+
+    def count(self) -> int:
+        return int(self._alive[:self._size].sum())
+
+    def _live_arrays_locked(self) -> Tuple[np.ndarray, np.ndarray, List[str], np.ndarray]:
+        """Live ids, difficulties, tag names and packed tag bits (one row per tag)"""
+        size = self._size
+        alive = self._alive[:size]
+        ids = self._ids[:size][alive]
+        difficulty = self._difficulty[:size][alive]
+        tag_names = []
+        tag_rows = []
+        for tag in sorted(self._tag_masks):
+            live_mask = self._tag_masks[tag][:size][alive]
+            if live_mask.any():
+                tag_names.append(tag)
+                tag_rows.append(np.packbits(live_mask))
+        tag_bits = np.stack(tag_rows) if tag_rows else np.zeros((0, (len(ids) + 7) // 8), dtype=np.uint8)
+        return ids, difficulty, tag_names, tag_bits
+
+    def fingerprint(self) -> str:
+        """Digest of the live content; unchanged by tombstones, reloads or unrelated writes"""
+        with self._lock:
+            if self._fingerprint is not None and self._fingerprint[0] == self.revision:
+                return self._fingerprint[1]
+            ids, difficulty, tag_names, tag_bits = self._live_arrays_locked()
+            digest = hashlib.blake2b(digest_size=12)
+            digest.update(ids.astype("<i8").tobytes())
+            digest.update(difficulty.tobytes())
+            digest.update("\0".join(tag_names).encode("utf-8"))
+            digest.update(tag_bits.tobytes())
+            self._fingerprint = (self.revision, digest.hexdigest())
+            return self._fingerprint[1]
+
+    def to_bytes(self) -> bytes:
+        """Compressed snapshot of the live content (see ``from_bytes``)"""
+        with self._lock:
+            ids, difficulty, tag_names, tag_bits = self._live_arrays_locked()
+        buffer = io.BytesIO()
+        np.savez_compressed(
+            buffer, ids=ids, difficulty=difficulty,
+            tag_names=np.array(tag_names, dtype=str), tag_bits=tag_bits
+        )
+        return buffer.getvalue()
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "ProblemCatalog":
+        """Read-only catalog rebuilt from a ``to_bytes`` snapshot"""
+        with np.load(io.BytesIO(data), allow_pickle=False) as arrays:
+            ids = arrays["ids"]
+            difficulty = arrays["difficulty"]
+            tag_names = arrays["tag_names"].tolist()
+            tag_bits = arrays["tag_bits"]
+
+        catalog = cls(db_path=":memory:")
+        size = len(ids)
+        with catalog._lock:
+            catalog._reset(size)
+            catalog._size = size
+            catalog._ids[:size] = ids
+            catalog._difficulty[:size] = difficulty
+            catalog._alive[:size] = True
+            for level in np.unique(difficulty).tolist():
+                catalog._mask_for(catalog._difficulty_masks, int(level))[:size] = difficulty == level
+            for tag, bits in zip(tag_names, tag_bits):
+                catalog._mask_for(catalog._tag_masks, tag)[:size] = np.unpackbits(bits, count=size).astype(bool)
+            catalog.loaded = True
+            catalog.revision = 1
+        return catalog
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            size = self._size
+            return {
+                "loaded": self.loaded,
+                "problems": int(self._alive[:size].sum()),
+                "tombstones": int(size - self._alive[:size].sum()),
+                "revision": self.revision,
+                "difficulty_counts": {
+                    str(level): int(mask[:size].sum())
+                    for level, mask in sorted(self._difficulty_masks.items())
+                },
+                "tag_counts": {
+                    tag: int(mask[:size].sum()) for tag, mask in sorted(self._tag_masks.items())
+                },
+                "resident_bytes": int(
+                    self._ids.nbytes + self._difficulty.nbytes + self._alive.nbytes
+                    + sum(m.nbytes for m in self._difficulty_masks.values())
+                    + sum(m.nbytes for m in self._tag_masks.values())
+                ),
+            }
+
+
+# Global instance
+_problem_catalog = ProblemCatalog()
+_load_lock = asyncio.Lock()
+
+
+def notify_problem_created(
+    problem_id: int,
+    difficulty: Optional[int],
+    tags: Optional[str],
+    collection_version: Optional[str] = None
+) -> None:
+    """Apply a committed insert to the in-process catalog"""
+    _problem_catalog.add(problem_id, difficulty, tags)
+    if collection_version is not None:
+        _problem_catalog.collection_version = collection_version
+
+
+def notify_problem_deleted(problem_id: int, collection_version: Optional[str] = None) -> None:
+    """Apply a committed delete to the in-process catalog"""
+    _problem_catalog.remove(problem_id)
+    if collection_version is not None:
+        _problem_catalog.collection_version = collection_version
+
+
+async def get_problem_catalog() -> ProblemCatalog:
+    """Dependency injection for FastAPI (reloads after writes from other processes)"""
+    def is_stale() -> bool:
+        return (
+            not _problem_catalog.loaded
+            or read_collection_version() != _problem_catalog.collection_version
+        )
+
+    if is_stale():
+        async with _load_lock:
+            if is_stale():
+                await asyncio.to_thread(_problem_catalog.load)
+    return _problem_catalog
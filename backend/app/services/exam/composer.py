@@ -0,0 +1,381 @@
+"""
+Exam composition with joint difficulty x tag quotas
+
+The requested difficulty and syllabus-area (tag) ratios are turned into
+integer quotas per (difficulty, area) cell whose row and column totals match
+largest-remainder apportionment of each ratio exactly. Cells that do not
+hold enough problems are filled greedily from the closest cells with spare
+capacity (same difficulty, then same area, then anywhere). Problems are then
+drawn with Floyd's algorithm, O(k) per cell, from partitions precomputed on
+the ``ProblemCatalog`` bitmaps. With per-problem weights (adaptive exams)
+each cell is instead sampled without replacement proportionally to weight:
+uniform draws accepted with probability weight / max weight, which only
+looks up the weights of the drawn ids and stays O(k) while most of the cell
+keeps a high weight.
+
+A problem tagged with several requested areas counts towards the first one
+in request order, so cells never overlap and a problem is drawn at most once.
+"""
+
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Mapping, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.services.exam.catalog import ProblemCatalog
+
+logger = logging.getLogger(__name__)
+
+# Area used when no per-tag quota is requested
+ANY_AREA = "*"
+
+Cell = Tuple[int, str]
+
+# Rejection sampling is used while k * REJECTION_MAX_SHARE < cell size, for at
+# most REJECTION_MAX_ROUNDS batches of draws
+REJECTION_MAX_SHARE = 4
+REJECTION_MAX_ROUNDS = 8
+
+# Partitions are cached per (catalog, revision, areas) and rebuilt after writes
+PARTITION_CACHE_SIZE = 32
+_partition_cache: "OrderedDict[tuple, Dict[Cell, np.ndarray]]" = OrderedDict()
+_partition_lock = threading.Lock()
+
+
+class InsufficientProblemsError(ValueError):
+    """Fewer matching problems than requested questions"""
+
+    def __init__(self, requested: int, available: int):
+        super().__init__(f"Not enough problems: requested {requested}, available {available}")
+        self.requested = requested
+        self.available = available
+
+
+class ProblemWeights(NamedTuple):
+    """Sampling weights for a sparse set of problems (sorted ids); all others weigh ``default``"""
+    ids: np.ndarray
+    weights: np.ndarray
+    default: float = 1.0
+
+    def lookup(self, problem_ids: np.ndarray) -> np.ndarray:
+        """Weights aligned with ``problem_ids``"""
+        result = np.full(len(problem_ids), self.default, dtype=np.float64)
+        if len(self.ids) == 0 or len(problem_ids) == 0:
+            return result
+        index = np.minimum(np.searchsorted(self.ids, problem_ids), len(self.ids) - 1)
+        found = self.ids[index] == problem_ids
+        result[found] = self.weights[index[found]]
+        return result
+
+
+class Composition(NamedTuple):
+    """Selected problem ids (exam order) and the achieved-vs-requested report"""
+    problem_ids: List[int]
+    report: Dict[str, Any]
+
+
+def _normalize_ratios(ratios: Mapping[Any, float]) -> Dict[Any, float]:
+    total = float(sum(ratios.values()))
+    if total <= 0:
+        raise ValueError("Ratios must sum to a positive value")
+    return {key: float(value) / total for key, value in ratios.items()}
+
+
+def largest_remainder(total: int, weights: Mapping[Any, float]) -> Dict[Any, int]:
+    """Integer apportionment of ``total`` proportional to ``weights`` (sums exactly)"""
+    if not weights:
+        return {}
+    shares = {key: total * weight for key, weight in _normalize_ratios(weights).items()}
+    counts = {key: int(np.floor(share)) for key, share in shares.items()}
+    remaining = total - sum(counts.values())
+    # Ties go to the larger share, then to request order
+    order = sorted(shares, key=lambda key: (-(shares[key] - counts[key]), -shares[key]))
+    for key in order[:remaining]:
+        counts[key] += 1
+    return counts
+
+
+def joint_quotas(
+    total: int,
+    difficulty_weights: Mapping[int, float],
+    area_weights: Mapping[str, float]
+) -> Dict[Cell, int]:
+    """
+    Integer cell quotas whose row/column sums equal the apportioned marginals
+
+    Starts from the floor of the independent joint targets and hands out the
+    remaining units one at a time to the cell with the largest remainder whose
+    row and column are both still short.
+    """
+    rows = largest_remainder(total, difficulty_weights)
+    cols = largest_remainder(total, area_weights)
+    rd = _normalize_ratios(difficulty_weights)
+    ra = _normalize_ratios(area_weights)
+
+    targets = {(d, a): total * rd[d] * ra[a] for d in rows for a in cols}
+    quotas = {cell: int(np.floor(target)) for cell, target in targets.items()}
+    row_left = {d: rows[d] - sum(quotas[(d, a)] for a in cols) for d in rows}
+    col_left = {a: cols[a] - sum(quotas[(d, a)] for d in rows) for a in cols}
+
+    remainders = sorted(targets, key=lambda cell: -(targets[cell] - quotas[cell]))
+    while any(row_left.values()):
+        # Row and column deficits have equal sums, so an open cell always exists
+        cell = next(c for c in remainders if row_left[c[0]] > 0 and col_left[c[1]] > 0)
+        quotas[cell] += 1
+        row_left[cell[0]] -= 1
+        col_left[cell[1]] -= 1
+    return quotas
+
+
+def allocate(
+    quotas: Mapping[Cell, int],
+    capacity: Mapping[Cell, int]
+) -> Tuple[Dict[Cell, int], int]:
+    """
+    Clip quotas to cell capacity and move the shortfall to the nearest cells
+
+    Returns the allocation and the number of questions that had to be moved.
+    """
+    alloc = {cell: min(quotas.get(cell, 0), capacity.get(cell, 0)) for cell in capacity}
+    moved = sum(quotas.values()) - sum(alloc.values())
+    if moved == 0:
+        return alloc, 0
+
+    def spare(cell: Cell) -> int:
+        return capacity[cell] - alloc[cell]
+
+    for short_cell, quota in quotas.items():
+        shortfall = quota - min(quota, capacity.get(short_cell, 0))
+        if shortfall <= 0:
+            continue
+        level, area = short_cell
+        tiers = (
+            [c for c in capacity if c[0] == level and c != short_cell],
+            [c for c in capacity if c[1] == area and c != short_cell],
+            list(capacity),
+        )
+        for tier in tiers:
+            # Prefer cells that were requested most, then those with most room
+            for cell in sorted(tier, key=lambda c: (-quotas.get(c, 0), -spare(c))):
+                take = min(shortfall, spare(cell))
+                if take > 0:
+                    alloc[cell] += take
+                    shortfall -= take
+                if shortfall == 0:
+                    break
+            if shortfall == 0:
+                break
+    return alloc, moved
+
+
+def exam_rng(seed: int) -> np.random.Generator:
+    """Counter-based generator, so (seed, catalog, parameters) always yields the same exam"""
+    return np.random.Generator(np.random.Philox(key=seed))
+
+
+def floyd_sample(n: int, k: int, rng: np.random.Generator) -> np.ndarray:
+    """k distinct indices from range(n) in O(k) (Floyd's algorithm)"""
+    if k > n:
+        raise ValueError(f"Cannot draw {k} items from {n}")
+    if k == 0:
+        return np.empty(0, dtype=np.int64)
+    # One vectorized draw per step j in [n - k, n): uniform on [0, j]
+    draws = rng.integers(0, np.arange(n - k + 1, n + 1))
+    chosen: Dict[int, None] = {}
+    for j, t in zip(range(n - k, n), draws.tolist()):
+        chosen[j if t in chosen else t] = None
+    return np.fromiter(chosen, dtype=np.int64, count=k)
+
+
+def weighted_sample(weights: np.ndarray, k: int, rng: np.random.Generator) -> np.ndarray:
+    """
+    k distinct indices drawn with probability proportional to ``weights``
+
+    Efraimidis-Spirakis: the k smallest exponential(1) / weight keys are a
+    weighted sample without replacement. Weights must be positive.
+    """
+    n = len(weights)
+    if k > n:
+        raise ValueError(f"Cannot draw {k} items from {n}")
+    if k == 0:
+        return np.empty(0, dtype=np.int64)
+    if k == n:
+        return np.arange(n, dtype=np.int64)
+    keys = rng.standard_exponential(n) / weights
+    return np.argpartition(keys, k - 1)[:k].astype(np.int64)
+
+
+def weighted_cell_sample(
+    cell_ids: np.ndarray,
+    k: int,
+    problem_weights: ProblemWeights,
+    rng: np.random.Generator
+) -> np.ndarray:
+    """
+    k distinct indices into ``cell_ids`` drawn proportionally to their weights
+
+    Rejection sampling: each accepted draw is a weighted draw from the ids not
+    yet chosen, so the result has the same law as ``weighted_sample``. Falls
+    back to ``weighted_sample`` over the whole cell when k is a large share
+    of it or the acceptance rate turns out too low.
+    """
+    n = len(cell_ids)
+    if k * REJECTION_MAX_SHARE >= n:
+        return weighted_sample(problem_weights.lookup(cell_ids), k, rng)
+    max_weight = max(problem_weights.default, float(problem_weights.weights.max(initial=0.0)))
+
+    chosen: Dict[int, None] = {}
+    for _ in range(REJECTION_MAX_ROUNDS):
+        missing = k - len(chosen)
+        draws = rng.integers(0, n, size=2 * missing + 8)
+        accept = rng.random(len(draws)) * max_weight < problem_weights.lookup(cell_ids[draws])
+        for index in draws[accept].tolist():
+            chosen[index] = None
+            if len(chosen) == k:
+                return np.fromiter(chosen, dtype=np.int64, count=k)
+    return weighted_sample(problem_weights.lookup(cell_ids), k, rng)
+
+
+def _partition(
+    catalog: ProblemCatalog,
+    levels: Sequence[int],
+    areas: Sequence[str],
+    tags: Optional[Sequence[str]]
+) -> Dict[Cell, np.ndarray]:
+    """Problem ids per (difficulty, area) cell, cached per catalog revision"""
+    key = (catalog.uid, catalog.revision, tuple(levels), tuple(areas), tuple(tags or ()))
+    with _partition_lock:
+        cached = _partition_cache.get(key)
+        if cached is not None:
+            _partition_cache.move_to_end(key)
+            return cached
+
+    # Every bitmap and the ids come from one snapshot, so concurrent inserts cannot misalign them
+    snapshot = catalog.snapshot([*(tags or ()), *(area for area in areas if area != ANY_AREA)])
+    key = (catalog.uid, snapshot.revision, *key[2:])
+    base = snapshot.mask(tags)
+    area_masks: Dict[str, np.ndarray] = {}
+    if list(areas) == [ANY_AREA]:
+        area_masks[ANY_AREA] = base
+    else:
+        claimed = np.zeros(len(base), dtype=bool)
+        for area in areas:
+            area_mask = snapshot.tag_mask(area) & base & ~claimed
+            claimed |= area_mask
+            area_masks[area] = area_mask
+
+    cells = {}
+    for level in levels:
+        level_mask = snapshot.difficulty_mask(level)
+        for area, area_mask in area_masks.items():
+            cells[(level, area)] = snapshot.ids_for(area_mask & level_mask)
+
+    with _partition_lock:
+        _partition_cache[key] = cells
+        while len(_partition_cache) > PARTITION_CACHE_SIZE:
+            _partition_cache.popitem(last=False)
+    return cells
+
+
+def compose_exam(
+    catalog: ProblemCatalog,
+    num_questions: int,
+    difficulty_ratio: Mapping[Any, float],
+    tag_ratio: Optional[Mapping[str, float]] = None,
+    tags: Optional[Sequence[str]] = None,
+    rng: Optional[np.random.Generator] = None,
+    problem_weights: Optional[ProblemWeights] = None
+) -> Composition:
+    """Pick ``num_questions`` problem ids meeting the joint quotas as closely as possible"""
+    rng = rng if rng is not None else np.random.default_rng()
+    difficulty_weights = {int(level): ratio for level, ratio in difficulty_ratio.items()}
+    area_weights = dict(tag_ratio) if tag_ratio else {ANY_AREA: 1.0}
+
+    # Unrequested levels get zero quota but can absorb shortfalls
+    levels = sorted(set(difficulty_weights) | set(catalog.difficulty_levels()))
+    cells = _partition(catalog, levels, list(area_weights), tags)
+    capacity = {cell: len(ids) for cell, ids in cells.items()}
+
+    available = sum(capacity.values())
+    if available < num_questions:
+        raise InsufficientProblemsError(num_questions, available)
+
+    quotas = joint_quotas(num_questions, difficulty_weights, area_weights)
+    alloc, moved = allocate(quotas, capacity)
+    if moved:
+        logger.info(f"Exam quotas infeasible; moved {moved} questions to neighbouring cells")
+
+    if problem_weights is None:
+        picked = [
+            cells[cell][floyd_sample(len(cells[cell]), count, rng)]
+            for cell, count in alloc.items() if count
+        ]
+    else:
+        picked = [
+            cells[cell][weighted_cell_sample(cells[cell], count, problem_weights, rng)]
+            for cell, count in alloc.items() if count
+        ]
+    problem_ids = np.concatenate(picked) if picked else np.empty(0, dtype=np.int64)
+    problem_ids = problem_ids[rng.permutation(len(problem_ids))]
+
+    report = build_report(num_questions, difficulty_weights, area_weights, quotas, alloc, capacity, moved)
+    return Composition(problem_ids=problem_ids.tolist(), report=report)
+
+
+def build_report(
+    num_questions: int,
+    difficulty_weights: Mapping[int, float],
+    area_weights: Mapping[str, float],
+    quotas: Mapping[Cell, int],
+    alloc: Mapping[Cell, int],
+    capacity: Mapping[Cell, int],
+    moved: int
+) -> Dict[str, Any]:
+    """Requested vs achieved distribution per difficulty, area and cell"""
+    rd = _normalize_ratios(difficulty_weights)
+    ra = _normalize_ratios(area_weights)
+
+    def by(axis: int, counts: Mapping[Cell, int]) -> Dict[str, int]:
+        totals: Dict[str, int] = {}
+        for cell, count in counts.items():
+            key = str(cell[axis])
+            totals[key] = totals.get(key, 0) + count
+        return totals
+
+    achieved_difficulty = by(0, alloc)
+    achieved_area = by(1, alloc)
+    return {
+        "num_questions": num_questions,
+        "difficulty": {
+            str(level): {
+                "requested_ratio": round(rd.get(level, 0.0), 4),
+                "quota": by(0, quotas).get(str(level), 0),
+                "achieved": achieved_difficulty.get(str(level), 0),
+            }
+            for level in sorted({cell[0] for cell in capacity})
+            if level in rd or achieved_difficulty.get(str(level))
+        },
+        "areas": {
+            area: {
+                "requested_ratio": round(ra[area], 4),
+                "quota": by(1, quotas).get(area, 0),
+                "achieved": achieved_area.get(area, 0),
+            }
+            for area in area_weights
+        },
+        "cells": [
+            {
+                "difficulty": level,
+                "area": area,
+                "quota": quotas.get((level, area), 0),
+                "achieved": alloc.get((level, area), 0),
+                "available": capacity[(level, area)],
+            }
+            for level, area in sorted(capacity)
+            if quotas.get((level, area)) or alloc.get((level, area))
+        ],
+        "redistributed": moved,
+        "total_candidates": sum(capacity.values()),
+    }
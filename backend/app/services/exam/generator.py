@@ -1,38 +1,518 @@
 """
 Exam generation service
+
+Exams are composed with a seeded counter-based PRNG, so an exam is stored
+as one row (seed, catalog fingerprint, parameters) and its questions are
+re-derived on read. A snapshot of the catalog is stored once per
+fingerprint so exams survive later problem changes.
 """
 
+import asyncio
+import json
+import logging
+import secrets
+import sqlite3
+import sys
+import time
 import uuid
-import random
-from typing import List, Dict
-from sqlalchemy.orm import Session
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Sequence, Set, Tuple
+
+from fastapi import HTTPException
 
-from app.core.database import get_db
+from app.core.config import settings
 from app.models.schemas import ExamGenerateRequest, ExamResponse, ExamQuestion
-from app.models.problem import Problem
+from app.services.embedding.collection_version import read_collection_version
+from app.services.exam.catalog import ProblemCatalog, get_problem_catalog
+from app.services.exam.composer import (
+    Composition,
+    InsufficientProblemsError,
+    ProblemWeights,
+    compose_exam,
+    exam_rng,
+)
+from app.utils.cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+EXAM_TABLE = "exams"
+EXAM_QUESTION_TABLE = "exam_questions"
+CATALOG_SNAPSHOT_TABLE = "catalog_snapshots"
+
+# Measured footprint of an ExamQuestion / Choice model without its strings
+# (approximate_size is too slow to run on every cache fill)
+QUESTION_OVERHEAD_BYTES = 650
+CHOICE_OVERHEAD_BYTES = 400
+
+def new_seed() -> int:
+    # 63 bits fit a signed SQLite INTEGER
+    return secrets.randbits(63)
+
+class PreparedExam(NamedTuple):
+    """Composed and hydrated exam that has not been stored yet"""
+    composition: Composition
+    questions: List[ExamQuestion]
+    catalog_revision: int
+    seed: int = 0
+    catalog_version: str = ""
+    tag_ratio: Optional[Dict[str, float]] = None
+    # False when the composition depends on more than (seed, catalog, parameters)
+    reproducible: bool = True
 
 class ExamGenerator:
     """Service for generating mock exams"""
-    
-    async def generate_exam(self, request: ExamGenerateRequest) -> ExamResponse:
-        """Generate a mock exam based on requirements"""
+
+    def __init__(self, db_path: Optional[str] = None):
+        self.db_path = db_path
+        self._tables_ready = False
+        # Hydrated questions shared across exams; cleared when problems are written
+        self._question_cache = TTLCache(
+            max_size=settings.EXAM_QUESTION_CACHE_SIZE,
+            ttl_seconds=settings.EXAM_QUESTION_CACHE_TTL_SEC,
+            max_bytes=settings.EXAM_QUESTION_CACHE_MAX_BYTES,
+            version_source=read_collection_version
+        )
+        # Catalog versions whose snapshot is known to be stored
+        self._snapshot_versions: Set[str] = set()
+        # Catalogs rebuilt from snapshots for re-deriving older exams
+        self._snapshot_catalogs = TTLCache(max_size=4)
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.db_path or settings.DB_PATH)
+
+    def _ensure_tables(self, conn: sqlite3.Connection) -> None:
+        """Create the exam tables on first use"""
+        if self._tables_ready:
+            return
+        conn.execute(f"""
+            CREATE TABLE IF NOT EXISTS {EXAM_TABLE} (
+                exam_id TEXT PRIMARY KEY,
+                num_questions INTEGER NOT NULL,
+                time_limit_min INTEGER NOT NULL,
+                params TEXT NOT NULL,
+                seed INTEGER,
+                catalog_version TEXT,
+                materialized INTEGER NOT NULL DEFAULT 1,
+                created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        # Tables created before seeded storage lack these columns
+        columns = {row[1] for row in conn.execute(f"PRAGMA table_info({EXAM_TABLE})")}
+        for column, ddl in (
+            ("seed", "INTEGER"),
+            ("catalog_version", "TEXT"),
+            ("materialized", "INTEGER NOT NULL DEFAULT 1"),
+        ):
+            if column not in columns:
+                conn.execute(f"ALTER TABLE {EXAM_TABLE} ADD COLUMN {column} {ddl}")
+        conn.execute(f"""
+            CREATE TABLE IF NOT EXISTS {EXAM_QUESTION_TABLE} (
+                exam_id TEXT NOT NULL,
+                position INTEGER NOT NULL,
+                problem_id INTEGER NOT NULL,
+                PRIMARY KEY (exam_id, position)
+            )
+        """)
+        conn.execute(f"""
+            CREATE TABLE IF NOT EXISTS {CATALOG_SNAPSHOT_TABLE} (
+                version TEXT PRIMARY KEY,
+                data BLOB NOT NULL,
+                created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_choices_problem_id ON choices(problem_id)")
+        conn.commit()
+        self._tables_ready = True
+
+    async def generate_exam(
+        self,
+        request: ExamGenerateRequest,
+        tag_ratio: Optional[Dict[str, float]] = None,
+        problem_weights: Optional[ProblemWeights] = None
+    ) -> ExamResponse:
+        """Generate a mock exam based on requirements (weighted per problem for adaptive exams)"""
+        start_time = time.perf_counter()
         exam_id = str(uuid.uuid4())
-        
-        # TODO: Implement actual exam generation logic
-        # For now, return a placeholder
-        questions = []
-        
+        prepared = await self._build(request, tag_ratio, exam_id, problem_weights)
+
+        elapsed_ms = (time.perf_counter() - start_time) * 1000
+        logger.info(f"Generated exam {exam_id}: {len(prepared.questions)} questions in {elapsed_ms:.1f} ms")
+        return self._response(exam_id, prepared.questions, request.time_limit_min)
+
+    async def prepare_exam(
+        self,
+        request: ExamGenerateRequest,
+        tag_ratio: Optional[Dict[str, float]] = None
+    ) -> PreparedExam:
+        """Compose and hydrate an exam without storing it (for pre-generation)"""
+        return await self._build(request, tag_ratio, exam_id=None)
+
+    async def publish_exam(self, prepared: PreparedExam, request: ExamGenerateRequest) -> ExamResponse:
+        """Store a prepared exam under a fresh exam id and build its response"""
+        exam_id = str(uuid.uuid4())
+        catalog = await get_problem_catalog()
+        await asyncio.to_thread(self._persist_exam, exam_id, prepared, request, catalog)
+        return self._response(exam_id, prepared.questions, request.time_limit_min)
+
+    async def load_exam(self, exam_id: str) -> ExamResponse:
+        """Return a stored exam, re-deriving compact exams from their seed"""
+        problem_ids, time_limit_min = await self.exam_problem_ids(exam_id)
+        questions = await asyncio.to_thread(self._load_questions, problem_ids)
+        if len(questions) != len(problem_ids):
+            logger.warning(f"Exam {exam_id}: {len(problem_ids) - len(questions)} problems no longer exist")
+        return self._response(
+            exam_id,
+            [questions[problem_id] for problem_id in problem_ids if problem_id in questions],
+            time_limit_min
+        )
+
+    async def exam_problem_ids(self, exam_id: str) -> Tuple[List[int], int]:
+        """Ordered problem ids and time limit of a stored exam (without hydrating questions)"""
+        row = await asyncio.to_thread(self._fetch_exam_row, exam_id)
+        if row is None:
+            raise HTTPException(status_code=404, detail="指定された模試IDが見つかりません")
+        num_questions, time_limit_min, params, seed, catalog_version, problem_ids = row
+
+        if problem_ids is None:
+            catalog = await self._catalog_for(catalog_version)
+            if catalog is None:
+                raise HTTPException(status_code=410, detail="模試の作成時点の問題セットが失われたため復元できません")
+            composition = compose_exam(
+                catalog,
+                num_questions,
+                params["difficulty_ratio"],
+                tag_ratio=params.get("tag_ratio"),
+                tags=params.get("tags"),
+                rng=exam_rng(seed)
+            )
+            problem_ids = composition.problem_ids
+        return list(problem_ids), time_limit_min
+
+    async def _build(
+        self,
+        request: ExamGenerateRequest,
+        tag_ratio: Optional[Dict[str, float]],
+        exam_id: Optional[str],
+        problem_weights: Optional[ProblemWeights] = None
+    ) -> PreparedExam:
+        """Compose, hydrate and (when ``exam_id`` is given) persist an exam"""
+        catalog = await get_problem_catalog()
+
+        for _ in range(2):
+            revision = catalog.revision
+            seed = new_seed()
+            try:
+                composition = compose_exam(
+                    catalog,
+                    request.num_questions,
+                    request.difficulty_ratio,
+                    tag_ratio=tag_ratio,
+                    tags=request.tags,
+                    rng=exam_rng(seed),
+                    problem_weights=problem_weights
+                )
+            except InsufficientProblemsError as e:
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"条件に合う問題が不足しています。必要: {e.requested}, 利用可能: {e.available}"
+                )
+            prepared = PreparedExam(
+                composition, [], revision, seed, catalog.fingerprint(), tag_ratio,
+                reproducible=problem_weights is None
+            )
+
+            # One thread hop for the hydrate query and the persisting transaction
+            questions = await asyncio.to_thread(
+                self._hydrate_and_persist, exam_id, prepared, request, catalog
+            )
+            if questions is not None:
+                return prepared._replace(questions=questions)
+            # A selected problem was deleted by another process; reload and draw again
+            logger.warning("Problem catalog was stale during exam generation; reloading")
+            await asyncio.to_thread(catalog.load)
+
+        raise HTTPException(status_code=503, detail="Problem set changed during exam generation")
+
+    def _response(
+        self,
+        exam_id: str,
+        questions: List[ExamQuestion],
+        time_limit_min: int
+    ) -> ExamResponse:
         return ExamResponse(
             exam_id=exam_id,
             questions=questions,
-            time_limit_min=request.time_limit_min,
-            total_questions=request.num_questions,
-            difficulty_distribution=request.difficulty_ratio
+            time_limit_min=time_limit_min,
+            total_questions=len(questions),
+            difficulty_distribution=self._distribution(questions)
         )
 
+    def _questions_from(
+        self,
+        conn_factory: Callable[[], sqlite3.Connection],
+        problem_ids: Sequence[int]
+    ) -> Dict[int, ExamQuestion]:
+        """Questions by id from the cache, hydrating the misses with ``conn_factory()``"""
+        version = self._question_cache.check_version()
+        questions: Dict[int, ExamQuestion] = {}
+        missing = []
+        for problem_id in problem_ids:
+            question = self._question_cache.get(problem_id)
+            if question is None:
+                missing.append(problem_id)
+            else:
+                questions[problem_id] = question
+
+        if missing:
+            for problem_id, problem in self._hydrate(conn_factory(), missing).items():
+                question = ExamQuestion(**problem)
+                self._question_cache.set(
+                    problem_id, question, size=self._question_size(problem), version=version
+                )
+                questions[problem_id] = question
+        return questions
+
+    def _hydrate_and_persist(
+        self,
+        exam_id: Optional[str],
+        prepared: PreparedExam,
+        request: ExamGenerateRequest,
+        catalog: ProblemCatalog
+    ) -> Optional[List[ExamQuestion]]:
+        """Fetch the selected problems and store the exam (None if any id vanished)"""
+        problem_ids = prepared.composition.problem_ids
+        conn: Optional[sqlite3.Connection] = None
+
+        def connect() -> sqlite3.Connection:
+            nonlocal conn
+            if conn is None:
+                conn = self._connect()
+                self._ensure_tables(conn)
+            return conn
+
+        try:
+            questions = self._questions_from(connect, problem_ids)
+            if len(questions) != len(problem_ids):
+                return None
+            if exam_id is not None:
+                self._insert_exam(connect(), exam_id, prepared, request, catalog)
+        finally:
+            if conn is not None:
+                conn.close()
+
+        return [questions[problem_id] for problem_id in problem_ids]
+
+    def _load_questions(self, problem_ids: Sequence[int]) -> Dict[int, ExamQuestion]:
+        conn: Optional[sqlite3.Connection] = None
+
+        def connect() -> sqlite3.Connection:
+            nonlocal conn
+            if conn is None:
+                conn = self._connect()
+            return conn
+
+        try:
+            return self._questions_from(connect, problem_ids)
+        finally:
+            if conn is not None:
+                conn.close()
+
+    def _persist_exam(
+        self,
+        exam_id: str,
+        prepared: PreparedExam,
+        request: ExamGenerateRequest,
+        catalog: ProblemCatalog
+    ) -> None:
+        conn = self._connect()
+        try:
+            self._ensure_tables(conn)
+            self._insert_exam(conn, exam_id, prepared, request, catalog)
+        finally:
+            conn.close()
+
+    def _insert_exam(
+        self,
+        conn: sqlite3.Connection,
+        exam_id: str,
+        prepared: PreparedExam,
+        request: ExamGenerateRequest,
+        catalog: ProblemCatalog
+    ) -> None:
+        """
+        Store the exam in one transaction
+
+        Compact storage keeps only (seed, catalog version, parameters); the
+        question order is re-derived on read. When the catalog changed after
+        composition, the composition used per-user weights, or storage is set
+        to "materialized", the ordered problem ids are written to the exam
+        question table instead.
+        """
+        problem_ids = prepared.composition.problem_ids
+        params: Dict[str, Any] = {
+            "difficulty_ratio": request.difficulty_ratio,
+            "tags": request.tags,
+            "tag_ratio": prepared.tag_ratio,
+        }
+        with conn:
+            compact = (
+                settings.EXAM_STORAGE == "compact"
+                and prepared.reproducible
+                and self._ensure_snapshot(conn, catalog, prepared.catalog_version)
+            )
+            if not compact:
+                params["report"] = prepared.composition.report
+            conn.execute(
+                f"""
+                INSERT INTO {EXAM_TABLE}
+                    (exam_id, num_questions, time_limit_min, params, seed, catalog_version, materialized)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                """,
+                (
+                    exam_id, len(problem_ids), request.time_limit_min,
+                    json.dumps(params, ensure_ascii=False),
+                    prepared.seed, prepared.catalog_version, 0 if compact else 1
+                )
+            )
+            if not compact:
+                conn.executemany(
+                    f"INSERT INTO {EXAM_QUESTION_TABLE} (exam_id, position, problem_id) VALUES (?, ?, ?)",
+                    [(exam_id, position, problem_id) for position, problem_id in enumerate(problem_ids)]
+                )
+
+    def _ensure_snapshot(self, conn: sqlite3.Connection, catalog: ProblemCatalog, version: str) -> bool:
+        """Store the catalog snapshot for ``version`` once (False if the catalog has moved on)"""
+        if version in self._snapshot_versions:
+            return True
+        stored = conn.execute(
+            f"SELECT 1 FROM {CATALOG_SNAPSHOT_TABLE} WHERE version = ?", (version,)
+        ).fetchone()
+        if stored is None:
+            if catalog.fingerprint() != version:
+                return False
+            conn.execute(
+                f"INSERT OR IGNORE INTO {CATALOG_SNAPSHOT_TABLE} (version, data) VALUES (?, ?)",
+                (version, catalog.to_bytes())
+            )
+        self._snapshot_versions.add(version)
+        return True
+
+    def _fetch_exam_row(self, exam_id: str) -> Optional[tuple]:
+        """(num_questions, time_limit_min, params, seed, catalog_version, problem_ids or None)"""
+        conn = self._connect()
+        try:
+            self._ensure_tables(conn)
+            row = conn.execute(
+                f"""
+                SELECT num_questions, time_limit_min, params, seed, catalog_version, materialized
+                FROM {EXAM_TABLE} WHERE exam_id = ?
+                """,
+                (exam_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            num_questions, time_limit_min, params, seed, catalog_version, materialized = row
+            problem_ids = None
+            if materialized:
+                problem_ids = [
+                    problem_id for (problem_id,) in conn.execute(
+                        f"SELECT problem_id FROM {EXAM_QUESTION_TABLE} WHERE exam_id = ? ORDER BY position",
+                        (exam_id,)
+                    )
+                ]
+            return num_questions, time_limit_min, json.loads(params), seed, catalog_version, problem_ids
+        finally:
+            conn.close()
+
+    async def _catalog_for(self, version: str) -> Optional[ProblemCatalog]:
+        """The live catalog if it still matches ``version``, else one rebuilt from its snapshot"""
+        catalog = await get_problem_catalog()
+        if catalog.fingerprint() == version:
+            return catalog
+
+        cached = self._snapshot_catalogs.get(version)
+        if cached is not None:
+            return cached
+
+        def load() -> Optional[ProblemCatalog]:
+            conn = self._connect()
+            try:
+                self._ensure_tables(conn)
+                row = conn.execute(
+                    f"SELECT data FROM {CATALOG_SNAPSHOT_TABLE} WHERE version = ?", (version,)
+                ).fetchone()
+            finally:
+                conn.close()
+            return ProblemCatalog.from_bytes(row[0]) if row else None
+
+        snapshot_catalog = await asyncio.to_thread(load)
+        if snapshot_catalog is not None:
+            self._snapshot_catalogs.set(version, snapshot_catalog)
+        return snapshot_catalog
+
+    @staticmethod
+    def _hydrate(conn: sqlite3.Connection, problem_ids: Sequence[int]) -> Dict[int, Dict[str, Any]]:
+        """Load problems and their choices for the given ids in a single query"""
+        if not problem_ids:
+            return {}
+        placeholders = ",".join("?" for _ in problem_ids)
+        # Choices are aggregated per problem through the choices(problem_id) index
+        # and arrive as structured JSON, ready to validate into ExamQuestion
+        rows = conn.execute(
+            f"""
+            SELECT p.id, p.question, p.difficulty, p.tags,
+                   (
+                       SELECT json_group_array(json_object(
+                           'id', c.id, 'label', c.label, 'body', c.body, 'is_correct', c.is_correct
+                       ))
+                       FROM (
+                           SELECT id, label, body, is_correct FROM choices
+                           WHERE problem_id = p.id ORDER BY label
+                       ) c
+                   ) AS choices_json
+            FROM problems p
+            WHERE p.id IN ({placeholders})
+            """,
+            list(problem_ids)
+        ).fetchall()
+
+        return {
+            problem_id: {
+                "id": problem_id,
+                "question": question,
+                "choices": json.loads(choices_json),
+                "difficulty": difficulty,
+                "tags": tags,
+            }
+            for problem_id, question, difficulty, tags, choices_json in rows
+        }
+
+    @staticmethod
+    def _question_size(problem: Dict[str, Any]) -> int:
+        return (
+            QUESTION_OVERHEAD_BYTES
+            + sys.getsizeof(problem["question"])
+            + sys.getsizeof(problem["tags"] or "")
+            + sum(CHOICE_OVERHEAD_BYTES + sys.getsizeof(choice["body"]) for choice in problem["choices"])
+        )
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """Question cache hit rate and memory use"""
+        return {"question_cache": self._question_cache.get_stats()}
+
+    @staticmethod
+    def _distribution(questions: List[ExamQuestion]) -> Dict[str, float]:
+        """Achieved difficulty ratios"""
+        if not questions:
+            return {}
+        counts: Dict[str, int] = {}
+        for question in questions:
+            level = str(question.difficulty)
+            counts[level] = counts.get(level, 0) + 1
+        return {level: round(count / len(questions), 4) for level, count in sorted(counts.items())}
+
 # Global instance
 _exam_generator = ExamGenerator()
 
 async def get_exam_generator() -> ExamGenerator:
     """Dependency injection for FastAPI"""
-    return _exam_generator
\ No newline at end of file
+    return _exam_generator
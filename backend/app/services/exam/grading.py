@@ -0,0 +1,441 @@
+"""
+Exam grading service
+
+Each exam has an answer key - the correct choice label, difficulty and tag
+membership of every question as NumPy arrays - built once and cached. A
+batch of answer sheets for one exam is encoded into a (sheets x questions)
+code matrix and graded with a single broadcast comparison; per-tag and
+per-difficulty counts are matrix products with the key's one-hot columns.
+Answered questions are written to ``answer_logs`` with one executemany,
+and sheets that name a user update that user's mastery aggregates in the
+same transaction.
+"""
+
+import asyncio
+import logging
+import sqlite3
+import time
+from collections import defaultdict
+from itertools import chain
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+from pydantic import BaseModel, Field
+
+from app.core.config import settings
+from app.services.embedding.collection_version import read_collection_version
+from app.services.exam.catalog import parse_tags
+from app.services.exam.generator import ExamGenerator, _exam_generator
+from app.services.exam.mastery import MasteryRow, MasteryStore, _mastery_store
+from app.utils.cache import TTLCache
+from app.utils.metrics import Histogram
+
+logger = logging.getLogger(__name__)
+
+ANSWER_LOG_TABLE = "answer_logs"
+
+# Answer codes: choice labels are single characters and encode as their code
+# point; unanswered is 0 and anything else never matches a key
+UNANSWERED = 0
+INVALID_ANSWER = -1
+NO_CORRECT_CHOICE = -2
+
+
+class ExamSubmission(BaseModel):
+    """Final answer sheet for one exam (omit answers to submit the autosaved session)"""
+    answers: Optional[Dict[int, Optional[str]]] = Field(None, description="問題ID:選択肢ラベル")
+    time_ms: Optional[Dict[int, int]] = Field(None, description="問題ID:回答時間(ms)")
+    user_id: Optional[str] = Field(None, description="習熟度を更新するユーザーID")
+
+
+class BulkSheet(BaseModel):
+    """One answer sheet of a bulk import"""
+    exam_id: str
+    answers: Dict[int, Optional[str]]
+    time_ms: Optional[Dict[int, int]] = None
+    user_id: Optional[str] = None
+
+
+class BulkSubmission(BaseModel):
+    """Answer sheets to grade in one request (e.g. a classroom import)"""
+    sheets: List[BulkSheet] = Field(..., min_length=1)
+
+
+class Breakdown(BaseModel):
+    correct: int
+    total: int
+    rate: float
+
+
+class QuestionResult(BaseModel):
+    problem_id: int
+    answer: Optional[str]
+    correct_label: Optional[str]
+    is_correct: bool
+
+
+class ExamGradeResult(BaseModel):
+    """Score of one answer sheet"""
+    exam_id: str
+    score: float = Field(..., description="正答率 (%)")
+    correct: int
+    answered: int
+    total: int
+    by_tag: Dict[str, Breakdown]
+    by_difficulty: Dict[str, Breakdown]
+    questions: Optional[List[QuestionResult]] = None
+
+
+class BulkGradeResult(BaseModel):
+    """Scores of a bulk import, in the order of the submitted sheets"""
+    results: List[ExamGradeResult]
+    graded: int
+    logged_answers: int
+    elapsed_ms: float
+
+
+class GradedBatch(NamedTuple):
+    """Encoded sheets of one exam with their optional timings and users"""
+    key: "AnswerKey"
+    codes: np.ndarray
+    timings: List[Optional[Dict[int, int]]]
+    users: List[Optional[str]]
+
+
+class AnswerKey(NamedTuple):
+    """Per-question arrays of an exam, in exam order"""
+    problem_ids: np.ndarray
+    correct: np.ndarray
+    positions: Dict[int, int]
+    tags: List[str]
+    tag_matrix: np.ndarray
+    levels: List[str]
+    level_matrix: np.ndarray
+
+
+def encode_label(label: Optional[str]) -> int:
+    if label is None:
+        return UNANSWERED
+    return ord(label) if len(label) == 1 else INVALID_ANSWER
+
+
+def build_answer_key(rows: Sequence[Tuple[int, Optional[int], Optional[str], Optional[str]]]) -> AnswerKey:
+    """Answer key from ``(problem_id, difficulty, tags, correct_label)`` rows in exam order"""
+    problem_ids = np.array([row[0] for row in rows], dtype=np.int64)
+    correct = np.array(
+        [encode_label(row[3]) if row[3] is not None else NO_CORRECT_CHOICE for row in rows],
+        dtype=np.int32
+    )
+    row_tags = [parse_tags(row[2]) for row in rows]
+    tags = sorted({tag for names in row_tags for tag in names})
+    tag_index = {tag: i for i, tag in enumerate(tags)}
+    tag_matrix = np.zeros((len(rows), len(tags)), dtype=np.int32)
+    for position, names in enumerate(row_tags):
+        for tag in names:
+            tag_matrix[position, tag_index[tag]] = 1
+
+    row_levels = [str(row[1]) for row in rows]
+    levels = sorted(set(row_levels))
+    level_index = {level: i for i, level in enumerate(levels)}
+    level_matrix = np.zeros((len(rows), len(levels)), dtype=np.int32)
+    level_matrix[np.arange(len(rows)), np.array([level_index[level] for level in row_levels], dtype=np.intp)] = 1
+
+    return AnswerKey(
+        problem_ids=problem_ids,
+        correct=correct,
+        positions={int(problem_id): i for i, problem_id in enumerate(problem_ids)},
+        tags=tags,
+        tag_matrix=tag_matrix,
+        levels=levels,
+        level_matrix=level_matrix,
+    )
+
+
+def encode_sheets(key: AnswerKey, sheets: Sequence[Dict[int, Optional[str]]]) -> np.ndarray:
+    """(sheets x questions) answer codes; answers to problems outside the exam are ignored"""
+    num_questions = len(key.problem_ids)
+    codes = np.zeros((len(sheets), num_questions), dtype=np.int32)
+    lengths = np.fromiter((len(answers) for answers in sheets), dtype=np.int64, count=len(sheets))
+    total = int(lengths.sum())
+    if total == 0 or num_questions == 0:
+        return codes
+
+    # Flatten every (problem id, label) pair so lookups and encoding run in C loops
+    problem_ids = np.fromiter(
+        chain.from_iterable(answers.keys() for answers in sheets), dtype=np.int64, count=total
+    )
+    labels = list(chain.from_iterable(answers.values() for answers in sheets))
+    label_codes = {label: encode_label(label) for label in set(labels)}
+    values = np.fromiter(map(label_codes.__getitem__, labels), dtype=np.int32, count=total)
+    rows = np.repeat(np.arange(len(sheets)), lengths)
+
+    order = np.argsort(key.problem_ids, kind="stable")
+    sorted_ids = key.problem_ids[order]
+    index = np.minimum(np.searchsorted(sorted_ids, problem_ids), num_questions - 1)
+    in_exam = sorted_ids[index] == problem_ids
+    codes[rows[in_exam], order[index[in_exam]]] = values[in_exam]
+    return codes
+
+
+def _breakdown(correct: np.ndarray, totals: np.ndarray, names: List[str]) -> Dict[str, Breakdown]:
+    return {
+        name: Breakdown(
+            correct=int(hits),
+            total=int(total),
+            rate=round(float(hits) / float(total), 4) if total else 0.0
+        )
+        for name, hits, total in zip(names, correct.tolist(), totals.tolist())
+    }
+
+
+class ExamGrader:
+    """Grades answer sheets against cached per-exam answer keys"""
+
+    def __init__(
+        self,
+        generator: ExamGenerator,
+        mastery: MasteryStore,
+        db_path: Optional[str] = None
+    ):
+        self.generator = generator
+        self.mastery = mastery
+        self.db_path = db_path
+        self._tables_ready = False
+        # Answer keys are rebuilt after problems (or their choices) are written
+        self._keys = TTLCache(
+            max_size=settings.EXAM_ANSWER_KEY_CACHE_SIZE,
+            ttl_seconds=settings.EXAM_ANSWER_KEY_CACHE_TTL_SEC,
+            version_source=read_collection_version
+        )
+        self.sheets_graded = 0
+        self.answers_logged = 0
+        self._grade_ms = Histogram()
+        self._log_ms = Histogram()
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.db_path or settings.DB_PATH)
+
+    def _ensure_tables(self, conn: sqlite3.Connection) -> None:
+        """Create the answer log table when the ORM schema has not been created"""
+        if self._tables_ready:
+            return
+        conn.execute(f"""
+            CREATE TABLE IF NOT EXISTS {ANSWER_LOG_TABLE} (
+                id INTEGER PRIMARY KEY,
+                problem_id INTEGER NOT NULL,
+                is_correct BOOLEAN NOT NULL,
+                time_ms INTEGER,
+                answered_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                user_id TEXT
+            )
+        """)
+        # Tables created from the ORM schema have no user column
+        columns = {row[1] for row in conn.execute(f"PRAGMA table_info({ANSWER_LOG_TABLE})")}
+        if "user_id" not in columns:
+            conn.execute(f"ALTER TABLE {ANSWER_LOG_TABLE} ADD COLUMN user_id TEXT")
+        conn.commit()
+        self._tables_ready = True
+
+    async def answer_key(self, exam_id: str) -> AnswerKey:
+        """The cached answer key of an exam (404 / 410 like loading the exam)"""
+        version = self._keys.check_version()
+        key = self._keys.get(exam_id)
+        if key is not None:
+            return key
+        problem_ids, _ = await self.generator.exam_problem_ids(exam_id)
+        key = await asyncio.to_thread(self._load_key, problem_ids)
+        self._keys.set(exam_id, key, version=version)
+        return key
+
+    def _load_key(self, problem_ids: Sequence[int]) -> AnswerKey:
+        conn = self._connect()
+        try:
+            placeholders = ",".join("?" for _ in problem_ids)
+            rows = conn.execute(
+                f"""
+                SELECT p.id, p.difficulty, p.tags,
+                       (SELECT MIN(c.label) FROM choices c WHERE c.problem_id = p.id AND c.is_correct)
+                FROM problems p
+                WHERE p.id IN ({placeholders})
+                """,
+                list(problem_ids)
+            ).fetchall()
+        finally:
+            conn.close()
+        by_id = {row[0]: row for row in rows}
+        if len(by_id) != len(problem_ids):
+            logger.warning(f"Answer key: {len(problem_ids) - len(by_id)} problems no longer exist")
+        return build_answer_key([by_id[problem_id] for problem_id in problem_ids if problem_id in by_id])
+
+    async def grade(
+        self,
+        exam_id: str,
+        answers: Dict[int, Optional[str]],
+        time_ms: Optional[Dict[int, int]] = None,
+        user_id: Optional[str] = None
+    ) -> ExamGradeResult:
+        """Grade one answer sheet, log its answers and include per-question results"""
+        key = await self.answer_key(exam_id)
+        start_time = time.perf_counter()
+        codes = encode_sheets(key, [answers])
+        result = self._score(exam_id, key, codes)[0]
+        hits = codes[0] == key.correct
+        result.questions = [
+            QuestionResult(
+                problem_id=problem_id,
+                answer=answers.get(problem_id),
+                correct_label=chr(label) if label > 0 else None,
+                is_correct=is_correct
+            )
+            for problem_id, label, is_correct in zip(
+                key.problem_ids.tolist(), key.correct.tolist(), hits.tolist()
+            )
+        ]
+        self._grade_ms.observe((time.perf_counter() - start_time) * 1000)
+
+        await self._log([GradedBatch(key, codes, [time_ms], [user_id])])
+        return result
+
+    async def grade_bulk(self, submission: BulkSubmission) -> BulkGradeResult:
+        """Grade many sheets, one vectorized pass per exam, and log them in one transaction"""
+        start_time = time.perf_counter()
+        groups: Dict[str, List[int]] = defaultdict(list)
+        for index, sheet in enumerate(submission.sheets):
+            groups[sheet.exam_id].append(index)
+
+        results: List[Optional[ExamGradeResult]] = [None] * len(submission.sheets)
+        batches = []
+        for exam_id, indices in groups.items():
+            key = await self.answer_key(exam_id)
+            sheets = [submission.sheets[index] for index in indices]
+            codes = encode_sheets(key, [sheet.answers for sheet in sheets])
+            for index, result in zip(indices, self._score(exam_id, key, codes)):
+                results[index] = result
+            batches.append(GradedBatch(
+                key, codes, [sheet.time_ms for sheet in sheets], [sheet.user_id for sheet in sheets]
+            ))
+        self._grade_ms.observe((time.perf_counter() - start_time) * 1000)
+
+        logged = await self._log(batches)
+        return BulkGradeResult(
+            results=results,
+            graded=len(results),
+            logged_answers=logged,
+            elapsed_ms=round((time.perf_counter() - start_time) * 1000, 1)
+        )
+
+    def _score(self, exam_id: str, key: AnswerKey, codes: np.ndarray) -> List[ExamGradeResult]:
+        """Scores and breakdowns of every row of ``codes``"""
+        hits = (codes == key.correct).astype(np.int32)
+        answered = np.count_nonzero(codes, axis=1).tolist()
+        correct = hits.sum(axis=1).tolist()
+        by_tag = hits @ key.tag_matrix
+        by_level = hits @ key.level_matrix
+        tag_totals = key.tag_matrix.sum(axis=0)
+        level_totals = key.level_matrix.sum(axis=0)
+        total = len(key.problem_ids)
+
+        self.sheets_graded += len(codes)
+        return [
+            ExamGradeResult(
+                exam_id=exam_id,
+                score=round(100.0 * correct[row] / total, 2) if total else 0.0,
+                correct=correct[row],
+                answered=answered[row],
+                total=total,
+                by_tag=_breakdown(by_tag[row], tag_totals, key.tags),
+                by_difficulty=_breakdown(by_level[row], level_totals, key.levels),
+            )
+            for row in range(len(codes))
+        ]
+
+    async def _log(self, batches: List[GradedBatch]) -> int:
+        """Write an answer log row for every answered question with a single executemany"""
+        rows: List[Tuple[int, bool, Optional[int], Optional[str]]] = []
+        tag_rows: List[MasteryRow] = []
+        problem_rows: List[MasteryRow] = []
+        for batch in batches:
+            key, codes = batch.key, batch.codes
+            sheet_index, position = np.nonzero(codes)
+            problem_ids = key.problem_ids[position].tolist()
+            is_correct = (codes[sheet_index, position] == key.correct[position]).tolist()
+            sheets = sheet_index.tolist()
+            if any(batch.timings):
+                elapsed = [
+                    (batch.timings[sheet] or {}).get(problem_id)
+                    for sheet, problem_id in zip(sheets, problem_ids)
+                ]
+            else:
+                elapsed = [None] * len(problem_ids)
+            if any(batch.users):
+                users = [batch.users[sheet] for sheet in sheets]
+                problem_rows.extend(
+                    (user, problem_id, 1, int(hit))
+                    for user, problem_id, hit in zip(users, problem_ids, is_correct) if user
+                )
+                tag_rows.extend(self._tag_rows(batch))
+            else:
+                users = [None] * len(problem_ids)
+            rows.extend(zip(problem_ids, is_correct, elapsed, users))
+        if not rows:
+            return 0
+
+        start_time = time.perf_counter()
+        await asyncio.to_thread(self._write_logs, rows, tag_rows, problem_rows)
+        self.mastery.invalidate({row[0] for row in problem_rows})
+        self._log_ms.observe((time.perf_counter() - start_time) * 1000)
+        self.answers_logged += len(rows)
+        return len(rows)
+
+    @staticmethod
+    def _tag_rows(batch: GradedBatch) -> List[MasteryRow]:
+        """(user, tag, attempts, correct) per sheet that names a user"""
+        sheets = [index for index, user in enumerate(batch.users) if user]
+        codes = batch.codes[sheets]
+        answered = (codes != UNANSWERED).astype(np.int32)
+        hits = (codes == batch.key.correct).astype(np.int32)
+        attempts = (answered @ batch.key.tag_matrix).tolist()
+        correct = (hits @ batch.key.tag_matrix).tolist()
+        return [
+            (batch.users[sheet], tag, attempts[row][column], correct[row][column])
+            for row, sheet in enumerate(sheets)
+            for column, tag in enumerate(batch.key.tags)
+            if attempts[row][column]
+        ]
+
+    def _write_logs(
+        self,
+        rows: List[Tuple[int, bool, Optional[int], Optional[str]]],
+        tag_rows: List[MasteryRow],
+        problem_rows: List[MasteryRow]
+    ) -> None:
+        conn = self._connect()
+        try:
+            self._ensure_tables(conn)
+            self.mastery.ensure_tables(conn)
+            with conn:
+                conn.executemany(
+                    f"INSERT INTO {ANSWER_LOG_TABLE} (problem_id, is_correct, time_ms, user_id) VALUES (?, ?, ?, ?)",
+                    rows
+                )
+                self.mastery.record(conn, tag_rows, problem_rows)
+        finally:
+            conn.close()
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """Grading throughput and answer key cache statistics"""
+        return {
+            "sheets_graded": self.sheets_graded,
+            "answers_logged": self.answers_logged,
+            "grade_ms": self._grade_ms.snapshot(),
+            "log_write_ms": self._log_ms.snapshot(),
+            "answer_key_cache": self._keys.get_stats(),
+        }
+
+
+# Global instance
+_exam_grader = ExamGrader(_exam_generator, _mastery_store)
+
+async def get_exam_grader() -> ExamGrader:
+    """Dependency injection for FastAPI"""
+    return _exam_grader
@@ -3,6 +3,7 @@
 /exam/generate エンドポイント
 """
 
+import json
 import uuid
 import random
 import time
@@ -76,6 +77,36 @@ def get_db_connection():
     finally:
         conn.close()
 
+def fetch_choices(conn: sqlite3.Connection, problem_ids: List[int]) -> Dict[int, List[Choice]]:
+    """
+    指定問題の選択肢を1クエリで取得
+    
+    json_group_array で構造化したまま集約するため、本文中のカンマで
+    選択肢が分割されることはない。choice(problem_id) インデックスを使う。
+    """
+    if not problem_ids:
+        return {}
+    
+    placeholders = ','.join('?' for _ in problem_ids)
+    cursor = conn.execute(f"""
+        SELECT problem_id,
+               json_group_array(
+                   json_object('label', label, 'body', body, 'is_correct', is_correct)
+               ) AS choices_json
+        FROM (
+            SELECT problem_id, label, body, is_correct
+            FROM choice
+            WHERE problem_id IN ({placeholders})
+            ORDER BY problem_id, label
+        )
+        GROUP BY problem_id
+    """, list(problem_ids))
+    
+    return {
+        problem_id: [Choice(**choice) for choice in json.loads(choices_json)]
+        for problem_id, choices_json in cursor.fetchall()
+    }
+
 # === Core Logic ===
 
 class ExamGenerator:
@@ -148,19 +179,14 @@ class ExamGenerator:
         )
     
     def _fetch_candidate_problems(self, tags: Optional[List[str]]) -> List[Dict]:
-        """条件に合う候補問題を取得"""
+        """条件に合う候補問題を取得 (選択肢は選ばれた問題だけ後で取得)"""
         with get_db_connection() as conn:
             if tags:
                 # タグ条件がある場合
-                placeholders = ','.join(['?' for _ in tags])
-                query = f"""
-                    SELECT p.*, GROUP_CONCAT(c.label) as choice_labels,
-                           GROUP_CONCAT(c.body) as choice_bodies,
-                           GROUP_CONCAT(c.is_correct) as choice_corrects
+                query = """
+                    SELECT p.id, p.question, p.difficulty, p.tags
                     FROM problem p
-                    LEFT JOIN choice c ON p.id = c.problem_id
                     WHERE p.tags REGEXP ?
-                    GROUP BY p.id
                     ORDER BY p.id
                 """
                 # SQLite REGEXPは簡易実装として、タグをOR条件で結合
@@ -169,12 +195,8 @@ class ExamGenerator:
             else:
                 # 全問題対象
                 query = """
-                    SELECT p.*, GROUP_CONCAT(c.label) as choice_labels,
-                           GROUP_CONCAT(c.body) as choice_bodies,
-                           GROUP_CONCAT(c.is_correct) as choice_corrects
+                    SELECT p.id, p.question, p.difficulty, p.tags
                     FROM problem p
-                    LEFT JOIN choice c ON p.id = c.problem_id
-                    GROUP BY p.id
                     ORDER BY p.id
                 """
                 cursor = conn.execute(query)
@@ -233,30 +255,18 @@ class ExamGenerator:
     
     def _build_question_list(self, problems: List[Dict]) -> List[ExamQuestion]:
         """レスポンス用問題リスト構築"""
-        questions = []
+        with get_db_connection() as conn:
+            choices_by_problem = fetch_choices(conn, [problem['id'] for problem in problems])
         
+        questions = []
         for problem in problems:
-            # 選択肢を解析
-            choices = []
-            if problem['choice_labels']:
-                labels = problem['choice_labels'].split(',')
-                bodies = problem['choice_bodies'].split(',')
-                corrects = problem['choice_corrects'].split(',')
-                
-                for label, body, correct in zip(labels, bodies, corrects):
-                    choices.append(Choice(
-                        label=label.strip(),
-                        body=body.strip(),
-                        is_correct=correct.strip() == '1'
-                    ))
-            
             # タグを解析
             tags = problem['tags'].split(',') if problem['tags'] else []
             
             questions.append(ExamQuestion(
                 id=problem['id'],
                 question=problem['question'],
-                choices=choices,
+                choices=choices_by_problem.get(problem['id'], []),
                 difficulty=problem['difficulty'],
                 tags=[tag.strip() for tag in tags]
             ))
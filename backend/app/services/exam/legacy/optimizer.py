@@ -6,13 +6,23 @@
 """
 
 import sqlite3
-import hashlib
-import json
-from typing import Dict, List, Optional
+import time
+from typing import Dict, List, Optional, Sequence
 from functools import lru_cache
 from contextlib import contextmanager
 import logging
 
+from fastapi import HTTPException
+
+from app.services.embedding.collection_version import read_collection_version
+from app.services.exam.legacy.generate import (
+    ExamGenerator,
+    ExamGenerateRequest,
+    ExamGenerateResponse,
+    get_db_connection,
+)
+from app.utils.cache import TTLCache
+
 # === Database Optimization ===
 
 def create_performance_indexes():
@@ -64,33 +74,16 @@ class OptimizedQueryBuilder:
     
     @staticmethod
     def build_candidate_query(tags: Optional[List[str]] = None) -> tuple:
-        """候補問題取得用最適化クエリ"""
+        """候補問題取得用最適化クエリ (選択肢は選ばれた問題だけ fetch_choices で取得)"""
         
         if tags:
             # FTS5を使用したタグ検索
             query = """
-                WITH filtered_problems AS (
-                    SELECT p.id, p.question, p.answer, p.explanation, 
-                           p.difficulty, p.tags, p.source_url, p.created_at
-                    FROM problem p
-                    JOIN problem_fts fts ON p.id = fts.rowid
-                    WHERE problem_fts MATCH ?
-                ),
-                problems_with_choices AS (
-                    SELECT fp.*,
-                           json_group_array(
-                               json_object(
-                                   'label', c.label,
-                                   'body', c.body,
-                                   'is_correct', c.is_correct
-                               )
-                           ) as choices_json
-                    FROM filtered_problems fp
-                    LEFT JOIN choice c ON fp.id = c.problem_id
-                    GROUP BY fp.id
-                )
-                SELECT * FROM problems_with_choices
-                ORDER BY difficulty, id
+                SELECT p.id, p.question, p.difficulty, p.tags
+                FROM problem p
+                JOIN problem_fts fts ON p.id = fts.rowid
+                WHERE problem_fts MATCH ?
+                ORDER BY p.difficulty, p.id
             """
             
             # FTS5クエリ形式に変換
@@ -100,22 +93,9 @@ class OptimizedQueryBuilder:
         else:
             # 全問題対象（最適化版）
             query = """
-                WITH problems_with_choices AS (
-                    SELECT p.id, p.question, p.answer, p.explanation,
-                           p.difficulty, p.tags, p.source_url, p.created_at,
-                           json_group_array(
-                               json_object(
-                                   'label', c.label,
-                                   'body', c.body,
-                                   'is_correct', c.is_correct
-                               )
-                           ) as choices_json
-                    FROM problem p
-                    LEFT JOIN choice c ON p.id = c.problem_id
-                    GROUP BY p.id
-                )
-                SELECT * FROM problems_with_choices
-                ORDER BY difficulty, id
+                SELECT p.id, p.question, p.difficulty, p.tags
+                FROM problem p
+                ORDER BY p.difficulty, p.id
             """
             params = ()
         
@@ -151,42 +131,19 @@ class OptimizedQueryBuilder:
 
 # === Cache Layer ===
 
-class ExamCache:
-    """模試生成結果キャッシュ"""
-    
-    def __init__(self, max_size: int = 100):
-        self.max_size = max_size
-        self._cache = {}
-    
-    def _generate_cache_key(self, request_dict: Dict) -> str:
-        """リクエスト内容からキャッシュキーを生成"""
-        # tagsをソートして順序に依存しないキーにする
-        normalized = request_dict.copy()
-        if normalized.get('tags'):
-            normalized['tags'] = sorted(normalized['tags'])
-        
-        # JSON文字列からハッシュ生成
-        json_str = json.dumps(normalized, sort_keys=True)
-        return hashlib.md5(json_str.encode()).hexdigest()
-    
-    def get(self, request_dict: Dict) -> Optional[List[Dict]]:
-        """キャッシュから候補問題を取得"""
-        cache_key = self._generate_cache_key(request_dict)
-        return self._cache.get(cache_key)
-    
-    def set(self, request_dict: Dict, candidates: List[Dict]):
-        """候補問題をキャッシュに保存"""
-        if len(self._cache) >= self.max_size:
-            # LRU的な削除（簡易版）
-            oldest_key = next(iter(self._cache))
-            del self._cache[oldest_key]
-        
-        cache_key = self._generate_cache_key(request_dict)
-        self._cache[cache_key] = candidates.copy()
-    
-    def clear(self):
-        """キャッシュクリア"""
-        self._cache.clear()
+# 候補セットは問題テーブルへの書き込み (コレクションバージョン更新) で破棄する
+CANDIDATE_CACHE_SIZE = 100
+CANDIDATE_CACHE_TTL_SEC = 600
+CANDIDATE_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+def create_candidate_cache() -> TTLCache:
+    """タグ条件ごとの候補問題キャッシュ (LRU + TTL + バイト上限)"""
+    return TTLCache(
+        max_size=CANDIDATE_CACHE_SIZE,
+        ttl_seconds=CANDIDATE_CACHE_TTL_SEC,
+        max_bytes=CANDIDATE_CACHE_MAX_BYTES,
+        version_source=read_collection_version
+    )
 
 # === Optimized Exam Generator ===
 
@@ -196,7 +153,7 @@ class OptimizedExamGenerator(ExamGenerator):
     def __init__(self):
         super().__init__()
         self.query_builder = OptimizedQueryBuilder()
-        self.cache = ExamCache()
+        self.cache = create_candidate_cache()
         self._ensure_indexes()
     
     def _ensure_indexes(self):
@@ -206,13 +163,18 @@ class OptimizedExamGenerator(ExamGenerator):
         except Exception as e:
             logging.warning(f"インデックス作成エラー: {e}")
     
-    def _fetch_candidate_problems(self, tags: Optional[List[str]]) -> List[Dict]:
-        """最適化された候補問題取得"""
+    def _fetch_candidate_problems(self, tags: Optional[List[str]]) -> Sequence[Dict]:
+        """
+        最適化された候補問題取得
         
-        # キャッシュ確認
-        cache_key_dict = {'tags': tags}
-        cached_result = self.cache.get(cache_key_dict)
-        if cached_result:
+        候補はタプルのまま共有する (呼び出し側は変更しないこと)
+        """
+        
+        # キャッシュ確認 (問題の追加・削除後は check_version で全破棄される)
+        version = self.cache.check_version()
+        cache_key = tuple(sorted(tags)) if tags else None
+        cached_result = self.cache.get(cache_key)
+        if cached_result is not None:
             logging.info("キャッシュから候補問題を取得")
             return cached_result
         
@@ -223,44 +185,18 @@ class OptimizedExamGenerator(ExamGenerator):
             cursor = conn.execute(query, params)
             rows = cursor.fetchall()
         
-        # 結果をパース
-        candidates = []
-        for row in rows:
-            row_dict = dict(row)
-            
-            # JSON形式の選択肢をパース
-            if row_dict['choices_json']:
-                try:
-                    choices_data = json.loads(row_dict['choices_json'])
-                    
-                    # 選択肢を従来形式に変換
-                    labels, bodies, corrects = [], [], []
-                    for choice in choices_data:
-                        if choice['label']:  # nullチェック
-                            labels.append(choice['label'])
-                            bodies.append(choice['body'])
-                            corrects.append('1' if choice['is_correct'] else '0')
-                    
-                    row_dict['choice_labels'] = ','.join(labels)
-                    row_dict['choice_bodies'] = ','.join(bodies)
-                    row_dict['choice_corrects'] = ','.join(corrects)
-                except json.JSONDecodeError:
-                    # フォールバック
-                    row_dict['choice_labels'] = ''
-                    row_dict['choice_bodies'] = ''
-                    row_dict['choice_corrects'] = ''
-            
-            candidates.append(row_dict)
+        # 選択肢は _build_question_list で json_group_array から直接復元する
+        candidates = tuple(dict(row) for row in rows)
         
-        # キャッシュに保存
-        self.cache.set(cache_key_dict, candidates)
+        # キャッシュに保存 (取得中に問題が更新されていれば保存しない)
+        self.cache.set(cache_key, candidates, version=version)
         
         logging.info(f"候補問題 {len(candidates)} 件を取得")
         return candidates
     
     def _select_problems_by_difficulty_optimized(
         self, 
-        candidates: List[Dict], 
+        candidates: Sequence[Dict], 
         num_questions: int, 
         difficulty_ratio: Dict[str, float]
     ) -> List[Dict]:
@@ -379,7 +315,7 @@ def create_optimized_router():
             # パフォーマンス情報を追加
             elapsed_ms = (time.time() - start_time) * 1000
             result.metadata['total_generation_time_ms'] = round(elapsed_ms, 2)
-            result.metadata['cache_size'] = len(generator.cache._cache)
+            result.metadata['cache'] = generator.cache.get_stats()
             
             return result
             
@@ -398,6 +334,11 @@ def create_optimized_router():
         generator.cache.clear()
         return {"message": "キャッシュをクリアしました"}
     
+    @router.get("/cache/stats")
+    async def get_cache_stats():
+        """キャッシュのヒット率・使用バイト数"""
+        return generator.cache.get_stats()
+    
     return router
 
 # === Database Migration ===
@@ -0,0 +1,230 @@
+"""
+Per-user mastery aggregates for adaptive exams
+
+Grading upserts (attempts, correct) per (user, tag) and per (user, problem)
+in the same transaction that writes the answer logs, so the aggregates are
+always current and never need a scan of ``answer_logs``. An adaptive exam
+reads one user's rows through the primary key: tags are weighted by
+weakness (Laplace-smoothed error rate) on top of their catalog share, and
+problems the user has already seen get a lower sampling weight the better
+they were answered. Unseen problems keep weight 1.
+"""
+
+import asyncio
+import logging
+import sqlite3
+import time
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+from pydantic import Field
+
+from app.core.config import settings
+from app.models.schemas import ExamGenerateRequest
+from app.services.exam.catalog import ProblemCatalog, get_problem_catalog
+from app.services.exam.composer import ProblemWeights
+from app.utils.cache import TTLCache
+from app.utils.metrics import Histogram
+
+logger = logging.getLogger(__name__)
+
+TAG_MASTERY_TABLE = "user_tag_mastery"
+PROBLEM_MASTERY_TABLE = "user_problem_mastery"
+
+# (user_id, key, attempts, correct)
+MasteryRow = Tuple[str, Any, int, int]
+
+
+class AdaptiveExamRequest(ExamGenerateRequest):
+    """Exam request targeted at one user's weak areas"""
+    user_id: str = Field(..., min_length=1, description="回答履歴を参照するユーザーID")
+
+
+class UserMastery(NamedTuple):
+    """One user's aggregates: tag -> (attempts, correct) and seen problems (sorted ids)"""
+    tags: Dict[str, Tuple[int, int]]
+    problem_ids: np.ndarray
+    attempts: np.ndarray
+    correct: np.ndarray
+
+
+class MasteryStore:
+    """Incrementally maintained (user, tag) and (user, problem) answer statistics"""
+
+    def __init__(
+        self,
+        db_path: Optional[str] = None,
+        weak_tag_boost: float = 2.0,
+        seen_weight: float = 0.2,
+        missed_weight: float = 0.8,
+        cache_size: int = 1000,
+        cache_ttl_sec: float = 300
+    ):
+        self.db_path = db_path
+        self.weak_tag_boost = weak_tag_boost
+        self.seen_weight = seen_weight
+        self.missed_weight = missed_weight
+        self._tables_ready = False
+        # Per-user aggregates; the grader invalidates a user after recording answers
+        self._cache = TTLCache(max_size=cache_size, ttl_seconds=cache_ttl_sec)
+        self.rows_upserted = 0
+        self.plans = 0
+        self._plan_ms = Histogram()
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.db_path or settings.DB_PATH)
+
+    def ensure_tables(self, conn: sqlite3.Connection) -> None:
+        if self._tables_ready:
+            return
+        conn.execute(f"""
+            CREATE TABLE IF NOT EXISTS {TAG_MASTERY_TABLE} (
+                user_id TEXT NOT NULL,
+                tag TEXT NOT NULL,
+                attempts INTEGER NOT NULL,
+                correct INTEGER NOT NULL,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (user_id, tag)
+            ) WITHOUT ROWID
+        """)
+        conn.execute(f"""
+            CREATE TABLE IF NOT EXISTS {PROBLEM_MASTERY_TABLE} (
+                user_id TEXT NOT NULL,
+                problem_id INTEGER NOT NULL,
+                attempts INTEGER NOT NULL,
+                correct INTEGER NOT NULL,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (user_id, problem_id)
+            ) WITHOUT ROWID
+        """)
+        conn.commit()
+        self._tables_ready = True
+
+    # === Updates (called by the grader inside its transaction) ===
+
+    def record(
+        self,
+        conn: sqlite3.Connection,
+        tag_rows: Sequence[MasteryRow],
+        problem_rows: Sequence[MasteryRow]
+    ) -> None:
+        """Add graded answer counts to the aggregates (caller ensures tables and commits)"""
+        now = time.time()
+        for table, column, rows in (
+            (TAG_MASTERY_TABLE, "tag", tag_rows),
+            (PROBLEM_MASTERY_TABLE, "problem_id", problem_rows),
+        ):
+            if not rows:
+                continue
+            conn.executemany(
+                f"""
+                INSERT INTO {table} (user_id, {column}, attempts, correct, updated_at)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (user_id, {column}) DO UPDATE SET
+                    attempts = attempts + excluded.attempts,
+                    correct = correct + excluded.correct,
+                    updated_at = excluded.updated_at
+                """,
+                [(*row, now) for row in rows]
+            )
+        self.rows_upserted += len(tag_rows) + len(problem_rows)
+
+    def invalidate(self, user_ids: Iterable[str]) -> None:
+        for user_id in user_ids:
+            self._cache.invalidate(user_id)
+
+    # === Reads ===
+
+    async def load(self, user_id: str) -> UserMastery:
+        """A user's aggregates (primary-key range reads, cached)"""
+        mastery = self._cache.get(user_id)
+        if mastery is None:
+            mastery = await asyncio.to_thread(self._load, user_id)
+            self._cache.set(user_id, mastery)
+        return mastery
+
+    def _load(self, user_id: str) -> UserMastery:
+        conn = self._connect()
+        try:
+            self.ensure_tables(conn)
+            tags = {
+                tag: (attempts, correct)
+                for tag, attempts, correct in conn.execute(
+                    f"SELECT tag, attempts, correct FROM {TAG_MASTERY_TABLE} WHERE user_id = ?",
+                    (user_id,)
+                )
+            }
+            rows = conn.execute(
+                f"""
+                SELECT problem_id, attempts, correct FROM {PROBLEM_MASTERY_TABLE}
+                WHERE user_id = ? ORDER BY problem_id
+                """,
+                (user_id,)
+            ).fetchall()
+        finally:
+            conn.close()
+        stats = np.array(rows, dtype=np.int64).reshape(-1, 3)
+        return UserMastery(tags, stats[:, 0].copy(), stats[:, 1].copy(), stats[:, 2].copy())
+
+    def tag_ratio(self, mastery: UserMastery, tag_counts: Dict[str, int]) -> Dict[str, float]:
+        """
+        Catalog share of each tag scaled by 1 + boost * error rate
+
+        The error rate is (wrong + 1) / (attempts + 2), so a tag the user has
+        never answered scales like one answered half right and a user with no
+        history gets the plain catalog distribution.
+        """
+        ratio = {}
+        for tag, count in tag_counts.items():
+            attempts, correct = mastery.tags.get(tag, (0, 0))
+            error_rate = (attempts - correct + 1) / (attempts + 2)
+            ratio[tag] = count * (1 + self.weak_tag_boost * error_rate)
+        total = sum(ratio.values())
+        return {tag: weight / total for tag, weight in ratio.items()} if total else {}
+
+    def problem_weights(self, mastery: UserMastery) -> ProblemWeights:
+        """Seen problems weigh between ``seen_weight`` (always right) and ``missed_weight`` (always wrong)"""
+        accuracy = mastery.correct / np.maximum(mastery.attempts, 1)
+        weights = self.missed_weight - (self.missed_weight - self.seen_weight) * accuracy
+        return ProblemWeights(mastery.problem_ids, weights)
+
+    async def plan(
+        self,
+        user_id: str,
+        tags: Optional[List[str]] = None,
+        catalog: Optional[ProblemCatalog] = None
+    ) -> Tuple[Dict[str, float], ProblemWeights]:
+        """Tag ratio and problem weights for an adaptive exam"""
+        start_time = time.perf_counter()
+        catalog = catalog or await get_problem_catalog()
+        mastery = await self.load(user_id)
+        tag_counts = catalog.tag_counts()
+        if tags:
+            tag_counts = {tag: tag_counts[tag] for tag in tags if tag in tag_counts}
+        result = self.tag_ratio(mastery, tag_counts), self.problem_weights(mastery)
+        self.plans += 1
+        self._plan_ms.observe((time.perf_counter() - start_time) * 1000)
+        return result
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """Aggregate upserts, adaptive plans and per-user cache statistics"""
+        return {
+            "rows_upserted": self.rows_upserted,
+            "plans": self.plans,
+            "plan_ms": self._plan_ms.snapshot(),
+            "user_cache": self._cache.get_stats(),
+        }
+
+
+# Global instance
+_mastery_store = MasteryStore(
+    weak_tag_boost=settings.ADAPTIVE_WEAK_TAG_BOOST,
+    seen_weight=settings.ADAPTIVE_SEEN_WEIGHT,
+    missed_weight=settings.ADAPTIVE_MISSED_WEIGHT,
+    cache_size=settings.ADAPTIVE_MASTERY_CACHE_SIZE,
+    cache_ttl_sec=settings.ADAPTIVE_MASTERY_CACHE_TTL_SEC
+)
+
+async def get_mastery_store() -> MasteryStore:
+    """Dependency injection for FastAPI"""
+    return _mastery_store
@@ -0,0 +1,277 @@
+"""
+Pre-generated exam pools for frequent exam configurations
+
+A whole class usually starts an exam at the same moment with identical
+settings. The pool learns the most frequent ``(num_questions,
+difficulty_ratio, tags)`` signatures from a sliding window of recent
+requests and keeps a number of composed and hydrated exams ready for each
+of them. A request for a pooled signature pops one in O(1) and only stores
+it under a fresh exam id; any other request falls back to live generation.
+Pools are refilled by a background task and dropped when the problem
+catalog changes.
+"""
+
+import asyncio
+import logging
+import time
+from collections import Counter, deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from fastapi import HTTPException
+
+from app.core.config import settings
+from app.models.schemas import ExamGenerateRequest, ExamResponse
+from app.services.exam.catalog import get_problem_catalog
+from app.services.exam.generator import ExamGenerator, PreparedExam, _exam_generator
+from app.utils.metrics import Histogram
+
+logger = logging.getLogger(__name__)
+
+# Refill lag spans milliseconds (one missing exam) to tens of seconds (a drained pool)
+REFILL_LAG_BUCKETS_MS = (10, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000)
+
+ExamSignature = Tuple[int, Tuple[Tuple[str, float], ...], Tuple[str, ...]]
+
+
+def exam_signature(request: ExamGenerateRequest) -> ExamSignature:
+    """Normalized pool key; requests that differ only in key order or time limit share it"""
+    ratio = tuple(sorted(
+        (str(level), round(float(weight), 4))
+        for level, weight in request.difficulty_ratio.items() if weight > 0
+    ))
+    tags = tuple(sorted(set(request.tags or ())))
+    return request.num_questions, ratio, tags
+
+
+class _Pool:
+    """Ready exams for one signature"""
+
+    __slots__ = ("request", "exams", "short_since")
+
+    def __init__(self, request: ExamGenerateRequest):
+        self.request = request
+        self.exams: Deque[PreparedExam] = deque()
+        # When the pool first dropped below its target (None while full)
+        self.short_since: Optional[float] = time.monotonic()
+
+
+class ExamPool:
+    """Keeps pre-generated exams ready for the most requested signatures"""
+
+    def __init__(
+        self,
+        generator: ExamGenerator,
+        pool_size: int = 20,
+        max_signatures: int = 8,
+        min_requests: int = 3,
+        history_size: int = 1000,
+        refill_interval_sec: float = 5.0,
+        enabled: bool = True
+    ):
+        self.generator = generator
+        self.pool_size = pool_size
+        self.max_signatures = max_signatures
+        self.min_requests = min_requests
+        self.refill_interval_sec = refill_interval_sec
+        self.enabled = enabled and pool_size > 0
+
+        self._history: Deque[ExamSignature] = deque(maxlen=max(1, history_size))
+        self._counts: Counter = Counter()
+        self._sample_requests: Dict[ExamSignature, ExamGenerateRequest] = {}
+        self._pools: Dict[ExamSignature, _Pool] = {}
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+        self.hits = 0
+        self.misses = 0
+        self.stale_dropped = 0
+        self.generated = 0
+        self.refill_errors = 0
+        self.refill_lag_histogram = Histogram(REFILL_LAG_BUCKETS_MS)
+
+    async def generate_exam(self, request: ExamGenerateRequest) -> ExamResponse:
+        """Serve a pooled exam when one is ready, otherwise generate it live"""
+        if not self.enabled:
+            return await self.generator.generate_exam(request)
+
+        signature = exam_signature(request)
+        prepared = await self._pop(signature)
+        if prepared is not None:
+            self.hits += 1
+            response = await self.generator.publish_exam(prepared, request)
+        else:
+            self.misses += 1
+            response = await self.generator.generate_exam(request)
+
+        # Only requests that could be served count towards the history
+        self._record(signature, request)
+        self._wake()
+        return response
+
+    async def _pop(self, signature: ExamSignature) -> Optional[PreparedExam]:
+        pool = self._pools.get(signature)
+        if pool is None or not pool.exams:
+            return None
+
+        catalog = await get_problem_catalog()
+        while pool.exams:
+            prepared = pool.exams.popleft()
+            if pool.short_since is None:
+                pool.short_since = time.monotonic()
+            if prepared.catalog_revision == catalog.revision:
+                return prepared
+            # Built before a problem was added or removed
+            self.stale_dropped += 1
+        return None
+
+    def _record(self, signature: ExamSignature, request: ExamGenerateRequest) -> None:
+        """Count the signature in the sliding request window"""
+        if len(self._history) == self._history.maxlen:
+            expired = self._history[0]
+            self._counts[expired] -= 1
+            if self._counts[expired] <= 0:
+                del self._counts[expired]
+                self._sample_requests.pop(expired, None)
+        self._history.append(signature)
+        self._counts[signature] += 1
+        self._sample_requests[signature] = request
+
+    def hot_signatures(self) -> List[ExamSignature]:
+        """Most requested signatures that qualify for a pool"""
+        return [
+            signature for signature, count in self._counts.most_common(self.max_signatures)
+            if count >= self.min_requests
+        ]
+
+    def _wake(self) -> None:
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def refill(self) -> int:
+        """Top up the pools of the hot signatures; returns the number of exams built"""
+        hot = self.hot_signatures()
+        for signature in list(self._pools):
+            if signature not in hot:
+                del self._pools[signature]
+        for signature in hot:
+            if signature not in self._pools:
+                self._pools[signature] = _Pool(self._sample_requests[signature])
+
+        catalog = await get_problem_catalog()
+        for pool in self._pools.values():
+            if any(prepared.catalog_revision != catalog.revision for prepared in pool.exams):
+                kept = [p for p in pool.exams if p.catalog_revision == catalog.revision]
+                self.stale_dropped += len(pool.exams) - len(kept)
+                pool.exams = deque(kept)
+                if pool.short_since is None:
+                    pool.short_since = time.monotonic()
+
+        # Round-robin one exam at a time so a drained pool does not starve the others
+        built = 0
+        pending = [signature for signature in hot if len(self._pools[signature].exams) < self.pool_size]
+        while pending:
+            for signature in list(pending):
+                pool = self._pools.get(signature)
+                if pool is None:
+                    pending.remove(signature)
+                    continue
+                try:
+                    prepared = await self.generator.prepare_exam(pool.request)
+                except HTTPException as e:
+                    self.refill_errors += 1
+                    logger.warning(f"Cannot pre-generate exams for {signature}: {e.detail}")
+                    pending.remove(signature)
+                    continue
+                except Exception as e:
+                    self.refill_errors += 1
+                    logger.error(f"Exam pool refill failed for {signature}: {e}")
+                    pending.remove(signature)
+                    continue
+
+                pool.exams.append(prepared)
+                built += 1
+                self.generated += 1
+                if len(pool.exams) >= self.pool_size:
+                    pending.remove(signature)
+                    if pool.short_since is not None:
+                        self.refill_lag_histogram.observe((time.monotonic() - pool.short_since) * 1000)
+                        pool.short_since = None
+        return built
+
+    async def run(self) -> None:
+        """Background refill loop: runs after pops and at least every refill interval"""
+        self._wakeup = asyncio.Event()
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.refill_interval_sec)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.refill()
+            except Exception as e:
+                logger.error(f"Exam pool refill pass failed: {e}")
+
+    def start(self) -> None:
+        """Start the background refill task (no-op when disabled or running)"""
+        if self.enabled and (self._task is None or self._task.done()):
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        """Cancel the background refill task"""
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """Hit rate, pool fill levels and refill lag"""
+        now = time.monotonic()
+        served = self.hits + self.misses
+        pools = []
+        current_lag_ms = 0.0
+        for (num_questions, ratio, tags), pool in self._pools.items():
+            lag_ms = (now - pool.short_since) * 1000 if pool.short_since is not None else 0.0
+            current_lag_ms = max(current_lag_ms, lag_ms)
+            pools.append({
+                "num_questions": num_questions,
+                "difficulty_ratio": dict(ratio),
+                "tags": list(tags),
+                "requests": self._counts.get((num_questions, ratio, tags), 0),
+                "ready": len(pool.exams),
+                "target": self.pool_size,
+                "lag_ms": round(lag_ms, 1),
+            })
+        return {
+            "enabled": self.enabled,
+            "running": self._task is not None and not self._task.done(),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / served, 4) if served else 0.0,
+            "stale_dropped": self.stale_dropped,
+            "generated": self.generated,
+            "refill_errors": self.refill_errors,
+            "pooled_exams": sum(len(pool.exams) for pool in self._pools.values()),
+            "current_refill_lag_ms": round(current_lag_ms, 1),
+            "refill_lag_ms": self.refill_lag_histogram.snapshot(),
+            "pools": pools,
+        }
+
+
+# Global instance
+_exam_pool = ExamPool(
+    _exam_generator,
+    pool_size=settings.EXAM_POOL_SIZE,
+    max_signatures=settings.EXAM_POOL_MAX_SIGNATURES,
+    min_requests=settings.EXAM_POOL_MIN_REQUESTS,
+    history_size=settings.EXAM_POOL_HISTORY_SIZE,
+    refill_interval_sec=settings.EXAM_POOL_REFILL_INTERVAL_SEC,
+    enabled=settings.EXAM_POOL_ENABLED
+)
+
+async def get_exam_pool() -> ExamPool:
+    """Dependency injection for FastAPI"""
+    return _exam_pool
@@ -0,0 +1,412 @@
+"""
+Exam session store: in-progress answers with debounced autosave
+
+Answers are applied to an in-memory session and only marked dirty; a
+background flusher writes every dirty session in one transaction every
+``flush_interval_sec`` (and on submit / shutdown), so a burst of clicks
+becomes a single UPSERT per session. Sessions are resumable from the
+database after a restart and are evicted by a background sweeper once
+their TTL has passed. Unflushed answers (at most one interval) are lost if
+the process dies; the store assumes a single worker process per database.
+"""
+
+import asyncio
+import json
+import logging
+import sqlite3
+import time
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from fastapi import HTTPException
+from pydantic import BaseModel, Field
+
+from app.core.config import settings
+from app.services.exam.generator import EXAM_TABLE
+from app.utils.metrics import Histogram
+
+logger = logging.getLogger(__name__)
+
+SESSION_TABLE = "exam_sessions"
+
+
+class AnswerUpdate(BaseModel):
+    """Answers changed since the last save (problem id -> choice label, None clears)"""
+    answers: Dict[int, Optional[str]] = Field(..., description="問題ID:選択肢ラベル")
+
+
+class ExamSessionState(BaseModel):
+    """Resumable state of an exam in progress"""
+    exam_id: str
+    answers: Dict[int, str]
+    started_at: float
+    deadline: float
+    remaining_sec: float
+    submitted: bool
+    saved: bool = Field(..., description="最新の回答がDBに保存済みか")
+
+
+class _Session:
+    __slots__ = ("exam_id", "answers", "started_at", "deadline", "updated_at", "submitted_at")
+
+    def __init__(
+        self,
+        exam_id: str,
+        answers: Dict[int, str],
+        started_at: float,
+        deadline: float,
+        updated_at: float,
+        submitted_at: Optional[float] = None
+    ):
+        self.exam_id = exam_id
+        self.answers = answers
+        self.started_at = started_at
+        self.deadline = deadline
+        self.updated_at = updated_at
+        self.submitted_at = submitted_at
+
+
+class ExamSessionStore:
+    """In-memory exam sessions backed by batched SQLite writes"""
+
+    def __init__(
+        self,
+        db_path: Optional[str] = None,
+        flush_interval_sec: float = 2.0,
+        ttl_sec: float = 86400,
+        grace_sec: float = 30,
+        sweep_interval_sec: float = 600
+    ):
+        self.db_path = db_path
+        self.flush_interval_sec = flush_interval_sec
+        self.ttl_sec = ttl_sec
+        self.grace_sec = grace_sec
+        self.sweep_interval_sec = sweep_interval_sec
+
+        self._sessions: Dict[str, _Session] = {}
+        self._dirty: Set[str] = set()
+        self._load_locks: Dict[str, asyncio.Lock] = {}
+        self._flush_lock: Optional[asyncio.Lock] = None
+        self._tables_ready = False
+        self._tasks: List[asyncio.Task] = []
+
+        self.updates = 0
+        self.rows_written = 0
+        self.flushes = 0
+        self.swept = 0
+        self.flush_histogram = Histogram()
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.db_path or settings.DB_PATH)
+
+    def _ensure_tables(self, conn: sqlite3.Connection) -> None:
+        if self._tables_ready:
+            return
+        conn.execute(f"""
+            CREATE TABLE IF NOT EXISTS {SESSION_TABLE} (
+                exam_id TEXT PRIMARY KEY,
+                answers TEXT NOT NULL,
+                started_at REAL NOT NULL,
+                deadline REAL NOT NULL,
+                updated_at REAL NOT NULL,
+                submitted_at REAL,
+                expires_at REAL NOT NULL
+            )
+        """)
+        conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{SESSION_TABLE}_expires_at ON {SESSION_TABLE}(expires_at)")
+        conn.commit()
+        self._tables_ready = True
+
+    # === Session lifecycle ===
+
+    async def start(self, exam_id: str) -> ExamSessionState:
+        """Start the timer for an exam, or resume its session if one exists"""
+        session = await self._get(exam_id, create=True)
+        return self._state(session)
+
+    async def resume(self, exam_id: str) -> ExamSessionState:
+        """Current answers and remaining time"""
+        session = await self._get(exam_id)
+        if session is None:
+            raise HTTPException(status_code=404, detail="模試セッションが見つかりません")
+        return self._state(session)
+
+    async def record_answers(self, exam_id: str, answers: Dict[int, Optional[str]]) -> ExamSessionState:
+        """Apply answer changes in memory; they are written by the next flush"""
+        session = await self._get(exam_id)
+        if session is None:
+            raise HTTPException(status_code=404, detail="模試セッションが見つかりません")
+        if session.submitted_at is not None:
+            raise HTTPException(status_code=409, detail="この模試は提出済みです")
+        now = time.time()
+        if now > session.deadline + self.grace_sec:
+            raise HTTPException(status_code=409, detail="制限時間を過ぎています")
+
+        for problem_id, label in answers.items():
+            if label is None:
+                session.answers.pop(problem_id, None)
+            else:
+                session.answers[problem_id] = label
+        session.updated_at = now
+        self._dirty.add(exam_id)
+        self.updates += 1
+        if self.flush_interval_sec <= 0:
+            # Write-through mode (one transaction per update)
+            await self.flush()
+        return self._state(session)
+
+    async def finish(
+        self,
+        exam_id: str,
+        answers: Optional[Dict[int, Optional[str]]] = None
+    ) -> Dict[int, str]:
+        """
+        Mark the session submitted, flush it and return the final answers
+
+        ``answers`` are applied as a last update before submitting; past the
+        deadline (plus grace) they are dropped and the autosaved answers are
+        graded. Without a session they are returned as-is (an answer sheet
+        taken offline).
+        """
+        session = await self._get(exam_id)
+        if session is None:
+            if answers is None:
+                raise HTTPException(status_code=404, detail="模試セッションが見つかりません")
+            return {problem_id: label for problem_id, label in answers.items() if label is not None}
+        if session.submitted_at is not None:
+            raise HTTPException(status_code=409, detail="この模試は提出済みです")
+        if answers:
+            if time.time() > session.deadline + self.grace_sec:
+                logger.info(f"Exam {exam_id}: dropped {len(answers)} answers submitted after the deadline")
+            else:
+                await self.record_answers(exam_id, answers)
+        session.submitted_at = time.time()
+        self._dirty.add(exam_id)
+        await self.flush()
+        return dict(session.answers)
+
+    async def reopen(self, exam_id: str) -> None:
+        """Undo ``finish`` when grading failed, so the sheet can be submitted again"""
+        session = await self._get(exam_id)
+        if session is None or session.submitted_at is None:
+            return
+        session.submitted_at = None
+        self._dirty.add(exam_id)
+        await self.flush()
+
+    async def _get(self, exam_id: str, create: bool = False) -> Optional[_Session]:
+        session = self._sessions.get(exam_id)
+        if session is not None:
+            return session
+        # Concurrent first requests for one exam load (or create) it once
+        lock = self._load_locks.setdefault(exam_id, asyncio.Lock())
+        try:
+            async with lock:
+                session = self._sessions.get(exam_id)
+                if session is None:
+                    session = await asyncio.to_thread(self._load_session, exam_id)
+                    if session is None and create:
+                        session = await asyncio.to_thread(self._create_session, exam_id)
+                    if session is not None:
+                        self._sessions[exam_id] = session
+        finally:
+            self._load_locks.pop(exam_id, None)
+        return session
+
+    def _state(self, session: _Session) -> ExamSessionState:
+        return ExamSessionState(
+            exam_id=session.exam_id,
+            answers=dict(session.answers),
+            started_at=session.started_at,
+            deadline=session.deadline,
+            remaining_sec=round(max(0.0, session.deadline - time.time()), 1),
+            submitted=session.submitted_at is not None,
+            saved=session.exam_id not in self._dirty
+        )
+
+    def _expires_at(self, session: _Session) -> float:
+        return max(session.deadline, session.updated_at) + self.ttl_sec
+
+    # === Database access (worker threads) ===
+
+    def _create_session(self, exam_id: str) -> _Session:
+        conn = self._connect()
+        try:
+            self._ensure_tables(conn)
+            row = conn.execute(
+                f"SELECT time_limit_min FROM {EXAM_TABLE} WHERE exam_id = ?", (exam_id,)
+            ).fetchone()
+            if row is None:
+                raise HTTPException(status_code=404, detail="指定された模試IDが見つかりません")
+            now = time.time()
+            session = _Session(exam_id, {}, now, now + row[0] * 60, now)
+            with conn:
+                conn.execute(
+                    f"""
+                    INSERT OR REPLACE INTO {SESSION_TABLE}
+                        (exam_id, answers, started_at, deadline, updated_at, expires_at)
+                    VALUES (?, '{{}}', ?, ?, ?, ?)
+                    """,
+                    (exam_id, session.started_at, session.deadline, now, self._expires_at(session))
+                )
+            return session
+        finally:
+            conn.close()
+
+    def _load_session(self, exam_id: str) -> Optional[_Session]:
+        conn = self._connect()
+        try:
+            self._ensure_tables(conn)
+            row = conn.execute(
+                f"""
+                SELECT answers, started_at, deadline, updated_at, submitted_at
+                FROM {SESSION_TABLE} WHERE exam_id = ? AND expires_at > ?
+                """,
+                (exam_id, time.time())
+            ).fetchone()
+        finally:
+            conn.close()
+        if row is None:
+            return None
+        answers, started_at, deadline, updated_at, submitted_at = row
+        return _Session(
+            exam_id,
+            {int(problem_id): label for problem_id, label in json.loads(answers).items()},
+            started_at, deadline, updated_at, submitted_at
+        )
+
+    def _write(self, rows: List[Tuple[Any, ...]]) -> None:
+        conn = self._connect()
+        try:
+            self._ensure_tables(conn)
+            with conn:
+                conn.executemany(
+                    f"""
+                    INSERT INTO {SESSION_TABLE}
+                        (exam_id, answers, started_at, deadline, updated_at, submitted_at, expires_at)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT(exam_id) DO UPDATE SET
+                        answers = excluded.answers,
+                        updated_at = excluded.updated_at,
+                        submitted_at = excluded.submitted_at,
+                        expires_at = excluded.expires_at
+                    """,
+                    rows
+                )
+        finally:
+            conn.close()
+
+    def _delete_expired(self, now: float) -> int:
+        conn = self._connect()
+        try:
+            self._ensure_tables(conn)
+            with conn:
+                return conn.execute(f"DELETE FROM {SESSION_TABLE} WHERE expires_at <= ?", (now,)).rowcount
+        finally:
+            conn.close()
+
+    # === Background tasks ===
+
+    async def flush(self) -> int:
+        """Write every dirty session in one transaction; returns the number of rows"""
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+        async with self._flush_lock:
+            if not self._dirty:
+                return 0
+            dirty, self._dirty = self._dirty, set()
+            rows = []
+            for exam_id in dirty:
+                session = self._sessions.get(exam_id)
+                if session is None:
+                    continue
+                rows.append((
+                    exam_id,
+                    json.dumps(session.answers),
+                    session.started_at,
+                    session.deadline,
+                    session.updated_at,
+                    session.submitted_at,
+                    self._expires_at(session),
+                ))
+
+            start_time = time.perf_counter()
+            try:
+                await asyncio.to_thread(self._write, rows)
+            except Exception as e:
+                # Keep them dirty so the next flush retries
+                self._dirty |= dirty
+                logger.error(f"Exam session flush failed for {len(rows)} sessions: {e}")
+                raise
+            self.flush_histogram.observe((time.perf_counter() - start_time) * 1000)
+            self.flushes += 1
+            self.rows_written += len(rows)
+            return len(rows)
+
+    async def sweep(self) -> int:
+        """Evict expired sessions from the database, and saved finished ones from memory"""
+        now = time.time()
+        for exam_id, session in list(self._sessions.items()):
+            if exam_id in self._dirty:
+                continue
+            if session.submitted_at is not None or self._expires_at(session) <= now:
+                del self._sessions[exam_id]
+        removed = await asyncio.to_thread(self._delete_expired, now)
+        if removed:
+            logger.info(f"Swept {removed} expired exam sessions")
+        self.swept += removed
+        return removed
+
+    async def _run_periodically(self, interval_sec: float, job) -> None:
+        while True:
+            await asyncio.sleep(interval_sec)
+            try:
+                await job()
+            except Exception as e:
+                logger.error(f"Exam session background job failed: {e}")
+
+    def start_background_tasks(self) -> None:
+        """Start the autosave flusher and the TTL sweeper"""
+        if self._tasks:
+            return
+        if self.flush_interval_sec > 0:
+            self._tasks.append(asyncio.create_task(self._run_periodically(self.flush_interval_sec, self.flush)))
+        self._tasks.append(asyncio.create_task(self._run_periodically(self.sweep_interval_sec, self.sweep)))
+
+    async def stop(self) -> None:
+        """Stop the background tasks and flush what is left"""
+        for task in self._tasks:
+            task.cancel()
+        for task in self._tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._tasks = []
+        await self.flush()
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """Autosave coalescing and sweeper counters"""
+        return {
+            "active_sessions": len(self._sessions),
+            "dirty_sessions": len(self._dirty),
+            "flush_interval_sec": self.flush_interval_sec,
+            "updates": self.updates,
+            "rows_written": self.rows_written,
+            "coalesced_updates": max(0, self.updates - self.rows_written),
+            "flushes": self.flushes,
+            "flush_ms": self.flush_histogram.snapshot(),
+            "swept": self.swept,
+        }
+
+
+# Global instance
+_exam_session_store = ExamSessionStore(
+    flush_interval_sec=settings.EXAM_SESSION_FLUSH_INTERVAL_SEC,
+    ttl_sec=settings.EXAM_SESSION_TTL_SEC,
+    grace_sec=settings.EXAM_SESSION_GRACE_SEC,
+    sweep_interval_sec=settings.EXAM_SESSION_SWEEP_INTERVAL_SEC
+)
+
+async def get_exam_session_store() -> ExamSessionStore:
+    """Dependency injection for FastAPI"""
+    return _exam_session_store
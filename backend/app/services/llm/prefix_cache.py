@@ -0,0 +1,101 @@
+"""
+Reuse of evaluated prompt prefixes on one llama-cpp instance
+
+llama-cpp already skips the tokens a new prompt shares with what is in the
+context, but only with the *last* prompt: alternating paraphrase and
+explanation requests re-evaluate the instruction block every time. The
+first time a prefix is seen, the context is reset, the prefix alone is
+evaluated and the state is saved (``Llama.save_state``, which copies only
+the used KV cells). Later requests with that prefix either find it still
+in the context or restore the saved state; either way llama-cpp's own
+prefix match then evaluates only the suffix.
+
+A ``PrefixCache`` belongs to one model instance and is only used on that
+instance's worker thread.
+"""
+
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class PrefixCache:
+    """Saved KV states of fixed prompt prefixes (LRU)"""
+
+    def __init__(self, model: Any, max_entries: int = 4):
+        self.model = model
+        self.max_entries = max(1, max_entries)
+        # prefix text -> (prefix tokens, saved state); None if the prompt tokenization
+        # does not start with the prefix tokens (the prefix cannot be reused)
+        self._states: "OrderedDict[str, Optional[Tuple[List[int], Any]]]" = OrderedDict()
+
+        self.stored = 0
+        self.restored = 0
+        self.resident = 0
+        self.mismatched = 0
+        self.reused_tokens = 0
+        self.restore_sec = 0.0
+
+    def _context_tokens(self) -> List[int]:
+        return list(self.model.input_ids[:self.model.n_tokens])
+
+    def prepare(self, prefix: str, prompt: str) -> str:
+        """
+        Put the evaluated ``prefix`` into the context before ``prompt`` is generated
+
+        Returns "resident", "restored", "stored" or "mismatch".
+        """
+        if prefix in self._states:
+            self._states.move_to_end(prefix)
+            entry = self._states[prefix]
+        else:
+            entry = self._store(prefix, prompt)
+            return "stored" if entry is not None else "mismatch"
+
+        if entry is None:
+            self.mismatched += 1
+            return "mismatch"
+        prefix_tokens, state = entry
+        self.reused_tokens += len(prefix_tokens)
+        if self._context_tokens()[:len(prefix_tokens)] == prefix_tokens:
+            self.resident += 1
+            return "resident"
+        start_time = time.perf_counter()
+        self.model.load_state(state)
+        self.restore_sec += time.perf_counter() - start_time
+        self.restored += 1
+        return "restored"
+
+    def _store(self, prefix: str, prompt: str) -> Optional[Tuple[List[int], Any]]:
+        model = self.model
+        prefix_tokens = list(model.tokenize(prefix.encode("utf-8")))
+        prompt_tokens = list(model.tokenize(prompt.encode("utf-8")))
+        entry = None
+        # Tokens can merge across the boundary; only reuse a prefix the prompt really starts with
+        if prompt_tokens[:len(prefix_tokens)] == prefix_tokens:
+            model.reset()
+            model.eval(prefix_tokens)
+            entry = (prefix_tokens, model.save_state())
+            self.stored += 1
+            logger.info(f"Cached KV state of a {len(prefix_tokens)}-token prompt prefix")
+        else:
+            self.mismatched += 1
+            logger.warning("Prompt does not start with the tokens of its prefix; prefix reuse disabled for it")
+        self._states[prefix] = entry
+        while len(self._states) > self.max_entries:
+            self._states.popitem(last=False)
+        return entry
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "entries": len(self._states),
+            "stored": self.stored,
+            "restored": self.restored,
+            "resident": self.resident,
+            "mismatched": self.mismatched,
+            "reused_tokens": self.reused_tokens,
+            "restore_ms_total": round(self.restore_sec * 1000, 1),
+        }
@@ -0,0 +1,70 @@
+"""
+Prompt templates for the LLM endpoints
+
+Each prompt is split into a fixed instruction ``prefix`` that is identical
+for every request of a template, and a variable ``suffix``. Model workers
+keep the evaluated KV state of each prefix, so only the suffix has to be
+evaluated per request (see ``app.services.llm.prefix_cache``). Anything
+that varies per request must therefore stay out of the prefix.
+"""
+
+from typing import NamedTuple, Optional
+
+PARAPHRASE_MARKER = "パラフレーズ結果:"
+
+# Template versions are part of the result cache key; bump one whenever its
+# prompt text or post-processing changes
+PARAPHRASE_TEMPLATE = "paraphrase/1"
+EXPLANATION_TEMPLATE = "explanation/1"
+
+
+class Prompt(NamedTuple):
+    prefix: str
+    suffix: str
+
+    @property
+    def text(self) -> str:
+        return self.prefix + self.suffix
+
+
+PARAPHRASE_PREFIX = """次の日本語テキストの意味を変えず表現を変えてください。単語の順序・語彙を変えても構いません。
+
+要求:
+- 元の意味を正確に保持する
+- 文体や表現を変える
+- 改行や余計な説明は不要
+"""
+
+EXPLANATION_PREFIX = """次のG検定の問題について、正解の理由を日本語で簡潔に解説してください。
+"""
+
+
+def paraphrase_prompt(text: str, max_length: int = 120) -> Prompt:
+    """Prompt asking for a meaning-preserving rewrite"""
+    return Prompt(PARAPHRASE_PREFIX, f"""- {max_length}字以内で出力
+
+元テキスト: {text}
+
+{PARAPHRASE_MARKER}""")
+
+
+def explanation_prompt(question: str, answer: str, context: Optional[str] = None) -> Prompt:
+    """Prompt asking for a short explanation of why the answer is correct"""
+    reference = f"\n参考情報: {context}\n" if context else ""
+    return Prompt(EXPLANATION_PREFIX, f"""{reference}
+問題: {question}
+正解: {answer}
+
+解説:""")
+
+
+def strip_newlines(text: str) -> str:
+    return text.replace('\n', '').replace('\r', '')
+
+
+def extract_paraphrase(generated_text: str, original_text: str) -> str:
+    """Paraphrase part of the generated text ("" if nothing new was produced)"""
+    result = strip_newlines(generated_text.split(PARAPHRASE_MARKER)[-1].strip())
+    if result == original_text:
+        return ""
+    return result
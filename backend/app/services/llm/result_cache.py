@@ -0,0 +1,260 @@
+"""
+Persistent cache of finished LLM generations
+
+Paraphrases and explanations are stored in a SQLite file keyed by the
+SHA-256 of the model file, the prompt template version, the normalized
+inputs and the sampling parameters (seed included). A request without a
+seed gets one derived from the rest of the key, so a purged or evicted
+entry is regenerated with the same sampling sequence (deterministic-seed
+replay). The total size of the stored results is capped; the least
+recently used entries are evicted first.
+
+The model file hash is memoized per (path, size, mtime) in the same
+database so a multi-GB GGUF file is only read once.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, NamedTuple, Optional, Sequence, Tuple
+
+from app.services.embedding.embedding_cache import normalize_text
+from app.services.llm.worker import GenerationParams
+
+logger = logging.getLogger(__name__)
+
+RESULT_TABLE = "llm_result_cache"
+MODEL_HASH_TABLE = "llm_model_hashes"
+
+# Extra bytes freed per eviction so that inserts do not evict one row at a time
+EVICTION_SLACK = 0.05
+
+# Separates the inputs of multi-field templates before hashing
+FIELD_SEPARATOR = "\x1f"
+
+
+class CachedResult(NamedTuple):
+    text: str
+    tokens: int
+    seed: int
+    created_at: float
+
+
+def file_sha256(path: str, chunk_size: int = 1 << 20) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class LLMResultCache:
+    """SQLite-backed generation results with a byte-size cap (LRU)"""
+
+    def __init__(self, path: str, model_path: str, max_bytes: int = 64 * 1024 * 1024):
+        self.path = Path(path)
+        self.model_name = Path(model_path).name
+        self.max_bytes = max(1, max_bytes)
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(f"""
+            CREATE TABLE IF NOT EXISTS {RESULT_TABLE} (
+                cache_key TEXT PRIMARY KEY,
+                model_hash TEXT NOT NULL,
+                model_name TEXT NOT NULL,
+                template TEXT NOT NULL,
+                params TEXT NOT NULL,
+                seed INTEGER NOT NULL,
+                text TEXT NOT NULL,
+                tokens INTEGER NOT NULL,
+                size INTEGER NOT NULL,
+                hits INTEGER NOT NULL DEFAULT 0,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            )
+        """)
+        self._conn.execute(f"""
+            CREATE INDEX IF NOT EXISTS idx_{RESULT_TABLE}_last_access
+            ON {RESULT_TABLE}(last_access)
+        """)
+        self._conn.execute(f"""
+            CREATE INDEX IF NOT EXISTS idx_{RESULT_TABLE}_model
+            ON {RESULT_TABLE}(model_hash)
+        """)
+        self._conn.execute(f"""
+            CREATE TABLE IF NOT EXISTS {MODEL_HASH_TABLE} (
+                path TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                sha256 TEXT NOT NULL
+            )
+        """)
+        self._conn.commit()
+        self.model_hash = self._model_hash(model_path)
+        self._total_bytes = self._conn.execute(
+            f"SELECT COALESCE(SUM(size), 0) FROM {RESULT_TABLE}"
+        ).fetchone()[0]
+
+    def _model_hash(self, model_path: str) -> str:
+        """SHA-256 of the model file, recomputed only when its size or mtime changes"""
+        resolved = str(Path(model_path).resolve())
+        stat = os.stat(resolved)
+        row = self._conn.execute(
+            f"SELECT size, mtime_ns, sha256 FROM {MODEL_HASH_TABLE} WHERE path = ?", (resolved,)
+        ).fetchone()
+        if row is not None and row[0] == stat.st_size and row[1] == stat.st_mtime_ns:
+            return row[2]
+
+        start_time = time.perf_counter()
+        digest = file_sha256(resolved)
+        self._conn.execute(
+            f"INSERT OR REPLACE INTO {MODEL_HASH_TABLE} (path, size, mtime_ns, sha256) VALUES (?, ?, ?, ?)",
+            (resolved, stat.st_size, stat.st_mtime_ns, digest)
+        )
+        self._conn.commit()
+        logger.info(f"Hashed model file {self.model_name} in {time.perf_counter() - start_time:.1f}s")
+        return digest
+
+    # === Keys ===
+
+    def key(
+        self,
+        template: str,
+        inputs: Sequence[Optional[str]],
+        params: GenerationParams
+    ) -> Tuple[str, GenerationParams]:
+        """
+        Cache key and the parameters to generate with
+
+        Without an explicit seed the seed is derived from the key material,
+        so the same request always samples the same sequence.
+        """
+        material = json.dumps({
+            "model": self.model_hash,
+            "template": template,
+            "inputs": FIELD_SEPARATOR.join(normalize_text(value or "") for value in inputs),
+            "params": params._replace(seed=None, stop=list(params.stop))._asdict(),
+        }, ensure_ascii=False, sort_keys=True)
+        base = hashlib.sha256(material.encode("utf-8")).hexdigest()
+        if params.seed is None:
+            params = params._replace(seed=int(base[:8], 16) & 0x7FFFFFFF)
+        return hashlib.sha256(f"{base}:{params.seed}".encode("utf-8")).hexdigest(), params
+
+    # === Reads / writes ===
+
+    def get(self, key: str) -> Optional[CachedResult]:
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT text, tokens, seed, created_at FROM {RESULT_TABLE} WHERE cache_key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute(
+                f"UPDATE {RESULT_TABLE} SET hits = hits + 1, last_access = ? WHERE cache_key = ?",
+                (time.time(), key)
+            )
+            self._conn.commit()
+        self.hits += 1
+        return CachedResult(*row)
+
+    def put(self, key: str, template: str, params: GenerationParams, text: str, tokens: int) -> None:
+        """Store a finished result, evicting least recently used entries over the byte cap"""
+        params_json = json.dumps(params._replace(stop=list(params.stop))._asdict(), ensure_ascii=False)
+        size = len(text.encode("utf-8")) + len(params_json.encode("utf-8"))
+        now = time.time()
+        with self._lock:
+            previous = self._conn.execute(
+                f"SELECT size FROM {RESULT_TABLE} WHERE cache_key = ?", (key,)
+            ).fetchone()
+            self._conn.execute(
+                f"""
+                INSERT OR REPLACE INTO {RESULT_TABLE}
+                    (cache_key, model_hash, model_name, template, params, seed, text, tokens, size,
+                     created_at, last_access)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                (key, self.model_hash, self.model_name, template, params_json, params.seed,
+                 text, tokens, size, now, now)
+            )
+            self._total_bytes += size - (previous[0] if previous else 0)
+            self._evict_locked()
+            self._conn.commit()
+        self.stores += 1
+
+    def _evict_locked(self) -> None:
+        """Drop least recently used rows once the byte cap is exceeded"""
+        if self._total_bytes <= self.max_bytes:
+            return
+        target = self.max_bytes - int(self.max_bytes * EVICTION_SLACK)
+        victims = []
+        freed = 0
+        for key, size in self._conn.execute(
+            f"SELECT cache_key, size FROM {RESULT_TABLE} ORDER BY last_access"
+        ):
+            if self._total_bytes - freed <= target:
+                break
+            victims.append((key,))
+            freed += size
+        self._conn.executemany(f"DELETE FROM {RESULT_TABLE} WHERE cache_key = ?", victims)
+        self._total_bytes -= freed
+        self.evictions += len(victims)
+        logger.info(f"Evicted {len(victims)} entries ({freed} bytes) from LLM result cache")
+
+    def purge(self, model: Optional[str] = None) -> int:
+        """Delete the entries of one model (hash or file name), or all entries when ``model`` is None"""
+        with self._lock:
+            if model is None:
+                cursor = self._conn.execute(f"DELETE FROM {RESULT_TABLE}")
+            else:
+                cursor = self._conn.execute(
+                    f"DELETE FROM {RESULT_TABLE} WHERE model_hash = ? OR model_name = ?", (model, model)
+                )
+            self._total_bytes = self._conn.execute(
+                f"SELECT COALESCE(SUM(size), 0) FROM {RESULT_TABLE}"
+            ).fetchone()[0]
+            self._conn.commit()
+        logger.info(f"Purged {cursor.rowcount} entries from LLM result cache (model={model or 'all'})")
+        return cursor.rowcount
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Hit rate, size and per-model breakdown"""
+        with self._lock:
+            rows = self._conn.execute(f"""
+                SELECT model_hash, model_name, COUNT(*), SUM(size), SUM(hits)
+                FROM {RESULT_TABLE} GROUP BY model_hash, model_name
+            """).fetchall()
+        lookups = self.hits + self.misses
+        return {
+            "model_hash": self.model_hash,
+            "model_name": self.model_name,
+            "entries": sum(row[2] for row in rows),
+            "bytes": self._total_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "stores": self.stores,
+            "evictions": self.evictions,
+            "models": [
+                {"model_hash": model_hash, "model_name": name, "entries": count, "bytes": size, "hits": hits}
+                for model_hash, name, count, size, hits in rows
+            ],
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
@@ -3,47 +3,292 @@ LLM service for paraphrasing and explanation generation
 """
 
 import time
+import asyncio
+import functools
 import logging
-from typing import Optional
+import sqlite3
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, NamedTuple, Optional, Sequence, Tuple, Union
+
+from fastapi import HTTPException
 
 from app.core.config import settings
 from app.models.schemas import ParaphraseResponse, ExplainResponse
+from app.services.llm.prompts import (
+    EXPLANATION_TEMPLATE,
+    PARAPHRASE_TEMPLATE,
+    Prompt,
+    explanation_prompt,
+    extract_paraphrase,
+    paraphrase_prompt,
+    strip_newlines,
+)
+from app.services.llm.result_cache import CachedResult, LLMResultCache
+from app.services.llm.streaming import cached_sse_events, sse_events
+from app.services.llm.worker import (
+    PRIORITY_INTERACTIVE,
+    GenerationParams,
+    GenerationResult,
+    LLMWorkerPool,
+    TokenStream,
+    load_llama,
+)
 
 logger = logging.getLogger(__name__)
 
+class Completion(NamedTuple):
+    """Post-processed output of one request"""
+    text: str
+    # Generated tokens (of the original generation when served from the cache)
+    tokens: int
+    cached: bool
+
 class LLMService:
     """Local LLM service for text generation tasks"""
     
-    def __init__(self):
-        self._model = None
+    def __init__(
+        self,
+        workers: Optional[LLMWorkerPool] = None,
+        result_cache: Optional[LLMResultCache] = None,
+        use_result_cache: Optional[bool] = None,
+        model_path: Optional[str] = None
+    ):
+        # Model the workers load; the result cache is keyed by this file's hash
+        self.model_path = model_path or settings.LLM_MODEL_PATH
+        # Each llama-cpp instance is owned by one worker thread and fed from a priority queue
+        self.workers = workers or LLMWorkerPool(
+            functools.partial(
+                load_llama,
+                self.model_path,
+                n_ctx=settings.LLM_N_CTX,
+                n_threads=settings.LLM_N_THREADS,
+                n_batch=settings.LLM_N_BATCH
+            ),
+            instances=settings.LLM_POOL_WORKERS,
+            max_queue=settings.LLM_POOL_QUEUE_DEPTH,
+            timeout_sec=settings.LLM_TIMEOUT_SEC,
+            prefix_cache_size=settings.LLM_PREFIX_CACHE_SIZE
+        )
+        # Finished paraphrases/explanations on disk; opened in initialize() or by the admin endpoints
+        self.result_cache = result_cache
+        self.use_result_cache = settings.LLM_RESULT_CACHE_ENABLED if use_result_cache is None else use_result_cache
+        self._initialized = False
+        self._init_lock = asyncio.Lock()
+        self._cache_lock = asyncio.Lock()
+        # Seconds spent per startup step, reported by the readiness endpoint
+        self.load_timings: Dict[str, float] = {}
+    
+    async def initialize(self):
+        """Load the model instances and start the workers"""
+        # Concurrent first requests wait for a single model load
+        async with self._init_lock:
+            if self._initialized:
+                return
+            start_time = time.perf_counter()
+            try:
+                await self.workers.start()
+                await self.ensure_result_cache()
+                self._initialized = True
+                self.load_timings["llm_model"] = round(time.perf_counter() - start_time, 3)
+                logger.info("LLM service initialized")
+            except Exception as e:
+                logger.error(f"Failed to initialize LLM: {e}")
+                raise
+    
+    async def ensure_result_cache(self) -> None:
+        """Open the result cache once; does not load the models"""
+        async with self._cache_lock:
+            if self.result_cache is None and self.use_result_cache:
+                await self._open_result_cache()
+    
+    async def _open_result_cache(self) -> None:
+        """Open the result cache; on failure generation runs uncached (the service still starts)"""
+        # Hashing the model file the first time takes a while; keep it off the loop
+        cache_start = time.perf_counter()
+        try:
+            self.result_cache = await asyncio.to_thread(
+                LLMResultCache,
+                settings.LLM_RESULT_CACHE_PATH,
+                self.model_path,
+                settings.LLM_RESULT_CACHE_MAX_MB * 1024 * 1024
+            )
+        except (sqlite3.Error, OSError) as e:
+            logger.warning(f"LLM result cache unavailable; generating without it: {e}")
+            self.use_result_cache = False
+            return
+        self.load_timings["llm_result_cache"] = round(time.perf_counter() - cache_start, 3)
+    
+    async def shutdown(self) -> None:
+        """Stop the workers (application shutdown)"""
+        await self.workers.stop()
         self._initialized = False
     
-    async def initialize(self, model_path: Optional[str] = None):
-        """Initialize LLM model"""
+    async def warm_up(self) -> None:
+        """Run one short generation so the first request does not pay for lazy setup"""
+        start_time = time.perf_counter()
+        await self.generate("ウォームアップ", GenerationParams(max_tokens=1, temperature=0.0))
+        self.load_timings["llm_warmup"] = round(time.perf_counter() - start_time, 3)
+    
+    async def generate(
+        self,
+        prompt: Union[str, Prompt],
+        params: GenerationParams = GenerationParams(),
+        priority: int = PRIORITY_INTERACTIVE,
+        timeout_sec: Optional[float] = None
+    ) -> GenerationResult:
+        """Queue a raw completion on the worker pool"""
+        return await self.workers.generate(prompt, params, priority=priority, timeout_sec=timeout_sec)
+    
+    async def stream(
+        self,
+        prompt: Union[str, Prompt],
+        params: GenerationParams = GenerationParams(),
+        priority: int = PRIORITY_INTERACTIVE,
+        is_disconnected: Optional[Callable[[], Awaitable[bool]]] = None
+    ) -> TokenStream:
+        """Queue a completion whose tokens are iterated as they are generated"""
+        return await self.workers.stream(prompt, params, priority=priority, is_disconnected=is_disconnected)
+    
+    def paraphrase_request(
+        self,
+        text: str,
+        creativity: float,
+        seed: Optional[int] = None
+    ) -> Tuple[Prompt, GenerationParams]:
+        """Prompt and sampling parameters of a paraphrase"""
+        max_length = settings.LLM_PARAPHRASE_MAX_CHARS
+        return paraphrase_prompt(text, max_length), GenerationParams(
+            max_tokens=max_length + 50,
+            temperature=creativity,
+            stop=("元テキスト:", "\n\n"),
+            seed=seed
+        )
+    
+    def finalize_paraphrase(self, generated_text: str, original_text: str) -> str:
+        """Validated paraphrase (422 when the model produced nothing new)"""
+        paraphrased = extract_paraphrase(generated_text, original_text)
+        if not paraphrased:
+            raise HTTPException(status_code=422, detail="意味のあるパラフレーズを生成できませんでした")
+        return paraphrased[:settings.LLM_PARAPHRASE_MAX_CHARS]
+    
+    def explanation_request(
+        self,
+        question: str,
+        answer: str,
+        context: Optional[str] = None,
+        seed: Optional[int] = None
+    ) -> Tuple[Prompt, GenerationParams]:
+        """Prompt and sampling parameters of an explanation"""
+        return explanation_prompt(question, answer, context), GenerationParams(
+            max_tokens=settings.LLM_EXPLANATION_MAX_TOKENS,
+            temperature=0.3,
+            stop=("\n\n問題:",),
+            seed=seed
+        )
+    
+    # === Result cache ===
+    
+    async def cache_lookup(
+        self,
+        template: str,
+        inputs: Sequence[Optional[str]],
+        params: GenerationParams
+    ) -> Tuple[Optional[str], GenerationParams, Optional[CachedResult]]:
+        """Cache key, the parameters to generate with (replay seed filled in) and the cached result"""
+        if self.result_cache is None:
+            return None, params, None
+        key, params = self.result_cache.key(template, inputs, params)
+        try:
+            return key, params, await asyncio.to_thread(self.result_cache.get, key)
+        except sqlite3.Error as e:
+            logger.warning(f"LLM result cache lookup failed: {e}")
+            return None, params, None
+    
+    async def cache_store(
+        self,
+        key: Optional[str],
+        template: str,
+        params: GenerationParams,
+        text: str,
+        tokens: int
+    ) -> None:
+        if key is None or self.result_cache is None:
+            return
         try:
-            # TODO: Initialize llama-cpp-python model
-            # from llama_cpp import Llama
-            # model_path = model_path or settings.LLM_MODEL_PATH
-            # self._model = Llama(model_path=model_path)
-            self._initialized = True
-            logger.info("LLM service initialized")
-        except Exception as e:
-            logger.error(f"Failed to initialize LLM: {e}")
-            raise
-    
-    async def paraphrase(self, text: str, creativity: float = 0.7) -> ParaphraseResponse:
+            await asyncio.to_thread(self.result_cache.put, key, template, params, text, tokens)
+        except sqlite3.Error as e:
+            logger.warning(f"LLM result cache store failed: {e}")
+    
+    async def purge_cache(self, model: Optional[str] = None) -> int:
+        """Delete cached results of one model (hash or file name) or all of them"""
+        if self.result_cache is None:
+            return 0
+        return await asyncio.to_thread(self.result_cache.purge, model)
+    
+    async def complete(
+        self,
+        template: str,
+        inputs: Sequence[Optional[str]],
+        prompt: Prompt,
+        params: GenerationParams,
+        finalize: Callable[[str], str],
+        priority: int = PRIORITY_INTERACTIVE
+    ) -> Completion:
+        """Serve from the result cache, or generate, post-process with ``finalize`` and store"""
+        key, params, cached = await self.cache_lookup(template, inputs, params)
+        if cached is not None:
+            return Completion(cached.text, cached.tokens, True)
+        result = await self.generate(prompt, params, priority=priority)
+        text = finalize(result.text)
+        await self.cache_store(key, template, params, text, result.tokens)
+        return Completion(text, result.tokens, False)
+    
+    async def paraphrase_completion(
+        self,
+        text: str,
+        creativity: float = 0.7,
+        priority: int = PRIORITY_INTERACTIVE,
+        seed: Optional[int] = None
+    ) -> Completion:
+        prompt, params = self.paraphrase_request(text, creativity, seed)
+        return await self.complete(
+            PARAPHRASE_TEMPLATE, [text], prompt, params,
+            lambda generated: self.finalize_paraphrase(generated, text),
+            priority=priority
+        )
+    
+    async def explanation_completion(
+        self,
+        question: str,
+        answer: str,
+        context: Optional[str] = None,
+        priority: int = PRIORITY_INTERACTIVE,
+        seed: Optional[int] = None
+    ) -> Completion:
+        prompt, params = self.explanation_request(question, answer, context, seed)
+        return await self.complete(
+            EXPLANATION_TEMPLATE, [question, answer, context], prompt, params, str.strip,
+            priority=priority
+        )
+    
+    # === Endpoints ===
+    
+    async def paraphrase(
+        self,
+        text: str,
+        creativity: float = 0.7,
+        priority: int = PRIORITY_INTERACTIVE,
+        seed: Optional[int] = None
+    ) -> ParaphraseResponse:
         """Generate paraphrased text"""
         start_time = time.time()
         
-        # TODO: Implement actual paraphrasing with LLM
-        # For now, return a placeholder
-        paraphrased = f"[パラフレーズ] {text}"
+        completion = await self.paraphrase_completion(text, creativity, priority, seed)
         
         processing_time = (time.time() - start_time) * 1000
         
         return ParaphraseResponse(
             original=text,
-            paraphrased=paraphrased,
+            paraphrased=completion.text,
             processing_time_ms=processing_time
         )
     
@@ -51,22 +296,83 @@ class LLMService:
         self, 
         question: str, 
         answer: str, 
-        context: Optional[str] = None
+        context: Optional[str] = None,
+        seed: Optional[int] = None
     ) -> ExplainResponse:
         """Generate explanation for a problem"""
         start_time = time.time()
         
-        # TODO: Implement actual explanation generation with LLM
-        # For now, return a placeholder
-        explanation = f"この問題は{answer}に関する内容です。詳細な解説はLLMモデルにより生成されます。"
+        completion = await self.explanation_completion(question, answer, context, seed=seed)
         
         processing_time = (time.time() - start_time) * 1000
         
         return ExplainResponse(
             question=question,
-            explanation=explanation,
+            explanation=completion.text,
             processing_time_ms=processing_time
         )
+    
+    async def paraphrase_events(
+        self,
+        text: str,
+        creativity: float = 0.7,
+        seed: Optional[int] = None,
+        is_disconnected: Optional[Callable[[], Awaitable[bool]]] = None
+    ) -> AsyncIterator[str]:
+        """SSE frames of a streamed paraphrase (503 is raised before the first frame)"""
+        prompt, params = self.paraphrase_request(text, creativity, seed)
+        return await self._events(
+            PARAPHRASE_TEMPLATE, [text], prompt, params, is_disconnected,
+            clean=strip_newlines,
+            finalize=lambda generated: self.finalize_paraphrase(generated, text)
+        )
+    
+    async def explanation_events(
+        self,
+        question: str,
+        answer: str,
+        context: Optional[str] = None,
+        seed: Optional[int] = None,
+        is_disconnected: Optional[Callable[[], Awaitable[bool]]] = None
+    ) -> AsyncIterator[str]:
+        """SSE frames of a streamed explanation (503 is raised before the first frame)"""
+        prompt, params = self.explanation_request(question, answer, context, seed)
+        return await self._events(
+            EXPLANATION_TEMPLATE, [question, answer, context], prompt, params, is_disconnected,
+            finalize=str.strip
+        )
+    
+    async def _events(
+        self,
+        template: str,
+        inputs: Sequence[Optional[str]],
+        prompt: Prompt,
+        params: GenerationParams,
+        is_disconnected: Optional[Callable[[], Awaitable[bool]]],
+        clean: Optional[Callable[[str], str]] = None,
+        finalize: Optional[Callable[[str], str]] = None
+    ) -> AsyncIterator[str]:
+        start_time = time.perf_counter()
+        key, params, cached = await self.cache_lookup(template, inputs, params)
+        if cached is not None:
+            return cached_sse_events(cached.text, cached.tokens, (time.perf_counter() - start_time) * 1000)
+        
+        async def store(text: str, result: GenerationResult) -> None:
+            await self.cache_store(key, template, params, text, result.tokens)
+        
+        tokens = await self.stream(prompt, params, is_disconnected=is_disconnected)
+        return sse_events(tokens, clean=clean, finalize=finalize, on_complete=store)
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """Worker queue depth, wait times and tokens/sec per model instance"""
+        return self.workers.get_metrics()
+    
+    async def get_cache_stats(self) -> Dict[str, Any]:
+        """Result cache hit rate and size per model"""
+        if self.result_cache is None:
+            return {"enabled": False}
+        # The per-model breakdown is a GROUP BY over the whole table; keep it off the loop
+        return {"enabled": True, **await asyncio.to_thread(self.result_cache.get_stats)}
 
 # Global instance
 _llm_service = LLMService()
@@ -75,4 +381,13 @@ async def get_llm_service() -> LLMService:
     """Dependency injection for FastAPI"""
     if not _llm_service._initialized:
         await _llm_service.initialize()
-    return _llm_service
\ No newline at end of file
+    return _llm_service
+
+async def get_llm_cache_service() -> LLMService:
+    """Dependency injection for the result cache admin endpoints (the models are not loaded)"""
+    await _llm_service.ensure_result_cache()
+    return _llm_service
+
+async def shutdown_llm_service() -> None:
+    """Stop the shared service's workers (application shutdown)"""
+    await _llm_service.shutdown()
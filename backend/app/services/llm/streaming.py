@@ -0,0 +1,91 @@
+"""
+Server-Sent Events encoding for streamed LLM generations
+
+A stream is a sequence of ``token`` events (``{"text": ...}``) followed by
+exactly one ``done`` event carrying the final text, time to first token and
+throughput, or one ``error`` event (``{"status": ..., "detail": ...}``). A
+result served from the cache is a single ``token`` event followed by a
+``done`` event with ``"cached": true``.
+"""
+
+import json
+import logging
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Optional
+
+from fastapi import HTTPException
+
+from app.services.llm.worker import GenerationResult, TokenStream
+
+logger = logging.getLogger(__name__)
+
+# Sent with every SSE response so proxies do not buffer the token events
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+
+def sse_event(event: str, data: Dict[str, Any]) -> str:
+    """One SSE frame with a JSON payload"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+async def sse_events(
+    tokens: TokenStream,
+    clean: Optional[Callable[[str], str]] = None,
+    finalize: Optional[Callable[[str], str]] = None,
+    on_complete: Optional[Callable[[str, GenerationResult], Awaitable[None]]] = None
+) -> AsyncIterator[str]:
+    """
+    Encode a token stream as SSE frames
+
+    ``clean`` is applied to each token before it is sent and ``finalize``
+    to the joined text for the ``done`` event; ``finalize`` may raise an
+    HTTPException to reject the output. ``on_complete`` receives the final
+    text of a generation that ran to the end (e.g. to cache it).
+    """
+    pieces = []
+    try:
+        async for piece in tokens:
+            if clean is not None:
+                piece = clean(piece)
+            if piece:
+                pieces.append(piece)
+                yield sse_event("token", {"text": piece})
+        if tokens.result is None:
+            # Client disconnected; nobody is listening for the final event
+            return
+        text = "".join(pieces)
+        if finalize is not None:
+            text = finalize(text)
+        result = tokens.result
+        if on_complete is not None and not result.cancelled:
+            await on_complete(text, result)
+        generation_sec = result.generation_ms / 1000
+        yield sse_event("done", {
+            "text": text,
+            "tokens": result.tokens,
+            "first_token_ms": round(result.first_token_ms, 1) if result.first_token_ms is not None else None,
+            "wait_ms": round(result.wait_ms, 1),
+            "generation_ms": round(result.generation_ms, 1),
+            "tokens_per_sec": round(result.tokens / generation_sec, 2) if generation_sec else 0.0,
+            "cached": False,
+        })
+    except HTTPException as e:
+        yield sse_event("error", {"status": e.status_code, "detail": e.detail})
+    except Exception as e:
+        logger.error(f"Streamed generation failed: {e}")
+        yield sse_event("error", {"status": 500, "detail": f"Generation failed: {str(e)}"})
+    finally:
+        tokens.close()
+
+
+async def cached_sse_events(text: str, tokens: int, elapsed_ms: float) -> AsyncIterator[str]:
+    """SSE frames for a result served from the cache"""
+    yield sse_event("token", {"text": text})
+    yield sse_event("done", {
+        "text": text,
+        "tokens": tokens,
+        "first_token_ms": round(elapsed_ms, 1),
+        "wait_ms": 0.0,
+        "generation_ms": 0.0,
+        "tokens_per_sec": 0.0,
+        "cached": True,
+    })
@@ -0,0 +1,488 @@
+"""
+Pooled llama-cpp model workers
+
+A ``Llama`` context is not thread-safe, so each model instance is owned by
+one worker with its own single-thread executor: only that thread ever
+touches the context. Workers pull jobs from one shared asyncio priority
+queue (lower value first, FIFO within a priority). Admission control
+rejects new jobs with a 503 once ``max_queue`` are waiting. Every job has
+a timeout; a timed out or cancelled job is dropped if still queued, and a
+running one stops at the next generated token. ``stream`` hands tokens to
+the event loop as they are generated, so a client that disconnects frees
+its model slot at the next token. Prompts given as ``Prompt`` reuse the
+evaluated KV state of their fixed prefix on each instance.
+"""
+
+import asyncio
+import itertools
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, NamedTuple, Optional, Sequence, Union
+
+from fastapi import HTTPException
+
+from app.services.llm.prefix_cache import PrefixCache
+from app.services.llm.prompts import Prompt
+from app.utils.metrics import Histogram
+
+logger = logging.getLogger(__name__)
+
+# Interactive API calls go ahead of bulk jobs (e.g. batch paraphrasing)
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BATCH = 10
+
+# How often a stream with no new token checks whether its client is still connected
+DISCONNECT_POLL_SEC = 0.5
+
+
+class GenerationParams(NamedTuple):
+    max_tokens: int = 256
+    temperature: float = 0.7
+    top_p: float = 0.9
+    repeat_penalty: float = 1.1
+    stop: Sequence[str] = ()
+    # Fixed sampling seed (None = llama-cpp's default); makes a generation replayable
+    seed: Optional[int] = None
+
+
+class GenerationResult(NamedTuple):
+    text: str
+    tokens: int
+    # Time spent queued before a worker picked the job up, and generating
+    wait_ms: float
+    generation_ms: float
+    instance: int
+    # Generation stopped early because the job was cancelled or timed out
+    cancelled: bool = False
+    # Time from submission (queue wait included) to the first token, if any
+    first_token_ms: Optional[float] = None
+
+
+class _Job:
+    __slots__ = (
+        "prompt", "prefix", "params", "future", "cancelled", "enqueued_at", "on_token"
+    )
+
+    def __init__(
+        self,
+        prompt: Union[str, Prompt],
+        params: GenerationParams,
+        future: asyncio.Future,
+        on_token: Optional[Callable[[str], None]]
+    ):
+        if isinstance(prompt, Prompt):
+            self.prompt, self.prefix = prompt.text, prompt.prefix
+        else:
+            self.prompt, self.prefix = prompt, None
+        self.params = params
+        self.future = future
+        # Set from the event loop, polled by the worker thread between tokens
+        self.cancelled = threading.Event()
+        self.enqueued_at = time.perf_counter()
+        self.on_token = on_token
+
+
+class _InstanceStats:
+    """Counters of one model instance"""
+
+    def __init__(self):
+        self.busy = False
+        self.completed = 0
+        self.failed = 0
+        self.cancelled = 0
+        self.tokens = 0
+        self.generation_sec = 0.0
+        self.wait_histogram = Histogram()
+
+    def snapshot(self, index: int) -> Dict[str, Any]:
+        return {
+            "instance": index,
+            "busy": self.busy,
+            "completed": self.completed,
+            "failed": self.failed,
+            "cancelled": self.cancelled,
+            "tokens": self.tokens,
+            "tokens_per_sec": round(self.tokens / self.generation_sec, 2) if self.generation_sec else 0.0,
+            "wait_ms": self.wait_histogram.snapshot(),
+        }
+
+
+def load_llama(model_path: str, n_ctx: int, n_threads: int, n_batch: int) -> Any:
+    """Load one llama-cpp model instance (CPU settings from the configuration)"""
+    from llama_cpp import Llama
+
+    return Llama(
+        model_path=model_path,
+        n_ctx=n_ctx,
+        n_batch=n_batch,
+        n_threads=n_threads,
+        verbose=False,
+        use_mmap=True,
+        use_mlock=False,
+    )
+
+
+def set_seed(model: Any, seed: int) -> None:
+    """Seed the sampler of a llama-cpp instance"""
+    setter = getattr(model, "set_seed", None)
+    if setter is not None:
+        setter(seed)
+        return
+    import llama_cpp
+
+    llama_cpp.llama_set_rng_seed(model.ctx, seed)
+
+
+def generate_sync(model: Any, job: _Job, prefix_cache: Optional[PrefixCache] = None) -> GenerationResult:
+    """Stream tokens from ``model`` until done, stopped or cancelled (worker thread)"""
+    params = job.params
+    pieces: List[str] = []
+    tokens = 0
+    start_time = time.perf_counter()
+    if job.prefix and prefix_cache is not None:
+        try:
+            prefix_cache.prepare(job.prefix, job.prompt)
+        except Exception as e:
+            # Fall back to evaluating the whole prompt from a clean context
+            logger.warning(f"Prompt prefix reuse failed: {e}")
+            model.reset()
+    if params.seed is not None:
+        set_seed(model, params.seed)
+    stream = model(
+        job.prompt,
+        max_tokens=params.max_tokens,
+        temperature=params.temperature,
+        top_p=params.top_p,
+        repeat_penalty=params.repeat_penalty,
+        stop=list(params.stop),
+        echo=False,
+        stream=True,
+    )
+    cancelled = False
+    first_token_ms = None
+    for chunk in stream:
+        if job.cancelled.is_set():
+            cancelled = True
+            break
+        piece = chunk["choices"][0]["text"]
+        if first_token_ms is None:
+            first_token_ms = (time.perf_counter() - job.enqueued_at) * 1000
+        tokens += 1
+        pieces.append(piece)
+        if job.on_token is not None:
+            job.on_token(piece)
+    close = getattr(stream, "close", None)
+    if close is not None:
+        close()
+    return GenerationResult(
+        text="".join(pieces),
+        tokens=tokens,
+        wait_ms=0.0,
+        generation_ms=(time.perf_counter() - start_time) * 1000,
+        instance=-1,
+        cancelled=cancelled,
+        first_token_ms=first_token_ms,
+    )
+
+
+class TokenStream:
+    """
+    Tokens of one queued job, delivered as they are generated
+
+    Iterate with ``async for``; ``result`` is set once the generation has
+    finished. Leaving the loop early, ``close()``, the timeout or
+    ``is_disconnected`` returning True cancels the job.
+    """
+
+    def __init__(
+        self,
+        pool: "LLMWorkerPool",
+        job: _Job,
+        pieces: asyncio.Queue,
+        timeout_sec: float,
+        is_disconnected: Optional[Callable[[], Awaitable[bool]]] = None
+    ):
+        self._pool = pool
+        self._job = job
+        self._pieces = pieces
+        self._timeout_sec = timeout_sec
+        self._is_disconnected = is_disconnected
+        self.result: Optional[GenerationResult] = None
+        self.aborted = False
+
+    def close(self) -> None:
+        """Cancel the job unless it already finished"""
+        if self.result is None and not self.aborted:
+            self.aborted = True
+            self._pool.streams_aborted += 1
+            self._job.cancelled.set()
+
+    async def __aiter__(self) -> AsyncIterator[str]:
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self._timeout_sec
+        next_poll = loop.time() + DISCONNECT_POLL_SEC
+        try:
+            while True:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    self._pool.timed_out += 1
+                    raise HTTPException(
+                        status_code=504, detail=f"LLM generation timed out after {self._timeout_sec:.0f}s"
+                    )
+                try:
+                    piece = await asyncio.wait_for(
+                        self._pieces.get(), min(remaining, max(next_poll - loop.time(), 0))
+                    )
+                except asyncio.TimeoutError:
+                    piece = ""
+                if piece is None:
+                    break
+                if loop.time() >= next_poll:
+                    next_poll = loop.time() + DISCONNECT_POLL_SEC
+                    if self._is_disconnected is not None and await self._is_disconnected():
+                        logger.info("Client disconnected; cancelling LLM generation")
+                        return
+                if piece:
+                    yield piece
+            self.result = self._job.future.result()
+        finally:
+            self.close()
+
+
+class LLMWorkerPool:
+    """Fixed set of model instances fed from a priority queue"""
+
+    def __init__(
+        self,
+        model_factory: Callable[[], Any],
+        instances: int = 1,
+        max_queue: int = 8,
+        timeout_sec: float = 60.0,
+        prefix_cache_size: int = 0
+    ):
+        self.model_factory = model_factory
+        self.instances = max(1, instances)
+        self.max_queue = max(0, max_queue)
+        self.timeout_sec = timeout_sec
+        # Saved prompt prefixes per instance (0 disables prefix reuse)
+        self.prefix_cache_size = prefix_cache_size
+
+        self._queue: Optional[asyncio.PriorityQueue] = None
+        self._sequence = itertools.count()
+        self._models: List[Any] = []
+        self._prefix_caches: List[Optional[PrefixCache]] = [None] * self.instances
+        self._executors: List[ThreadPoolExecutor] = []
+        self._tasks: List[asyncio.Task] = []
+        self._stats = [_InstanceStats() for _ in range(self.instances)]
+        self._running: List[Optional[_Job]] = [None] * self.instances
+        self._start_lock: Optional[asyncio.Lock] = None
+
+        self.submitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.dropped = 0
+        self.streams = 0
+        self.streams_aborted = 0
+        self.wait_histogram = Histogram()
+        self.first_token_histogram = Histogram()
+
+    @property
+    def started(self) -> bool:
+        return bool(self._tasks)
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    # === Lifecycle ===
+
+    async def start(self) -> None:
+        """Load every model instance (each on its own thread) and start the workers"""
+        if self._start_lock is None:
+            self._start_lock = asyncio.Lock()
+        async with self._start_lock:
+            if self.started:
+                return
+            self._queue = asyncio.PriorityQueue()
+            self._executors = [
+                ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"llm-{index}")
+                for index in range(self.instances)
+            ]
+            loop = asyncio.get_running_loop()
+            # Load in parallel; a context is created on the thread that will use it
+            self._models = list(await asyncio.gather(*(
+                loop.run_in_executor(executor, self.model_factory) for executor in self._executors
+            )))
+            if self.prefix_cache_size > 0:
+                self._prefix_caches = [PrefixCache(model, self.prefix_cache_size) for model in self._models]
+            self._tasks = [
+                asyncio.create_task(self._worker(index), name=f"llm-worker-{index}")
+                for index in range(self.instances)
+            ]
+            logger.info(f"Started {self.instances} LLM worker(s), queue limit {self.max_queue}")
+
+    async def stop(self) -> None:
+        """Cancel the workers, fail queued jobs and release the models"""
+        for job in self._running:
+            if job is not None:
+                job.cancelled.set()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self._queue is not None:
+            while not self._queue.empty():
+                _, _, job = self._queue.get_nowait()
+                if not job.future.done():
+                    job.future.set_exception(
+                        HTTPException(status_code=503, detail="LLM service is shutting down")
+                    )
+        for executor in self._executors:
+            executor.shutdown(wait=False, cancel_futures=True)
+        self._executors = []
+        self._models = []
+        self._prefix_caches = [None] * self.instances
+
+    # === Submission ===
+
+    async def submit(
+        self,
+        prompt: Union[str, Prompt],
+        params: GenerationParams = GenerationParams(),
+        priority: int = PRIORITY_INTERACTIVE,
+        on_token: Optional[Callable[[str], None]] = None
+    ) -> _Job:
+        """Queue a generation (503 when the queue is full)"""
+        if not self.started:
+            await self.start()
+        if self.queue_depth >= self.max_queue:
+            self.rejected += 1
+            logger.warning(f"LLM queue full ({self.queue_depth} waiting); rejecting request")
+            raise HTTPException(
+                status_code=503,
+                detail="LLM service is busy. Please retry shortly.",
+                headers={"Retry-After": "2"}
+            )
+
+        job = _Job(prompt, params, asyncio.get_running_loop().create_future(), on_token)
+        self._queue.put_nowait((priority, next(self._sequence), job))
+        self.submitted += 1
+        return job
+
+    async def generate(
+        self,
+        prompt: Union[str, Prompt],
+        params: GenerationParams = GenerationParams(),
+        priority: int = PRIORITY_INTERACTIVE,
+        timeout_sec: Optional[float] = None,
+        on_token: Optional[Callable[[str], None]] = None
+    ) -> GenerationResult:
+        """
+        Queue a generation and wait for its result
+
+        Raises 503 when the queue is full and 504 when the job does not
+        finish within ``timeout_sec``. Cancelling the awaiting task cancels
+        the job. ``on_token`` is called on the worker thread for each token.
+        """
+        job = await self.submit(prompt, params, priority, on_token)
+        timeout = self.timeout_sec if timeout_sec is None else timeout_sec
+        try:
+            return await asyncio.wait_for(asyncio.shield(job.future), timeout)
+        except asyncio.TimeoutError:
+            self.timed_out += 1
+            job.cancelled.set()
+            raise HTTPException(status_code=504, detail=f"LLM generation timed out after {timeout:.0f}s")
+        except asyncio.CancelledError:
+            job.cancelled.set()
+            raise
+
+    async def stream(
+        self,
+        prompt: Union[str, Prompt],
+        params: GenerationParams = GenerationParams(),
+        priority: int = PRIORITY_INTERACTIVE,
+        timeout_sec: Optional[float] = None,
+        is_disconnected: Optional[Callable[[], Awaitable[bool]]] = None
+    ) -> TokenStream:
+        """Queue a generation whose tokens are iterated as they arrive (503 when the queue is full)"""
+        loop = asyncio.get_running_loop()
+        pieces: asyncio.Queue = asyncio.Queue()
+
+        def on_token(piece: str) -> None:
+            loop.call_soon_threadsafe(pieces.put_nowait, piece)
+
+        job = await self.submit(prompt, params, priority, on_token)
+        # Tokens are scheduled on the loop before the result, so the sentinel comes last
+        job.future.add_done_callback(lambda _: pieces.put_nowait(None))
+        self.streams += 1
+        timeout = self.timeout_sec if timeout_sec is None else timeout_sec
+        return TokenStream(self, job, pieces, timeout, is_disconnected)
+
+    async def _worker(self, index: int) -> None:
+        loop = asyncio.get_running_loop()
+        stats = self._stats[index]
+        while True:
+            _, _, job = await self._queue.get()
+            if job.cancelled.is_set() or job.future.done():
+                self.dropped += 1
+                continue
+
+            wait_ms = (time.perf_counter() - job.enqueued_at) * 1000
+            self.wait_histogram.observe(wait_ms)
+            stats.wait_histogram.observe(wait_ms)
+            stats.busy = True
+            self._running[index] = job
+            try:
+                result = await loop.run_in_executor(
+                    self._executors[index], generate_sync, self._models[index], job, self._prefix_caches[index]
+                )
+            except asyncio.CancelledError:
+                job.cancelled.set()
+                raise
+            except Exception as e:
+                stats.failed += 1
+                logger.error(f"LLM worker {index} generation failed: {e}")
+                # Nobody awaits an abandoned job's future
+                if not job.future.done() and not job.cancelled.is_set():
+                    job.future.set_exception(e)
+                continue
+            finally:
+                stats.busy = False
+                self._running[index] = None
+
+            if result.first_token_ms is not None:
+                self.first_token_histogram.observe(result.first_token_ms)
+            stats.tokens += result.tokens
+            stats.generation_sec += result.generation_ms / 1000
+            if result.cancelled:
+                stats.cancelled += 1
+            else:
+                stats.completed += 1
+            if not job.future.done():
+                job.future.set_result(result._replace(wait_ms=wait_ms, instance=index))
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """Queue depth, admission counters, wait and first-token times, per-instance throughput"""
+        return {
+            "started": self.started,
+            "instances": self.instances,
+            "max_queue": self.max_queue,
+            "queue_depth": self.queue_depth,
+            "submitted": self.submitted,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+            "dropped": self.dropped,
+            "streams": self.streams,
+            "streams_aborted": self.streams_aborted,
+            "wait_ms": self.wait_histogram.snapshot(),
+            "first_token_ms": self.first_token_histogram.snapshot(),
+            "workers": [
+                {
+                    **stats.snapshot(index),
+                    "prefix_cache": cache.snapshot() if cache is not None else None,
+                }
+                for index, (stats, cache) in enumerate(zip(self._stats, self._prefix_caches))
+            ],
+        }
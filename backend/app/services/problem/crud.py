@@ -8,6 +8,8 @@ from sqlalchemy import and_
 
 from app.models.problem import Problem, Choice
 from app.models.schemas import ProblemCreate
+from app.services.embedding.collection_version import bump_collection_version
+from app.services.exam.catalog import notify_problem_created, notify_problem_deleted
 
 class ProblemCRUD:
     """CRUD service for problems"""
@@ -63,6 +65,10 @@ class ProblemCRUD:
         db.commit()
         db.refresh(db_problem)
         
+        # Cached search results may no longer reflect the problem set
+        version = bump_collection_version()
+        notify_problem_created(db_problem.id, db_problem.difficulty, db_problem.tags, version)
+        
         return db_problem
     
     async def delete_problem(self, db: Session, problem_id: int) -> bool:
@@ -71,6 +77,8 @@ class ProblemCRUD:
         if problem:
             db.delete(problem)
             db.commit()
+            version = bump_collection_version()
+            notify_problem_deleted(problem_id, version)
             return True
         return False
 
@@ -0,0 +1,179 @@
+"""
+In-process caching utilities
+"""
+
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+_CONTAINERS = (list, tuple, set, frozenset)
+
+
+def approximate_size(value: Any) -> int:
+    """Deep ``sys.getsizeof`` over containers and object attributes (shared objects counted once)"""
+    seen = set()
+    stack = [value]
+    total = 0
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen:
+            continue
+        seen.add(id(obj))
+        total += sys.getsizeof(obj)
+        if isinstance(obj, dict):
+            stack.extend(obj.keys())
+            stack.extend(obj.values())
+        elif isinstance(obj, _CONTAINERS):
+            stack.extend(obj)
+        elif hasattr(obj, "__dict__") and not isinstance(obj, type):
+            stack.append(vars(obj))
+    return total
+
+
+class TTLCache:
+    """
+    Size-bounded LRU cache whose entries also expire after a fixed TTL
+
+    Reads refresh recency but not the expiry time. Safe to share between the
+    event loop and worker threads.
+
+    With ``max_bytes`` the cache also keeps the summed entry sizes (given to
+    ``set`` or estimated with ``sizeof``) under a byte budget. With
+    ``version_source`` (e.g. ``read_collection_version``) ``check_version``
+    drops every entry once the source data has changed; values are stored
+    and returned as-is, so they should be treated as immutable.
+    """
+
+    def __init__(
+        self,
+        max_size: int = 1024,
+        ttl_seconds: Optional[float] = None,
+        max_bytes: Optional[int] = None,
+        sizeof: Callable[[Any], int] = approximate_size,
+        version_source: Optional[Callable[[], str]] = None
+    ):
+        self.max_size = max(1, max_size)
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self._sizeof = sizeof
+        self._version_source = version_source
+        self._version: Optional[str] = None
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Return the cached value or ``default`` on a miss"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+
+            value, expires_at, size = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._data[key]
+                self.bytes -= size
+                self.expirations += 1
+                self.misses += 1
+                return default
+
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(
+        self,
+        key: Hashable,
+        value: Any,
+        size: Optional[int] = None,
+        version: Optional[str] = None
+    ) -> bool:
+        """
+        Insert or replace an entry, evicting the least recently used
+
+        ``version`` is the stamp returned by ``check_version`` before the
+        value was computed; values computed against older data are not
+        stored. Returns False when the entry was not stored.
+        """
+        expires_at = None
+        if self.ttl_seconds is not None:
+            expires_at = time.monotonic() + self.ttl_seconds
+        if self.max_bytes is not None and size is None:
+            size = self._sizeof(value)
+        size = size or 0
+        if self.max_bytes is not None and size > self.max_bytes:
+            return False
+
+        with self._lock:
+            if version is not None and version != self._version:
+                return False
+            previous = self._data.pop(key, None)
+            if previous is not None:
+                self.bytes -= previous[2]
+            self._data[key] = (value, expires_at, size)
+            self.bytes += size
+
+            while len(self._data) > self.max_size or (
+                self.max_bytes is not None and self.bytes > self.max_bytes
+            ):
+                _, (_, _, evicted_size) = self._data.popitem(last=False)
+                self.bytes -= evicted_size
+                self.evictions += 1
+        return True
+
+    def check_version(self) -> Optional[str]:
+        """Drop every entry if ``version_source`` changed; returns the current stamp"""
+        if self._version_source is None:
+            return None
+        version = self._version_source()
+        with self._lock:
+            if version != self._version:
+                if self._data:
+                    self.invalidations += 1
+                self._data.clear()
+                self.bytes = 0
+                self._version = version
+        return version
+
+    def invalidate(self, key: Hashable) -> bool:
+        """Drop a single entry"""
+        with self._lock:
+            entry = self._data.pop(key, None)
+            if entry is None:
+                return False
+            self.bytes -= entry[2]
+            return True
+
+    def clear(self) -> None:
+        """Drop every entry (counters are kept)"""
+        with self._lock:
+            self._data.clear()
+            self.bytes = 0
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Hit/miss counters for metrics endpoints"""
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "max_size": self.max_size,
+            "ttl_seconds": self.ttl_seconds,
+            "bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+        }
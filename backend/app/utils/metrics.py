@@ -0,0 +1,80 @@
+"""
+Lightweight in-process metrics primitives
+"""
+
+import bisect
+import threading
+from typing import Dict, Any, List, Sequence
+
+# Default bucket bounds for latency-style histograms (milliseconds)
+LATENCY_BUCKETS_MS = (0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+
+# Default bucket bounds for batch-size histograms
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128)
+
+
+class Histogram:
+    """Fixed-bucket histogram with approximate quantiles"""
+
+    def __init__(self, buckets: Sequence[float] = LATENCY_BUCKETS_MS):
+        self._bounds: List[float] = sorted(buckets)
+        self._counts: List[int] = [0] * (len(self._bounds) + 1)
+        self._count = 0
+        self._sum = 0.0
+        self._max = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        """Record a single observation"""
+        index = bisect.bisect_left(self._bounds, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._count += 1
+            self._sum += value
+            if value > self._max:
+                self._max = value
+
+    def quantile(self, q: float) -> float:
+        """Approximate quantile (upper bound of the bucket containing q)"""
+        with self._lock:
+            if self._count == 0:
+                return 0.0
+            rank = q * self._count
+            seen = 0
+            for index, count in enumerate(self._counts):
+                seen += count
+                if seen >= rank and count:
+                    if index < len(self._bounds):
+                        return float(self._bounds[index])
+                    return self._max
+            return self._max
+
+    def reset(self) -> None:
+        """Drop all observations"""
+        with self._lock:
+            self._counts = [0] * (len(self._bounds) + 1)
+            self._count = 0
+            self._sum = 0.0
+            self._max = 0.0
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Serializable view for metrics endpoints"""
+        with self._lock:
+            counts = list(self._counts)
+            count, total, maximum = self._count, self._sum, self._max
+
+        buckets = {
+            f"le_{bound:g}": counts[index] for index, bound in enumerate(self._bounds)
+        }
+        buckets["le_inf"] = counts[-1]
+
+        return {
+            "count": count,
+            "sum": round(total, 4),
+            "mean": round(total / count, 4) if count else 0.0,
+            "max": round(maximum, 4),
+            "p50": self.quantile(0.50),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99),
+            "buckets": buckets,
+        }
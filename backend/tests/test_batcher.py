@@ -0,0 +1,70 @@
+"""
+MicroBatcher のテスト
+"""
+
+import asyncio
+
+import pytest
+
+from app.services.embedding.batcher import MicroBatcher
+
+
+async def test_concurrent_items_share_one_batch():
+    """ウィンドウ内に到着したクエリは1バッチにまとめられる"""
+    batches = []
+
+    async def handler(items):
+        batches.append(list(items))
+        return [item * 2 for item in items]
+
+    batcher = MicroBatcher(handler, window_ms=20, max_batch_size=32)
+    results = await asyncio.gather(*(batcher.submit(i) for i in range(5)))
+
+    assert results == [0, 2, 4, 6, 8]
+    assert batches == [[0, 1, 2, 3, 4]]
+
+    metrics = batcher.get_metrics()
+    assert metrics["batch_size"]["count"] == 1
+    assert metrics["queue_wait_ms"]["count"] == 5
+
+
+async def test_max_batch_size_flushes_early():
+    """最大バッチサイズに達したら即座にフラッシュする"""
+    batches = []
+
+    async def handler(items):
+        batches.append(len(items))
+        return items
+
+    batcher = MicroBatcher(handler, window_ms=1000, max_batch_size=3)
+    results = await asyncio.wait_for(
+        asyncio.gather(*(batcher.submit(i) for i in range(6))), timeout=0.5
+    )
+
+    assert results == list(range(6))
+    assert batches == [3, 3]
+
+
+async def test_handler_error_propagates_to_all_waiters():
+    """ハンドラの例外は全ての呼び出し元に伝播する"""
+
+    async def handler(items):
+        raise ValueError("boom")
+
+    batcher = MicroBatcher(handler, window_ms=1, max_batch_size=8)
+    results = await asyncio.gather(
+        batcher.submit("a"), batcher.submit("b"), return_exceptions=True
+    )
+
+    assert all(isinstance(r, ValueError) for r in results)
+
+
+async def test_result_count_mismatch_is_an_error():
+    """結果数が入力数と一致しない場合はエラー"""
+
+    async def handler(items):
+        return items[:1]
+
+    batcher = MicroBatcher(handler, window_ms=1, max_batch_size=8)
+    with pytest.raises(RuntimeError):
+        await asyncio.gather(batcher.submit(1), batcher.submit(2))
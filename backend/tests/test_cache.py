@@ -0,0 +1,103 @@
+"""
+TTLCache のテスト
+"""
+
+import time
+
+from app.utils.cache import TTLCache, approximate_size
+
+
+def test_lru_eviction_keeps_recently_used():
+    """最近参照したエントリは追い出されない"""
+    cache = TTLCache(max_size=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+
+    cache.set("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert cache.get_stats()["evictions"] == 1
+
+
+def test_entries_expire_after_ttl():
+    """TTL経過後はミス扱いになる"""
+    cache = TTLCache(max_size=10, ttl_seconds=0.01)
+    cache.set("query", [0.1, 0.2])
+    assert cache.get("query") == [0.1, 0.2]
+
+    time.sleep(0.02)
+
+    assert cache.get("query") is None
+    stats = cache.get_stats()
+    assert stats["expirations"] == 1
+    assert stats["size"] == 0
+
+
+def test_hit_miss_counters():
+    """ヒット・ミス数とヒット率を集計する"""
+    cache = TTLCache(max_size=10)
+    cache.set(("ニューラルネットワーク", 5, None), "response")
+
+    cache.get(("ニューラルネットワーク", 5, None))
+    cache.get(("CNN プーリング", 5, None))
+
+    stats = cache.get_stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+    assert stats["hit_rate"] == 0.5
+
+
+def test_clear_and_invalidate():
+    """個別削除と全削除"""
+    cache = TTLCache(max_size=10)
+    cache.set("a", 1)
+    cache.set("b", 2)
+
+    assert cache.invalidate("a") is True
+    assert cache.invalidate("a") is False
+    cache.clear()
+    assert len(cache) == 0
+
+
+def test_byte_budget_evicts_least_recently_used():
+    """バイト上限を超えると古いエントリから追い出す"""
+    cache = TTLCache(max_size=10, max_bytes=100)
+    cache.set("a", "x", size=40)
+    cache.set("b", "y", size=40)
+    cache.get("a")
+
+    cache.set("c", "z", size=40)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == "x"
+    stats = cache.get_stats()
+    assert stats["bytes"] == 80
+    assert stats["evictions"] == 1
+    assert cache.set("huge", "w", size=101) is False
+
+
+def test_byte_size_is_estimated_when_not_given():
+    """サイズ省略時は approximate_size で見積もる"""
+    value = {"question": "問題" * 100, "choices": [{"body": "選択肢"}] * 4}
+    cache = TTLCache(max_size=10, max_bytes=10**6)
+    cache.set("q", value)
+    assert cache.get_stats()["bytes"] == approximate_size(value) > 0
+
+
+def test_version_change_drops_entries():
+    """バージョンが変わると全エントリを破棄し、古い版で計算した値は保存しない"""
+    versions = ["v1"]
+    cache = TTLCache(max_size=10, version_source=lambda: versions[0])
+
+    old = cache.check_version()
+    cache.set("candidates", (1, 2, 3), version=old)
+    assert cache.get("candidates") == (1, 2, 3)
+
+    versions[0] = "v2"
+    assert cache.check_version() == "v2"
+    assert cache.get("candidates") is None
+    assert cache.set("candidates", (1, 2), version=old) is False
+    assert cache.get_stats()["invalidations"] == 1
@@ -0,0 +1,130 @@
+"""
+ProblemCatalog のテスト
+"""
+
+import sqlite3
+
+import numpy as np
+import pytest
+
+from app.services.exam.catalog import ProblemCatalog
+
+ROWS = [
+    (1, 1, "機械学習,統計"),
+    (2, 2, "深層学習"),
+    (3, 2, "機械学習"),
+    (5, 3, "深層学習,CNN"),
+    (8, 1, None),
+]
+
+
+@pytest.fixture
+def catalog():
+    c = ProblemCatalog(db_path=":memory:")
+    c.load(ROWS)
+    return c
+
+
+def test_filters_by_tag_and_difficulty(catalog):
+    """タグは OR、難易度は AND で絞り込む"""
+    assert catalog.candidate_ids().tolist() == [1, 2, 3, 5, 8]
+    assert catalog.candidate_ids(tags=["機械学習"]).tolist() == [1, 3]
+    assert catalog.candidate_ids(tags=["統計", "CNN"]).tolist() == [1, 5]
+    assert catalog.candidate_ids(tags=["深層学習"], difficulty=2).tolist() == [2]
+    assert catalog.candidate_ids(difficulty=4).tolist() == []
+    assert catalog.candidate_ids(tags=["存在しないタグ"]).tolist() == []
+
+
+def test_incremental_add_and_remove(catalog):
+    """作成・削除が全件再読み込みなしで反映される"""
+    revision = catalog.revision
+
+    catalog.add(9, 3, "CNN")
+    catalog.add(4, 1, "統計")  # 既存IDより小さいIDは位置を保って挿入
+    assert catalog.remove(2)
+    assert not catalog.remove(2)
+
+    assert catalog.candidate_ids().tolist() == [1, 3, 4, 5, 8, 9]
+    assert catalog.candidate_ids(tags=["CNN"]).tolist() == [5, 9]
+    assert catalog.candidate_ids(tags=["統計"], difficulty=1).tolist() == [1, 4]
+    assert catalog.candidate_ids(tags=["深層学習"]).tolist() == [5]
+    assert catalog.revision == revision + 3
+    assert catalog.get_stats()["tombstones"] == 1
+
+
+def test_snapshot_is_unaffected_by_later_inserts(catalog):
+    """挿入で配列がずれても、取得済みスナップショットのビットマップとIDは一致したまま"""
+    snapshot = catalog.snapshot(["CNN"])
+    mask = snapshot.tag_mask("CNN") & snapshot.difficulty_mask(3)
+
+    catalog.add(4, 1, "統計")
+
+    assert snapshot.ids_for(mask).tolist() == [5]
+    assert set(snapshot.tag_masks) == {"CNN"}
+    assert snapshot.revision == catalog.revision - 1
+    assert catalog.snapshot().candidate_ids(tags=["CNN"], difficulty=3).tolist() == [5]
+
+
+def test_add_replaces_existing_problem(catalog):
+    catalog.add(3, 3, "CNN")
+
+    assert catalog.candidate_ids(tags=["機械学習"]).tolist() == [1]
+    assert catalog.candidate_ids(tags=["CNN"], difficulty=3).tolist() == [3, 5]
+
+
+def test_growth_beyond_initial_capacity():
+    """容量を超える追加でも配列が伸長される"""
+    c = ProblemCatalog(db_path=":memory:")
+    c.load([])
+    for problem_id in range(1, 3001):
+        c.add(problem_id, problem_id % 5 + 1, f"tag{problem_id % 7}")
+
+    assert c.count() == 3000
+    ids = c.candidate_ids(tags=["tag3"], difficulty=2)
+    expected = [i for i in range(1, 3001) if i % 7 == 3 and i % 5 + 1 == 2]
+    assert np.array_equal(ids, expected)
+
+
+def test_load_from_database(tmp_path):
+    db_path = tmp_path / "problems.db"
+    conn = sqlite3.connect(db_path)
+    conn.execute("CREATE TABLE problems (id INTEGER PRIMARY KEY, question TEXT, difficulty INTEGER, tags TEXT)")
+    conn.executemany("INSERT INTO problems (id, question, difficulty, tags) VALUES (?, 'q', ?, ?)", ROWS)
+    conn.commit()
+    conn.close()
+
+    c = ProblemCatalog(db_path=str(db_path))
+    assert c.load() == len(ROWS)
+    assert c.get_stats()["difficulty_counts"] == {"1": 2, "2": 2, "3": 1}
+
+
+def test_changes_before_load_are_ignored():
+    """未ロード時の通知は無視し、次回ロードで反映する"""
+    c = ProblemCatalog(db_path=":memory:")
+    c.add(1, 1, "統計")
+    assert not c.remove(1)
+    assert not c.loaded
+
+
+def test_fingerprint_tracks_live_content_only(catalog):
+    """フィンガープリントは内容のみで決まり、墓標や再読み込みでは変わらない"""
+    fingerprint = catalog.fingerprint()
+    reloaded = ProblemCatalog(db_path=":memory:")
+    reloaded.load(reversed(ROWS))
+    assert reloaded.fingerprint() == fingerprint
+
+    catalog.add(9, 3, "CNN")
+    assert catalog.fingerprint() != fingerprint
+    catalog.remove(9)
+    assert catalog.fingerprint() == fingerprint
+
+
+def test_snapshot_round_trip(catalog):
+    """to_bytes / from_bytes で同じ内容のカタログを復元する"""
+    catalog.remove(3)
+    restored = ProblemCatalog.from_bytes(catalog.to_bytes())
+
+    assert restored.fingerprint() == catalog.fingerprint()
+    assert restored.candidate_ids().tolist() == [1, 2, 5, 8]
+    assert restored.candidate_ids(tags=["深層学習"], difficulty=3).tolist() == [5]
+    assert restored.candidate_ids(tags=["機械学習"]).tolist() == [1]
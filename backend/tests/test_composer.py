@@ -0,0 +1,206 @@
+"""
+模試コンポーザ (難易度 × 分野クォータ) のテスト
+"""
+
+import time
+from collections import Counter
+
+import numpy as np
+import pytest
+
+from app.services.exam.catalog import ProblemCatalog
+from app.services.exam.composer import (
+    InsufficientProblemsError,
+    ProblemWeights,
+    allocate,
+    compose_exam,
+    exam_rng,
+    floyd_sample,
+    joint_quotas,
+    largest_remainder,
+    weighted_sample,
+)
+
+AREAS = ["機械学習", "深層学習", "AI倫理", "数理統計"]
+
+
+def make_catalog(n: int, seed: int = 0) -> ProblemCatalog:
+    rng = np.random.default_rng(seed)
+    catalog = ProblemCatalog(db_path=":memory:")
+    catalog.load([
+        (i, int(rng.integers(1, 6)), AREAS[int(rng.integers(0, len(AREAS)))])
+        for i in range(1, n + 1)
+    ])
+    return catalog
+
+
+def test_largest_remainder_sums_exactly():
+    """round() と違い、合計が必ず要求数に一致する"""
+    counts = largest_remainder(10, {"1": 1 / 3, "2": 1 / 3, "3": 1 / 3})
+    assert sum(counts.values()) == 10
+    assert sorted(counts.values()) == [3, 3, 4]
+
+    # 比率0の難易度には1問も割り当てない
+    assert largest_remainder(7, {1: 0.0, 2: 1.0}) == {1: 0, 2: 7}
+
+
+def test_joint_quotas_match_both_marginals():
+    quotas = joint_quotas(
+        37,
+        {1: 0.2, 2: 0.5, 3: 0.3},
+        {"機械学習": 0.4, "深層学習": 0.35, "AI倫理": 0.25}
+    )
+    rows = Counter()
+    cols = Counter()
+    for (level, area), count in quotas.items():
+        rows[level] += count
+        cols[area] += count
+
+    assert rows == largest_remainder(37, {1: 0.2, 2: 0.5, 3: 0.3})
+    assert cols == largest_remainder(37, {"機械学習": 0.4, "深層学習": 0.35, "AI倫理": 0.25})
+
+
+def test_allocate_moves_shortfall_within_same_difficulty_first():
+    """不足分はまず同じ難易度の他分野から補う"""
+    quotas = {(1, "a"): 5, (1, "b"): 5, (2, "a"): 5, (2, "b"): 5}
+    capacity = {(1, "a"): 2, (1, "b"): 100, (2, "a"): 100, (2, "b"): 100}
+
+    alloc, moved = allocate(quotas, capacity)
+
+    assert moved == 3
+    assert alloc == {(1, "a"): 2, (1, "b"): 8, (2, "a"): 5, (2, "b"): 5}
+
+
+def test_floyd_sample_is_distinct_and_uniform():
+    rng = np.random.default_rng(1)
+    counts = np.zeros(10)
+    for _ in range(5000):
+        sample = floyd_sample(10, 3, rng)
+        assert len(set(sample.tolist())) == 3
+        counts[sample] += 1
+
+    # 各要素は 5000 * 3 / 10 = 1500 回前後選ばれる
+    assert np.all(np.abs(counts - 1500) < 150)
+
+
+def test_compose_meets_quotas_without_duplicates():
+    catalog = make_catalog(5000)
+    composition = compose_exam(
+        catalog,
+        100,
+        {"1": 0.1, "2": 0.2, "3": 0.4, "4": 0.2, "5": 0.1},
+        tag_ratio={"機械学習": 0.5, "深層学習": 0.3, "AI倫理": 0.2},
+        rng=np.random.default_rng(0)
+    )
+
+    ids = composition.problem_ids
+    assert len(ids) == len(set(ids)) == 100
+    report = composition.report
+    assert report["redistributed"] == 0
+    assert {k: v["achieved"] for k, v in report["difficulty"].items()} == {
+        "1": 10, "2": 20, "3": 40, "4": 20, "5": 10
+    }
+    assert {k: v["achieved"] for k, v in report["areas"].items()} == {
+        "機械学習": 50, "深層学習": 30, "AI倫理": 20
+    }
+    # 数理統計は指定されていないので選ばれない
+    assert set(catalog.candidate_ids(tags=["数理統計"]).tolist()).isdisjoint(ids)
+
+
+def test_compose_reports_infeasible_quota():
+    """在庫不足のセルは他セルで補完し、レポートに記録する"""
+    catalog = ProblemCatalog(db_path=":memory:")
+    catalog.load(
+        [(i, 1, "機械学習") for i in range(1, 4)]
+        + [(i, 2, "機械学習") for i in range(4, 40)]
+    )
+
+    composition = compose_exam(catalog, 10, {"1": 0.5, "2": 0.5})
+
+    assert len(composition.problem_ids) == 10
+    assert composition.report["redistributed"] == 2
+    assert composition.report["difficulty"]["1"] == {"requested_ratio": 0.5, "quota": 5, "achieved": 3}
+    assert composition.report["difficulty"]["2"]["achieved"] == 7
+
+
+def test_compose_raises_when_not_enough_problems():
+    catalog = make_catalog(50)
+    with pytest.raises(InsufficientProblemsError):
+        compose_exam(catalog, 10, {"1": 1.0}, tags=["存在しない分野"])
+
+
+def test_compose_200_from_100k_is_fast():
+    """10万問から200問の抽出が数ミリ秒で終わる"""
+    catalog = make_catalog(100_000)
+    ratio = {"1": 0.1, "2": 0.2, "3": 0.4, "4": 0.2, "5": 0.1}
+    tag_ratio = {"機械学習": 0.4, "深層学習": 0.4, "AI倫理": 0.2}
+    compose_exam(catalog, 200, ratio, tag_ratio)  # パーティションを構築
+
+    start_time = time.perf_counter()
+    for _ in range(20):
+        compose_exam(catalog, 200, ratio, tag_ratio)
+    elapsed_ms = (time.perf_counter() - start_time) * 1000 / 20
+
+    assert elapsed_ms < 20
+
+
+def test_same_seed_reproduces_exam():
+    """同じシード・カタログ・条件なら同じ模試になる (Philox)"""
+    catalog = make_catalog(2000)
+    ratio = {"1": 0.2, "2": 0.3, "3": 0.5}
+    first = compose_exam(catalog, 50, ratio, rng=exam_rng(12345))
+    second = compose_exam(catalog, 50, ratio, rng=exam_rng(12345))
+    other = compose_exam(catalog, 50, ratio, rng=exam_rng(12346))
+
+    assert first.problem_ids == second.problem_ids
+    assert first.problem_ids != other.problem_ids
+
+
+def test_weighted_sample_follows_weights():
+    rng = np.random.default_rng(3)
+    weights = np.array([1.0, 1.0, 0.1, 0.1, 4.0])
+    counts = np.zeros(5)
+    for _ in range(4000):
+        sample = weighted_sample(weights, 2, rng)
+        assert len(set(sample.tolist())) == 2
+        counts[sample] += 1
+
+    assert counts[4] > counts[0] > counts[2]
+    assert abs(counts[0] - counts[1]) < 250
+
+
+def test_problem_weights_steer_selection_within_quotas():
+    """出題済み (重み小) の問題を避けつつ、難易度・分野の配分は変えない"""
+    catalog = make_catalog(5000)
+    ratio = {"1": 0.2, "2": 0.3, "3": 0.5}
+    tag_ratio = {"機械学習": 0.5, "深層学習": 0.5}
+    seen = np.arange(1, 4001, dtype=np.int64)
+    weights = ProblemWeights(seen, np.full(len(seen), 0.05))
+
+    plain = compose_exam(catalog, 100, ratio, tag_ratio, rng=np.random.default_rng(0))
+    weighted = compose_exam(catalog, 100, ratio, tag_ratio, rng=np.random.default_rng(0), problem_weights=weights)
+
+    assert sum(pid <= 4000 for pid in plain.problem_ids) > 60
+    assert sum(pid <= 4000 for pid in weighted.problem_ids) < 30
+    def achieved(composition):
+        return {k: v["achieved"] for k, v in composition.report["difficulty"].items()}
+
+    assert achieved(weighted) == achieved(plain)
+
+
+def test_weighted_compose_200_from_100k_is_fast():
+    """2万問の出題履歴で重み付けしても 10万問から200問が数ミリ秒"""
+    catalog = make_catalog(100_000)
+    ratio = {"1": 0.1, "2": 0.2, "3": 0.4, "4": 0.2, "5": 0.1}
+    tag_ratio = {"機械学習": 0.4, "深層学習": 0.4, "AI倫理": 0.2}
+    rng = np.random.default_rng(5)
+    seen = np.sort(rng.choice(100_000, size=20_000, replace=False) + 1)
+    weights = ProblemWeights(seen, rng.uniform(0.2, 0.8, size=len(seen)))
+    compose_exam(catalog, 200, ratio, tag_ratio, problem_weights=weights)
+
+    start_time = time.perf_counter()
+    for _ in range(20):
+        compose_exam(catalog, 200, ratio, tag_ratio, problem_weights=weights)
+    elapsed_ms = (time.perf_counter() - start_time) * 1000 / 20
+
+    assert elapsed_ms < 20
@@ -0,0 +1,82 @@
+"""
+EmbeddingDiskCache のテスト
+"""
+
+import time
+
+import numpy as np
+import pytest
+
+from app.services.embedding.embedding_cache import EmbeddingDiskCache
+
+
+class CountingEncoder:
+    """呼び出し回数を記録するダミーエンコーダ"""
+
+    def __init__(self):
+        self.encoded = []
+
+    def __call__(self, texts):
+        self.encoded.extend(texts)
+        return np.array([[float(len(t)), 1.0, 0.5] for t in texts], dtype=np.float32)
+
+
+@pytest.fixture
+def cache(tmp_path):
+    c = EmbeddingDiskCache(str(tmp_path), "test-model", max_entries=100)
+    yield c
+    c.close()
+
+
+def test_second_encode_is_served_from_cache(cache):
+    """2回目以降はモデルを呼ばずにキャッシュから返す"""
+    encoder = CountingEncoder()
+    first = cache.encode(["ニューラルネットワーク", "CNN"], encoder)
+    second = cache.encode(["ニューラルネットワーク", "CNN"], encoder)
+
+    assert first == second
+    assert encoder.encoded == ["ニューラルネットワーク", "CNN"]
+    assert cache.get_stats()["hits"] == 2
+
+
+def test_keys_use_normalized_text(cache):
+    """全角・空白の違いは同じキーとして扱う"""
+    encoder = CountingEncoder()
+    cache.encode(["CNN  プーリング"], encoder)
+    cache.encode(["ＣＮＮ プーリング"], encoder)
+
+    assert len(encoder.encoded) == 1
+
+
+def test_entries_are_scoped_by_model(tmp_path, cache):
+    """モデル名が異なるエントリは共有しない"""
+    cache.put_many(["テキスト"], [[1.0, 2.0]])
+    other = EmbeddingDiskCache(str(tmp_path), "other-model")
+
+    assert other.get_many(["テキスト"]) == [None]
+    assert cache.get_many(["テキスト"]) == [[1.0, 2.0]]
+    other.close()
+
+
+def test_cache_persists_across_instances(tmp_path, cache):
+    """別インスタンス(再起動後)でも再利用できる"""
+    cache.put_many(["永続化"], [[0.25, 0.5]])
+    reopened = EmbeddingDiskCache(str(tmp_path), "test-model")
+
+    assert reopened.get_many(["永続化"]) == [[0.25, 0.5]]
+    reopened.close()
+
+
+def test_lru_eviction_over_cap(tmp_path):
+    """上限を超えると最も古く参照されたエントリから削除する"""
+    cache = EmbeddingDiskCache(str(tmp_path), "test-model", max_entries=3)
+    for text, vector in [("a", [1.0]), ("b", [2.0]), ("c", [3.0])]:
+        cache.put_many([text], [vector])
+        time.sleep(0.01)
+    cache.get_many(["a"])
+
+    cache.put_many(["d"], [[4.0]])
+
+    assert cache.get_many(["a", "b"]) == [[1.0], None]
+    assert cache.get_stats()["size"] <= 3
+    cache.close()
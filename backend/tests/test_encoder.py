@@ -0,0 +1,74 @@
+"""
+エンコーダバックエンドのテスト
+"""
+
+import numpy as np
+import pytest
+
+from app.services.embedding.encoder import OnnxEncoder, load_encoder
+
+MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+SENTENCES = [
+    "ニューラルネットワークの学習で勾配消失が起きる原因はどれか。",
+    "CNNにおけるプーリング層の役割として正しいものを選べ。",
+    "Transformer",
+    "過学習を防ぐための手法として、ドロップアウトや早期終了がある。",
+]
+
+
+def make_pooler(pooling_mode: str, normalize: bool) -> OnnxEncoder:
+    """セッションを作らずにプーリング処理だけを持つインスタンス"""
+    encoder = OnnxEncoder.__new__(OnnxEncoder)
+    encoder.config = {"pooling_mode": pooling_mode, "normalize": normalize}
+    return encoder
+
+
+def test_mean_pooling_ignores_padding():
+    """パディングトークンは平均に含めない"""
+    hidden = np.array([[[1.0, 2.0], [3.0, 4.0], [100.0, 100.0]]], dtype=np.float32)
+    mask = np.array([[1, 1, 0]])
+
+    pooled = make_pooler("mean", normalize=False)._pool(hidden, mask)
+
+    np.testing.assert_allclose(pooled, [[2.0, 3.0]])
+
+
+def test_pooling_normalizes_rows():
+    """Normalize モジュール相当の L2 正規化"""
+    hidden = np.array([[[3.0, 4.0]], [[0.0, 2.0]]], dtype=np.float32)
+    mask = np.ones((2, 1), dtype=np.int64)
+
+    pooled = make_pooler("cls", normalize=True)._pool(hidden, mask)
+
+    np.testing.assert_allclose(np.linalg.norm(pooled, axis=1), [1.0, 1.0], rtol=1e-6)
+    np.testing.assert_allclose(pooled[0], [0.6, 0.8], rtol=1e-6)
+
+
+def test_unknown_backend_is_rejected():
+    with pytest.raises(ValueError):
+        load_encoder(MODEL_NAME, backend="tensorflow")
+
+
+@pytest.mark.parametrize("quantize, min_cosine", [(False, 0.9999), (True, 0.98)])
+def test_onnx_matches_torch(tmp_path, quantize, min_cosine):
+    """ONNX 版の出力が PyTorch 版とコサイン類似度で一致する"""
+    pytest.importorskip("onnxruntime")
+    pytest.importorskip("sentence_transformers")
+
+    try:
+        torch_encoder = load_encoder(MODEL_NAME, backend="torch")
+    except OSError as e:
+        pytest.skip(f"model not available: {e}")
+    onnx_encoder = load_encoder(
+        MODEL_NAME, backend="onnx", onnx_cache_dir=str(tmp_path), quantize=quantize
+    )
+
+    expected = torch_encoder.encode(SENTENCES, batch_size=2)
+    actual = onnx_encoder.encode(SENTENCES, batch_size=2)
+
+    assert actual.shape == expected.shape
+    cosines = (expected * actual).sum(axis=1) / (
+        np.linalg.norm(expected, axis=1) * np.linalg.norm(actual, axis=1)
+    )
+    assert cosines.min() >= min_cosine
+    assert onnx_encoder.name == (f"{MODEL_NAME}+onnx-int8" if quantize else MODEL_NAME)
@@ -0,0 +1,197 @@
+"""
+v1 ExamGenerator のテスト
+"""
+
+import sqlite3
+
+import numpy as np
+import pytest
+from fastapi import HTTPException
+
+from app.models.schemas import ExamGenerateRequest
+from app.services.exam import generator as generator_module
+from app.services.exam.catalog import ProblemCatalog
+from app.services.exam.composer import ProblemWeights
+from app.services.exam.generator import EXAM_QUESTION_TABLE, EXAM_TABLE, ExamGenerator
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = tmp_path / "problems.db"
+    conn = sqlite3.connect(path)
+    conn.executescript("""
+        CREATE TABLE problems (
+            id INTEGER PRIMARY KEY, question TEXT, answer TEXT, explanation TEXT,
+            difficulty INTEGER, tags TEXT, source_url TEXT, created_at DATETIME
+        );
+        CREATE TABLE choices (
+            id INTEGER PRIMARY KEY, problem_id INTEGER, label TEXT, body TEXT, is_correct BOOLEAN
+        );
+    """)
+    for i in range(1, 41):
+        conn.execute(
+            "INSERT INTO problems (id, question, difficulty, tags) VALUES (?, ?, ?, ?)",
+            (i, f"問題{i}", i % 4 + 1, "深層学習" if i % 2 else "機械学習")
+        )
+        conn.executemany(
+            "INSERT INTO choices (problem_id, label, body, is_correct) VALUES (?, ?, ?, ?)",
+            [(i, label, f"選択肢{label}", label == "A") for label in "ABCD"]
+        )
+    conn.commit()
+    conn.close()
+    return str(path)
+
+
+@pytest.fixture
+def generator(db_path, monkeypatch):
+    catalog = ProblemCatalog(db_path=db_path)
+    catalog.load()
+
+    async def get_catalog():
+        return catalog
+
+    monkeypatch.setattr(generator_module, "get_problem_catalog", get_catalog)
+    return ExamGenerator(db_path=db_path)
+
+
+async def test_generate_exam_hydrates_and_persists(generator, db_path):
+    request = ExamGenerateRequest(
+        num_questions=20,
+        difficulty_ratio={"1": 0.25, "2": 0.25, "3": 0.25, "4": 0.25},
+        time_limit_min=60
+    )
+
+    exam = await generator.generate_exam(request)
+
+    assert exam.total_questions == 20
+    assert len({q.id for q in exam.questions}) == 20
+    assert all(len(q.choices) == 4 for q in exam.questions)
+    assert exam.difficulty_distribution == {"1": 0.25, "2": 0.25, "3": 0.25, "4": 0.25}
+
+    # 既定の compact 保存では問題ごとの行を書かず、取得時にシードから再生成する
+    conn = sqlite3.connect(db_path)
+    stored = conn.execute(f"SELECT COUNT(*) FROM {EXAM_QUESTION_TABLE}").fetchone()[0]
+    seed, materialized = conn.execute(
+        f"SELECT seed, materialized FROM {EXAM_TABLE} WHERE exam_id = ?", (exam.exam_id,)
+    ).fetchone()
+    conn.close()
+    assert stored == 0
+    assert seed is not None and materialized == 0
+
+    loaded = await generator.load_exam(exam.exam_id)
+    assert [q.id for q in loaded.questions] == [q.id for q in exam.questions]
+
+
+async def test_generate_exam_rejects_when_not_enough_problems(generator):
+    request = ExamGenerateRequest(
+        num_questions=30,
+        difficulty_ratio={"1": 1.0},
+        tags=["機械学習"],
+        time_limit_min=60
+    )
+
+    with pytest.raises(HTTPException) as exc_info:
+        await generator.generate_exam(request)
+    assert exc_info.value.status_code == 400
+
+
+def test_hydrate_keeps_commas_in_choice_bodies(db_path):
+    conn = sqlite3.connect(db_path)
+    conn.execute("UPDATE choices SET body = 'ReLU, tanh, sigmoid' WHERE problem_id = 1 AND label = 'B'")
+
+    problems = ExamGenerator._hydrate(conn, [1, 2])
+    conn.close()
+
+    choices = problems[1]["choices"]
+    assert [c["label"] for c in choices] == ["A", "B", "C", "D"]
+    assert choices[1]["body"] == "ReLU, tanh, sigmoid"
+    assert [c["is_correct"] for c in choices] == [1, 0, 0, 0]
+
+
+async def test_question_cache_is_shared_and_invalidated_on_write(generator, tmp_path, monkeypatch):
+    from app.core.config import settings
+    from app.services.embedding.collection_version import bump_collection_version
+
+    monkeypatch.setattr(settings, "CHROMA_PATH", str(tmp_path / "chroma"))
+    request = ExamGenerateRequest(num_questions=40, difficulty_ratio={"1": 0.25, "2": 0.25, "3": 0.25, "4": 0.25})
+
+    first = await generator.generate_exam(request)
+    second = await generator.generate_exam(request)
+    stats = generator.get_metrics()["question_cache"]
+    assert stats["hits"] == 40 and stats["misses"] == 40
+    assert stats["bytes"] > 0
+    # 同じ問題は同じオブジェクトを共有する
+    by_id = {q.id: q for q in first.questions}
+    assert all(q is by_id[q.id] for q in second.questions)
+
+    bump_collection_version()
+    await generator.generate_exam(request)
+    stats = generator.get_metrics()["question_cache"]
+    assert stats["invalidations"] == 1
+    assert stats["misses"] == 80
+
+
+def add_problem(db_path, catalog, problem_id, difficulty, tags):
+    conn = sqlite3.connect(db_path)
+    conn.execute(
+        "INSERT INTO problems (id, question, difficulty, tags) VALUES (?, ?, ?, ?)",
+        (problem_id, f"問題{problem_id}", difficulty, tags)
+    )
+    conn.commit()
+    conn.close()
+    catalog.add(problem_id, difficulty, tags)
+
+
+async def test_exam_is_rederived_from_snapshot_after_catalog_change(generator, db_path):
+    request = ExamGenerateRequest(num_questions=10, difficulty_ratio={"1": 0.5, "2": 0.5})
+    exam = await generator.generate_exam(request)
+
+    catalog = await generator_module.get_problem_catalog()
+    fingerprint = catalog.fingerprint()
+    for problem_id in range(41, 61):
+        add_problem(db_path, catalog, problem_id, 1, "機械学習")
+    assert catalog.fingerprint() != fingerprint
+
+    loaded = await generator.load_exam(exam.exam_id)
+    assert [q.id for q in loaded.questions] == [q.id for q in exam.questions]
+
+
+async def test_materialized_fallback_when_catalog_changes_before_persisting(generator, db_path):
+    request = ExamGenerateRequest(num_questions=10, difficulty_ratio={"1": 0.5, "2": 0.5})
+    catalog = await generator_module.get_problem_catalog()
+    prepared = await generator.prepare_exam(request)
+    add_problem(db_path, catalog, 99, 2, "機械学習")
+
+    exam = await generator.publish_exam(prepared, request)
+
+    conn = sqlite3.connect(db_path)
+    materialized = conn.execute(
+        f"SELECT materialized FROM {EXAM_TABLE} WHERE exam_id = ?", (exam.exam_id,)
+    ).fetchone()[0]
+    conn.close()
+    assert materialized == 1
+    loaded = await generator.load_exam(exam.exam_id)
+    assert [q.id for q in loaded.questions] == [q.id for q in prepared.questions]
+
+
+async def test_load_unknown_exam_returns_404(generator):
+    with pytest.raises(HTTPException) as exc_info:
+        await generator.load_exam("missing")
+    assert exc_info.value.status_code == 404
+
+
+async def test_weighted_exam_is_materialized(generator, db_path):
+    """ユーザーごとの重みで選んだ模試はシードから再生成できないので問題IDを保存する"""
+    request = ExamGenerateRequest(num_questions=10, difficulty_ratio={"1": 0.5, "2": 0.5}, time_limit_min=60)
+    weights = ProblemWeights(np.arange(1, 41, dtype=np.int64), np.full(40, 0.5))
+
+    exam = await generator.generate_exam(request, problem_weights=weights)
+
+    conn = sqlite3.connect(db_path)
+    materialized = conn.execute(
+        f"SELECT materialized FROM {EXAM_TABLE} WHERE exam_id = ?", (exam.exam_id,)
+    ).fetchone()[0]
+    conn.close()
+    assert materialized == 1
+    loaded = await generator.load_exam(exam.exam_id)
+    assert [q.id for q in loaded.questions] == [q.id for q in exam.questions]
@@ -0,0 +1,134 @@
+"""
+模試採点 (正解表キャッシュ・一括採点・回答ログ) のテスト
+"""
+
+import sqlite3
+
+import numpy as np
+import pytest
+from fastapi import HTTPException
+
+from app.services.exam.grading import (
+    ANSWER_LOG_TABLE,
+    BulkSheet,
+    BulkSubmission,
+    ExamGrader,
+    build_answer_key,
+    encode_sheets,
+)
+from app.services.exam.mastery import MasteryStore
+
+EXAMS = {"exam-1": [3, 1, 2, 4], "exam-2": [5, 6]}
+
+
+class FakeGenerator:
+    """保存済み模試の出題順だけを返す生成器"""
+
+    async def exam_problem_ids(self, exam_id):
+        if exam_id not in EXAMS:
+            raise HTTPException(status_code=404, detail="指定された模試IDが見つかりません")
+        return EXAMS[exam_id], 60
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = tmp_path / "problems.db"
+    conn = sqlite3.connect(path)
+    conn.executescript("""
+        CREATE TABLE problems (id INTEGER PRIMARY KEY, question TEXT, difficulty INTEGER, tags TEXT);
+        CREATE TABLE choices (
+            id INTEGER PRIMARY KEY, problem_id INTEGER, label TEXT, body TEXT, is_correct BOOLEAN
+        );
+    """)
+    problems = [
+        (1, 1, "機械学習"), (2, 1, "深層学習"), (3, 2, "機械学習,深層学習"),
+        (4, 3, "AI倫理"), (5, 1, "機械学習"), (6, 2, "機械学習"),
+    ]
+    for problem_id, difficulty, tags in problems:
+        conn.execute(
+            "INSERT INTO problems VALUES (?, ?, ?, ?)", (problem_id, f"問題{problem_id}", difficulty, tags)
+        )
+        correct = "ABCD"[problem_id % 4]
+        conn.executemany(
+            "INSERT INTO choices (problem_id, label, body, is_correct) VALUES (?, ?, ?, ?)",
+            [(problem_id, label, f"選択肢{label}", label == correct) for label in "ABCD"]
+        )
+    conn.commit()
+    conn.close()
+    return str(path)
+
+
+@pytest.fixture
+def grader(db_path):
+    return ExamGrader(FakeGenerator(), MasteryStore(db_path=db_path), db_path=db_path)
+
+
+def logged(db_path):
+    conn = sqlite3.connect(db_path)
+    rows = conn.execute(f"SELECT problem_id, is_correct, time_ms FROM {ANSWER_LOG_TABLE} ORDER BY id").fetchall()
+    conn.close()
+    return rows
+
+
+async def test_grade_scores_and_breaks_down_one_sheet(grader, db_path):
+    # 正解: 1=B, 2=C, 3=D, 4=A
+    result = await grader.grade("exam-1", {1: "B", 2: "A", 3: "D", 99: "A"}, time_ms={1: 1200})
+
+    assert (result.correct, result.answered, result.total) == (2, 3, 4)
+    assert result.score == 50.0
+    # 複数タグの問題は両方の分野に数える
+    assert result.by_tag["機械学習"].model_dump() == {"correct": 2, "total": 2, "rate": 1.0}
+    assert result.by_tag["深層学習"].model_dump() == {"correct": 1, "total": 2, "rate": 0.5}
+    assert result.by_tag["AI倫理"].correct == 0
+    assert result.by_difficulty["1"].model_dump() == {"correct": 1, "total": 2, "rate": 0.5}
+    assert [q.problem_id for q in result.questions] == [3, 1, 2, 4]
+    assert [q.correct_label for q in result.questions] == ["D", "B", "C", "A"]
+    assert [q.is_correct for q in result.questions] == [True, True, False, False]
+
+    # 回答した問題だけを出題順に記録する (模試外の問題IDは無視)
+    assert logged(db_path) == [(3, 1, None), (1, 1, 1200), (2, 0, None)]
+
+
+async def test_bulk_grades_sheets_in_submitted_order(grader, db_path):
+    submission = BulkSubmission(sheets=[
+        BulkSheet(exam_id="exam-2", answers={5: "B", 6: "C"}),
+        BulkSheet(exam_id="exam-1", answers={1: "B", 2: "C", 3: "D", 4: "A"}),
+        BulkSheet(exam_id="exam-2", answers={5: "b", 6: "CC"}),
+        BulkSheet(exam_id="exam-1", answers={4: None}),
+    ])
+
+    result = await grader.grade_bulk(submission)
+
+    assert [(r.exam_id, r.correct, r.answered) for r in result.results] == [
+        ("exam-2", 2, 2), ("exam-1", 4, 4), ("exam-2", 0, 2), ("exam-1", 0, 0)
+    ]
+    assert all(r.questions is None for r in result.results)
+    assert result.graded == 4
+    assert result.logged_answers == len(logged(db_path)) == 8
+
+    metrics = grader.get_metrics()
+    assert metrics["sheets_graded"] == 4
+    assert metrics["answer_key_cache"]["misses"] == 2
+
+
+async def test_answer_key_is_cached_and_unknown_exam_is_404(grader):
+    first = await grader.answer_key("exam-1")
+    assert await grader.answer_key("exam-1") is first
+
+    with pytest.raises(HTTPException) as exc_info:
+        await grader.answer_key("missing")
+    assert exc_info.value.status_code == 404
+
+
+def test_vectorized_grading_matches_per_answer_loop():
+    rng = np.random.default_rng(0)
+    rows = [(i, int(rng.integers(1, 6)), "機械学習", "ABCD"[int(rng.integers(0, 4))]) for i in range(200)]
+    key = build_answer_key(rows)
+    sheets = [
+        {i: "ABCD"[int(rng.integers(0, 4))] for i in range(200) if rng.random() < 0.9}
+        for _ in range(50)
+    ]
+
+    hits = encode_sheets(key, sheets) == key.correct
+    expected = [[sheet.get(i) == rows[i][3] for i in range(200)] for sheet in sheets]
+    assert hits.tolist() == expected
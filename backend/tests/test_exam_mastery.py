@@ -0,0 +1,112 @@
+"""
+習熟度集計と弱点克服模試のテスト
+"""
+
+import sqlite3
+
+import numpy as np
+import pytest
+
+from app.services.exam.catalog import ProblemCatalog
+from app.services.exam.grading import BulkSheet, BulkSubmission, ExamGrader
+from app.services.exam.mastery import (
+    PROBLEM_MASTERY_TABLE,
+    TAG_MASTERY_TABLE,
+    MasteryStore,
+    UserMastery,
+)
+
+EXAMS = {"exam-1": [1, 2, 3, 4]}
+
+
+class FakeGenerator:
+    async def exam_problem_ids(self, exam_id):
+        return EXAMS[exam_id], 60
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = tmp_path / "problems.db"
+    conn = sqlite3.connect(path)
+    conn.executescript("""
+        CREATE TABLE problems (id INTEGER PRIMARY KEY, question TEXT, difficulty INTEGER, tags TEXT);
+        CREATE TABLE choices (
+            id INTEGER PRIMARY KEY, problem_id INTEGER, label TEXT, body TEXT, is_correct BOOLEAN
+        );
+    """)
+    for problem_id, tags in [(1, "機械学習"), (2, "機械学習"), (3, "深層学習"), (4, "機械学習,深層学習")]:
+        conn.execute("INSERT INTO problems VALUES (?, '問題', 1, ?)", (problem_id, tags))
+        conn.executemany(
+            "INSERT INTO choices (problem_id, label, body, is_correct) VALUES (?, ?, '選択肢', ?)",
+            [(problem_id, label, label == "A") for label in "ABCD"]
+        )
+    conn.commit()
+    conn.close()
+    return str(path)
+
+
+def table(db_path, name):
+    conn = sqlite3.connect(db_path)
+    rows = conn.execute(f"SELECT * FROM {name} ORDER BY 1, 2").fetchall()
+    conn.close()
+    return [row[:4] for row in rows]
+
+
+async def test_grading_updates_aggregates_incrementally(db_path):
+    mastery = MasteryStore(db_path=db_path)
+    grader = ExamGrader(FakeGenerator(), mastery, db_path=db_path)
+
+    await grader.grade("exam-1", {1: "A", 3: "B"}, user_id="u1")
+    before = await mastery.load("u1")
+    assert before.tags == {"機械学習": (1, 1), "深層学習": (1, 0)}
+
+    await grader.grade_bulk(BulkSubmission(sheets=[
+        BulkSheet(exam_id="exam-1", answers={1: "B", 4: "A"}, user_id="u1"),
+        BulkSheet(exam_id="exam-1", answers={2: "A"}, user_id="u2"),
+        BulkSheet(exam_id="exam-1", answers={2: "A"}),
+    ]))
+
+    assert table(db_path, TAG_MASTERY_TABLE) == [
+        ("u1", "機械学習", 3, 2), ("u1", "深層学習", 2, 1), ("u2", "機械学習", 1, 1),
+    ]
+    assert table(db_path, PROBLEM_MASTERY_TABLE) == [
+        ("u1", 1, 2, 1), ("u1", 3, 1, 0), ("u1", 4, 1, 1), ("u2", 2, 1, 1),
+    ]
+    # 採点で u1 のキャッシュは破棄される
+    after = await mastery.load("u1")
+    assert after.problem_ids.tolist() == [1, 3, 4]
+    assert after.attempts.tolist() == [2, 1, 1]
+
+
+def test_tag_ratio_boosts_weak_tags_over_catalog_share():
+    store = MasteryStore(weak_tag_boost=2.0)
+    counts = {"機械学習": 300, "深層学習": 100}
+    empty = UserMastery({}, np.empty(0, dtype=np.int64), np.empty(0), np.empty(0))
+    assert store.tag_ratio(empty, counts) == {"機械学習": 0.75, "深層学習": 0.25}
+
+    weak = empty._replace(tags={"機械学習": (20, 19), "深層学習": (20, 2)})
+    ratio = store.tag_ratio(weak, counts)
+    assert ratio["深層学習"] > 0.25
+    assert sum(ratio.values()) == pytest.approx(1.0)
+
+
+def test_problem_weights_favour_unseen_and_missed():
+    store = MasteryStore(seen_weight=0.2, missed_weight=0.8)
+    mastery = UserMastery({}, np.array([2, 5, 9]), np.array([4, 2, 1]), np.array([4, 0, 1]))
+    weights = store.problem_weights(mastery)
+
+    assert weights.lookup(np.array([1, 2, 5, 9])).tolist() == pytest.approx([1.0, 0.2, 0.8, 0.2])
+
+
+async def test_plan_uses_catalog_tags_and_request_filter(db_path):
+    catalog = ProblemCatalog(db_path=db_path)
+    catalog.load()
+    store = MasteryStore(db_path=db_path)
+
+    tag_ratio, weights = await store.plan("nobody", catalog=catalog)
+    assert tag_ratio == {"機械学習": 0.6, "深層学習": 0.4}
+    assert len(weights.ids) == 0
+
+    tag_ratio, _ = await store.plan("nobody", tags=["深層学習", "存在しない分野"], catalog=catalog)
+    assert tag_ratio == {"深層学習": 1.0}
+    assert store.get_metrics()["plans"] == 2
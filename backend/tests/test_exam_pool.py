@@ -0,0 +1,113 @@
+"""
+模試プールのテスト
+"""
+
+import pytest
+
+from app.models.schemas import ExamGenerateRequest
+from app.services.exam import pool as pool_module
+from app.services.exam.generator import PreparedExam
+from app.services.exam.pool import ExamPool, exam_signature
+
+
+class FakeCatalog:
+    revision = 1
+
+
+class FakeGenerator:
+    """prepare / publish / generate の呼び出しを記録するだけの生成器"""
+
+    def __init__(self, catalog):
+        self.catalog = catalog
+        self.prepared = 0
+        self.published = []
+        self.live = 0
+
+    async def prepare_exam(self, request, tag_ratio=None):
+        self.prepared += 1
+        return PreparedExam(None, [], self.catalog.revision)
+
+    async def publish_exam(self, prepared, request):
+        self.published.append(prepared)
+        return "pooled"
+
+    async def generate_exam(self, request, tag_ratio=None):
+        self.live += 1
+        return "live"
+
+
+@pytest.fixture
+def catalog(monkeypatch):
+    catalog = FakeCatalog()
+
+    async def get_catalog():
+        return catalog
+
+    monkeypatch.setattr(pool_module, "get_problem_catalog", get_catalog)
+    return catalog
+
+
+def make_request(**overrides):
+    params = {"num_questions": 100, "difficulty_ratio": {"1": 0.5, "2": 0.5}, "time_limit_min": 120}
+    params.update(overrides)
+    return ExamGenerateRequest(**params)
+
+
+def test_signature_ignores_key_order_and_time_limit():
+    a = make_request(difficulty_ratio={"1": 0.5, "2": 0.5}, tags=["B", "A"], time_limit_min=60)
+    b = make_request(difficulty_ratio={"2": 0.5, "1": 0.5}, tags=["A", "B"], time_limit_min=90)
+    assert exam_signature(a) == exam_signature(b)
+    assert exam_signature(a) != exam_signature(make_request(num_questions=50))
+
+
+async def test_frequent_signature_is_pooled_and_served(catalog):
+    generator = FakeGenerator(catalog)
+    pool = ExamPool(generator, pool_size=3, min_requests=2)
+    request = make_request()
+
+    assert await pool.generate_exam(request) == "live"
+    assert await pool.refill() == 0  # 1回だけではプール対象にならない
+    assert await pool.generate_exam(request) == "live"
+    assert await pool.refill() == 3
+
+    assert await pool.generate_exam(request) == "pooled"
+    metrics = pool.get_metrics()
+    assert metrics["hits"] == 1 and metrics["misses"] == 2
+    assert metrics["pools"][0]["ready"] == 2
+    assert metrics["refill_lag_ms"]["count"] == 1
+
+    await pool.refill()
+    assert pool.get_metrics()["pools"][0]["ready"] == 3
+    assert pool.get_metrics()["refill_lag_ms"]["count"] == 2
+
+
+async def test_catalog_change_drops_pooled_exams(catalog):
+    generator = FakeGenerator(catalog)
+    pool = ExamPool(generator, pool_size=2, min_requests=1)
+    request = make_request()
+    await pool.generate_exam(request)
+    await pool.refill()
+
+    catalog.revision += 1
+    assert await pool.generate_exam(request) == "live"
+    assert pool.stale_dropped == 2
+
+
+async def test_history_window_expires_old_signatures(catalog):
+    generator = FakeGenerator(catalog)
+    pool = ExamPool(generator, pool_size=1, min_requests=1, max_signatures=1, history_size=2)
+    await pool.generate_exam(make_request(num_questions=10))
+    await pool.generate_exam(make_request(num_questions=20))
+    await pool.generate_exam(make_request(num_questions=20))
+
+    assert pool.hot_signatures() == [exam_signature(make_request(num_questions=20))]
+    await pool.refill()
+    assert [p["num_questions"] for p in pool.get_metrics()["pools"]] == [20]
+
+
+async def test_disabled_pool_passes_through(catalog):
+    generator = FakeGenerator(catalog)
+    pool = ExamPool(generator, enabled=False)
+    for _ in range(5):
+        assert await pool.generate_exam(make_request()) == "live"
+    assert await pool.refill() == 0
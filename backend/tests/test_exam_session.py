@@ -0,0 +1,152 @@
+"""
+模試セッション (自動保存・再開・期限切れ削除) のテスト
+"""
+
+import sqlite3
+import time
+
+import pytest
+from fastapi import HTTPException
+
+from app.services.exam.session import SESSION_TABLE, ExamSessionStore
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = tmp_path / "problems.db"
+    conn = sqlite3.connect(path)
+    conn.execute(
+        "CREATE TABLE exams (exam_id TEXT PRIMARY KEY, num_questions INTEGER, time_limit_min INTEGER, params TEXT)"
+    )
+    conn.executemany(
+        "INSERT INTO exams VALUES (?, 10, 60, '{}')", [("exam-1",), ("exam-2",)]
+    )
+    conn.commit()
+    conn.close()
+    return str(path)
+
+
+def stored_answers(db_path, exam_id):
+    conn = sqlite3.connect(db_path)
+    row = conn.execute(f"SELECT answers FROM {SESSION_TABLE} WHERE exam_id = ?", (exam_id,)).fetchone()
+    conn.close()
+    return row[0] if row else None
+
+
+async def test_answers_are_coalesced_until_flush(db_path):
+    store = ExamSessionStore(db_path=db_path, flush_interval_sec=60)
+    state = await store.start("exam-1")
+    assert state.remaining_sec > 3590
+
+    for problem_id in range(1, 11):
+        state = await store.record_answers("exam-1", {problem_id: "A"})
+    state = await store.record_answers("exam-1", {3: "C", 4: None})
+    assert not state.saved
+    assert stored_answers(db_path, "exam-1") == "{}"
+
+    assert await store.flush() == 1
+    metrics = store.get_metrics()
+    assert metrics["updates"] == 11
+    assert metrics["rows_written"] == 1
+    assert metrics["coalesced_updates"] == 10
+    assert (await store.resume("exam-1")).saved
+
+
+async def test_session_resumes_after_restart(db_path):
+    store = ExamSessionStore(db_path=db_path, flush_interval_sec=60)
+    started = await store.start("exam-1")
+    await store.record_answers("exam-1", {1: "B", 2: "D"})
+    await store.stop()
+
+    restarted = ExamSessionStore(db_path=db_path, flush_interval_sec=60)
+    resumed = await restarted.start("exam-1")
+    assert resumed.answers == {1: "B", 2: "D"}
+    assert resumed.started_at == started.started_at
+
+
+async def test_write_through_mode_writes_every_update(db_path):
+    store = ExamSessionStore(db_path=db_path, flush_interval_sec=0)
+    await store.start("exam-1")
+    await store.record_answers("exam-1", {1: "A"})
+    await store.record_answers("exam-1", {2: "B"})
+
+    assert store.get_metrics()["rows_written"] == 2
+    assert stored_answers(db_path, "exam-1") == '{"1": "A", "2": "B"}'
+
+
+async def test_submitted_or_late_answers_are_rejected(db_path):
+    store = ExamSessionStore(db_path=db_path, flush_interval_sec=60, grace_sec=0)
+    await store.start("exam-1")
+    await store.start("exam-2")
+
+    assert await store.finish("exam-1") == {}
+    with pytest.raises(HTTPException) as exc_info:
+        await store.record_answers("exam-1", {1: "A"})
+    assert exc_info.value.status_code == 409
+
+    store._sessions["exam-2"].deadline = time.time() - 1
+    with pytest.raises(HTTPException) as exc_info:
+        await store.record_answers("exam-2", {1: "A"})
+    assert exc_info.value.status_code == 409
+
+    with pytest.raises(HTTPException) as exc_info:
+        await store.start("missing")
+    assert exc_info.value.status_code == 404
+
+
+async def test_sweeper_evicts_expired_sessions(db_path):
+    store = ExamSessionStore(db_path=db_path, flush_interval_sec=60, ttl_sec=0)
+    await store.start("exam-1")
+    await store.start("exam-2")
+    store._sessions["exam-1"].deadline = time.time() - 1
+    conn = sqlite3.connect(db_path)
+    conn.execute(f"UPDATE {SESSION_TABLE} SET expires_at = ? WHERE exam_id = 'exam-1'", (time.time() - 1,))
+    conn.commit()
+    conn.close()
+
+    assert await store.sweep() == 1
+    assert store.get_metrics()["active_sessions"] == 1
+    assert stored_answers(db_path, "exam-1") is None
+    with pytest.raises(HTTPException):
+        await store.resume("exam-1")
+
+
+async def test_finish_applies_final_answers_once(db_path):
+    store = ExamSessionStore(db_path=db_path, flush_interval_sec=60)
+    await store.start("exam-1")
+    await store.record_answers("exam-1", {1: "A", 2: "B"})
+
+    assert await store.finish("exam-1", {2: None, 3: "C"}) == {1: "A", 3: "C"}
+    assert stored_answers(db_path, "exam-1") == '{"1": "A", "3": "C"}'
+    with pytest.raises(HTTPException) as exc_info:
+        await store.finish("exam-1")
+    assert exc_info.value.status_code == 409
+
+    # セッションなし (紙の答案など) は渡された回答をそのまま返す
+    assert await store.finish("exam-2", {1: "D", 2: None}) == {1: "D"}
+
+
+async def test_reopen_allows_resubmitting_after_a_failed_grade(db_path):
+    store = ExamSessionStore(db_path=db_path, flush_interval_sec=60)
+    await store.start("exam-1")
+    await store.finish("exam-1", {1: "A"})
+    store._sessions.clear()
+
+    # 採点に失敗した提出は取り消され、再起動後も再提出できる
+    await store.reopen("exam-1")
+    store._sessions.clear()
+    assert await store.finish("exam-1", {2: "B"}) == {1: "A", 2: "B"}
+
+
+async def test_late_finish_grades_the_autosaved_answers(db_path):
+    store = ExamSessionStore(db_path=db_path, flush_interval_sec=60, grace_sec=0)
+    await store.start("exam-1")
+    await store.record_answers("exam-1", {1: "A", 2: "B"})
+    store._sessions["exam-1"].deadline = time.time() - 1
+
+    # 期限後に送られた最終答案は破棄し、自動保存済みの回答で採点する
+    assert await store.finish("exam-1", {2: "C", 3: "D"}) == {1: "A", 2: "B"}
+    assert stored_answers(db_path, "exam-1") == '{"1": "A", "2": "B"}'
+    with pytest.raises(HTTPException) as exc_info:
+        await store.finish("exam-1", {3: "D"})
+    assert exc_info.value.status_code == 409
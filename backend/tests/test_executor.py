@@ -0,0 +1,45 @@
+"""
+InferencePool のテスト
+"""
+
+import asyncio
+import threading
+
+import pytest
+from fastapi import HTTPException
+
+from app.core.executor import InferencePool
+
+
+async def test_run_executes_off_event_loop():
+    """ブロッキング処理はイベントループ外のスレッドで実行される"""
+    pool = InferencePool("test", max_workers=1, max_queue=1)
+    loop_thread = threading.get_ident()
+
+    result = await pool.run(threading.get_ident)
+
+    assert result != loop_thread
+    assert pool.get_metrics()["completed"] == 1
+    pool.shutdown()
+
+
+async def test_saturated_pool_rejects_with_503():
+    """待ち行列が上限に達したら503で拒否する"""
+    pool = InferencePool("test", max_workers=1, max_queue=1)
+    release = threading.Event()
+
+    running = asyncio.ensure_future(pool.run(release.wait, 5))
+    queued = asyncio.ensure_future(pool.run(release.wait, 5))
+    await asyncio.sleep(0.05)
+
+    assert pool.saturated
+    assert pool.queue_depth == 1
+    with pytest.raises(HTTPException) as exc_info:
+        await pool.run(lambda: None)
+    assert exc_info.value.status_code == 503
+
+    release.set()
+    await asyncio.gather(running, queued)
+    assert pool.in_flight == 0
+    assert pool.get_metrics()["rejected"] == 1
+    pool.shutdown()
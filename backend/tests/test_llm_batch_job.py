@@ -0,0 +1,155 @@
+"""
+問題バンク一括生成ジョブ (再開・一括書き込み・予算・失敗の記録) のテスト
+"""
+
+import asyncio
+import sqlite3
+
+import pytest
+from fastapi import HTTPException
+
+from app.scripts.generate_llm_content import (
+    CHECKPOINT_TABLE,
+    OUTPUT_TABLE,
+    BatchGenerator,
+)
+from app.services.llm.service import Completion
+
+
+class FakeService:
+    """Returns canned completions; questions containing "NG" are rejected, ids in ``timeouts`` time out"""
+
+    def __init__(self, tokens: int = 10, delay: float = 0.0, timeouts=()):
+        self.tokens = tokens
+        self.delay = delay
+        self.timeouts = set(timeouts)
+        self.calls = []
+
+    async def paraphrase_completion(self, text, creativity=0.7, priority=0, seed=None):
+        self.calls.append(("paraphrase", text, priority))
+        await asyncio.sleep(self.delay)
+        if "NG" in text:
+            raise HTTPException(status_code=422, detail="Paraphrase produced no new text")
+        return Completion(f"言い換え:{text}", self.tokens, False)
+
+    async def explanation_completion(self, question, answer, context=None, priority=0, seed=None):
+        self.calls.append(("explanation", question, priority))
+        await asyncio.sleep(self.delay)
+        if question in self.timeouts:
+            raise HTTPException(status_code=504, detail="LLM generation timed out after 900s")
+        return Completion(f"{answer}が正解", self.tokens, False)
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = tmp_path / "problems.db"
+    conn = sqlite3.connect(path)
+    conn.execute("""
+        CREATE TABLE problems (
+            id INTEGER PRIMARY KEY, question TEXT, answer TEXT, explanation TEXT,
+            difficulty TEXT, tags TEXT, source_url TEXT, created_at DATETIME
+        )
+    """)
+    conn.execute("CREATE TABLE choices (id INTEGER PRIMARY KEY, problem_id INTEGER, label TEXT, body TEXT, is_correct INTEGER)")
+    for i in range(1, 21):
+        conn.execute("INSERT INTO problems (id, question, answer) VALUES (?, ?, ?)",
+                     (i, f"問題{i}" + (" NG" if i == 7 else ""), "" if i == 3 else f"解答{i}"))
+    conn.execute("INSERT INTO choices (problem_id, label, body, is_correct) VALUES (3, 'A', '選択肢A', 1)")
+    conn.commit()
+    conn.close()
+    return str(path)
+
+
+def outputs(db_path):
+    conn = sqlite3.connect(db_path)
+    try:
+        return {
+            (row[0], row[1]): (row[2], row[3])
+            for row in conn.execute(f"SELECT problem_id, kind, text, error FROM {OUTPUT_TABLE}")
+        }
+    finally:
+        conn.close()
+
+
+def make_generator(service, db_path, **kwargs):
+    kwargs.setdefault("kinds", ("paraphrase", "explanation"))
+    return BatchGenerator(service, db_path=db_path, slots=2, page_size=6, commit_every=4, **kwargs)
+
+
+def test_generates_every_problem_and_records_failures(db_path):
+    service = FakeService()
+    summary = asyncio.run(make_generator(service, db_path).run())
+
+    rows = outputs(db_path)
+    assert len(rows) == 40
+    assert rows[(3, "explanation")][0] == "選択肢Aが正解"
+    assert rows[(7, "paraphrase")] == (None, "Paraphrase produced no new text")
+    assert summary["jobs"] == 40 and summary["failed"] == 1
+    assert summary["tokens"] == 39 * 10 and summary["checkpoint"] == 20
+    assert all(priority == 10 for _, _, priority in service.calls)
+
+
+def test_token_budget_stops_and_next_run_resumes(db_path):
+    first = make_generator(FakeService(delay=0.001), db_path)
+    summary = asyncio.run(first.run(max_tokens=100))
+
+    assert summary["stopped"] is not None
+    done = set(outputs(db_path))
+    assert 10 <= len(done) < 40
+    assert first.load_checkpoint() == summary["checkpoint"]
+    assert all((pid, kind) in done for pid in range(1, summary["checkpoint"] + 1)
+               for kind in ("paraphrase", "explanation"))
+
+    service = FakeService()
+    asyncio.run(make_generator(service, db_path).run())
+
+    assert len(outputs(db_path)) == 40
+    # Nothing that was already written is generated again
+    regenerated = {(int(text[len("問題"):].split()[0]), kind) for kind, text, _ in service.calls}
+    assert not done & regenerated
+
+
+def test_retry_failed_regenerates_only_failures(db_path):
+    asyncio.run(make_generator(FakeService(), db_path).run())
+    generator = make_generator(FakeService(), db_path)
+
+    assert generator.reset(failed_only=True) == 1
+    service = FakeService()
+    generator.service = service
+    asyncio.run(generator.run())
+
+    assert [(kind, text) for kind, text, _ in service.calls] == [("paraphrase", "問題7 NG")]
+
+
+def test_checkpoint_is_per_template_set(db_path):
+    asyncio.run(make_generator(FakeService(), db_path, kinds=("paraphrase",)).run())
+    conn = sqlite3.connect(db_path)
+    jobs = [row[0] for row in conn.execute(f"SELECT job FROM {CHECKPOINT_TABLE}")]
+    conn.close()
+
+    assert jobs == ["paraphrase:paraphrase/1"]
+    assert make_generator(FakeService(), db_path).load_checkpoint() == -1
+
+
+def test_transient_errors_are_not_written_and_hold_the_checkpoint(db_path):
+    summary = asyncio.run(make_generator(FakeService(timeouts={"問題5"}), db_path).run())
+
+    rows = outputs(db_path)
+    assert (5, "explanation") not in rows and len(rows) == 39
+    assert summary["deferred"] == 1 and summary["failed"] == 1
+    assert summary["checkpoint"] == 4
+
+    service = FakeService()
+    asyncio.run(make_generator(service, db_path).run())
+
+    assert [(kind, text) for kind, text, _ in service.calls] == [("explanation", "問題5")]
+    assert outputs(db_path)[(5, "explanation")] == ("解答5が正解", None)
+
+
+def test_outputs_record_the_model_that_ran(db_path):
+    asyncio.run(make_generator(FakeService(), db_path, model_path="/models/other.gguf").run())
+    conn = sqlite3.connect(db_path)
+    names = {row[0] for row in conn.execute(f"SELECT DISTINCT model_name FROM {OUTPUT_TABLE}")}
+    conn.close()
+
+    assert names == {"other.gguf"}
@@ -0,0 +1,118 @@
+"""
+固定プロンプト前半のKV状態再利用のテスト
+"""
+
+import numpy as np
+
+from app.services.llm.prefix_cache import PrefixCache
+from app.services.llm.prompts import explanation_prompt, paraphrase_prompt
+from app.services.llm.worker import GenerationParams, LLMWorkerPool
+
+
+class FakeLlama:
+    """Byte tokenizer and a context that, like llama-cpp, skips the prefix it already holds"""
+
+    def __init__(self):
+        self.input_ids = np.zeros(8192, dtype=np.intc)
+        self.n_tokens = 0
+        self.evaluated = 0
+
+    def tokenize(self, text: bytes):
+        return [1] + list(text)
+
+    def reset(self):
+        self.n_tokens = 0
+
+    def eval(self, tokens):
+        self.input_ids[self.n_tokens:self.n_tokens + len(tokens)] = tokens
+        self.n_tokens += len(tokens)
+        self.evaluated += len(tokens)
+
+    def save_state(self):
+        return self.input_ids[:self.n_tokens].copy()
+
+    def load_state(self, state):
+        self.input_ids[:len(state)] = state
+        self.n_tokens = len(state)
+
+    def __call__(self, prompt, stream, **kwargs):
+        tokens = self.tokenize(prompt.encode("utf-8"))
+        common = 0
+        for held, token in zip(self.input_ids[:self.n_tokens], tokens[:-1]):
+            if held != token:
+                break
+            common += 1
+        self.n_tokens = common
+        self.eval(tokens[common:])
+        self.eval([2])
+        yield {"choices": [{"text": "x"}]}
+
+
+def mixed_prompts(count):
+    return [
+        paraphrase_prompt(f"文{i}") if i % 2 == 0 else explanation_prompt(f"問{i}", "A")
+        for i in range(count)
+    ]
+
+
+async def evaluated_tokens(prefix_cache_size):
+    model = FakeLlama()
+    pool = LLMWorkerPool(lambda: model, prefix_cache_size=prefix_cache_size)
+    for prompt in mixed_prompts(10):
+        await pool.generate(prompt, GenerationParams(max_tokens=1))
+    metrics = pool.get_metrics()
+    await pool.stop()
+    return model.evaluated, metrics["workers"][0]["prefix_cache"]
+
+
+async def test_alternating_templates_only_evaluate_suffixes():
+    baseline, no_cache = await evaluated_tokens(0)
+    reused, stats = await evaluated_tokens(4)
+    prompts = mixed_prompts(10)
+    # Each template's prefix (with BOS) is evaluated once; every request then
+    # evaluates its suffix and one generated token
+    prefixes = sum(len(p.prefix.encode("utf-8")) + 1 for p in prompts[:2])
+    suffixes = sum(len(p.suffix.encode("utf-8")) + 1 for p in prompts)
+    assert no_cache is None
+    assert reused == prefixes + suffixes
+    assert reused < baseline / 2
+    assert stats["stored"] == 2
+    assert stats["restored"] == 8
+    assert stats["reused_tokens"] > 0
+
+
+def test_prefix_still_in_context_is_not_restored():
+    model = FakeLlama()
+    cache = PrefixCache(model)
+    first, second = paraphrase_prompt("一"), paraphrase_prompt("二")
+
+    assert cache.prepare(first.prefix, first.text) == "stored"
+    list(model(first.text, stream=True))
+    assert cache.prepare(second.prefix, second.text) == "resident"
+
+
+def test_prefix_that_does_not_tokenize_as_a_prompt_prefix_is_skipped():
+    class MergingTokenizer(FakeLlama):
+        def tokenize(self, text: bytes):
+            return [1, len(text)]
+
+    model = MergingTokenizer()
+    cache = PrefixCache(model)
+    prompt = paraphrase_prompt("一")
+
+    assert cache.prepare(prompt.prefix, prompt.text) == "mismatch"
+    assert cache.prepare(prompt.prefix, prompt.text) == "mismatch"
+    assert model.evaluated == 0
+    assert cache.snapshot()["mismatched"] == 2
+
+
+def test_least_recently_used_prefix_is_evicted():
+    model = FakeLlama()
+    cache = PrefixCache(model, max_entries=1)
+    paraphrase, explanation = paraphrase_prompt("一"), explanation_prompt("問", "A")
+
+    cache.prepare(paraphrase.prefix, paraphrase.text)
+    cache.prepare(explanation.prefix, explanation.text)
+
+    assert cache.prepare(paraphrase.prefix, paraphrase.text) == "stored"
+    assert cache.snapshot()["entries"] == 1
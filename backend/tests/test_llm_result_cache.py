@@ -0,0 +1,159 @@
+"""
+LLM生成結果キャッシュ (キー・シード再現・容量上限・モデル別削除) のテスト
+"""
+
+import asyncio
+import time
+
+import pytest
+
+from app.services.llm import result_cache
+from app.services.llm.result_cache import LLMResultCache
+from app.services.llm.worker import GenerationParams
+
+PARAMS = GenerationParams(max_tokens=100, temperature=0.3, stop=("\n\n",))
+
+
+@pytest.fixture
+def model_path(tmp_path):
+    path = tmp_path / "model-a.gguf"
+    path.write_bytes(b"weights-a" * 1000)
+    return str(path)
+
+
+@pytest.fixture
+def cache(tmp_path, model_path):
+    cache = LLMResultCache(str(tmp_path / "cache" / "llm.sqlite3"), model_path)
+    yield cache
+    cache.close()
+
+
+def test_key_normalizes_inputs_and_derives_a_stable_seed(cache):
+    key, params = cache.key("explanation/1", ["ＡＩとは？", "A", None], PARAMS)
+    same_key, same_params = cache.key("explanation/1", ["AIとは? ", "A", ""], PARAMS)
+
+    assert key == same_key
+    assert params.seed is not None and params.seed == same_params.seed
+    assert cache.key("explanation/2", ["AIとは?", "A", None], PARAMS)[0] != key
+    assert cache.key("explanation/1", ["AIとは?", "B", None], PARAMS)[0] != key
+    assert cache.key("explanation/1", ["AIとは?", "A", None], PARAMS._replace(temperature=0.7))[0] != key
+
+
+def test_explicit_seed_is_kept_and_separates_entries(cache):
+    key, params = cache.key("paraphrase/1", ["text"], PARAMS._replace(seed=7))
+    other_key, _ = cache.key("paraphrase/1", ["text"], PARAMS._replace(seed=8))
+
+    assert params.seed == 7
+    assert key != other_key
+
+
+def test_round_trip_counts_hits_and_misses(cache):
+    key, params = cache.key("paraphrase/1", ["text"], PARAMS)
+    assert cache.get(key) is None
+
+    cache.put(key, "paraphrase/1", params, "言い換え", 5)
+    start_time = time.perf_counter()
+    cached = cache.get(key)
+    elapsed_ms = (time.perf_counter() - start_time) * 1000
+
+    assert cached.text == "言い換え" and cached.tokens == 5 and cached.seed == params.seed
+    assert elapsed_ms < 50
+    stats = cache.get_stats()
+    assert (stats["hits"], stats["misses"], stats["hit_rate"]) == (1, 1, 0.5)
+    assert stats["models"][0]["hits"] == 1
+
+
+def test_model_hash_is_only_computed_when_the_file_changes(tmp_path, model_path, monkeypatch):
+    calls = []
+    original = result_cache.file_sha256
+    monkeypatch.setattr(result_cache, "file_sha256", lambda path: calls.append(path) or original(path))
+    db = str(tmp_path / "llm.sqlite3")
+
+    first = LLMResultCache(db, model_path)
+    first.close()
+    second = LLMResultCache(db, model_path)
+    second.close()
+    with open(model_path, "ab") as f:
+        f.write(b"retrained")
+    third = LLMResultCache(db, model_path)
+    third.close()
+
+    assert len(calls) == 2
+    assert first.model_hash == second.model_hash != third.model_hash
+
+
+def test_least_recently_used_entries_are_evicted_over_the_byte_cap(tmp_path, model_path):
+    cache = LLMResultCache(str(tmp_path / "llm.sqlite3"), model_path, max_bytes=2400)
+    keys = []
+    for i in range(4):
+        key, params = cache.key("explanation/1", [f"q{i}"], PARAMS)
+        cache.put(key, "explanation/1", params, "x" * 400, 10)
+        keys.append(key)
+        time.sleep(0.002)
+    cache.get(keys[0])
+    time.sleep(0.002)
+    key, params = cache.key("explanation/1", ["q4"], PARAMS)
+    cache.put(key, "explanation/1", params, "x" * 400, 10)
+    stats = cache.get_stats()
+    cache.close()
+
+    assert stats["bytes"] <= 2400
+    assert stats["evictions"] >= 1
+    assert cache_has(tmp_path / "llm.sqlite3", model_path, keys[0])
+    assert not cache_has(tmp_path / "llm.sqlite3", model_path, keys[1])
+
+
+def cache_has(db, model_path, key):
+    cache = LLMResultCache(str(db), model_path)
+    try:
+        return cache.get(key) is not None
+    finally:
+        cache.close()
+
+
+def test_purge_by_model_name_hash_or_all(tmp_path, model_path):
+    other_path = tmp_path / "model-b.gguf"
+    other_path.write_bytes(b"weights-b")
+    db = str(tmp_path / "llm.sqlite3")
+    caches = [LLMResultCache(db, model_path), LLMResultCache(db, str(other_path))]
+    for cache in caches:
+        for i in range(3):
+            key, params = cache.key("paraphrase/1", [f"t{i}"], PARAMS)
+            cache.put(key, "paraphrase/1", params, "out", 1)
+    first, second = caches
+
+    assert {model["model_name"]: model["entries"] for model in first.get_stats()["models"]} == {
+        "model-a.gguf": 3, "model-b.gguf": 3
+    }
+    assert first.purge("model-b.gguf") == 3
+    assert first.purge(first.model_hash) == 3
+    key, params = second.key("paraphrase/1", ["t0"], PARAMS)
+    second.put(key, "paraphrase/1", params, "out", 1)
+    assert second.purge() == 1
+    assert first.get_stats()["entries"] == 0
+    for cache in caches:
+        cache.close()
+
+
+def test_admin_endpoints_open_the_cache_without_loading_models(tmp_path, model_path, monkeypatch):
+    """管理用の依存はモデルを読み込まずにキャッシュだけを開く"""
+    from app.core.config import settings
+    from app.services.llm.service import LLMService
+
+    class UnstartedWorkers:
+        async def start(self):
+            raise AssertionError("models must not be loaded")
+
+    monkeypatch.setattr(settings, "LLM_RESULT_CACHE_PATH", str(tmp_path / "llm.sqlite3"))
+    service = LLMService(workers=UnstartedWorkers(), use_result_cache=True, model_path=model_path)
+
+    async def scenario():
+        await service.ensure_result_cache()
+        await service.ensure_result_cache()
+        return await service.get_cache_stats()
+
+    stats = asyncio.run(scenario())
+
+    assert stats["enabled"] and stats["model_name"] == "model-a.gguf"
+    assert not service._initialized
+    service.result_cache.close()
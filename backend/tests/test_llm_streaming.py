@@ -0,0 +1,57 @@
+"""
+LLM生成のServer-Sent Eventsエンコードのテスト
+"""
+
+import json
+
+from fastapi import HTTPException
+
+from app.services.llm.streaming import sse_event, sse_events
+from app.services.llm.worker import LLMWorkerPool
+
+
+def fake_model(prompt, stream, **kwargs):
+    for piece in ("言い\n", "換え", "た文"):
+        yield {"choices": [{"text": piece}]}
+
+
+def parse(frames):
+    events = []
+    for frame in frames:
+        event, data = frame.rstrip("\n").split("\n")
+        events.append((event.removeprefix("event: "), json.loads(data.removeprefix("data: "))))
+    return events
+
+
+async def collect(tokens, **kwargs):
+    return parse([frame async for frame in sse_events(tokens, **kwargs)])
+
+
+def test_sse_event_keeps_japanese_readable():
+    assert sse_event("token", {"text": "解説"}) == 'event: token\ndata: {"text": "解説"}\n\n'
+
+
+async def test_tokens_then_done_with_first_token_time():
+    pool = LLMWorkerPool(lambda: fake_model)
+    events = await collect(await pool.stream("p"), clean=lambda piece: piece.replace("\n", ""))
+    await pool.stop()
+
+    assert events[:3] == [("token", {"text": "言い"}), ("token", {"text": "換え"}), ("token", {"text": "た文"})]
+    name, done = events[3]
+    assert name == "done"
+    assert done["text"] == "言い換えた文"
+    assert done["tokens"] == 3
+    assert done["first_token_ms"] > 0
+    assert len(events) == 4
+
+
+async def test_rejected_output_becomes_an_error_event():
+    def reject(text):
+        raise HTTPException(status_code=422, detail="no paraphrase")
+
+    pool = LLMWorkerPool(lambda: fake_model)
+    events = await collect(await pool.stream("p"), finalize=reject)
+    await pool.stop()
+
+    assert [name for name, _ in events] == ["token", "token", "token", "error"]
+    assert events[-1][1] == {"status": 422, "detail": "no paraphrase"}
@@ -0,0 +1,210 @@
+"""
+LLMワーカープール (優先度キュー・受付制御・タイムアウト・キャンセル) のテスト
+"""
+
+import asyncio
+import threading
+import time
+
+import pytest
+from fastapi import HTTPException
+
+from app.services.llm import worker
+from app.services.llm.worker import (
+    PRIORITY_BATCH,
+    PRIORITY_INTERACTIVE,
+    GenerationParams,
+    LLMWorkerPool,
+)
+
+
+class FakeModel:
+    """Streams one token per ``delay`` seconds and records the calling threads"""
+
+    def __init__(self, delay: float = 0.0, tokens: int = 3):
+        self.delay = delay
+        self.tokens = tokens
+        self.prompts = []
+        self.threads = set()
+        self.emitted = 0
+
+    def __call__(self, prompt, max_tokens, stream, **kwargs):
+        assert stream
+        self.prompts.append(prompt)
+        self.threads.add(threading.get_ident())
+        for index in range(min(self.tokens, max_tokens)):
+            time.sleep(self.delay)
+            self.emitted += 1
+            yield {"choices": [{"text": f"{prompt}-{index} "}]}
+
+
+def make_pool(models, **kwargs):
+    created = iter(models)
+    return LLMWorkerPool(lambda: next(created), instances=len(models), **kwargs)
+
+
+async def test_generate_streams_tokens_and_reports_instance():
+    model = FakeModel()
+    pool = make_pool([model])
+    seen = []
+    result = await pool.generate("a", on_token=seen.append)
+    await pool.stop()
+
+    assert result.text == "a-0 a-1 a-2 "
+    assert result.tokens == 3
+    assert result.instance == 0
+    assert not result.cancelled
+    assert seen == ["a-0 ", "a-1 ", "a-2 "]
+
+
+async def test_interactive_jobs_run_before_queued_batch_jobs():
+    model = FakeModel(delay=0.02, tokens=1)
+    pool = make_pool([model])
+    await pool.start()
+
+    blocker = asyncio.create_task(pool.generate("first"))
+    await asyncio.sleep(0.005)
+    jobs = [asyncio.create_task(pool.generate(f"batch{i}", priority=PRIORITY_BATCH)) for i in range(2)]
+    jobs.append(asyncio.create_task(pool.generate("interactive", priority=PRIORITY_INTERACTIVE)))
+    await asyncio.gather(blocker, *jobs)
+    await pool.stop()
+
+    assert model.prompts == ["first", "interactive", "batch0", "batch1"]
+
+
+async def test_full_queue_is_rejected_with_503():
+    pool = make_pool([FakeModel(delay=0.02, tokens=2)], max_queue=1)
+    await pool.start()
+
+    running = asyncio.create_task(pool.generate("running"))
+    await asyncio.sleep(0.005)
+    queued = asyncio.create_task(pool.generate("queued"))
+    await asyncio.sleep(0)
+    with pytest.raises(HTTPException) as exc_info:
+        await pool.generate("rejected")
+    await asyncio.gather(running, queued)
+    await pool.stop()
+
+    assert exc_info.value.status_code == 503
+    assert exc_info.value.headers["Retry-After"]
+    assert pool.get_metrics()["rejected"] == 1
+
+
+async def test_timeout_returns_504_and_stops_the_running_generation():
+    model = FakeModel(delay=0.01, tokens=100)
+    pool = make_pool([model])
+    with pytest.raises(HTTPException) as exc_info:
+        await pool.generate("slow", timeout_sec=0.05)
+    # The worker notices the flag at the next token and frees the instance
+    for _ in range(50):
+        if not pool.get_metrics()["workers"][0]["busy"]:
+            break
+        await asyncio.sleep(0.01)
+    metrics = pool.get_metrics()
+    await pool.stop()
+
+    assert exc_info.value.status_code == 504
+    assert model.emitted < 100
+    assert metrics["timed_out"] == 1
+    assert metrics["workers"][0]["cancelled"] == 1
+
+
+async def test_cancelled_queued_job_is_dropped():
+    model = FakeModel(delay=0.02, tokens=1)
+    pool = make_pool([model])
+    await pool.start()
+
+    running = asyncio.create_task(pool.generate("running"))
+    await asyncio.sleep(0.005)
+    queued = asyncio.create_task(pool.generate("abandoned"))
+    await asyncio.sleep(0)
+    queued.cancel()
+    await running
+    await pool.generate("next")
+    await pool.stop()
+
+    assert model.prompts == ["running", "next"]
+    assert pool.get_metrics()["dropped"] == 1
+
+
+async def test_each_instance_is_only_used_by_its_own_thread():
+    models = [FakeModel(delay=0.005, tokens=2) for _ in range(2)]
+    pool = make_pool(models, max_queue=32)
+    results = await asyncio.gather(*(pool.generate(str(i)) for i in range(12)))
+    metrics = pool.get_metrics()
+    await pool.stop()
+
+    assert {result.instance for result in results} == {0, 1}
+    assert all(len(model.threads) == 1 for model in models)
+    assert models[0].threads != models[1].threads
+    workers = metrics["workers"]
+    assert sum(worker["completed"] for worker in workers) == 12
+    assert sum(worker["tokens"] for worker in workers) == 24
+    assert all(worker["tokens_per_sec"] > 0 for worker in workers)
+    assert metrics["wait_ms"]["count"] == 12
+
+
+async def test_generation_errors_reach_the_caller():
+    class BrokenModel:
+        def __call__(self, prompt, **kwargs):
+            raise RuntimeError("context overflow")
+
+    pool = make_pool([BrokenModel()])
+    with pytest.raises(RuntimeError, match="context overflow"):
+        await pool.generate("x", GenerationParams(max_tokens=1))
+    await pool.stop()
+
+    assert pool.get_metrics()["workers"][0]["failed"] == 1
+
+
+async def test_stream_delivers_tokens_before_generation_finishes():
+    model = FakeModel(delay=0.02, tokens=5)
+    pool = make_pool([model])
+    tokens = await pool.stream("s")
+    arrivals = []
+    async for piece in tokens:
+        arrivals.append((piece, model.emitted))
+    metrics = pool.get_metrics()
+    await pool.stop()
+
+    assert [piece for piece, _ in arrivals] == [f"s-{i} " for i in range(5)]
+    # The first token is seen while the model is still generating
+    assert arrivals[0][1] < 5
+    assert tokens.result.tokens == 5
+    assert 0 < tokens.result.first_token_ms < tokens.result.wait_ms + tokens.result.generation_ms
+    assert metrics["first_token_ms"]["count"] == 1
+    assert metrics["streams"] == 1 and metrics["streams_aborted"] == 0
+
+
+async def test_leaving_a_stream_early_cancels_the_generation():
+    model = FakeModel(delay=0.01, tokens=100)
+    pool = make_pool([model])
+    tokens = await pool.stream("s")
+    async for _ in tokens:
+        break
+    tokens.close()
+    await pool.generate("next", GenerationParams(max_tokens=1))
+    await pool.stop()
+
+    assert model.emitted < 100
+    assert model.prompts == ["s", "next"]
+    assert pool.get_metrics()["streams_aborted"] == 1
+
+
+async def test_stream_aborts_when_client_disconnects_before_first_token(monkeypatch):
+    monkeypatch.setattr(worker, "DISCONNECT_POLL_SEC", 0.01)
+    model = FakeModel(delay=0.2, tokens=100)
+    pool = make_pool([model])
+    disconnected = False
+
+    async def is_disconnected():
+        return disconnected
+
+    tokens = await pool.stream("s", is_disconnected=is_disconnected)
+    disconnected = True
+    received = [piece async for piece in tokens]
+    await pool.stop()
+
+    assert received == []
+    assert tokens.aborted and tokens.result is None
+    assert model.emitted <= 1
@@ -0,0 +1,168 @@
+"""
+NumpyVectorIndex のテスト
+"""
+
+import numpy as np
+import pytest
+
+from app.services.embedding.vector_index import (
+    CURRENT_FILENAME,
+    SIDECAR_FILENAME,
+    VECTORS_FILENAME,
+    NumpyVectorIndex,
+    current_index_dir,
+    quantize_int8,
+    recall_at_k,
+)
+
+
+@pytest.fixture
+def corpus():
+    """ランダムな埋め込みとメタデータ"""
+    rng = np.random.default_rng(0)
+    embeddings = rng.normal(size=(200, 16)).astype(np.float32)
+    ids = [str(i) for i in range(200)]
+    metadatas = [
+        {"difficulty": i % 3 + 1, "tags": "機械学習", "snippet": f"問題{i}"}
+        for i in range(200)
+    ]
+    return ids, embeddings, metadatas
+
+
+@pytest.fixture
+def index(tmp_path, corpus):
+    ids, embeddings, metadatas = corpus
+    NumpyVectorIndex.build(str(tmp_path), ids, embeddings, metadatas, model_name="test")
+    return NumpyVectorIndex.load(str(tmp_path))
+
+
+def test_self_query_returns_itself_first(index, corpus):
+    """登録済みベクトルで検索すると自身が最上位になる"""
+    _, embeddings, _ = corpus
+    hits = index.query(embeddings[[5, 42]], k=3)
+
+    assert [row[0].id for row in hits] == ["5", "42"]
+    assert hits[0][0].score == pytest.approx(1.0, abs=1e-5)
+    assert hits[0][0].metadata["snippet"] == "問題5"
+
+
+def test_matches_exact_cosine_ranking(index, corpus):
+    """総当たりのコサイン類似度順と一致する"""
+    _, embeddings, _ = corpus
+    query = np.random.default_rng(1).normal(size=16).astype(np.float32)
+
+    normalized = embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+    expected = np.argsort(-(normalized @ (query / np.linalg.norm(query))))[:10]
+
+    hits = index.query([query], k=10)[0]
+    assert [hit.id for hit in hits] == [str(i) for i in expected]
+
+
+def test_difficulty_filter(index, corpus):
+    """難易度フィルタに合う結果のみ返す"""
+    _, embeddings, _ = corpus
+    hits = index.query(embeddings[:1], k=20, difficulty=2)[0]
+
+    assert len(hits) == 20
+    assert all(hit.metadata["difficulty"] == 2 for hit in hits)
+
+
+def test_refresh_picks_up_rebuild(tmp_path, index, corpus):
+    """再構築後の refresh で新しいインデックスを読み込む"""
+    ids, embeddings, metadatas = corpus
+    NumpyVectorIndex.build(str(tmp_path), ids[:10], embeddings[:10], metadatas[:10])
+
+    index.refresh()
+
+    assert index.count() == 10
+
+
+def test_unpublished_generation_is_not_read(tmp_path, index, corpus):
+    """CURRENT が切り替わるまで書き込み途中の世代は読まれない"""
+    ids, embeddings, metadatas = corpus
+    partial = tmp_path / "v999-partial"
+    partial.mkdir()
+    np.save(partial / VECTORS_FILENAME, embeddings[:3])
+
+    index.refresh()
+
+    assert index.count() == 200
+    assert current_index_dir(str(tmp_path)).name != partial.name
+
+
+def test_rebuild_keeps_only_current_and_previous_generations(tmp_path, corpus):
+    """再構築ごとに古い世代を削除し、直前の世代は読み込み中のリーダー用に残す"""
+    ids, embeddings, metadatas = corpus
+    for size in (50, 40, 30):
+        NumpyVectorIndex.build(str(tmp_path), ids[:size], embeddings[:size], metadatas[:size])
+
+    generations = sorted(p.name for p in tmp_path.iterdir() if p.is_dir())
+    assert len(generations) == 2
+    assert (tmp_path / CURRENT_FILENAME).read_text() == generations[-1]
+    assert NumpyVectorIndex.load(str(tmp_path)).count() == 30
+
+
+def test_loads_flat_layout_of_older_builds(tmp_path, corpus):
+    """世代ディレクトリ導入前の直下配置のインデックスも読み込める"""
+    ids, embeddings, metadatas = corpus
+    NumpyVectorIndex.build(str(tmp_path / "build"), ids[:5], embeddings[:5], metadatas[:5])
+    flat = tmp_path / "flat"
+    current_index_dir(str(tmp_path / "build")).rename(flat)
+
+    index = NumpyVectorIndex.load(str(flat))
+
+    assert (flat / SIDECAR_FILENAME).exists() and index.count() == 5
+
+
+def test_index_from_another_encoder_is_refused(tmp_path, index, corpus):
+    """別モデルで構築されたインデックスは拒否し、読み込み済みの世代を使い続ける"""
+    with pytest.raises(ValueError):
+        index.bind_model("other")
+
+    index.bind_model("test")
+    ids, embeddings, metadatas = corpus
+    NumpyVectorIndex.build(str(tmp_path), ids[:10], embeddings[:10], metadatas[:10], model_name="other")
+
+    with pytest.raises(ValueError):
+        index.refresh()
+    assert index.count() == 200
+
+
+def test_mismatched_lengths_rejected(tmp_path):
+    """ID数とベクトル数が異なる場合はエラー"""
+    with pytest.raises(ValueError):
+        NumpyVectorIndex.build(str(tmp_path), ["1"], np.zeros((2, 4)), [{}])
+
+
+@pytest.mark.parametrize("dtype", ["float16", "int8"])
+def test_quantized_scan_with_rerank_keeps_recall(tmp_path, corpus, dtype):
+    """量子化走査 + 再スコアで float32 厳密検索とほぼ同じ結果になる"""
+    ids, embeddings, metadatas = corpus
+    NumpyVectorIndex.build(str(tmp_path), ids, embeddings, metadatas)
+    exact = NumpyVectorIndex.load(str(tmp_path))
+    quantized = NumpyVectorIndex.load(str(tmp_path), dtype=dtype, rerank_factor=4)
+
+    queries = np.random.default_rng(2).normal(size=(50, 16)).astype(np.float32)
+
+    assert recall_at_k(exact, quantized, queries, k=10) >= 0.98
+    assert quantized.resident_bytes() < exact.resident_bytes()
+
+
+def test_int8_quantization_roundtrip():
+    """int8量子化の復元誤差はスケールの半分以内"""
+    matrix = np.random.default_rng(3).normal(size=(20, 8)).astype(np.float32)
+    codes, scales = quantize_int8(matrix)
+
+    restored = codes.astype(np.float32) * scales[:, None]
+    assert codes.dtype == np.int8
+    assert np.all(np.abs(restored - matrix) <= scales[:, None] / 2 + 1e-6)
+
+
+def test_rerank_respects_difficulty_filter(tmp_path, corpus):
+    """量子化検索でも難易度フィルタが効く"""
+    ids, embeddings, metadatas = corpus
+    NumpyVectorIndex.build(str(tmp_path), ids, embeddings, metadatas)
+    index = NumpyVectorIndex.load(str(tmp_path), dtype="int8")
+
+    hits = index.query(embeddings[:1], k=5, difficulty=3)[0]
+    assert hits and all(hit.metadata["difficulty"] == 3 for hit in hits)
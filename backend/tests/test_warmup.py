@@ -0,0 +1,93 @@
+"""
+起動時ウォームアップのテスト
+"""
+
+import asyncio
+import time
+
+from app.core.warmup import ReadinessState, warm_up
+
+
+def sleeping_step(seconds: float, details=None):
+    async def step():
+        await asyncio.sleep(seconds)
+        return details
+    return step
+
+
+async def test_steps_run_in_parallel():
+    """各コンポーネントは並行してウォームアップされる"""
+    state = ReadinessState()
+    start_time = time.perf_counter()
+
+    await warm_up({"a": sleeping_step(0.1), "b": sleeping_step(0.1)}, state)
+
+    assert time.perf_counter() - start_time < 0.18
+    assert state.ready
+    assert set(state.timings) == {"a", "b"}
+
+
+async def test_component_timings_are_recorded():
+    """サービスが返した内訳もタイミングに含める"""
+    state = ReadinessState()
+
+    await warm_up({"embedding": sleeping_step(0, {"embedding_model": 1.5})}, state)
+
+    assert state.timings["embedding.embedding_model"] == 1.5
+    assert state.snapshot()["status"] == "ready"
+
+
+async def test_failed_step_keeps_not_ready():
+    """失敗したコンポーネントがあれば ready にならない"""
+    async def broken():
+        raise RuntimeError("model file not found")
+
+    state = ReadinessState()
+    await warm_up({"llm": broken, "embedding": sleeping_step(0)}, state, max_attempts=1)
+
+    assert not state.ready
+    snapshot = state.snapshot()
+    assert snapshot["status"] == "failed"
+    assert snapshot["errors"] == {"llm": "model file not found"}
+    assert "embedding" in snapshot["timings_s"]
+
+
+async def test_failed_step_is_retried_with_backoff():
+    """失敗したコンポーネントは再試行し、成功すれば ready になる"""
+    failures = [RuntimeError("index not built yet")] * 2
+
+    async def flaky():
+        if failures:
+            raise failures.pop()
+
+    state = ReadinessState()
+    await warm_up({"embedding": flaky}, state, backoff_sec=0.01)
+
+    assert state.ready
+    assert state.attempts == {"embedding": 3}
+    assert state.snapshot()["errors"] == {}
+
+
+async def test_optional_step_does_not_block_readiness():
+    """任意コンポーネントの失敗中も必須コンポーネントが揃えば ready になる"""
+    async def missing_model():
+        raise FileNotFoundError("model.gguf")
+
+    state = ReadinessState()
+    task = asyncio.create_task(warm_up(
+        {"llm": missing_model, "embedding": sleeping_step(0)}, state,
+        optional=["llm"], backoff_sec=0.01, max_backoff_sec=0.02
+    ))
+    await asyncio.sleep(0.1)
+
+    snapshot = state.snapshot()
+    assert state.ready and snapshot["status"] == "ready"
+    assert snapshot["errors"] == {"llm": "model.gguf"} and snapshot["optional"] == ["llm"]
+    assert state.attempts["llm"] > 2
+
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+
+
+def test_snapshot_before_start():
+    assert ReadinessState().snapshot()["status"] == "starting"